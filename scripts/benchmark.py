@@ -0,0 +1,310 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This module provides a benchmark suite for the parser and the routers.
+
+The suite times the following stages per feed (see STAGES):
+- parse_gtfs: parsing the gtfs-file (including the beeline footpaths).
+- create_beeline_footpaths: creating the beeline footpaths of the parsed stops.
+- make_transitive: making the footpaths of the parsed timetable data transitive.
+- connection_scan_data: creating the ConnectionScanData of the parsed stops, footpaths and trips.
+- the three routers of ConnectionScanCore on a fixed query set (see create_query_set).
+
+Each stage is repeated and the minimum, median and mean of the elapsed times are recorded as json,
+so that runs (e.g. before and after a change) can be compared (see compare_benchmarks).
+
+Besides the bundled feeds, synthetic feeds of the sizes in synthetic_gtfs.SIZE_PRESETS can be benchmarked
+(see create_synthetic_feeds), e.g. for measuring the scaling behaviour of the parser and the routers.
+
+Examples:
+    python -m scripts.benchmark run --output before.json
+    python -m scripts.benchmark run --synthetic small --synthetic medium --output scaling.json
+    python -m scripts.benchmark run --feed path/to/gtfs.zip 20190118 --repetitions 5 --output after.json
+    python -m scripts.benchmark compare before.json after.json --threshold 0.1
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from scripts.connectionscan_router import ConnectionScanCore, ConnectionScanData, make_transitive
+from scripts.gtfs_parser import create_beeline_footpaths, parse_gtfs
+from scripts.helpers.funs import parse_yymmdd
+from scripts.synthetic_gtfs import SIZE_PRESETS, generate_synthetic_gtfs
+
+log = logging.getLogger(__name__)
+
+ROUTERS = ("earliest_arrival", "earliest_arrival_with_reconstruction",
+           "optimized_earliest_arrival_with_reconstruction")
+STAGES = ("parse_gtfs", "create_beeline_footpaths", "make_transitive", "connection_scan_data") + tuple(
+    "route_{}".format(router) for router in ROUTERS)
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# bundled feeds of different sizes: (name, path to the gtfs-file, date)-tuples
+DEFAULT_FEEDS = (
+    ("gtfsfp2019_small", os.path.join(ROOT_DIRECTORY, "tests", "resources", "gtfsfp20192018-12-05_small.zip"),
+     "20190118"),
+    ("small_gtfs_feed", os.path.join(ROOT_DIRECTORY, "resources", "small_gtfs_feed.zip"), "20200124"),
+)
+MIN_QUERY_DEP_TIME = 6 * 60 * 60  # earliest departure time of the queries of the query sets
+MAX_QUERY_DEP_TIME = 20 * 60 * 60  # latest departure time of the queries of the query sets
+
+
+def create_query_set(connection_scan_data, nb_queries, seed=0):
+    """Returns a fixed set of routing queries (the same for the same timetable data and seed).
+
+    Args:
+        connection_scan_data (ConnectionScanData): timetable data.
+        nb_queries (int): number of queries.
+        seed (:obj:`int`, optional): seed of the random generator. Default is 0.
+
+    Returns:
+        list: (from_stop_id, to_stop_id, desired_dep_time)-tuples (the source and target stops are served by trips
+        and the desired departure times are full minutes between MIN_QUERY_DEP_TIME and MAX_QUERY_DEP_TIME).
+    """
+    served_stop_ids = sorted({stop_id for trip in connection_scan_data.trips_per_id.values()
+                              for c in trip.connections for stop_id in (c.from_stop_id, c.to_stop_id)})
+    if len(served_stop_ids) < 2:
+        raise ValueError("at least two stops must be served by trips, but {} are".format(len(served_stop_ids)))
+    rnd = random.Random(seed)
+    return [tuple(rnd.sample(served_stop_ids, 2)) + (60 * rnd.randrange(MIN_QUERY_DEP_TIME // 60,
+                                                                        MAX_QUERY_DEP_TIME // 60),)
+            for _ in range(nb_queries)]
+
+
+def time_stage(stage_function, nb_repetitions):
+    """Executes a stage repeatedly and returns the statistics of the elapsed times.
+
+    Args:
+        stage_function (callable): function executing the stage (called without arguments).
+        nb_repetitions (int): number of repetitions.
+
+    Returns:
+        dict: minimum, median and mean of the elapsed times in seconds and the number of repetitions.
+    """
+    elapsed_times = []
+    for _ in range(nb_repetitions):
+        start_time = time.perf_counter()
+        stage_function()
+        elapsed_times += [time.perf_counter() - start_time]
+    return {
+        "min": min(elapsed_times),
+        "median": statistics.median(elapsed_times),
+        "mean": statistics.mean(elapsed_times),
+        "nb_repetitions": nb_repetitions,
+    }
+
+
+def benchmark_feed(path_to_gtfs_zip, desired_date, nb_repetitions=3, nb_queries=20, seed=0, beeline_distance=100.0,
+                   max_transitive_walking_time=600.0):
+    """Times the stages in STAGES on a gtfs-file.
+
+    Args:
+        path_to_gtfs_zip (str): path to the gtfs-file.
+        desired_date (date): date of the timetable data.
+        nb_repetitions (:obj:`int`, optional): number of repetitions per stage. Default is 3.
+        nb_queries (:obj:`int`, optional): number of queries of the query set of the routers. Default is 20.
+        seed (:obj:`int`, optional): seed of the query set (see create_query_set). Default is 0.
+        beeline_distance (:obj:`float`, optional): beeline distance of the footpaths (see parse_gtfs).
+        Default is 100.
+        max_transitive_walking_time (:obj:`float`, optional): maximal walking time of the footpaths created by
+        make_transitive. Default is 600.
+
+    Returns:
+        dict: size of the timetable data and the statistics of the elapsed times per stage (see time_stage;
+        the times of the routers are the times of the whole query set).
+    """
+    results = {}
+    cs_data = None
+
+    def run_parse_gtfs():
+        nonlocal cs_data
+        cs_data = parse_gtfs(path_to_gtfs_zip, desired_date, beeline_distance=beeline_distance)
+
+    results["parse_gtfs"] = time_stage(run_parse_gtfs, nb_repetitions)
+    stops_per_id = cs_data.stops_per_id
+    results["create_beeline_footpaths"] = time_stage(
+        lambda: create_beeline_footpaths(stops_per_id, {}, beeline_distance, 2.0 / 3.6), nb_repetitions)
+    results["make_transitive"] = time_stage(
+        lambda: make_transitive(dict(cs_data.footpaths_per_from_to_stop_id), max_transitive_walking_time),
+        nb_repetitions)
+    results["connection_scan_data"] = time_stage(
+        lambda: ConnectionScanData(stops_per_id, cs_data.footpaths_per_from_to_stop_id, cs_data.trips_per_id),
+        nb_repetitions)
+
+    cs_core = ConnectionScanCore(cs_data)
+    queries = create_query_set(cs_data, nb_queries, seed)
+    for router in ROUTERS:
+        route = getattr(cs_core, "route_{}".format(router))
+        results["route_{}".format(router)] = time_stage(
+            lambda: [route(from_stop_id, to_stop_id, desired_dep_time)
+                     for from_stop_id, to_stop_id, desired_dep_time in queries], nb_repetitions)
+    return {
+        "path": path_to_gtfs_zip,
+        "date": desired_date.isoformat(),
+        "nb_stops": len(cs_data.stops_per_id),
+        "nb_footpaths": len(cs_data.footpaths_per_from_to_stop_id),
+        "nb_trips": len(cs_data.trips_per_id),
+        "nb_connections": len(cs_data.sorted_connections),
+        "nb_queries": len(queries),
+        "stages": results,
+    }
+
+
+def create_synthetic_feeds(presets, directory, seed=0):
+    """Writes synthetic gtfs-files of preset sizes (see synthetic_gtfs.py) and returns them as benchmark feeds.
+
+    Args:
+        presets (list): names of the presets in synthetic_gtfs.SIZE_PRESETS.
+        directory (str): directory of the gtfs-files.
+        seed (:obj:`int`, optional): seed of the generator. Default is 0.
+
+    Returns:
+        list: (name, path to the gtfs-file, date as YYYYMMDD)-tuples (the date is a wednesday of the service period).
+    """
+    feeds = []
+    for preset in presets:
+        path_to_gtfs_zip = os.path.join(directory, "synthetic_{}_{}.zip".format(preset, seed))
+        res = generate_synthetic_gtfs(path_to_gtfs_zip, seed=seed, **SIZE_PRESETS[preset])
+        start_date = datetime.strptime(res["start_date"], "%Y-%m-%d").date()
+        wednesday = start_date + timedelta(days=(2 - start_date.weekday()) % 7)
+        feeds += [("synthetic_{}".format(preset), path_to_gtfs_zip, wednesday.strftime("%Y%m%d"))]
+    return feeds
+
+
+def run_benchmark(feeds=DEFAULT_FEEDS, nb_repetitions=3, nb_queries=20, seed=0):
+    """Runs the benchmark suite on several feeds.
+
+    Args:
+        feeds (:obj:`list`, optional): (name, path to the gtfs-file, date as YYYYMMDD)-tuples.
+        Default is DEFAULT_FEEDS.
+        nb_repetitions (:obj:`int`, optional): number of repetitions per stage. Default is 3.
+        nb_queries (:obj:`int`, optional): number of queries of the query set per feed. Default is 20.
+        seed (:obj:`int`, optional): seed of the query sets. Default is 0.
+
+    Returns:
+        dict: json-serializable benchmark results with the environment and the results per feed name
+        (see benchmark_feed).
+    """
+    results_per_feed = {}
+    for name, path_to_gtfs_zip, yyyymmdd in feeds:
+        log.info("benchmarking feed {} ({} at {})".format(name, path_to_gtfs_zip, yyyymmdd))
+        results_per_feed[name] = benchmark_feed(path_to_gtfs_zip, parse_yymmdd(yyyymmdd), nb_repetitions,
+                                                nb_queries, seed)
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "nb_repetitions": nb_repetitions,
+        "seed": seed,
+        "feeds": results_per_feed,
+    }
+
+
+def compare_benchmarks(baseline, current, threshold=0.1, min_difference=0.001, statistic="median"):
+    """Compares two benchmark results and returns the regressions.
+
+    A stage regresses if its elapsed time is more than threshold (relative) and more than min_difference
+    (absolute, to ignore noise of very fast stages) slower than in the baseline.
+    Only the stages of feeds contained in both results are compared.
+
+    Args:
+        baseline (dict): benchmark results of the baseline (see run_benchmark).
+        current (dict): benchmark results to check.
+        threshold (:obj:`float`, optional): tolerated relative slowdown. Default is 0.1 (i.e. 10%).
+        min_difference (:obj:`float`, optional): tolerated absolute slowdown in seconds. Default is 0.001.
+        statistic (:obj:`str`, optional): compared statistic of the elapsed times ("min", "median" or "mean").
+        Default is "median".
+
+    Returns:
+        list: (feed name, stage, baseline time, current time, ratio)-tuples of the regressions.
+    """
+    regressions = []
+    for name, current_feed in current["feeds"].items():
+        baseline_feed = baseline["feeds"].get(name)
+        if baseline_feed is None:
+            continue
+        for stage, current_stats in current_feed["stages"].items():
+            if stage not in baseline_feed["stages"]:
+                continue
+            baseline_time = baseline_feed["stages"][stage][statistic]
+            current_time = current_stats[statistic]
+            if current_time > baseline_time * (1 + threshold) and current_time - baseline_time > min_difference:
+                regressions += [(name, stage, baseline_time, current_time,
+                                 current_time / baseline_time if baseline_time > 0 else float("inf"))]
+    return regressions
+
+
+def format_results(results, statistic="median"):
+    """Returns a table with the elapsed time per feed and stage.
+
+    Args:
+        results (dict): benchmark results (see run_benchmark).
+        statistic (:obj:`str`, optional): shown statistic of the elapsed times. Default is "median".
+
+    Returns:
+        str: the table.
+    """
+    lines = []
+    for name, feed in results["feeds"].items():
+        lines += ["{} ({} stops, {} connections, {} queries):".format(name, feed["nb_stops"], feed["nb_connections"],
+                                                                      feed["nb_queries"])]
+        lines += ["    {:<55} {:>10.4f}s".format(stage, stats[statistic]) for stage, stats in feed["stages"].items()]
+    return "\n".join(lines)
+
+
+def main(args=None):
+    """Runs the benchmark suite (run) or compares two benchmark results (compare, exit code 1 on regressions)."""
+    parser = argparse.ArgumentParser(description="Benchmark suite for the parser and the routers.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the benchmark suite")
+    run_parser.add_argument("--feed", nargs=2, action="append", metavar=("GTFS_ZIP", "YYYYMMDD"),
+                            help="feed to benchmark (repeatable). Default are the bundled feeds")
+    run_parser.add_argument("--synthetic", action="append", choices=list(SIZE_PRESETS),
+                            help="synthetic feed of a preset size to benchmark (repeatable)")
+    run_parser.add_argument("--repetitions", type=int, default=3)
+    run_parser.add_argument("--queries", type=int, default=20, help="number of queries per feed")
+    run_parser.add_argument("--seed", type=int, default=0, help="seed of the query sets")
+    run_parser.add_argument("--output", default=None, help="path to the json-file (default: stdout)")
+    compare_parser = subparsers.add_parser("compare", help="compare two benchmark results")
+    compare_parser.add_argument("baseline", help="path to the json-file of the baseline")
+    compare_parser.add_argument("current", help="path to the json-file to check")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="tolerated relative slowdown")
+    compare_parser.add_argument("--min-difference", type=float, default=0.001,
+                                help="tolerated absolute slowdown in seconds")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if args.command == "run":
+        feeds = [] if args.feed is None else [(path, path, yyyymmdd) for path, yyyymmdd in args.feed]
+        with tempfile.TemporaryDirectory() as directory:
+            if args.synthetic is not None:
+                feeds += create_synthetic_feeds(args.synthetic, directory)
+            results = run_benchmark(feeds if feeds else DEFAULT_FEEDS, args.repetitions, args.queries, args.seed)
+        print(format_results(results), file=sys.stderr)
+        if args.output is None:
+            json.dump(results, sys.stdout, indent=2)
+        else:
+            with open(args.output, "w") as output_file:
+                json.dump(results, output_file, indent=2)
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.current) as current_file:
+        current = json.load(current_file)
+    regressions = compare_benchmarks(baseline, current, args.threshold, args.min_difference)
+    for name, stage, baseline_time, current_time, ratio in regressions:
+        print("REGRESSION {} {}: {:.4f}s -> {:.4f}s ({:+.1%})".format(name, stage, baseline_time, current_time,
+                                                                      ratio - 1))
+    print("{} regressions (threshold: {:.0%})".format(len(regressions), args.threshold))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
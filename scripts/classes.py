@@ -36,6 +36,61 @@ class Stop:
         return str(self)
 
 
+class IdRegistry:
+    """Bidirectional mapping between ids (i.e. stop or trip id's) and dense integer indices 0, ..., n - 1.
+
+    The index of an id is its position in ids.
+
+    Args and attributes:
+        ids (list): id per index.
+
+    Additional attributes:
+        index_per_id (dict): index per id.
+    """
+    __slots__ = ["ids", "index_per_id"]
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+        self.index_per_id = {an_id: ind for ind, an_id in enumerate(self.ids)}
+        if len(self.index_per_id) != len(self.ids):
+            raise ValueError("ids are not unique: {} ids, but only {} distinct ids".format(len(self.ids),
+                                                                                           len(self.index_per_id)))
+
+    def get_index(self, an_id):
+        """Returns the index of an id.
+
+        Args:
+            an_id (str): the id.
+
+        Returns:
+            int: the index of the id.
+        """
+        return self.index_per_id[an_id]
+
+    def get_id(self, index):
+        """Returns the id of an index.
+
+        Args:
+            index (int): the index.
+
+        Returns:
+            str: the id of the index.
+        """
+        return self.ids[index]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, an_id):
+        return an_id in self.index_per_id
+
+    def __str__(self):
+        return "[# ids={}]".format(len(self.ids))
+
+    def __repr__(self):
+        return str(self)
+
+
 class Footpath:
     """Represents a footpath with a fixed walking time between two stops .
     Footpaths are used to model minimal transfer times for transfers between two trips
@@ -0,0 +1,331 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This module provides a date-independent compiled version of a gtfs-file.
+
+The gtfs-file is parsed once (compile_gtfs) into a columnar store of the connections of all trips together with
+a service validity bitset per service id over the feed period. The timetable data (ConnectionScanData) of any date
+of the feed period is then created by filtering the columnar store, without reading the gtfs-file again.
+"""
+import csv
+import logging
+from datetime import timedelta
+from io import TextIOWrapper
+from zipfile import ZipFile
+
+import numpy as np
+
+from scripts.classes import Connection, Trip
+from scripts.connectionscan_router import ConnectionScanData, ValidationLevel, create_connection_time_indexes
+from scripts.gtfs_parser import (DEFAULT_STOP_TIMES_CHUNK_SIZE, ENCODING, BeelineMetric, create_footpaths,
+                                 get_route_type_per_route_id, get_trip_type, parse_stops, read_stop_times_in_chunks)
+from scripts.helpers.funs import parse_yymmdd
+from scripts.helpers.my_logging import log_end, log_span, log_start
+
+log = logging.getLogger(__name__)
+
+WEEKDAY_COLUMNS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+class CompiledFeed:
+    """Container for the date-independent data of a gtfs-file (see compile_gtfs).
+
+    The connections are stored grouped by trip (in the order of the first occurrence of the trips in stop_times.txt,
+    within a trip in the order of stop_times.txt), i.e. in the order in which parse_gtfs creates them.
+
+    Args and attributes:
+        stops_per_id (dict): stop per stop id.
+        footpaths_per_from_to_stop_id (dict): footpath per (from_stop_id, to_stop_id)-tuple.
+        first_date (date): first date of the feed period (None if the feed has no service dates).
+        nb_days (int): number of days of the feed period.
+        service_ids (list): service id's.
+        service_validity_bitsets (ndarray): bitset (packed uint8, see numpy.packbits) of the days of the feed period
+        at which the service is available per service index.
+        trip_ids (list): trip id's (of trips.txt).
+        service_index_per_trip_index (ndarray): index of the service (-1 if not defined) per trip index.
+        trip_types (list): trip type per trip index.
+        trip_indices (ndarray): trip index (int32) per connection.
+        from_stop_indices (ndarray): index (int32) of the from stop (in stops_per_id) per connection.
+        to_stop_indices (ndarray): index (int32) of the to stop (in stops_per_id) per connection.
+        dep_times (ndarray): departure time (int32) per connection.
+        arr_times (ndarray): arrival time (int32) per connection.
+        read_trip_indices (ndarray): indices of the trips in stop_times.txt (without trips with missing times)
+        in the order of their first occurrence.
+    """
+
+    def __init__(self, stops_per_id, footpaths_per_from_to_stop_id, first_date, nb_days, service_ids,
+                 service_validity_bitsets, trip_ids, service_index_per_trip_index, trip_types, trip_indices,
+                 from_stop_indices, to_stop_indices, dep_times, arr_times, read_trip_indices):
+        self.stops_per_id = stops_per_id
+        self.footpaths_per_from_to_stop_id = footpaths_per_from_to_stop_id
+        self.first_date = first_date
+        self.nb_days = nb_days
+        self.service_ids = service_ids
+        self.service_validity_bitsets = service_validity_bitsets
+        self.trip_ids = trip_ids
+        self.service_index_per_trip_index = service_index_per_trip_index
+        self.trip_types = trip_types
+        self.trip_indices = trip_indices
+        self.from_stop_indices = from_stop_indices
+        self.to_stop_indices = to_stop_indices
+        self.dep_times = dep_times
+        self.arr_times = arr_times
+        self.read_trip_indices = read_trip_indices
+
+    def get_day_index(self, desired_date):
+        """Returns the index of the date in the feed period (None if the date is not in the feed period).
+
+        Args:
+            desired_date (date): date.
+
+        Returns:
+            int: number of days since first_date.
+        """
+        if self.first_date is None:
+            return None
+        day_index = (desired_date - self.first_date).days
+        return day_index if 0 <= day_index < self.nb_days else None
+
+    def get_dates(self):
+        """Returns the dates of the feed period.
+
+        Returns:
+            list: dates of the feed period.
+        """
+        return [self.first_date + timedelta(days=d) for d in range(self.nb_days)]
+
+    def get_service_available_at_date(self, desired_date):
+        """Returns whether or not the services are available at the date.
+
+        Args:
+            desired_date (date): date.
+
+        Returns:
+            ndarray: True if the service is available at the date per service index.
+        """
+        day_index = self.get_day_index(desired_date)
+        if day_index is None:
+            return np.zeros(len(self.service_ids), dtype=bool)
+        return ((self.service_validity_bitsets[:, day_index // 8] >> (7 - day_index % 8)) & 1).astype(bool)
+
+    def get_trip_available_at_date(self, desired_date):
+        """Returns whether or not the trips are available at the date.
+
+        Args:
+            desired_date (date): date.
+
+        Returns:
+            ndarray: True if the trip is available at the date per trip index.
+        """
+        service_available = np.append(self.get_service_available_at_date(desired_date), False)  # -1: not defined
+        return service_available[self.service_index_per_trip_index]
+
+    def get_connection_scan_data(self, desired_date, validation_level=ValidationLevel.NONE):
+        """Creates the timetable data of a date by filtering the connections of the trips available at the date.
+
+        The stops and footpaths are shared by all ConnectionScanData created from this CompiledFeed.
+
+        Args:
+            desired_date (date): date on which the timetable data is created.
+            validation_level (:obj:`ValidationLevel`, optional): consistency checks of ConnectionScanData.
+            Default is ValidationLevel.NONE (the compiled connections refer to the stops and trips by index,
+            i.e. they are consistent by construction).
+
+        Returns:
+            ConnectionScanData: timetable data of the date.
+        """
+        log_start("creating ConnectionScanData of {} from compiled feed".format(desired_date), log)
+        if self.get_day_index(desired_date) is None:
+            log.warning("{} is not within the feed period ({} days from {})".format(
+                desired_date, self.nb_days, self.first_date))
+        trip_available = self.get_trip_available_at_date(desired_date)
+        available_trip_indices = self.read_trip_indices[trip_available[self.read_trip_indices]]
+        is_available = trip_available[self.trip_indices]
+        stop_ids = list(self.stops_per_id.keys())
+        trip_ids = [self.trip_ids[trip_index] for trip_index in available_trip_indices.tolist()]
+
+        # trip index in the timetable data of the date per trip index
+        trip_indices = np.full(len(self.trip_ids), -1, dtype=np.int32)
+        trip_indices[available_trip_indices] = np.arange(len(available_trip_indices), dtype=np.int32)
+        trip_indices = trip_indices[self.trip_indices[is_available]]
+        from_stop_indices = self.from_stop_indices[is_available]
+        to_stop_indices = self.to_stop_indices[is_available]
+        dep_times = self.dep_times[is_available]
+        arr_times = self.arr_times[is_available]
+
+        connections = [Connection(trip_ids[trip_index], stop_ids[from_stop_index], stop_ids[to_stop_index],
+                                  dep_time, arr_time)
+                       for trip_index, from_stop_index, to_stop_index, dep_time, arr_time in zip(
+                           trip_indices.tolist(), from_stop_indices.tolist(), to_stop_indices.tolist(),
+                           dep_times.tolist(), arr_times.tolist())]
+        first_positions = np.searchsorted(trip_indices, np.arange(len(trip_ids) + 1)).tolist()
+        trips_per_id = {trip_id: Trip(trip_id, connections[first_positions[ind]:first_positions[ind + 1]],
+                                      self.trip_types[trip_index])
+                        for ind, (trip_id, trip_index) in enumerate(zip(trip_ids, available_trip_indices.tolist()))}
+
+        # stable sort by (dep_time, arr_time), i.e. the same order as in ConnectionScanData
+        order = np.lexsort((arr_times, dep_times))
+        columnar_store = {
+            "sorted_connections": [connections[ind] for ind in order.tolist()],
+            "dep_times": dep_times[order],
+            "arr_times": arr_times[order],
+            "from_stop_indices": from_stop_indices[order],
+            "to_stop_indices": to_stop_indices[order],
+            "trip_indices": trip_indices[order],
+        }
+        columnar_store["connection_indices_by_arr_time"], columnar_store["first_connection_index_per_minute"] = \
+            create_connection_time_indexes(columnar_store["dep_times"], columnar_store["arr_times"])
+        cs_data = ConnectionScanData(self.stops_per_id, self.footpaths_per_from_to_stop_id, trips_per_id,
+                                     columnar_store, validation_level)
+        log_end(additional_message="{}".format(cs_data))
+        return cs_data
+
+    def __str__(self):
+        res = "CompiledFeed: "
+        res += "# stops: {}, ".format(len(self.stops_per_id))
+        res += "# footpaths: {}, ".format(len(self.footpaths_per_from_to_stop_id))
+        res += "# services: {}, ".format(len(self.service_ids))
+        res += "# trips: {}, ".format(len(self.read_trip_indices))
+        res += "# connections: {}, ".format(len(self.trip_indices))
+        res += "feed period: {} days from {}".format(self.nb_days, self.first_date)
+        return res
+
+
+def compile_gtfs(
+        path_to_gtfs_zip,
+        add_beeline_footpaths=True,
+        beeline_distance=100.0,
+        walking_speed=2.0 / 3.6,
+        make_footpaths_transitive=False,
+        stop_times_chunk_size=DEFAULT_STOP_TIMES_CHUNK_SIZE,
+        nb_processes=1,
+        beeline_metric=BeelineMetric.MERCATOR,
+        max_transitive_walking_time=None
+):
+    """Parses a gtfs-file once and returns the date-independent compiled feed.
+
+    Args:
+        path_to_gtfs_zip (str): path to the gtfs-file.
+        add_beeline_footpaths (obj:`bool`, optional): see parse_gtfs.
+        beeline_distance (obj:`float`, optional): see parse_gtfs.
+        walking_speed (obj:`float`, optional): see parse_gtfs.
+        make_footpaths_transitive (obj:`bool`, optional): see parse_gtfs.
+        stop_times_chunk_size (obj:`int`, optional): number of rows of stop_times.txt per chunk
+        (see read_stop_times_in_chunks). Default is DEFAULT_STOP_TIMES_CHUNK_SIZE.
+        nb_processes (obj:`int`, optional): number of processes converting the chunks of stop_times.txt. Default is 1.
+        beeline_metric (obj:`BeelineMetric`, optional): see parse_gtfs.
+        max_transitive_walking_time (obj:`float`, optional): see parse_gtfs.
+
+    Returns:
+        CompiledFeed: compiled feed.
+    """
+    with log_span("compiling gtfs-file {}".format(path_to_gtfs_zip), log) as span:
+        with ZipFile(path_to_gtfs_zip, "r") as zip_file:
+            stops_per_id = parse_stops(zip_file)
+            footpaths_per_from_to_stop_id = create_footpaths(zip_file, stops_per_id, add_beeline_footpaths,
+                                                             beeline_distance, walking_speed, make_footpaths_transitive,
+                                                             beeline_metric, max_transitive_walking_time)
+
+            with log_span("parsing calendar.txt and calendar_dates.txt", log) as calendar_span:
+                first_date, nb_days, service_ids, service_validity = get_service_validity(zip_file)
+                calendar_span.set_additional_message("# services: {}, feed period: {} days from {}".format(
+                    len(service_ids), nb_days, first_date))
+
+            log_start("parsing trips.txt and routes.txt", log)
+            service_index_per_id = {service_id: ind for ind, service_id in enumerate(service_ids)}
+            route_type_per_route_id = get_route_type_per_route_id(zip_file)
+            trip_ids = []
+            service_indices = []
+            trip_types = []
+            with zip_file.open("trips.txt", "r") as gtfs_file:  # required
+                reader = csv.reader(TextIOWrapper(gtfs_file, ENCODING))
+                header = next(reader)
+                trip_id_index = header.index("trip_id")  # required
+                service_id_index = header.index("service_id")  # required
+                route_id_index = header.index("route_id")  # required
+                for row in reader:
+                    trip_ids += [row[trip_id_index]]
+                    service_indices += [service_index_per_id.get(row[service_id_index], -1)]
+                    trip_types += [get_trip_type(route_type_per_route_id[row[route_id_index]])]
+            service_index_per_trip_index = np.array(service_indices, dtype=np.int32)
+            nb_trips_without_service = int(np.sum(service_index_per_trip_index < 0))
+            if nb_trips_without_service > 0:
+                log.warning("{} trips have a service_id which is neither defined in calendar.txt nor in "
+                            "calendar_dates.txt, these trips are never available".format(nb_trips_without_service))
+            log_end(additional_message="# trips: {}".format(len(trip_ids)))
+
+            with log_span("parsing stop_times.txt in chunks of {} rows".format(stop_times_chunk_size),
+                          log) as stop_times_span:
+                with zip_file.open("stop_times.txt", "r") as gtfs_file:  # required
+                    trip_indices, from_stop_indices, to_stop_indices, dep_times, arr_times, read_trip_indices = \
+                        read_stop_times_in_chunks(gtfs_file, {stop_id: ind for ind, stop_id in enumerate(stops_per_id)},
+                                                  {trip_id: ind for ind, trip_id in enumerate(trip_ids)},
+                                                  stop_times_chunk_size, nb_processes)
+                # group the connections by trip in the order of the first occurrence of the trips
+                position_per_trip_index = np.zeros(len(trip_ids), dtype=np.int32)
+                position_per_trip_index[read_trip_indices] = np.arange(len(read_trip_indices), dtype=np.int32)
+                order = np.argsort(position_per_trip_index[trip_indices], kind="stable")
+                stop_times_span.set_additional_message("# connections: {}".format(len(order)))
+
+        compiled_feed = CompiledFeed(stops_per_id, footpaths_per_from_to_stop_id, first_date, nb_days, service_ids,
+                                     np.packbits(service_validity, axis=1), trip_ids, service_index_per_trip_index,
+                                     trip_types, trip_indices[order], from_stop_indices[order], to_stop_indices[order],
+                                     dep_times[order], arr_times[order], read_trip_indices)
+        span.set_additional_message("{}".format(compiled_feed))
+    return compiled_feed
+
+
+def get_service_validity(zip_file):
+    """Parses calendar.txt and calendar_dates.txt and returns the validity of every service over the feed period.
+
+    The feed period starts at the first and ends at the last date occurring in calendar.txt or calendar_dates.txt.
+
+    Args:
+        zip_file (ZipFile): gtfs-file.
+
+    Returns:
+        tuple: first date of the feed period (None if there are no dates), number of days of the feed period,
+        service id's and an ndarray of shape (# services, # days) which is True if the service is available at the day.
+    """
+    calendar_rows = []  # (service_id, start_date, end_date, available per weekday)
+    with zip_file.open("calendar.txt", "r") as gtfs_file:  # conditionally required, but we assume that the file exists
+        reader = csv.reader(TextIOWrapper(gtfs_file, ENCODING))
+        header = next(reader)
+        service_id_index = header.index("service_id")  # required
+        weekday_indices = [header.index(weekday_column) for weekday_column in WEEKDAY_COLUMNS]  # required
+        start_date_index = header.index("start_date")  # required
+        end_date_index = header.index("end_date")  # required
+        for row in reader:
+            calendar_rows += [(row[service_id_index], parse_yymmdd(row[start_date_index]),
+                               parse_yymmdd(row[end_date_index]), [row[ind] == "1" for ind in weekday_indices])]
+
+    calendar_date_rows = []  # (service_id, date, is_available)
+    if "calendar_dates.txt" in zip_file.namelist():
+        with zip_file.open("calendar_dates.txt", "r") as gtfs_file:  # conditionally required
+            reader = csv.reader(TextIOWrapper(gtfs_file, ENCODING))
+            header = next(reader)
+            service_id_index = header.index("service_id")  # required
+            date_index = header.index("date")  # required
+            exception_type_index = header.index("exception_type")  # required
+            for row in reader:
+                exception_type = row[exception_type_index]
+                if exception_type not in ("1", "2"):
+                    raise ValueError("as exception_type only 1 or 2 are permitted, but is: {}".format(exception_type))
+                calendar_date_rows += [(row[service_id_index], parse_yymmdd(row[date_index]), exception_type == "1")]
+
+    service_ids = list(dict.fromkeys([r[0] for r in calendar_rows] + [r[0] for r in calendar_date_rows]))
+    all_dates = [d for r in calendar_rows for d in r[1:3]] + [r[1] for r in calendar_date_rows]
+    if not all_dates:
+        return None, 0, service_ids, np.zeros((len(service_ids), 0), dtype=bool)
+    first_date = min(all_dates)
+    nb_days = (max(all_dates) - first_date).days + 1
+    service_index_per_id = {service_id: ind for ind, service_id in enumerate(service_ids)}
+    weekday_per_day = (first_date.weekday() + np.arange(nb_days)) % 7
+    service_validity = np.zeros((len(service_ids), nb_days), dtype=bool)
+    for service_id, start_date, end_date, available_per_weekday in calendar_rows:
+        validity = np.array(available_per_weekday, dtype=bool)[weekday_per_day]
+        validity[:(start_date - first_date).days] = False
+        validity[(end_date - first_date).days + 1:] = False
+        service_validity[service_index_per_id[service_id]] = validity
+    for service_id, date_, is_available in calendar_date_rows:
+        service_validity[service_index_per_id[service_id], (date_ - first_date).days] = is_available
+    return first_date, nb_days, service_ids, service_validity
@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This module provides the scan kernels of the connection scan algorithm working on the columnar connection store.
+
+The kernels are compiled with numba (https://numba.pydata.org/) if numba is installed.
+Otherwise they are plain Python functions and NUMBA_AVAILABLE is False.
+"""
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba is optional
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """Replacement for numba.njit if numba is not installed: the function is returned uncompiled."""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fun: fun
+
+
+@njit(cache=True)
+def scan_optimized_earliest_arrival(
+        dep_times,
+        arr_times,
+        from_stop_indices,
+        to_stop_indices,
+        trip_indices,
+        footpath_first_indices,
+        footpath_to_stop_indices,
+        footpath_walking_times,
+        nb_trips,
+        from_stop_index,
+        to_stop_index,
+        desired_dep_time,
+        first_connection_index,
+        max_arr_time):
+    """Kernel of the optimized earliest arrival with reconstruction version of the connection scan algorithm
+    (the same logic as ConnectionScanCore.scan_earliest_arrival with optimized=True).
+
+    The footpaths are given in compressed sparse row format: the outgoing footpaths of the stop with index i are
+    the footpaths with position footpath_first_indices[i], ..., footpath_first_indices[i + 1] - 1.
+
+    A journey leg is described by the position of its in connection, its out connection and its footpath,
+    where -1 marks a missing part.
+
+    Args:
+        dep_times (ndarray): departure time per connection.
+        arr_times (ndarray): arrival time per connection.
+        from_stop_indices (ndarray): index of the from stop per connection.
+        to_stop_indices (ndarray): index of the to stop per connection.
+        trip_indices (ndarray): index of the trip per connection.
+        footpath_first_indices (ndarray): position of the first outgoing footpath per stop index
+        (the last entry is the number of footpaths).
+        footpath_to_stop_indices (ndarray): index of the to stop per footpath.
+        footpath_walking_times (ndarray): walking time per footpath.
+        nb_trips (int): number of trips.
+        from_stop_index (int): index of the source stop.
+        to_stop_index (int): index of the target stop.
+        desired_dep_time (float): desired departure time in seconds after midnight.
+        first_connection_index (int): index of the first connection to scan (starting criterion).
+        max_arr_time (float): arrival time used for stops which are not reachable.
+
+    Returns:
+        tuple: earliest arrival time at the target stop, journey leg reaching the target stop (as array of length 3),
+        position of the in connection, out connection and footpath of the journey leg per stop index.
+    """
+    nb_stops = len(footpath_first_indices) - 1
+    earliest_arrival_per_stop_index = np.full(nb_stops, max_arr_time)
+    vehicle_arrival_per_stop_index = np.full(nb_stops, max_arr_time)
+    in_connection_per_stop_index = np.full(nb_stops, -1, dtype=np.int64)
+    out_connection_per_stop_index = np.full(nb_stops, -1, dtype=np.int64)
+    footpath_per_stop_index = np.full(nb_stops, -1, dtype=np.int64)
+    in_connection_index_per_trip_index = np.full(nb_trips, -1, dtype=np.int64)
+    journey_leg_target = np.full(3, -1, dtype=np.int64)
+
+    earliest_arrival_per_stop_index[from_stop_index] = desired_dep_time
+    vehicle_arrival_per_stop_index[from_stop_index] = desired_dep_time
+    earliest_arrival_target = desired_dep_time if from_stop_index == to_stop_index else max_arr_time
+
+    for footpath_index in range(footpath_first_indices[from_stop_index], footpath_first_indices[from_stop_index + 1]):
+        walk_to_stop_index = footpath_to_stop_indices[footpath_index]
+        if walk_to_stop_index != from_stop_index:
+            arr_time_walk = desired_dep_time + footpath_walking_times[footpath_index]
+            if arr_time_walk < earliest_arrival_per_stop_index[walk_to_stop_index]:
+                earliest_arrival_per_stop_index[walk_to_stop_index] = arr_time_walk
+                footpath_per_stop_index[walk_to_stop_index] = footpath_index
+            if walk_to_stop_index == to_stop_index and arr_time_walk < earliest_arrival_target:
+                earliest_arrival_target = arr_time_walk
+                journey_leg_target[2] = footpath_index
+
+    for con_index in range(first_connection_index, len(dep_times)):
+        dep_time = dep_times[con_index]
+        if dep_time >= earliest_arrival_target:
+            break  # stopping criterion
+        trip_index = trip_indices[con_index]
+        in_connection_index = in_connection_index_per_trip_index[trip_index]
+        if in_connection_index >= 0 or earliest_arrival_per_stop_index[from_stop_indices[con_index]] <= dep_time:
+            if in_connection_index < 0:
+                in_connection_index = con_index
+                in_connection_index_per_trip_index[trip_index] = con_index
+            arr_time = arr_times[con_index]
+            con_to_stop_index = to_stop_indices[con_index]
+            if con_to_stop_index == to_stop_index and arr_time < earliest_arrival_target:
+                earliest_arrival_target = arr_time
+                journey_leg_target[0] = in_connection_index
+                journey_leg_target[1] = con_index
+                journey_leg_target[2] = -1
+            if arr_time >= vehicle_arrival_per_stop_index[con_to_stop_index]:
+                continue  # limited walking
+            vehicle_arrival_per_stop_index[con_to_stop_index] = arr_time
+            for footpath_index in range(footpath_first_indices[con_to_stop_index],
+                                        footpath_first_indices[con_to_stop_index + 1]):
+                walk_to_stop_index = footpath_to_stop_indices[footpath_index]
+                arr_time_walk = arr_time + footpath_walking_times[footpath_index]
+                if arr_time_walk < earliest_arrival_per_stop_index[walk_to_stop_index]:
+                    earliest_arrival_per_stop_index[walk_to_stop_index] = arr_time_walk
+                    in_connection_per_stop_index[walk_to_stop_index] = in_connection_index
+                    out_connection_per_stop_index[walk_to_stop_index] = con_index
+                    footpath_per_stop_index[walk_to_stop_index] = footpath_index
+                if walk_to_stop_index == to_stop_index and walk_to_stop_index != con_to_stop_index and \
+                        arr_time_walk < earliest_arrival_target:
+                    earliest_arrival_target = arr_time_walk
+                    journey_leg_target[0] = in_connection_index
+                    journey_leg_target[1] = con_index
+                    journey_leg_target[2] = footpath_index
+
+    return (earliest_arrival_target, journey_leg_target, in_connection_per_stop_index, out_connection_per_stop_index,
+            footpath_per_stop_index)
+
+
+@njit(cache=True)
+def scan_earliest_arrival_all_targets(
+        dep_times,
+        arr_times,
+        from_stop_indices,
+        to_stop_indices,
+        trip_indices,
+        footpath_first_indices,
+        footpath_to_stop_indices,
+        footpath_walking_times,
+        nb_trips,
+        from_stop_index,
+        desired_dep_time,
+        first_connection_index,
+        max_arr_time):
+    """Kernel of the one-to-all earliest arrival version of the connection scan algorithm
+    (the same logic as ConnectionScanCore.scan_earliest_arrival_all_targets).
+
+    See scan_optimized_earliest_arrival for the description of the arguments.
+
+    Returns:
+        ndarray: earliest arrival time per stop index (max_arr_time if the stop is not reachable).
+    """
+    nb_stops = len(footpath_first_indices) - 1
+    earliest_arrival_per_stop_index = np.full(nb_stops, max_arr_time)
+    arr_time_per_stop_index = np.full(nb_stops, max_arr_time)
+    vehicle_arrival_per_stop_index = np.full(nb_stops, max_arr_time)
+    trip_is_set_per_trip_index = np.zeros(nb_trips, dtype=np.bool_)
+
+    earliest_arrival_per_stop_index[from_stop_index] = desired_dep_time
+    arr_time_per_stop_index[from_stop_index] = desired_dep_time
+    vehicle_arrival_per_stop_index[from_stop_index] = desired_dep_time
+
+    for footpath_index in range(footpath_first_indices[from_stop_index], footpath_first_indices[from_stop_index + 1]):
+        walk_to_stop_index = footpath_to_stop_indices[footpath_index]
+        if walk_to_stop_index != from_stop_index:
+            arr_time_walk = desired_dep_time + footpath_walking_times[footpath_index]
+            if arr_time_walk < earliest_arrival_per_stop_index[walk_to_stop_index]:
+                earliest_arrival_per_stop_index[walk_to_stop_index] = arr_time_walk
+            if arr_time_walk < arr_time_per_stop_index[walk_to_stop_index]:
+                arr_time_per_stop_index[walk_to_stop_index] = arr_time_walk
+
+    for con_index in range(first_connection_index, len(dep_times)):
+        trip_index = trip_indices[con_index]
+        if trip_is_set_per_trip_index[trip_index] or \
+                earliest_arrival_per_stop_index[from_stop_indices[con_index]] <= dep_times[con_index]:
+            trip_is_set_per_trip_index[trip_index] = True
+            arr_time = arr_times[con_index]
+            con_to_stop_index = to_stop_indices[con_index]
+            if arr_time >= vehicle_arrival_per_stop_index[con_to_stop_index]:
+                continue  # limited walking
+            vehicle_arrival_per_stop_index[con_to_stop_index] = arr_time
+            if arr_time < arr_time_per_stop_index[con_to_stop_index]:
+                arr_time_per_stop_index[con_to_stop_index] = arr_time
+            for footpath_index in range(footpath_first_indices[con_to_stop_index],
+                                        footpath_first_indices[con_to_stop_index + 1]):
+                walk_to_stop_index = footpath_to_stop_indices[footpath_index]
+                arr_time_walk = arr_time + footpath_walking_times[footpath_index]
+                if arr_time_walk < earliest_arrival_per_stop_index[walk_to_stop_index]:
+                    earliest_arrival_per_stop_index[walk_to_stop_index] = arr_time_walk
+                if walk_to_stop_index != con_to_stop_index and \
+                        arr_time_walk < arr_time_per_stop_index[walk_to_stop_index]:
+                    arr_time_per_stop_index[walk_to_stop_index] = arr_time_walk
+
+    return arr_time_per_stop_index
@@ -0,0 +1,334 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This module provides the multi-criteria version of the connection scan algorithm
+optimizing the arrival time and the number of public transport legs (i.e. the number of transfers + 1)."""
+import logging
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from scripts.classes import Journey, JourneyLeg
+from scripts.connectionscan_router import ConnectionScanCore, get_query_message
+from scripts.helpers.my_logging import log_end, log_start
+
+log = logging.getLogger(__name__)
+
+# Label of a Pareto bag: the journey arrives at arr_time with nb_pt_legs public transport legs.
+# journey_leg is the journey leg pointer (in_connection_index, out_connection_index, footpath) of the last journey leg
+# (see ConnectionScanCore.scan_earliest_arrival) and boarding_label the label used to board in_connection
+# (None for the label at the source stop).
+McLabel = namedtuple("McLabel", ["arr_time", "nb_pt_legs", "journey_leg", "boarding_label"])
+
+
+class McConnectionScanCore:
+    """Container for the multi-criteria routing instance.
+
+    The router scans the columnar connection store of connection_scan_data once and keeps a Pareto bag of labels
+    (arrival time, number of public transport legs) per stop instead of a single earliest arrival time.
+
+    Args and attributes:
+        connection_scan_data (ConnectionScanData): timetable data belong to this routing instance.
+
+    Additional attributes:
+        connection_scan_core (ConnectionScanCore): single-criterion routing instance on the same data
+        (used for the footpaths per stop index and the starting criterion).
+    """
+
+    def __init__(self, connection_scan_data):
+        self.connection_scan_data = connection_scan_data
+        self.connection_scan_core = ConnectionScanCore(connection_scan_data)
+
+    def route_pareto_earliest_arrival(self, from_stop_id, to_stop_id, desired_dep_time, max_nb_transfers=None):
+        """Executes the multi-criteria earliest arrival version of the connection scan algorithm
+        from the source to the target stop.
+
+        The result is the Pareto set of the journeys with respect to (early arrival time, few public transport legs),
+        i.e. for every journey there is no other journey which arrives not later and has not more legs.
+        A journey consisting of a footpath only (without public transport) has 0 public transport legs.
+
+        Args:
+            from_stop_id (str): id of the source stop.
+            to_stop_id (str): id of the target stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+            max_nb_transfers (:obj:`int`, optional): maximal number of transfers. Default is None (no limit).
+
+        Returns:
+            list: Journey's of the Pareto set sorted by arrival time (i.e. with decreasing number of legs).
+            The list is empty if the source stop equals the target stop or the target stop is not reachable.
+        """
+        log_start(get_query_message, log, "multi-criteria earliest arrival routing",
+                  self.connection_scan_data.stops_per_id[from_stop_id],
+                  self.connection_scan_data.stops_per_id[to_stop_id],
+                  desired_dep_time)
+        stop_id_registry = self.connection_scan_data.stop_id_registry
+        from_stop_index = stop_id_registry.get_index(from_stop_id)
+        to_stop_index = stop_id_registry.get_index(to_stop_id)
+        res = []
+        if from_stop_index != to_stop_index:
+            labels = self.scan_pareto_earliest_arrival(from_stop_index, to_stop_index, desired_dep_time,
+                                                       max_nb_transfers)
+            res = [self.reconstruct_journey(label) for label in labels]
+        log_end("# journeys: {}", len(res))
+        return res
+
+    def scan_pareto_earliest_arrival(self, from_stop_index, to_stop_index, desired_dep_time, max_nb_transfers=None):
+        """Scans the columnar connection store of the ConnectionScanData once
+        for the Pareto set of (arrival time, number of public transport legs) at the target stop.
+
+        A bag is a list of McLabel's sorted by increasing arrival time and decreasing number of legs.
+        The bag of a stop contains the labels including the transfer/walking times (i.e. the times when a trip
+        can be boarded at the stop), whereas the bag of the target stop contains the arrival times at the target stop.
+
+        Args:
+            from_stop_index (int): index of the source stop.
+            to_stop_index (int): index of the target stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+            max_nb_transfers (:obj:`int`, optional): maximal number of transfers. Default is None (no limit).
+
+        Returns:
+            list: McLabel's of the Pareto set at the target stop sorted by arrival time.
+        """
+        cs_data = self.connection_scan_data
+        cs_core = self.connection_scan_core
+        nb_stops = len(cs_data.stop_id_registry)
+        max_nb_pt_legs = max_nb_transfers + 1 if max_nb_transfers is not None else len(cs_data.trip_id_registry)
+        # flat lists indexed by the stop and trip indices
+        bag_per_stop_index = [[] for _ in range(nb_stops)]
+        arr_times_per_stop_index = [[] for _ in range(nb_stops)]  # arrival times of the bags (for bisect)
+        boarding_per_trip_index = [None] * len(cs_data.trip_id_registry)  # (nb_pt_legs, in_con, boarding_label)
+        target_bag = []
+        target_arr_times = []
+        earliest_arrival_target_one_leg = cs_core.MAX_ARR_TIME_VALUE  # with at most one public transport leg
+
+        source_label = McLabel(desired_dep_time, 0, None, None)
+        insert_into_bag(bag_per_stop_index[from_stop_index], arr_times_per_stop_index[from_stop_index], source_label)
+        for walk_to_stop_index, walking_time, footpath in cs_core.outgoing_footpaths_per_stop_index[from_stop_index]:
+            if walk_to_stop_index != from_stop_index:
+                label = McLabel(desired_dep_time + walking_time, 0, (None, None, footpath), source_label)
+                insert_into_bag(bag_per_stop_index[walk_to_stop_index], arr_times_per_stop_index[walk_to_stop_index],
+                                label)
+                if walk_to_stop_index == to_stop_index:
+                    insert_into_bag(target_bag, target_arr_times, label)
+                    earliest_arrival_target_one_leg = label.arr_time
+
+        first_connection_index = cs_core.get_first_connection_index(desired_dep_time)
+        for con_index, (dep_time, arr_time, con_from_stop_index, con_to_stop_index, trip_index) in enumerate(zip(
+                cs_data.dep_times[first_connection_index:],
+                cs_data.arr_times[first_connection_index:],
+                cs_data.from_stop_indices[first_connection_index:],
+                cs_data.to_stop_indices[first_connection_index:],
+                cs_data.trip_indices[first_connection_index:]), first_connection_index):
+            if dep_time >= earliest_arrival_target_one_leg:
+                break  # stopping criterion: every journey boarding this connection is dominated
+            # boarding the trip with the fewest legs possible
+            boarding = boarding_per_trip_index[trip_index]
+            nb_labels = bisect_right(arr_times_per_stop_index[con_from_stop_index], dep_time)
+            if nb_labels > 0:
+                boarding_label = bag_per_stop_index[con_from_stop_index][nb_labels - 1]
+                if boarding_label.nb_pt_legs < max_nb_pt_legs and \
+                        (boarding is None or boarding_label.nb_pt_legs + 1 < boarding[0]):
+                    boarding = (boarding_label.nb_pt_legs + 1, con_index, boarding_label)
+                    boarding_per_trip_index[trip_index] = boarding
+            if boarding is None:
+                continue
+            nb_pt_legs, in_connection_index, boarding_label = boarding
+            if is_dominated(target_bag, target_arr_times, arr_time, nb_pt_legs):
+                continue  # target pruning
+            if con_to_stop_index == to_stop_index:
+                insert_into_bag(target_bag, target_arr_times,
+                                McLabel(arr_time, nb_pt_legs, (in_connection_index, con_index, None), boarding_label))
+                if nb_pt_legs <= 1:
+                    earliest_arrival_target_one_leg = min(earliest_arrival_target_one_leg, arr_time)
+            for walk_to_stop_index, walking_time, footpath in \
+                    cs_core.outgoing_footpaths_per_stop_index[con_to_stop_index]:
+                label = McLabel(arr_time + walking_time, nb_pt_legs, (in_connection_index, con_index, footpath),
+                                boarding_label)
+                insert_into_bag(bag_per_stop_index[walk_to_stop_index], arr_times_per_stop_index[walk_to_stop_index],
+                                label)
+                if walk_to_stop_index == to_stop_index and walk_to_stop_index != con_to_stop_index:
+                    insert_into_bag(target_bag, target_arr_times, label)
+                    if nb_pt_legs <= 1:
+                        earliest_arrival_target_one_leg = min(earliest_arrival_target_one_leg, label.arr_time)
+        return target_bag
+
+    def reconstruct_journey(self, label):
+        """Reconstructs the journey from a label collected in scan_pareto_earliest_arrival.
+
+        Args:
+            label (McLabel): the label at the target stop.
+
+        Returns:
+            Journey: the reconstructed journey.
+        """
+        sorted_connections = self.connection_scan_data.sorted_connections
+        journey = Journey()
+        while label.journey_leg is not None:
+            in_connection_index, out_connection_index, footpath = label.journey_leg
+            if in_connection_index is None:
+                journey.prepend_journey_leg(JourneyLeg(None, None, footpath))
+            else:
+                journey.prepend_journey_leg(JourneyLeg(sorted_connections[in_connection_index],
+                                                       sorted_connections[out_connection_index],
+                                                       footpath))
+            label = label.boarding_label
+        return journey
+
+    def route_pareto_earliest_arrival_by_repeated_scans(self, from_stop_id, to_stop_id, desired_dep_time,
+                                                        max_nb_transfers=None):
+        """Computes the same Pareto set as route_pareto_earliest_arrival (without reconstruction)
+        with repeated single-criterion scans.
+
+        The k-th scan computes the earliest arrival times with at most k public transport legs: a trip can only
+        be boarded at a stop with the earliest arrival time of the (k - 1)-th scan.
+        The scans are repeated until no stop improves (or the maximal number of transfers is reached).
+
+        Note:
+            this router is the reference for the multi-criteria router and is used in benchmark_mc_router.
+
+        Args:
+            from_stop_id (str): id of the source stop.
+            to_stop_id (str): id of the target stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+            max_nb_transfers (:obj:`int`, optional): maximal number of transfers. Default is None (no limit).
+
+        Returns:
+            tuple: list of (arr_time, nb_pt_legs)-tuples of the Pareto set sorted by arrival time
+            and number of single-criterion scans.
+        """
+        cs_data = self.connection_scan_data
+        cs_core = self.connection_scan_core
+        from_stop_index = cs_data.stop_id_registry.get_index(from_stop_id)
+        to_stop_index = cs_data.stop_id_registry.get_index(to_stop_id)
+        if from_stop_index == to_stop_index:
+            return [], 0
+        max_arr_time = cs_core.MAX_ARR_TIME_VALUE
+        max_nb_pt_legs = max_nb_transfers + 1 if max_nb_transfers is not None else len(cs_data.trip_id_registry)
+        nb_stops = len(cs_data.stop_id_registry)
+
+        earliest_arrival_per_stop_index = [max_arr_time] * nb_stops  # with at most k - 1 legs
+        earliest_arrival_per_stop_index[from_stop_index] = desired_dep_time
+        earliest_arrival_target = max_arr_time
+        for walk_to_stop_index, walking_time, _ in cs_core.outgoing_footpaths_per_stop_index[from_stop_index]:
+            if walk_to_stop_index != from_stop_index:
+                earliest_arrival_per_stop_index[walk_to_stop_index] = min(
+                    earliest_arrival_per_stop_index[walk_to_stop_index], desired_dep_time + walking_time)
+                if walk_to_stop_index == to_stop_index:
+                    earliest_arrival_target = desired_dep_time + walking_time
+        res = [(earliest_arrival_target, 0)] if earliest_arrival_target < max_arr_time else []
+
+        first_connection_index = cs_core.get_first_connection_index(desired_dep_time)
+        nb_scans = 0
+        while nb_scans < max_nb_pt_legs:
+            nb_scans += 1
+            new_earliest_arrival_per_stop_index = list(earliest_arrival_per_stop_index)  # with at most k legs
+            trip_is_set_per_trip_index = [False] * len(cs_data.trip_id_registry)
+            for dep_time, arr_time, con_from_stop_index, con_to_stop_index, trip_index in zip(
+                    cs_data.dep_times[first_connection_index:],
+                    cs_data.arr_times[first_connection_index:],
+                    cs_data.from_stop_indices[first_connection_index:],
+                    cs_data.to_stop_indices[first_connection_index:],
+                    cs_data.trip_indices[first_connection_index:]):
+                if dep_time >= earliest_arrival_target:
+                    break  # stopping criterion
+                if trip_is_set_per_trip_index[trip_index] or \
+                        earliest_arrival_per_stop_index[con_from_stop_index] <= dep_time:
+                    trip_is_set_per_trip_index[trip_index] = True
+                    if con_to_stop_index == to_stop_index and arr_time < earliest_arrival_target:
+                        earliest_arrival_target = arr_time
+                    for walk_to_stop_index, walking_time, _ in \
+                            cs_core.outgoing_footpaths_per_stop_index[con_to_stop_index]:
+                        arr_time_walk = arr_time + walking_time
+                        if arr_time_walk < new_earliest_arrival_per_stop_index[walk_to_stop_index]:
+                            new_earliest_arrival_per_stop_index[walk_to_stop_index] = arr_time_walk
+                        if walk_to_stop_index == to_stop_index and walk_to_stop_index != con_to_stop_index and \
+                                arr_time_walk < earliest_arrival_target:
+                            earliest_arrival_target = arr_time_walk
+            if earliest_arrival_target < max_arr_time and (not res or earliest_arrival_target < res[-1][0]):
+                res += [(earliest_arrival_target, nb_scans)]
+            if new_earliest_arrival_per_stop_index == earliest_arrival_per_stop_index:
+                break  # no stop improved
+            earliest_arrival_per_stop_index = new_earliest_arrival_per_stop_index
+        return [(int(arr_time), nb_pt_legs) for arr_time, nb_pt_legs in reversed(res)], nb_scans
+
+
+def is_dominated(bag, arr_times, arr_time, nb_pt_legs):
+    """Checks if (arr_time, nb_pt_legs) is dominated by a label of the bag.
+
+    Args:
+        bag (list): McLabel's sorted by increasing arrival time and decreasing number of legs.
+        arr_times (list): arrival times of the labels in bag.
+        arr_time (int): arrival time.
+        nb_pt_legs (int): number of public transport legs.
+
+    Returns:
+        bool: True if there is a label arriving not later with not more legs, else False.
+    """
+    nb_labels = bisect_right(arr_times, arr_time)
+    return nb_labels > 0 and bag[nb_labels - 1].nb_pt_legs <= nb_pt_legs
+
+
+def insert_into_bag(bag, arr_times, label):
+    """Inserts the label into the bag if it is not dominated and removes the labels dominated by the label.
+
+    Args:
+        bag (list): McLabel's sorted by increasing arrival time and decreasing number of legs.
+        arr_times (list): arrival times of the labels in bag.
+        label (McLabel): the label to insert.
+
+    Returns:
+        bool: True if the label was inserted, else False.
+    """
+    if is_dominated(bag, arr_times, label.arr_time, label.nb_pt_legs):
+        return False
+    position = bisect_left(arr_times, label.arr_time)
+    end = position
+    while end < len(bag) and bag[end].nb_pt_legs >= label.nb_pt_legs:
+        end += 1
+    bag[position:end] = [label]
+    arr_times[position:end] = [label.arr_time]
+    return True
+
+
+def benchmark_mc_router(connection_scan_data, queries, max_nb_transfers=None):
+    """Benchmarks the multi-criteria router against repeated single-criterion scans
+    (see McConnectionScanCore.route_pareto_earliest_arrival_by_repeated_scans).
+
+    Args:
+        connection_scan_data (ConnectionScanData): timetable data.
+        queries (list): (from_stop_id, to_stop_id, desired_dep_time)-tuples.
+        max_nb_transfers (:obj:`int`, optional): maximal number of transfers. Default is None (no limit).
+
+    Returns:
+        dict: number of queries, number of Pareto journeys, number of single-criterion scans,
+        total running time in seconds of both routers and the speedup of the multi-criteria router.
+    """
+    log_start("benchmarking multi-criteria router with {} queries".format(len(queries)), log)
+    mc_core = McConnectionScanCore(connection_scan_data)
+    # the routers log every query, which would distort the measurement
+    logging.disable(logging.INFO)
+    try:
+        start_time = time.perf_counter()
+        nb_journeys = sum(len(mc_core.scan_pareto_earliest_arrival(
+            connection_scan_data.stop_id_registry.get_index(from_stop_id),
+            connection_scan_data.stop_id_registry.get_index(to_stop_id),
+            desired_dep_time,
+            max_nb_transfers)) for from_stop_id, to_stop_id, desired_dep_time in queries if from_stop_id != to_stop_id)
+        time_mc = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        nb_scans = sum(mc_core.route_pareto_earliest_arrival_by_repeated_scans(
+            from_stop_id, to_stop_id, desired_dep_time, max_nb_transfers)[1]
+                       for from_stop_id, to_stop_id, desired_dep_time in queries)
+        time_repeated_scans = time.perf_counter() - start_time
+    finally:
+        logging.disable(logging.NOTSET)
+    res = {
+        "nb_queries": len(queries),
+        "nb_journeys": nb_journeys,
+        "nb_single_criterion_scans": nb_scans,
+        "time_mc": time_mc,
+        "time_repeated_scans": time_repeated_scans,
+        "speedup": time_repeated_scans / time_mc if time_mc > 0 else float("inf"),
+    }
+    log_end(additional_message=", ".join("{}: {}".format(key, value) for key, value in res.items()))
+    return res
@@ -2,94 +2,155 @@
 # -*- coding: utf-8 -*-
 """This module defines the core data structures for the implementation of the connection scan algorithm."""
 import logging
+import time
+from bisect import bisect_right
 from collections import defaultdict
+from contextlib import contextmanager
+from enum import Enum
+from itertools import chain
+from operator import attrgetter, eq, itemgetter
 
-from scripts.classes import Journey, Footpath
-from scripts.helpers.funs import (hhmmss_to_sec, seconds_to_hhmmss)
-from scripts.helpers.my_logging import log_end, log_start
+import numpy as np
+
+from scripts.classes import Footpath, IdRegistry, Journey, JourneyLeg
+from scripts.connectionscan_kernels import (NUMBA_AVAILABLE, scan_earliest_arrival_all_targets,
+                                            scan_optimized_earliest_arrival)
+from scripts.helpers.funs import hhmmss_to_sec, seconds_to_hhmmss
+from scripts.helpers.my_logging import log_end, log_span, log_start
 
 log = logging.getLogger(__name__)
 
+# names of the array attributes of ConnectionScanData and ConnectionScanCore which can be precomputed (see snapshot.py)
+COLUMNAR_ARRAY_NAMES = ("dep_times", "arr_times", "from_stop_indices", "to_stop_indices", "trip_indices",
+                        "connection_indices_by_arr_time", "first_connection_index_per_minute")
+FOOTPATH_ARRAY_NAMES = ("footpath_first_indices", "footpath_to_stop_indices", "footpath_walking_times",
+                        "arr_times_by_arr_time")
+
+
+class ValidationLevel(Enum):
+    """Definition of the consistency checks performed during the creation of a ConnectionScanData object."""
+    FULL = 0  # all checks (incl. the check for transitivity of the footpaths), see check_connection_scan_data
+    FAST = 1  # set-based checks without transitivity check, see check_connection_scan_data_fast
+    NONE = 2  # no checks (only for already validated data, e.g. snapshots with a validation stamp)
+
 
 class ConnectionScanData:
     """Container for all timetable data.
     Designed so that the data can be used directly in the connection scan algorithm.
 
-    Note that during the creation of an object various consistency checks are performed.
+    Note that during the creation of an object various consistency checks are performed (see ValidationLevel).
     For example all stop id's occurring in footpaths or connections of trips must also occur in stops_per_id.
+    The sorting of the connections is skipped if a precomputed columnar store is passed
+    (e.g. when loading a snapshot, see snapshot.py).
 
     Args and attributes:
         stops_per_id (dict): stop per stop id.
         footpaths_per_from_to_stop_id (dict): footpath per (from_stop_id, to_stop_id)-tuple.
         trips_per_id (dict): trip per trip id.
+        columnar_store (:obj:`dict`, optional): sorted_connections and the arrays in COLUMNAR_ARRAY_NAMES
+        per attribute name. The arrays may be memory-mapped. Default is None (computed from trips_per_id).
+        validation_level (:obj:`ValidationLevel`, optional): consistency checks performed.
+        Default is ValidationLevel.FULL.
 
     Additional attributes:
         stops_per_name (dict): stop per stop name. If the name is not unique, the name is assigned the best fitting stop
         according to the following logic: (1. stop which is a station, 2. stop which has the shortest id).
         sorted_connections (list): connections in the timetable sorted by departure time in the from stop.
+        stop_id_registry (IdRegistry): dense index (0, ..., # stops - 1) per stop id and vice versa.
+        trip_id_registry (IdRegistry): dense index (0, ..., # trips - 1) per trip id and vice versa.
+        dep_times (ndarray): departure time (int32) per connection, sorted exactly like sorted_connections.
+        arr_times (ndarray): arrival time (int32) per connection, sorted exactly like sorted_connections.
+        from_stop_indices (ndarray): index of the from stop (int32) per connection,
+        sorted exactly like sorted_connections.
+        to_stop_indices (ndarray): index of the to stop (int32) per connection, sorted exactly like sorted_connections.
+        trip_indices (ndarray): index of the trip (int32) per connection, sorted exactly like sorted_connections.
+        connection_indices_by_arr_time (ndarray): indices (int32) of the connections in sorted_connections
+        sorted by (arr_time, dep_time).
+        first_connection_index_per_minute (ndarray): index (int32) of the first connection with dep_time >= 60 * m
+        per minute m (from 0 to the minute after the last departure).
+        validation_level (ValidationLevel): consistency checks performed during the creation
+        (recorded in the header of a snapshot as validation stamp).
     """
 
-    def __init__(self, stops_per_id, footpaths_per_from_to_stop_id, trips_per_id):
-        log_start("creating ConnectionScanData", log)
-        # stops
-        for stop_id, stop in stops_per_id.items():
-            if stop_id != stop.id:
-                raise ValueError("id in dict ({}) does not equal id in Stop {}".format(stop_id, stop))
-        self.stops_per_id = stops_per_id
-        stop_list_per_name = defaultdict(list)
-        for a_stop in self.stops_per_id.values():
-            stop_list_per_name[a_stop.name] += [a_stop]
-
-        def choose_best_stop(stops_with_same_name):
-            """Helper function for chosen the best fitting stop per stop name"""
-            stops_with_same_name_sorted = sorted(stops_with_same_name,
-                                                 key=lambda s: (0 if s.is_station else 1, len(s.id)))
-            return stops_with_same_name_sorted[0]
-
-        self.stops_per_name = {name: choose_best_stop(stop_list) for (name, stop_list) in stop_list_per_name.items()}
-
-        # footpaths
-        for ((from_stop_id, to_stop_id), footpath) in footpaths_per_from_to_stop_id.items():
-            if from_stop_id != footpath.from_stop_id:
-                raise ValueError(
-                    "from_stop_id {} in dict does not equal from_stop_id in footpath {}".format(from_stop_id, footpath))
-            if to_stop_id != footpath.to_stop_id:
-                raise ValueError(
-                    "to_stop_id {} in dict does not equal to_stop_id in footpath {}".format(to_stop_id, footpath))
-
-        stop_ids_in_footpaths = {s[0] for s in footpaths_per_from_to_stop_id.keys()}.union(
-            {s[1] for s in footpaths_per_from_to_stop_id.keys()})
-        stop_ids_in_footpaths_not_in_stops = stop_ids_in_footpaths.difference(set(stops_per_id.keys()))
-        if len(stop_ids_in_footpaths_not_in_stops) > 0:
-            raise ValueError(("there are stop_ids in footpaths_per_from_to_stop_id which do not occur as stop_id in "
-                              "stops_per_id: {}").format(
-                stop_ids_in_footpaths_not_in_stops))
-
-        self.footpaths_per_from_to_stop_id = footpaths_per_from_to_stop_id
+    def __init__(self, stops_per_id, footpaths_per_from_to_stop_id, trips_per_id, columnar_store=None,
+                 validation_level=ValidationLevel.FULL):
+        if not isinstance(validation_level, ValidationLevel):
+            raise ValueError("unknown validation level: {}".format(validation_level))
+        with log_span("creating ConnectionScanData", log) as span:
+            if validation_level == ValidationLevel.FULL:
+                check_connection_scan_data(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id)
+            elif validation_level == ValidationLevel.FAST:
+                check_connection_scan_data_fast(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id)
+            else:
+                log.info("consistency checks of ConnectionScanData are skipped")
+            self.validation_level = validation_level
+            self.stops_per_id = stops_per_id
+            self.stops_per_name = get_stops_per_name(stops_per_id)
+            self.footpaths_per_from_to_stop_id = footpaths_per_from_to_stop_id
+            self.trips_per_id = trips_per_id
+
+            if columnar_store is not None:
+                self.sorted_connections = columnar_store["sorted_connections"]
+                self.stop_id_registry = IdRegistry(stops_per_id.keys())
+                self.trip_id_registry = IdRegistry(trips_per_id.keys())
+                for name in COLUMNAR_ARRAY_NAMES:
+                    setattr(self, name, columnar_store[name])
+                span.set_additional_message("precomputed columnar store")
+                return
+
+            cons_in_trips = [t.connections for t in trips_per_id.values()]
+            self.sorted_connections = sorted([c for cons in cons_in_trips for c in cons],
+                                             key=lambda c: (c.dep_time, c.arr_time))
+
+            # columnar connection store (struct of arrays) for scanning the connections without attribute lookups
+            self.stop_id_registry = IdRegistry(stops_per_id.keys())
+            self.trip_id_registry = IdRegistry(trips_per_id.keys())
+            stop_index_per_id = self.stop_id_registry.index_per_id
+            trip_index_per_id = self.trip_id_registry.index_per_id
+            self.dep_times = np.array([c.dep_time for c in self.sorted_connections], dtype=np.int32)
+            self.arr_times = np.array([c.arr_time for c in self.sorted_connections], dtype=np.int32)
+            self.from_stop_indices = np.array([stop_index_per_id[c.from_stop_id] for c in self.sorted_connections],
+                                              dtype=np.int32)
+            self.to_stop_indices = np.array([stop_index_per_id[c.to_stop_id] for c in self.sorted_connections],
+                                            dtype=np.int32)
+            self.trip_indices = np.array([trip_index_per_id[c.trip_id] for c in self.sorted_connections],
+                                         dtype=np.int32)
+            self.connection_indices_by_arr_time, self.first_connection_index_per_minute = \
+                create_connection_time_indexes(self.dep_times, self.arr_times)
+
+    def get_first_connection_index(self, desired_dep_time):
+        """Returns the index of the first connection departing not before the desired departure time.
+
+        The minute of the desired departure time is looked up in first_connection_index_per_minute,
+        only the connections departing in this minute are searched.
 
-        new_footpaths, footpaths_with_time_change = check_for_transitivity(self.footpaths_per_from_to_stop_id)
-        if len(new_footpaths) > 0 or len(footpaths_with_time_change) > 0:
-            msg_str = "footpaths are not transitive: there are {} missing footpaths and {} footpaths" \
-                      " violating the triangle inequality"
-            log.warning(msg_str.format(len(new_footpaths), len(footpaths_with_time_change)))
+        Args:
+            desired_dep_time (int): desired departure time in seconds after midnight.
 
-        # trips
-        for trip_id, trip in trips_per_id.items():
-            if trip_id != trip.id:
-                raise ValueError("id in dict ({}) does not equal id in Trip {}".format(trip_id, trip))
+        Returns:
+            int: index of the first connection with dep_time >= desired_dep_time
+            (the number of connections if there is no such connection).
+        """
+        if desired_dep_time <= 0:
+            return 0
+        minute = int(desired_dep_time) // 60
+        if minute + 1 >= len(self.first_connection_index_per_minute):
+            return len(self.dep_times)
+        from_index = int(self.first_connection_index_per_minute[minute])
+        to_index = int(self.first_connection_index_per_minute[minute + 1])
+        return from_index + int(np.searchsorted(self.dep_times[from_index:to_index], desired_dep_time, side="left"))
+
+    def get_first_connection_indices(self, desired_dep_times):
+        """Vectorized version of get_first_connection_index for many desired departure times.
 
-        stop_ids_in_trips = {s for t in trips_per_id.values() for s in t.get_set_of_all_stop_ids()}
-        stop_ids_in_trips_not_in_stops = stop_ids_in_trips.difference(set(stops_per_id.keys()))
-        if len(stop_ids_in_trips_not_in_stops) > 0:
-            raise ValueError(
-                "there are stop_ids in trips_per_id which do not occur as stop_id in stops_per_id: {}".format(
-                    stop_ids_in_trips_not_in_stops))
-        self.trips_per_id = trips_per_id
+        Args:
+            desired_dep_times (list, ndarray): desired departure times in seconds after midnight.
 
-        cons_in_trips = [t.connections for t in trips_per_id.values()]
-        self.sorted_connections = sorted([c for cons in cons_in_trips for c in cons],
-                                         key=lambda c: (c.dep_time, c.arr_time))
-        log_end()
+        Returns:
+            ndarray: index (int64) of the first connection with dep_time >= desired_dep_time
+            per desired departure time.
+        """
+        return np.searchsorted(self.dep_times, np.asarray(desired_dep_times), side="left").astype(np.int64)
 
     def __str__(self):
         res = "ConnectionsScanData: "
@@ -100,68 +161,322 @@ class ConnectionScanData:
         return res
 
 
+class RoutingBackend(Enum):
+    """Definition of the backends executing the scans of the optimized earliest arrival and the one-to-all router."""
+    PYTHON = 0  # the scans implemented in ConnectionScanCore
+    NUMBA = 1  # the compiled kernels in connectionscan_kernels (if numba is installed)
+
+
+class ScanWorkspace:
+    """Preallocated dynamic data structures of the earliest arrival scans of ConnectionScanCore.
+
+    The flat lists are allocated once and reused by all queries scanned with this workspace.
+    Instead of reallocating the lists per query, a scan records the stop and trip indices it writes
+    and reset restores only these entries, i.e. the cost of a query does not depend on the number of stops and trips.
+
+    Args and attributes:
+        nb_stops (int): number of stops.
+        nb_trips (int): number of trips.
+        max_arr_time_value (int): initial arrival time per stop (see ConnectionScanCore.MAX_ARR_TIME_VALUE).
+
+    Additional attributes:
+        earliest_arrival_per_stop_index (list): earliest arrival per stop index (including transfer/walking times).
+        journey_leg_per_stop_index (list): journey leg pointer per stop index (None if not set).
+        vehicle_arrival_per_stop_index (list): earliest vehicle arrival per stop index (only used for limited walking).
+        in_connection_index_per_trip_index (list): index of the boarded connection per trip index
+        (-1 marks a trip which is not set).
+        touched_stop_indices (list): stop indices whose earliest arrival was written since the last reset
+        (with duplicates).
+        relaxed_stop_indices (list): stop indices whose vehicle arrival was improved since the last reset, i.e. whose
+        outgoing footpaths were relaxed (with duplicates, only used for limited walking).
+        touched_trip_indices (list): trip indices written since the last reset.
+        first_connection_index (int): index of the first connection of the last scan (starting criterion).
+        end_connection_index (int): index after the last connection of the last scan (stopping criterion).
+        nb_queries (int): number of queries scanned with this workspace.
+    """
+
+    def __init__(self, nb_stops, nb_trips, max_arr_time_value):
+        self.nb_stops = nb_stops
+        self.nb_trips = nb_trips
+        self.max_arr_time_value = max_arr_time_value
+        self.earliest_arrival_per_stop_index = [max_arr_time_value] * nb_stops
+        self.journey_leg_per_stop_index = [None] * nb_stops
+        self.vehicle_arrival_per_stop_index = [max_arr_time_value] * nb_stops
+        self.in_connection_index_per_trip_index = [-1] * nb_trips
+        self.touched_stop_indices = []
+        self.relaxed_stop_indices = []
+        self.touched_trip_indices = []
+        self.first_connection_index = 0
+        self.end_connection_index = 0
+        self.nb_queries = 0
+
+    def reset(self):
+        """Restores the initial values of the entries written since the last reset."""
+        earliest_arrival_per_stop_index = self.earliest_arrival_per_stop_index
+        journey_leg_per_stop_index = self.journey_leg_per_stop_index
+        vehicle_arrival_per_stop_index = self.vehicle_arrival_per_stop_index
+        for stop_index in self.touched_stop_indices:
+            earliest_arrival_per_stop_index[stop_index] = self.max_arr_time_value
+            journey_leg_per_stop_index[stop_index] = None
+            vehicle_arrival_per_stop_index[stop_index] = self.max_arr_time_value
+        for stop_index in self.relaxed_stop_indices:
+            vehicle_arrival_per_stop_index[stop_index] = self.max_arr_time_value
+        in_connection_index_per_trip_index = self.in_connection_index_per_trip_index
+        for trip_index in self.touched_trip_indices:
+            in_connection_index_per_trip_index[trip_index] = -1
+        self.touched_stop_indices.clear()
+        self.relaxed_stop_indices.clear()
+        self.touched_trip_indices.clear()
+
+    def start_query(self):
+        """Prepares the workspace for the next query (called at the start of each scan, see reset)."""
+        self.reset()
+        self.nb_queries += 1
+
+
+class ScanWorkspacePool:
+    """Pool of the ScanWorkspace's of a ConnectionScanCore.
+
+    A workspace is used by at most one query at the same time: acquire returns a free workspace
+    (creating a new one if all workspaces are in use) and release puts it back into the pool.
+    Since each worker process holds its own ConnectionScanCore (see travel_time_matrix.py and query_server.py),
+    it reuses the workspaces of its own pool.
+
+    Args and attributes:
+        nb_stops (int): number of stops.
+        nb_trips (int): number of trips.
+        max_arr_time_value (int): initial arrival time per stop (see ConnectionScanCore.MAX_ARR_TIME_VALUE).
+
+    Additional attributes:
+        free_workspaces (list): workspaces which are not in use.
+        nb_workspaces (int): number of workspaces created by this pool.
+    """
+
+    def __init__(self, nb_stops, nb_trips, max_arr_time_value):
+        self.nb_stops = nb_stops
+        self.nb_trips = nb_trips
+        self.max_arr_time_value = max_arr_time_value
+        self.free_workspaces = []
+        self.nb_workspaces = 0
+
+    def acquire(self):
+        """Returns a free workspace.
+
+        Returns:
+            ScanWorkspace: the workspace (to be released after the query).
+        """
+        try:
+            workspace = self.free_workspaces.pop()  # atomic, i.e. a workspace is never returned twice
+        except IndexError:
+            workspace = ScanWorkspace(self.nb_stops, self.nb_trips, self.max_arr_time_value)
+            self.nb_workspaces += 1
+        return workspace
+
+    def release(self, workspace):
+        """Puts a workspace returned by acquire back into the pool.
+
+        Args:
+            workspace (ScanWorkspace): the workspace.
+        """
+        self.free_workspaces.append(workspace)
+
+    @contextmanager
+    def acquired(self):
+        """Context manager acquiring a workspace and releasing it on exit.
+
+        Yields:
+            ScanWorkspace: the workspace.
+        """
+        workspace = self.acquire()
+        try:
+            yield workspace
+        finally:
+            self.release(workspace)
+
+
+class QueryStats:
+    """Statistics of a routing query (see the argument with_stats of the earliest arrival routers).
+
+    The statistics are derived from the state of the ScanWorkspace after the scan, i.e. the scans are not instrumented
+    and collecting the statistics costs nothing if they are not requested.
+    The connections outside [first_connection_index, end_connection_index) are skipped by the starting
+    and the stopping criterion.
+
+    Args and attributes:
+        router (str): name of the router.
+        first_connection_index (int): index of the first scanned connection (starting criterion).
+        end_connection_index (int): index after the last scanned connection (stopping criterion).
+        nb_connections (int): number of connections of the timetable data.
+        stopping_criterion_fired (bool): True if the scan was stopped by the stopping criterion, else False.
+        nb_trips_boarded (int): number of boarded trips (None if not available, e.g. with RoutingBackend.NUMBA).
+        nb_footpath_relaxations (int): number of relaxed footpaths (without loops at the source stop,
+        None if not available).
+        scan_time (float): wall time of the scan in seconds.
+        reconstruction_time (float): wall time of the journey reconstruction in seconds (0 without reconstruction).
+
+    Additional attributes:
+        nb_connections_scanned (int): number of scanned connections.
+        nb_connections_skipped (int): number of connections skipped by the starting and the stopping criterion.
+    """
+
+    def __init__(self, router, first_connection_index, end_connection_index, nb_connections, stopping_criterion_fired,
+                 nb_trips_boarded, nb_footpath_relaxations, scan_time, reconstruction_time=0.0):
+        self.router = router
+        self.first_connection_index = int(first_connection_index)
+        self.end_connection_index = int(end_connection_index)
+        self.nb_connections = nb_connections
+        self.stopping_criterion_fired = stopping_criterion_fired
+        self.nb_trips_boarded = nb_trips_boarded
+        self.nb_footpath_relaxations = nb_footpath_relaxations
+        self.scan_time = scan_time
+        self.reconstruction_time = reconstruction_time
+        self.nb_connections_scanned = self.end_connection_index - self.first_connection_index
+        self.nb_connections_skipped = nb_connections - self.nb_connections_scanned
+
+    def to_dict(self):
+        """Returns the statistics as json-serializable dict."""
+        return {name: getattr(self, name) for name in [
+            "router", "first_connection_index", "end_connection_index", "nb_connections", "nb_connections_scanned",
+            "nb_connections_skipped", "stopping_criterion_fired", "nb_trips_boarded", "nb_footpath_relaxations",
+            "scan_time", "reconstruction_time"]}
+
+    def __str__(self):
+        return ("QueryStats {}: scanned {} of {} connections from index {} (stopping criterion fired: {}), "
+                "# trips boarded: {}, # footpath relaxations: {}, scan: {:.6f}s, reconstruction: {:.6f}s").format(
+            self.router, self.nb_connections_scanned, self.nb_connections, self.first_connection_index,
+            self.stopping_criterion_fired, self.nb_trips_boarded, self.nb_footpath_relaxations, self.scan_time,
+            self.reconstruction_time)
+
+
 class ConnectionScanCore:
     """Container for the routing instance.
 
-    Note that connection_scan_data.sorted_connections is a list and not an specific typed array.
-    The performance when iterating over this list is therefore not optimal.
+    The routers scan the columnar connection store of connection_scan_data (dep_times, arr_times, from_stop_indices,
+    to_stop_indices and trip_indices) instead of the list sorted_connections.
+    The dynamic data structures of the routers are flat lists indexed by the stop and trip indices
+    of the id registries of connection_scan_data.
+    The lists of the earliest arrival scans are preallocated in ScanWorkspace's which are reused by the queries
+    (see workspace_pool).
+    The Connection objects are only used for the reconstruction of the journeys.
+
+    The scans of the optimized earliest arrival and the one-to-all router can be executed by compiled kernels
+    (see RoutingBackend).
+    If numba is not installed, the backend RoutingBackend.NUMBA falls back to RoutingBackend.PYTHON.
 
     Args and attributes:
         connection_scan_data (ConnectionScanData): timetable data belong to this routing instance.
+        backend (:obj:`RoutingBackend`, optional): default backend of the optimized earliest arrival
+        and the one-to-all router. Default is RoutingBackend.PYTHON.
+        footpath_store (:obj:`dict`, optional): precomputed arrays in FOOTPATH_ARRAY_NAMES per attribute name
+        (e.g. loaded from a snapshot, see snapshot.py). The arrays may be memory-mapped and must be consistent
+        with the order of connection_scan_data.footpaths_per_from_to_stop_id. Default is None (computed).
 
     Additional attributes:
-        stops_per_name (dict): stop per stop name. If the name is not unique, the name is assigned the best fitting stop
-        according to the following logic: (1. stop which is a station, 2. stop which has the shortest id).
+        outgoing_footpaths_per_stop_id (dict): outgoing footpaths per stop id.
+        outgoing_footpaths_per_stop_index (list): list of (to_stop_index, walking_time, footpath)-tuples
+        of the outgoing footpaths per stop index.
+        incoming_footpaths_per_stop_index (list): list of (from_stop_index, walking_time, footpath)-tuples
+        of the incoming footpaths per stop index.
+        sorted_footpaths (list): footpaths sorted by the index of the from stop
+        (in the same order as in outgoing_footpaths_per_stop_index).
+        footpath_first_indices (ndarray): position in sorted_footpaths of the first outgoing footpath per stop index
+        (the last entry is the number of footpaths).
+        footpath_to_stop_indices (ndarray): index of the to stop per footpath in sorted_footpaths.
+        footpath_walking_times (ndarray): walking time per footpath in sorted_footpaths.
+        arr_times_by_arr_time (ndarray): arrival time per connection in the order of
+        connection_scan_data.connection_indices_by_arr_time (i.e. sorted).
+        workspace_pool (ScanWorkspacePool): pool of the workspaces of the earliest arrival scans.
     """
 
-    def __init__(self, connection_scan_data):
+    def __init__(self, connection_scan_data, backend=RoutingBackend.PYTHON, footpath_store=None):
         log_start("creating ConnectionScanData", log)
         # static per ConnectionScanCore
         self.MAX_ARR_TIME_VALUE = 2 * 24 * 60 * 60  # we assume that arrival times are always within two days
+        self.MIN_DEP_TIME_VALUE = -1  # we assume that departure times are never negative
         self.connection_scan_data = connection_scan_data
+        if backend == RoutingBackend.NUMBA and not NUMBA_AVAILABLE:
+            log.warning("numba is not installed: the backend {} falls back to {}".format(backend,
+                                                                                         RoutingBackend.PYTHON))
+        self.backend = backend
         self.outgoing_footpaths_per_stop_id = defaultdict(list)
+        stop_id_registry = self.connection_scan_data.stop_id_registry
+        self.outgoing_footpaths_per_stop_index = [[] for _ in range(len(stop_id_registry))]
+        self.incoming_footpaths_per_stop_index = [[] for _ in range(len(stop_id_registry))]
         for footpath in self.connection_scan_data.footpaths_per_from_to_stop_id.values():
             self.outgoing_footpaths_per_stop_id[footpath.from_stop_id] += [footpath]
+            from_stop_index = stop_id_registry.get_index(footpath.from_stop_id)
+            to_stop_index = stop_id_registry.get_index(footpath.to_stop_id)
+            self.outgoing_footpaths_per_stop_index[from_stop_index] += [
+                (to_stop_index, footpath.walking_time, footpath)]
+            self.incoming_footpaths_per_stop_index[to_stop_index] += [
+                (from_stop_index, footpath.walking_time, footpath)]
+        self.workspace_pool = ScanWorkspacePool(len(stop_id_registry), len(self.connection_scan_data.trip_id_registry),
+                                                self.MAX_ARR_TIME_VALUE)
+
+        # footpaths in compressed sparse row format for the scan kernels
+        self.sorted_footpaths = [f for footpaths in self.outgoing_footpaths_per_stop_index for _, _, f in footpaths]
+        if footpath_store is not None:
+            for name in FOOTPATH_ARRAY_NAMES:
+                setattr(self, name, footpath_store[name])
+            log_end(additional_message="precomputed footpath store")
+            return
+        self.footpath_first_indices = np.zeros(len(stop_id_registry) + 1, dtype=np.int64)
+        self.footpath_first_indices[1:] = np.cumsum([len(f) for f in self.outgoing_footpaths_per_stop_index])
+        self.footpath_to_stop_indices = np.array(
+            [stop_id_registry.get_index(f.to_stop_id) for f in self.sorted_footpaths], dtype=np.int32)
+        self.footpath_walking_times = np.array([f.walking_time for f in self.sorted_footpaths], dtype=np.float64)
+
+        # arrival times in the order of connection_indices_by_arr_time for the backward scans
+        self.arr_times_by_arr_time = self.connection_scan_data.arr_times[
+            self.connection_scan_data.connection_indices_by_arr_time]
         log_end()
 
-    def route_earliest_arrival(self, from_stop_id, to_stop_id, desired_dep_time):
+    def route_earliest_arrival(self, from_stop_id, to_stop_id, desired_dep_time, with_stats=False):
         """Executes the unoptimized earliest arrival version (figure 3 of https://arxiv.org/pdf/1703.05997.pdf) of the
         connection scan algorithm from the source to the target stop respecting the desired departure time.
 
         Note:
             - In order to correctly model the footpaths at the start and end of the journey,
             the algorithm from the pseudo code is slightly modified.
-            - the data structures are not optimized for performance.
+            - the connections are scanned on the columnar connection store of the ConnectionScanData.
 
         Args:
             from_stop_id (str): id of the source stop.
             to_stop_id (str): id of the target stop.
             desired_dep_time (int): desired departure time in seconds after midnight.
+            with_stats (:obj:`bool`, optional): True if a QueryStats record is to be returned alongside the result,
+            else False. Default is False.
 
         Returns:
-            int: earliest possible arrival time at the target stop.
-        """
-
-        log_start("unoptimized earliest arrival routing from {} to {} at {}".format(
-            self.connection_scan_data.stops_per_id[from_stop_id].name,
-            self.connection_scan_data.stops_per_id[to_stop_id].name,
-            seconds_to_hhmmss(desired_dep_time)), log)
-
-        # TODO implement task 1 here
-        # Some hints:
-        # - First get familiar with the data structures from the classes module and the ConnectionScanData class
-        # - In order to correctly model the footpaths at the start and end of the journey,
-        #   the algorithm from the pseudo code must be slightly modified.
-        # - You could use the following dynamic data structures:
-        #    - a dict for the earliest arrival including transfer/walking times per stop.
-        #    - a int for the earliest arrival time at the target stop.
-        #    - a dict to mark if a trip is set or not.
-
-        res = -1
-        log_end(additional_message="earliest arrival time: {}".format(seconds_to_hhmmss(res) if res else res))
-        return res
+            int: earliest possible arrival time at the target stop
+            (with_stats: tuple with the earliest possible arrival time and the QueryStats).
+        """
 
-    def route_earliest_arrival_with_reconstruction(self, from_stop_id, to_stop_id, desired_dep_time):
+        log_start(get_query_message, log, "unoptimized earliest arrival routing",
+                  self.connection_scan_data.stops_per_id[from_stop_id],
+                  self.connection_scan_data.stops_per_id[to_stop_id],
+                  desired_dep_time)
+
+        from_stop_index = self.connection_scan_data.stop_id_registry.get_index(from_stop_id)
+        with self.workspace_pool.acquired() as workspace:
+            start_time = time.perf_counter() if with_stats else None
+            arr_time_target, _, _ = self.scan_earliest_arrival(
+                from_stop_index,
+                self.connection_scan_data.stop_id_registry.get_index(to_stop_id),
+                desired_dep_time,
+                False,
+                False,
+                workspace
+            )
+            if with_stats:
+                stats = self.get_query_stats("earliest_arrival", workspace, from_stop_index, False,
+                                             time.perf_counter() - start_time)
+        res = arr_time_target if arr_time_target < self.MAX_ARR_TIME_VALUE else None
+        log_end(get_time_message, "earliest arrival time", res)
+        return (res, stats) if with_stats else res
+
+    def route_earliest_arrival_with_reconstruction(self, from_stop_id, to_stop_id, desired_dep_time,
+                                                   with_stats=False):
         """Executes the unoptimized earliest arrival with reconstruction version
         (figure 6 of https://arxiv.org/pdf/1703.05997.pdf) of the
         connection scan algorithm from the source to the target stop respecting the desired departure time.
@@ -169,38 +484,45 @@ class ConnectionScanCore:
         Note:
             - In order to correctly model the footpaths at the start and end of the journey,
             the algorithm from the pseudo code is slightly modified.
-            - the data structures are not optimized for performance.
+            - the connections are scanned on the columnar connection store of the ConnectionScanData.
 
         Args:
             from_stop_id (str): id of the source stop.
             to_stop_id (str): id of the target stop.
             desired_dep_time (int): desired departure time in seconds after midnight.
+            with_stats (:obj:`bool`, optional): True if a QueryStats record is to be returned alongside the result,
+            else False. Default is False.
 
         Returns:
-            Journey: a Journey with earliest possible arrival time from the source to the target stop.
+            Journey: a Journey with earliest possible arrival time from the source to the target stop
+            (with_stats: tuple with the Journey and the QueryStats).
         """
-        log_start("unoptimized earliest arrival routing with journey reconstruction from {} to {} at {}".format(
-            self.connection_scan_data.stops_per_id[from_stop_id].name,
-            self.connection_scan_data.stops_per_id[to_stop_id].name,
-            seconds_to_hhmmss(desired_dep_time)), log)
-
-        # TODO implement task 2 here
-        # Some hints:
-        # - Implement task 1 first.
-        # - In order to correctly model the footpaths at the start and end of the journey,
-        #   the algorithm from the pseudo code must be slightly modified.
-        # - You could use the following dynamic data structures:
-        #    - a dict for the earliest arrival including transfer/walking times per stop.
-        #    - a int for the earliest arrival time at the target stop.
-        #    - a dict for the in/boarding connection per trip.
-        #    - a JourneyLeg for the last journey leg at the target stop.
-        # - Construct the resulting Journey with the reconstruction logic from the pseudo code.
-
-        res = Journey()
-        log_end(additional_message="# journey legs: {}".format(0 if res is None else res.get_nb_journey_legs()))
-        return res
-
-    def route_optimized_earliest_arrival_with_reconstruction(self, from_stop_id, to_stop_id, desired_dep_time):
+        log_start(get_query_message, log, "unoptimized earliest arrival routing with journey reconstruction",
+                  self.connection_scan_data.stops_per_id[from_stop_id],
+                  self.connection_scan_data.stops_per_id[to_stop_id],
+                  desired_dep_time)
+
+        from_stop_index = self.connection_scan_data.stop_id_registry.get_index(from_stop_id)
+        with self.workspace_pool.acquired() as workspace:
+            start_time = time.perf_counter() if with_stats else None
+            _, journey_leg_target, journey_leg_per_stop_index = self.scan_earliest_arrival(
+                from_stop_index,
+                self.connection_scan_data.stop_id_registry.get_index(to_stop_id),
+                desired_dep_time,
+                True,
+                False,
+                workspace
+            )
+            scan_end_time = time.perf_counter() if with_stats else None
+            res = self.reconstruct_journey(from_stop_index, journey_leg_target, journey_leg_per_stop_index)
+            if with_stats:
+                stats = self.get_query_stats("earliest_arrival_with_reconstruction", workspace, from_stop_index, False,
+                                             scan_end_time - start_time, time.perf_counter() - scan_end_time)
+        log_end("# journey legs: {}", 0 if res is None else res.get_nb_journey_legs())
+        return (res, stats) if with_stats else res
+
+    def route_optimized_earliest_arrival_with_reconstruction(self, from_stop_id, to_stop_id, desired_dep_time,
+                                                             backend=None, with_stats=False):
         """Executes the optimized earliest arrival with reconstruction version
         (figure 4 and 6 of https://arxiv.org/pdf/1703.05997.pdf) of the
         connection scan algorithm from the source to the target stop respecting the desired departure time.
@@ -208,35 +530,894 @@ class ConnectionScanCore:
         Note:
             - In order to correctly model the footpaths at the start and end of the journey,
             the algorithm from the pseudo code is slightly modified.
-            - the data structures are not optimized for performance.
+            - the connections are scanned on the columnar connection store of the ConnectionScanData.
 
         Args:
             from_stop_id (str): id of the source stop.
             to_stop_id (str): id of the target stop.
             desired_dep_time (int): desired departure time in seconds after midnight.
+            backend (:obj:`RoutingBackend`, optional): backend executing the scan. Default is None
+            (i.e. the backend of this ConnectionScanCore).
+            with_stats (:obj:`bool`, optional): True if a QueryStats record is to be returned alongside the result,
+            else False. Default is False.
 
         Returns:
-            Journey: a Journey with earliest possible arrival time from the source to the target stop.
+            Journey: a Journey with earliest possible arrival time from the source to the target stop
+            (with_stats: tuple with the Journey and the QueryStats).
+        """
+        log_start(get_query_message, log, "optimized earliest arrival routing with journey reconstruction",
+                  self.connection_scan_data.stops_per_id[from_stop_id],
+                  self.connection_scan_data.stops_per_id[to_stop_id],
+                  desired_dep_time)
+
+        from_stop_index = self.connection_scan_data.stop_id_registry.get_index(from_stop_id)
+        to_stop_index = self.connection_scan_data.stop_id_registry.get_index(to_stop_id)
+        router = "optimized_earliest_arrival_with_reconstruction"
+        start_time = time.perf_counter() if with_stats else None
+        if self.get_effective_backend(backend) == RoutingBackend.NUMBA:
+            earliest_arrival_target, journey_leg_target, journey_leg_per_stop_index = \
+                self.scan_optimized_earliest_arrival_with_kernel(
+                    from_stop_index,
+                    to_stop_index,
+                    desired_dep_time
+                )
+            scan_end_time = time.perf_counter() if with_stats else None
+            res = self.reconstruct_journey(from_stop_index, journey_leg_target, journey_leg_per_stop_index)
+            if with_stats:
+                first_connection_index = self.get_first_connection_index(desired_dep_time)
+                end_connection_index = max(first_connection_index, int(np.searchsorted(
+                    self.connection_scan_data.dep_times, earliest_arrival_target, side="left")))
+                nb_connections = len(self.connection_scan_data.dep_times)
+                stats = QueryStats(router, first_connection_index, end_connection_index, nb_connections,
+                                   end_connection_index < nb_connections, None, None, scan_end_time - start_time,
+                                   time.perf_counter() - scan_end_time)
+        else:
+            with self.workspace_pool.acquired() as workspace:
+                _, journey_leg_target, journey_leg_per_stop_index = self.scan_earliest_arrival(
+                    from_stop_index,
+                    to_stop_index,
+                    desired_dep_time,
+                    True,
+                    True,
+                    workspace
+                )
+                scan_end_time = time.perf_counter() if with_stats else None
+                res = self.reconstruct_journey(from_stop_index, journey_leg_target, journey_leg_per_stop_index)
+                if with_stats:
+                    stats = self.get_query_stats(router, workspace, from_stop_index, True, scan_end_time - start_time,
+                                                 time.perf_counter() - scan_end_time)
+        log_end("# journey legs: {}", 0 if res is None else res.get_nb_journey_legs())
+        return (res, stats) if with_stats else res
+
+    def route_earliest_arrival_all_targets(self, from_stop_id, desired_dep_time, backend=None, with_stats=False):
+        """Executes the earliest arrival version of the connection scan algorithm from the source stop to all stops
+        respecting the desired departure time.
+
+        In contrast to calling route_earliest_arrival once per target stop, the connections are scanned only once
+        (with starting criterion and limited walking, but without stopping criterion).
+        The arrival time per stop equals the result of route_earliest_arrival for this stop.
+
+        Args:
+            from_stop_id (str): id of the source stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+            backend (:obj:`RoutingBackend`, optional): backend executing the scan. Default is None
+            (i.e. the backend of this ConnectionScanCore).
+            with_stats (:obj:`bool`, optional): True if a QueryStats record is to be returned alongside the result,
+            else False. Default is False.
+
+        Returns:
+            dict: earliest possible arrival time per stop id (only for the reachable stops)
+            (with_stats: tuple with the dict and the QueryStats).
+        """
+        log_start(get_query_message, log, "earliest arrival routing",
+                  self.connection_scan_data.stops_per_id[from_stop_id],
+                  None,
+                  desired_dep_time)
+        from_stop_index = self.connection_scan_data.stop_id_registry.get_index(from_stop_id)
+        with self.workspace_pool.acquired() as workspace:
+            start_time = time.perf_counter() if with_stats else None
+            arr_time_per_stop_index = self.scan_earliest_arrival_all_targets(
+                from_stop_index,
+                desired_dep_time,
+                backend,
+                workspace=workspace
+            )
+            if with_stats:
+                scan_time = time.perf_counter() - start_time
+                if self.get_effective_backend(backend) == RoutingBackend.NUMBA:
+                    first_connection_index = self.get_first_connection_index(desired_dep_time)
+                    nb_connections = len(self.connection_scan_data.dep_times)
+                    stats = QueryStats("earliest_arrival_all_targets", first_connection_index, nb_connections,
+                                       nb_connections, False, None, None, scan_time)
+                else:
+                    stats = self.get_query_stats("earliest_arrival_all_targets", workspace, from_stop_index, True,
+                                                 scan_time)
+        stop_ids = self.connection_scan_data.stop_id_registry.ids
+        res = {stop_ids[ind]: arr_time for ind, arr_time in enumerate(arr_time_per_stop_index.tolist())
+               if arr_time < self.MAX_ARR_TIME_VALUE}
+        log_end("# reachable stops: {}", len(res))
+        return (res, stats) if with_stats else res
+
+    def scan_earliest_arrival_all_targets(self, from_stop_index, desired_dep_time, backend=None,
+                                          first_connection_index=None, workspace=None):
+        """Scans the columnar connection store of the ConnectionScanData
+        for the earliest arrival from the source stop to all stops.
+
+        Args:
+            from_stop_index (int): index of the source stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+            backend (:obj:`RoutingBackend`, optional): backend executing the scan. Default is None
+            (i.e. the backend of this ConnectionScanCore).
+            first_connection_index (:obj:`int`, optional): index of the first connection departing not before
+            desired_dep_time (e.g. from ConnectionScanData.get_first_connection_indices). Default is None
+            (i.e. the index is looked up).
+            workspace (:obj:`ScanWorkspace`, optional): workspace of the scan with RoutingBackend.PYTHON.
+            Default is None (i.e. a workspace of workspace_pool is used for the scan).
+
+        Returns:
+            ndarray: earliest arrival time (float64) per stop index (MAX_ARR_TIME_VALUE if the stop is not reachable).
+        """
+        cs_data = self.connection_scan_data
+        if first_connection_index is None:
+            first_connection_index = self.get_first_connection_index(desired_dep_time)
+        if self.get_effective_backend(backend) == RoutingBackend.NUMBA:
+            return scan_earliest_arrival_all_targets(
+                cs_data.dep_times,
+                cs_data.arr_times,
+                cs_data.from_stop_indices,
+                cs_data.to_stop_indices,
+                cs_data.trip_indices,
+                self.footpath_first_indices,
+                self.footpath_to_stop_indices,
+                self.footpath_walking_times,
+                len(cs_data.trip_id_registry),
+                from_stop_index,
+                float(desired_dep_time),
+                int(first_connection_index),
+                float(self.MAX_ARR_TIME_VALUE)
+            )
+
+        if workspace is not None:
+            return np.array(self.scan_earliest_arrival_all_targets_in_workspace(
+                from_stop_index, desired_dep_time, first_connection_index, workspace), dtype=np.float64)
+        with self.workspace_pool.acquired() as workspace:
+            return np.array(self.scan_earliest_arrival_all_targets_in_workspace(
+                from_stop_index, desired_dep_time, first_connection_index, workspace), dtype=np.float64)
+
+    def scan_earliest_arrival_all_targets_in_workspace(self, from_stop_index, desired_dep_time,
+                                                       first_connection_index, workspace):
+        """Executes scan_earliest_arrival_all_targets with the backend RoutingBackend.PYTHON.
+
+        Args:
+            from_stop_index (int): index of the source stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+            first_connection_index (int): index of the first connection departing not before desired_dep_time.
+            workspace (ScanWorkspace): workspace of the scan (reset at the start of the scan).
+
+        Returns:
+            list: earliest arrival time per stop index (MAX_ARR_TIME_VALUE if the stop is not reachable).
+        """
+        cs_data = self.connection_scan_data
+        workspace.start_query()
+        earliest_arrival_per_stop_index = workspace.earliest_arrival_per_stop_index  # including transfer/walking times
+        arr_time_per_stop_index = [self.MAX_ARR_TIME_VALUE] * workspace.nb_stops  # result, i.e. without transfer times
+        vehicle_arrival_per_stop_index = workspace.vehicle_arrival_per_stop_index  # only used for limited walking
+        in_connection_index_per_trip_index = workspace.in_connection_index_per_trip_index  # only used as flag
+        touched_stop_indices = workspace.touched_stop_indices
+        relaxed_stop_indices = workspace.relaxed_stop_indices
+        touched_trip_indices = workspace.touched_trip_indices
+        earliest_arrival_per_stop_index[from_stop_index] = desired_dep_time
+        arr_time_per_stop_index[from_stop_index] = desired_dep_time
+        vehicle_arrival_per_stop_index[from_stop_index] = desired_dep_time
+        touched_stop_indices.append(from_stop_index)
+        workspace.first_connection_index = first_connection_index
+        workspace.end_connection_index = len(cs_data.dep_times)
+
+        for walk_to_stop_index, walking_time, _ in self.outgoing_footpaths_per_stop_index[from_stop_index]:
+            if walk_to_stop_index != from_stop_index:
+                arr_time_walk = desired_dep_time + walking_time
+                if arr_time_walk < earliest_arrival_per_stop_index[walk_to_stop_index]:
+                    earliest_arrival_per_stop_index[walk_to_stop_index] = arr_time_walk
+                    touched_stop_indices.append(walk_to_stop_index)
+                if arr_time_walk < arr_time_per_stop_index[walk_to_stop_index]:
+                    arr_time_per_stop_index[walk_to_stop_index] = arr_time_walk
+
+        for dep_time, arr_time, con_from_stop_index, con_to_stop_index, trip_index in zip(
+                cs_data.dep_times[first_connection_index:],
+                cs_data.arr_times[first_connection_index:],
+                cs_data.from_stop_indices[first_connection_index:],
+                cs_data.to_stop_indices[first_connection_index:],
+                cs_data.trip_indices[first_connection_index:]):
+            if in_connection_index_per_trip_index[trip_index] >= 0 or \
+                    earliest_arrival_per_stop_index[con_from_stop_index] <= dep_time:
+                if in_connection_index_per_trip_index[trip_index] < 0:
+                    in_connection_index_per_trip_index[trip_index] = 0
+                    touched_trip_indices.append(trip_index)
+                if arr_time >= vehicle_arrival_per_stop_index[con_to_stop_index]:
+                    continue  # limited walking: the footpaths were already relaxed with an earlier arrival
+                vehicle_arrival_per_stop_index[con_to_stop_index] = arr_time
+                relaxed_stop_indices.append(con_to_stop_index)
+                if arr_time < arr_time_per_stop_index[con_to_stop_index]:
+                    arr_time_per_stop_index[con_to_stop_index] = arr_time
+                for walk_to_stop_index, walking_time, _ in self.outgoing_footpaths_per_stop_index[con_to_stop_index]:
+                    arr_time_walk = arr_time + walking_time
+                    if arr_time_walk < earliest_arrival_per_stop_index[walk_to_stop_index]:
+                        earliest_arrival_per_stop_index[walk_to_stop_index] = arr_time_walk
+                        touched_stop_indices.append(walk_to_stop_index)
+                    if walk_to_stop_index != con_to_stop_index and \
+                            arr_time_walk < arr_time_per_stop_index[walk_to_stop_index]:
+                        arr_time_per_stop_index[walk_to_stop_index] = arr_time_walk
+
+        return arr_time_per_stop_index
+
+    def get_query_stats(self, router, workspace, from_stop_index, limited_walking, scan_time, reconstruction_time=0.0):
+        """Returns the statistics of the last scan of a workspace (see QueryStats).
+
+        The number of footpath relaxations is derived from the relaxed stops of the workspace if limited walking
+        is applied. Otherwise the footpaths of the to stop of every reachable scanned connection are relaxed,
+        i.e. of every scanned connection not before the boarding connection of its trip.
+
+        Args:
+            router (str): name of the router.
+            workspace (ScanWorkspace): workspace of the scan.
+            from_stop_index (int): index of the source stop.
+            limited_walking (bool): True if the scan applied limited walking, else False.
+            scan_time (float): wall time of the scan in seconds.
+            reconstruction_time (:obj:`float`, optional): wall time of the journey reconstruction in seconds.
+            Default is 0.
+
+        Returns:
+            QueryStats: the statistics.
+        """
+        cs_data = self.connection_scan_data
+        nb_footpaths_per_stop_index = np.diff(self.footpath_first_indices)
+        nb_footpath_relaxations = sum(1 for to_stop_index, _, _ in self.outgoing_footpaths_per_stop_index[
+            from_stop_index] if to_stop_index != from_stop_index)
+        first_connection_index = workspace.first_connection_index
+        end_connection_index = workspace.end_connection_index
+        if limited_walking:
+            nb_footpath_relaxations += int(nb_footpaths_per_stop_index[workspace.relaxed_stop_indices].sum())
+        elif workspace.touched_trip_indices:
+            in_connection_index_per_trip_index = np.full(len(cs_data.trip_id_registry), end_connection_index,
+                                                         dtype=np.int64)
+            in_connection_index_per_trip_index[workspace.touched_trip_indices] = [
+                workspace.in_connection_index_per_trip_index[trip_index]
+                for trip_index in workspace.touched_trip_indices]
+            is_reachable = in_connection_index_per_trip_index[
+                cs_data.trip_indices[first_connection_index:end_connection_index]] <= np.arange(
+                first_connection_index, end_connection_index)
+            nb_footpath_relaxations += int(nb_footpaths_per_stop_index[
+                cs_data.to_stop_indices[first_connection_index:end_connection_index][is_reachable]].sum())
+        nb_connections = len(cs_data.dep_times)
+        return QueryStats(router, first_connection_index, end_connection_index, nb_connections,
+                          end_connection_index < nb_connections, len(workspace.touched_trip_indices),
+                          nb_footpath_relaxations, scan_time, reconstruction_time)
+
+    def get_effective_backend(self, backend=None):
+        """Returns the backend which is used for a query.
+
+        Args:
+            backend (:obj:`RoutingBackend`, optional): backend requested for the query. Default is None
+            (i.e. the backend of this ConnectionScanCore).
+
+        Returns:
+            RoutingBackend: the requested backend or RoutingBackend.PYTHON if numba is not installed.
+        """
+        backend = self.backend if backend is None else backend
+        if backend == RoutingBackend.NUMBA and not NUMBA_AVAILABLE:
+            return RoutingBackend.PYTHON
+        return backend
+
+    def get_first_connection_index(self, desired_dep_time):
+        """Returns the index of the first connection departing not before the desired departure time
+        (starting criterion on page 8 of https://arxiv.org/pdf/1703.05997.pdf).
+
+        Args:
+            desired_dep_time (int): desired departure time in seconds after midnight.
+
+        Returns:
+            int: index of the first connection with dep_time >= desired_dep_time
+            (the number of connections if there is no such connection).
+        """
+        return self.connection_scan_data.get_first_connection_index(desired_dep_time)
+
+    def scan_optimized_earliest_arrival_with_kernel(self, from_stop_index, to_stop_index, desired_dep_time):
+        """Executes scan_earliest_arrival (with reconstruction and optimized) with the compiled kernel
+        connectionscan_kernels.scan_optimized_earliest_arrival.
+
+        Args:
+            from_stop_index (int): index of the source stop.
+            to_stop_index (int): index of the target stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+
+        Returns:
+            tuple: the same as scan_earliest_arrival.
         """
-        log_start("optimized earliest arrival routing with journey reconstruction from {} to {} at {}".format(
-            self.connection_scan_data.stops_per_id[from_stop_id].name,
-            self.connection_scan_data.stops_per_id[to_stop_id].name,
-            seconds_to_hhmmss(desired_dep_time)), log)
-
-        # TODO implement task 3 here
-        # Some hints:
-        # - Implement task 2 first.
-        # - In order to correctly model the footpaths at the start and end of the journey,
-        #   the algorithm from the pseudo code must be slightly modified.
-        # - You could use the same dynamic data structures and reconstruction logic as in task 2.
-        # - Implement the three optimization criterion's described in the paper (on page 8):
-        #   stopping criterion, starting criterion and limited walking.
-        #   For the starting criterion you can use the function binary_search from the funs module.
-
-        res = Journey()
-        log_end(additional_message="# journey legs: {}".format(0 if res is None else res.get_nb_journey_legs()))
+        cs_data = self.connection_scan_data
+        earliest_arrival_target, journey_leg_target, in_connection_indices, out_connection_indices, footpath_indices = \
+            scan_optimized_earliest_arrival(
+                cs_data.dep_times,
+                cs_data.arr_times,
+                cs_data.from_stop_indices,
+                cs_data.to_stop_indices,
+                cs_data.trip_indices,
+                self.footpath_first_indices,
+                self.footpath_to_stop_indices,
+                self.footpath_walking_times,
+                len(cs_data.trip_id_registry),
+                from_stop_index,
+                to_stop_index,
+                float(desired_dep_time),
+                self.get_first_connection_index(desired_dep_time),
+                float(self.MAX_ARR_TIME_VALUE)
+            )
+        journey_legs = KernelJourneyLegs(in_connection_indices, out_connection_indices, footpath_indices,
+                                         self.sorted_footpaths)
+        return earliest_arrival_target, journey_legs.get_journey_leg(*journey_leg_target), journey_legs
+
+    def scan_earliest_arrival(self, from_stop_index, to_stop_index, desired_dep_time, with_reconstruction,
+                              optimized, workspace=None):
+        """Scans the columnar connection store of the ConnectionScanData
+        for the earliest arrival from the source to the target stop.
+
+        A journey leg pointer is a (in_connection_index, out_connection_index, footpath)-tuple,
+        where the connection indices refer to the position in the sorted connections.
+        In journey leg pointers of type "only footpath" both connection indices are None.
+
+        Args:
+            from_stop_index (int): index of the source stop.
+            to_stop_index (int): index of the target stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+            with_reconstruction (bool): True if the journey leg pointers are to be collected, else False.
+            optimized (bool): True if the starting criterion, the stopping criterion
+            and limited walking (page 8 of https://arxiv.org/pdf/1703.05997.pdf) are to be applied, else False.
+            workspace (:obj:`ScanWorkspace`, optional): workspace of the scan, which is reset at the start of the scan
+            and holds the returned journey leg pointers until its next scan. Default is None
+            (i.e. a workspace of workspace_pool is used for the scan).
+
+        Returns:
+            tuple: earliest arrival time at the target stop (MAX_ARR_TIME_VALUE if the target stop is not reachable),
+            journey leg pointer reaching the target stop and list with the journey leg pointer per stop index
+            (None if with_reconstruction is False).
+        """
+        if workspace is None:
+            with self.workspace_pool.acquired() as workspace:
+                return self.scan_earliest_arrival(from_stop_index, to_stop_index, desired_dep_time,
+                                                  with_reconstruction, optimized, workspace)
+        cs_data = self.connection_scan_data
+        workspace.start_query()
+        # flat lists indexed by the stop and trip indices (-1 marks a trip which is not set)
+        earliest_arrival_per_stop_index = workspace.earliest_arrival_per_stop_index  # including transfer/walking times
+        journey_leg_per_stop_index = workspace.journey_leg_per_stop_index if with_reconstruction else None
+        in_connection_index_per_trip_index = workspace.in_connection_index_per_trip_index
+        touched_stop_indices = workspace.touched_stop_indices
+        relaxed_stop_indices = workspace.relaxed_stop_indices
+        touched_trip_indices = workspace.touched_trip_indices
+        earliest_arrival_per_stop_index[from_stop_index] = desired_dep_time
+        touched_stop_indices.append(from_stop_index)
+        earliest_arrival_target = desired_dep_time if from_stop_index == to_stop_index else self.MAX_ARR_TIME_VALUE
+        journey_leg_target = None
+
+        for walk_to_stop_index, walking_time, footpath in self.outgoing_footpaths_per_stop_index[from_stop_index]:
+            if walk_to_stop_index != from_stop_index:
+                arr_time_walk = desired_dep_time + walking_time
+                if arr_time_walk < earliest_arrival_per_stop_index[walk_to_stop_index]:
+                    earliest_arrival_per_stop_index[walk_to_stop_index] = arr_time_walk
+                    touched_stop_indices.append(walk_to_stop_index)
+                    if with_reconstruction:
+                        journey_leg_per_stop_index[walk_to_stop_index] = (None, None, footpath)
+                if walk_to_stop_index == to_stop_index and arr_time_walk < earliest_arrival_target:
+                    earliest_arrival_target = arr_time_walk
+                    journey_leg_target = (None, None, footpath)
+
+        first_connection_index = 0
+        vehicle_arrival_per_stop_index = None  # only used for limited walking
+        if optimized:
+            first_connection_index = self.get_first_connection_index(desired_dep_time)
+            vehicle_arrival_per_stop_index = workspace.vehicle_arrival_per_stop_index
+            vehicle_arrival_per_stop_index[from_stop_index] = desired_dep_time
+        workspace.first_connection_index = first_connection_index
+
+        for con_index, (dep_time, arr_time, con_from_stop_index, con_to_stop_index, trip_index) in enumerate(zip(
+                cs_data.dep_times[first_connection_index:],
+                cs_data.arr_times[first_connection_index:],
+                cs_data.from_stop_indices[first_connection_index:],
+                cs_data.to_stop_indices[first_connection_index:],
+                cs_data.trip_indices[first_connection_index:]), first_connection_index):
+            if optimized and dep_time >= earliest_arrival_target:
+                workspace.end_connection_index = con_index
+                break  # stopping criterion
+            in_connection_index = in_connection_index_per_trip_index[trip_index]
+            if in_connection_index >= 0 or earliest_arrival_per_stop_index[con_from_stop_index] <= dep_time:
+                if in_connection_index < 0:
+                    in_connection_index = con_index
+                    in_connection_index_per_trip_index[trip_index] = con_index
+                    touched_trip_indices.append(trip_index)
+                if con_to_stop_index == to_stop_index and arr_time < earliest_arrival_target:
+                    earliest_arrival_target = arr_time
+                    journey_leg_target = (in_connection_index, con_index, None)
+                if optimized:
+                    if arr_time >= vehicle_arrival_per_stop_index[con_to_stop_index]:
+                        continue  # limited walking: the footpaths were already relaxed with an earlier arrival
+                    vehicle_arrival_per_stop_index[con_to_stop_index] = arr_time
+                    relaxed_stop_indices.append(con_to_stop_index)
+                for walk_to_stop_index, walking_time, footpath in \
+                        self.outgoing_footpaths_per_stop_index[con_to_stop_index]:
+                    arr_time_walk = arr_time + walking_time
+                    if arr_time_walk < earliest_arrival_per_stop_index[walk_to_stop_index]:
+                        earliest_arrival_per_stop_index[walk_to_stop_index] = arr_time_walk
+                        touched_stop_indices.append(walk_to_stop_index)
+                        if with_reconstruction:
+                            journey_leg_per_stop_index[walk_to_stop_index] = (in_connection_index, con_index,
+                                                                              footpath)
+                    if walk_to_stop_index == to_stop_index and walk_to_stop_index != con_to_stop_index and \
+                            arr_time_walk < earliest_arrival_target:
+                        earliest_arrival_target = arr_time_walk
+                        journey_leg_target = (in_connection_index, con_index, footpath)
+        else:
+            workspace.end_connection_index = len(cs_data.dep_times)
+
+        return earliest_arrival_target, journey_leg_target, journey_leg_per_stop_index
+
+    def reconstruct_journey(self, from_stop_index, journey_leg_target, journey_leg_per_stop_index):
+        """Reconstructs the journey from the journey leg pointers collected in scan_earliest_arrival.
+
+        Args:
+            from_stop_index (int): index of the source stop.
+            journey_leg_target (tuple): journey leg pointer reaching the target stop.
+            journey_leg_per_stop_index (list): journey leg pointer per stop index.
+
+        Returns:
+            Journey: the reconstructed journey (without journey legs if the target stop is not reachable).
+        """
+        cs_data = self.connection_scan_data
+        journey = Journey()
+        journey_leg = journey_leg_target
+        while journey_leg is not None:
+            in_connection_index, out_connection_index, footpath = journey_leg
+            if in_connection_index is None:
+                journey.prepend_journey_leg(JourneyLeg(None, None, footpath))
+                break
+            journey.prepend_journey_leg(JourneyLeg(
+                cs_data.sorted_connections[in_connection_index],
+                cs_data.sorted_connections[out_connection_index],
+                footpath))
+            in_stop_index = cs_data.from_stop_indices[in_connection_index]
+            journey_leg = None if in_stop_index == from_stop_index else journey_leg_per_stop_index[in_stop_index]
+        return journey
+
+    def route_earliest_arrival_profile(self, from_stop_id, to_stop_id, min_dep_time, max_dep_time):
+        """Executes the earliest arrival profile version (section 4 of https://arxiv.org/pdf/1703.05997.pdf) of the
+        connection scan algorithm from the source to the target stop for a departure time window.
+
+        The connections are scanned only once in descending departure time order.
+        The result are the journeys of the Pareto set with respect to (late departure time, early arrival time)
+        which depart in the time window, i.e. there is no other journey which departs not earlier and arrives
+        not later (also no journey departing after the time window).
+        Hence the earliest arrival time for a desired departure time in the time window is the arrival time of
+        the first journey departing not before the desired departure time (if this journey is in the result).
+
+        Note:
+            - the connections departing after the earliest arrival at the target stop for a departure at max_dep_time
+            cannot be part of a journey in the Pareto set and are not scanned.
+            - journeys consisting of a footpath only (without public transport) are not part of the result,
+            but the journeys arriving not earlier than walking from the source to the target stop are removed.
+
+        Args:
+            from_stop_id (str): id of the source stop.
+            to_stop_id (str): id of the target stop.
+            min_dep_time (int): begin of the departure time window in seconds after midnight.
+            max_dep_time (int): end of the departure time window in seconds after midnight.
+
+        Returns:
+            list: Journey's of the Pareto set sorted by departure time.
+        """
+        log_start(get_query_message, log, "earliest arrival profile routing",
+                  self.connection_scan_data.stops_per_id[from_stop_id],
+                  self.connection_scan_data.stops_per_id[to_stop_id],
+                  min_dep_time,
+                  max_dep_time)
+        from_stop_index = self.connection_scan_data.stop_id_registry.get_index(from_stop_id)
+        to_stop_index = self.connection_scan_data.stop_id_registry.get_index(to_stop_id)
+        res = []
+        if from_stop_index != to_stop_index:
+            pareto_set = self.scan_earliest_arrival_profile(from_stop_index, to_stop_index, min_dep_time, max_dep_time)
+            res = [self.reconstruct_profile_journey(first_footpath, profile_entry)
+                   for _, _, first_footpath, profile_entry in pareto_set]
+        log_end("# journeys: {}", len(res))
         return res
 
+    def scan_earliest_arrival_profile(self, from_stop_index, to_stop_index, min_dep_time, max_dep_time):
+        """Scans the columnar connection store of the ConnectionScanData in descending departure time order
+        for the earliest arrival profiles to the target stop.
+
+        The profile of a stop is a list of profile entries (dep_time, arr_time, in_connection_index,
+        out_connection_index, footpath, next_profile_entry) with decreasing departure and arrival time.
+        A profile entry describes a journey which boards in_connection at the stop at dep_time,
+        alights after out_connection, walks along footpath (None if the stop of out_connection is the target stop)
+        and continues with next_profile_entry (None if the journey arrives at the target stop at arr_time).
+
+        Args:
+            from_stop_index (int): index of the source stop.
+            to_stop_index (int): index of the target stop.
+            min_dep_time (int): begin of the departure time window in seconds after midnight.
+            max_dep_time (int): end of the departure time window in seconds after midnight.
+
+        Returns:
+            list: (dep_time, arr_time, first_footpath, profile_entry)-tuples of the Pareto set sorted by
+            departure time, where first_footpath is the footpath from the source stop to the stop of profile_entry
+            (None if the journey starts with public transport at the source stop).
+        """
+        cs_data = self.connection_scan_data
+        nb_stops = len(cs_data.stop_id_registry)
+        walking_time_to_target_per_stop_index = {from_ind: walking_time for from_ind, walking_time, _ in
+                                                 self.incoming_footpaths_per_stop_index[to_stop_index]
+                                                 if from_ind != to_stop_index}
+        footpath_to_target_per_stop_index = {from_ind: footpath for from_ind, _, footpath in
+                                             self.incoming_footpaths_per_stop_index[to_stop_index]
+                                             if from_ind != to_stop_index}
+        neg_dep_times_per_stop_index = [[] for _ in range(nb_stops)]  # negated for bisect
+        profile_per_stop_index = [[] for _ in range(nb_stops)]
+        best_exit_per_trip_index = [None] * len(cs_data.trip_id_registry)  # (arr_time, out_con, footpath, next)
+
+        arr_time_bound, _, _ = self.scan_earliest_arrival(from_stop_index, to_stop_index, max_dep_time, False, True)
+        first_connection_index = self.get_first_connection_index(min_dep_time)
+        last_connection_index = int(np.searchsorted(cs_data.dep_times, arr_time_bound, side="right"))
+
+        for con_index, dep_time, arr_time, con_from_stop_index, con_to_stop_index, trip_index in zip(
+                range(last_connection_index - 1, first_connection_index - 1, -1),
+                cs_data.dep_times[first_connection_index:last_connection_index][::-1],
+                cs_data.arr_times[first_connection_index:last_connection_index][::-1],
+                cs_data.from_stop_indices[first_connection_index:last_connection_index][::-1],
+                cs_data.to_stop_indices[first_connection_index:last_connection_index][::-1],
+                cs_data.trip_indices[first_connection_index:last_connection_index][::-1]):
+            # alighting at the target stop or walking to the target stop
+            best_exit = best_exit_per_trip_index[trip_index]  # remaining seated
+            if con_to_stop_index == to_stop_index:
+                if best_exit is None or arr_time < best_exit[0]:
+                    best_exit = (arr_time, con_index, None, None)
+            elif con_to_stop_index in walking_time_to_target_per_stop_index:
+                arr_time_walk = arr_time + walking_time_to_target_per_stop_index[con_to_stop_index]
+                if best_exit is None or arr_time_walk < best_exit[0]:
+                    best_exit = (arr_time_walk, con_index, footpath_to_target_per_stop_index[con_to_stop_index], None)
+            # transferring to another trip
+            for walk_to_stop_index, walking_time, footpath in \
+                    self.outgoing_footpaths_per_stop_index[con_to_stop_index]:
+                nb_entries = bisect_right(neg_dep_times_per_stop_index[walk_to_stop_index], -(arr_time + walking_time))
+                if nb_entries > 0:
+                    next_profile_entry = profile_per_stop_index[walk_to_stop_index][nb_entries - 1]
+                    if best_exit is None or next_profile_entry[1] < best_exit[0]:
+                        best_exit = (next_profile_entry[1], con_index, footpath, next_profile_entry)
+            if best_exit is None:
+                continue
+            best_exit_per_trip_index[trip_index] = best_exit
+
+            # boarding the trip at the from stop
+            profile = profile_per_stop_index[con_from_stop_index]
+            neg_dep_times = neg_dep_times_per_stop_index[con_from_stop_index]
+            if not profile or best_exit[0] < profile[-1][1]:
+                profile_entry = (dep_time, best_exit[0], con_index, best_exit[1], best_exit[2], best_exit[3])
+                if profile and profile[-1][0] == dep_time:
+                    profile[-1] = profile_entry
+                else:
+                    profile += [profile_entry]
+                    neg_dep_times += [-dep_time]
+
+        candidates = [(entry[0], entry[1], None, entry) for entry in profile_per_stop_index[from_stop_index]]
+        for walk_to_stop_index, walking_time, footpath in self.outgoing_footpaths_per_stop_index[from_stop_index]:
+            if walk_to_stop_index != from_stop_index:
+                candidates += [(entry[0] - walking_time, entry[1], footpath, entry)
+                               for entry in profile_per_stop_index[walk_to_stop_index]]
+        walking_time_to_target = walking_time_to_target_per_stop_index.get(from_stop_index)
+        pareto_set = []
+        for candidate in sorted(candidates, key=lambda cand: (-cand[0], cand[1])):
+            if walking_time_to_target is not None and candidate[1] >= candidate[0] + walking_time_to_target:
+                continue  # dominated by walking from the source to the target stop
+            if not pareto_set or candidate[1] < pareto_set[-1][1]:
+                pareto_set += [candidate]
+        return [candidate for candidate in reversed(pareto_set) if min_dep_time <= candidate[0] <= max_dep_time]
+
+    def reconstruct_profile_journey(self, first_footpath, profile_entry):
+        """Reconstructs the journey from a profile entry collected in scan_earliest_arrival_profile.
+
+        Args:
+            first_footpath (Footpath): footpath from the source stop to the stop of profile_entry
+            (None if the journey starts with public transport at the source stop).
+            profile_entry (tuple): the profile entry.
+
+        Returns:
+            Journey: the reconstructed journey.
+        """
+        sorted_connections = self.connection_scan_data.sorted_connections
+        journey_legs = [JourneyLeg(None, None, first_footpath)] if first_footpath is not None else []
+        while profile_entry is not None:
+            _, _, in_connection_index, out_connection_index, footpath, profile_entry = profile_entry
+            journey_legs += [JourneyLeg(sorted_connections[in_connection_index],
+                                        sorted_connections[out_connection_index],
+                                        footpath)]
+        journey = Journey()
+        for journey_leg in reversed(journey_legs):
+            journey.prepend_journey_leg(journey_leg)
+        return journey
+
+    def route_latest_departure(self, from_stop_id, to_stop_id, desired_arr_time):
+        """Executes the latest departure version of the connection scan algorithm from the source to the target stop
+        respecting the desired arrival time.
+
+        The connections are scanned backward, i.e. in descending arrival time order
+        (with starting criterion, stopping criterion and limited walking).
+
+        Args:
+            from_stop_id (str): id of the source stop.
+            to_stop_id (str): id of the target stop.
+            desired_arr_time (int): desired arrival time in seconds after midnight.
+
+        Returns:
+            int: latest possible departure time at the source stop (None if the target stop is not reachable).
+        """
+        log_start(get_query_message, log, "latest departure routing",
+                  self.connection_scan_data.stops_per_id[from_stop_id],
+                  self.connection_scan_data.stops_per_id[to_stop_id],
+                  desired_arr_time)
+        dep_time_source, _, _ = self.scan_latest_departure(
+            self.connection_scan_data.stop_id_registry.get_index(from_stop_id),
+            self.connection_scan_data.stop_id_registry.get_index(to_stop_id),
+            desired_arr_time,
+            False
+        )
+        res = int(dep_time_source) if dep_time_source > self.MIN_DEP_TIME_VALUE else None
+        log_end(get_time_message, "latest departure time", res)
+        return res
+
+    def route_latest_departure_with_reconstruction(self, from_stop_id, to_stop_id, desired_arr_time):
+        """Executes the latest departure with reconstruction version of the connection scan algorithm
+        from the source to the target stop respecting the desired arrival time (see route_latest_departure).
+
+        Args:
+            from_stop_id (str): id of the source stop.
+            to_stop_id (str): id of the target stop.
+            desired_arr_time (int): desired arrival time in seconds after midnight.
+
+        Returns:
+            Journey: a Journey with latest possible departure time from the source to the target stop
+            (without journey legs if the target stop is not reachable).
+        """
+        log_start(get_query_message, log, "latest departure routing with journey reconstruction",
+                  self.connection_scan_data.stops_per_id[from_stop_id],
+                  self.connection_scan_data.stops_per_id[to_stop_id],
+                  desired_arr_time)
+        _, next_leg_source, next_leg_per_stop_index = self.scan_latest_departure(
+            self.connection_scan_data.stop_id_registry.get_index(from_stop_id),
+            self.connection_scan_data.stop_id_registry.get_index(to_stop_id),
+            desired_arr_time,
+            True
+        )
+        res = self.reconstruct_journey_backward(next_leg_source, next_leg_per_stop_index)
+        log_end("# journey legs: {}", res.get_nb_journey_legs())
+        return res
+
+    def route_latest_departure_all_sources(self, to_stop_id, desired_arr_time):
+        """Executes the latest departure version of the connection scan algorithm from all stops to the target stop
+        respecting the desired arrival time.
+
+        In contrast to calling route_latest_departure once per source stop, the connections are scanned only once
+        (with starting criterion and limited walking, but without stopping criterion).
+
+        Args:
+            to_stop_id (str): id of the target stop.
+            desired_arr_time (int): desired arrival time in seconds after midnight.
+
+        Returns:
+            dict: latest possible departure time per stop id (only stops from which the target stop is reachable).
+        """
+        log_start(get_query_message, log, "latest departure routing",
+                  None,
+                  self.connection_scan_data.stops_per_id[to_stop_id],
+                  desired_arr_time)
+        stop_id_registry = self.connection_scan_data.stop_id_registry
+        dep_time_per_stop_index = self.scan_latest_departure_all_sources(stop_id_registry.get_index(to_stop_id),
+                                                                         desired_arr_time)
+        res = {stop_id_registry.get_id(stop_index): int(dep_time)
+               for stop_index, dep_time in enumerate(dep_time_per_stop_index) if dep_time > self.MIN_DEP_TIME_VALUE}
+        log_end("# reachable stops: {}", len(res))
+        return res
+
+    def get_last_connection_position(self, desired_arr_time):
+        """Returns the number of connections arriving not after the desired arrival time
+        (starting criterion of the backward scans).
+
+        Args:
+            desired_arr_time (int): desired arrival time in seconds after midnight.
+
+        Returns:
+            int: position in connection_scan_data.connection_indices_by_arr_time after the last connection
+            with arr_time <= desired_arr_time.
+        """
+        return int(np.searchsorted(self.arr_times_by_arr_time, desired_arr_time, side="right"))
+
+    def scan_latest_departure(self, from_stop_index, to_stop_index, desired_arr_time, with_reconstruction):
+        """Scans the columnar connection store of the ConnectionScanData in descending arrival time order
+        for the latest departure from the source to the target stop.
+
+        The scan mirrors scan_earliest_arrival with optimized=True: the latest arrival per stop is the latest time
+        at which a vehicle can arrive at the stop such that the target stop is still reachable in time
+        (including the transfer/walking time to the next departure).
+
+        A next leg pointer of a stop is a (footpath, in_connection_index)-tuple: after the arrival at the stop,
+        the journey continues with footpath (None at the source stop if the journey starts with public transport)
+        and boards the trip of in_connection.
+        The exit per trip is a (out_connection_index, footpath, is_last)-tuple: the journey leaves the trip after
+        out_connection and walks along footpath (None if the journey leaves the trip at the target stop).
+        If is_last is False, the journey continues with the next leg pointer of the to stop of out_connection.
+
+        Args:
+            from_stop_index (int): index of the source stop.
+            to_stop_index (int): index of the target stop.
+            desired_arr_time (int): desired arrival time in seconds after midnight.
+            with_reconstruction (bool): True if the next leg pointers are to be collected, else False.
+
+        Returns:
+            tuple: latest departure time at the source stop (MIN_DEP_TIME_VALUE if the target stop is not reachable),
+            next leg pointer at the source stop (for a journey consisting of a footpath only:
+            (footpath, None)) and tuple with the next leg pointer per stop index and the exit per trip index
+            (None if with_reconstruction is False).
+        """
+        cs_data = self.connection_scan_data
+        nb_stops = len(cs_data.stop_id_registry)
+        # flat lists indexed by the stop and trip indices (None marks a trip which is not set)
+        latest_arrival_per_stop_index = [self.MIN_DEP_TIME_VALUE] * nb_stops  # including transfer/walking times
+        vehicle_departure_per_stop_index = [self.MIN_DEP_TIME_VALUE] * nb_stops  # only used for limited walking
+        next_leg_per_stop_index = [None] * nb_stops if with_reconstruction else None
+        exit_per_trip_index = [None] * len(cs_data.trip_id_registry)
+        latest_departure_source = desired_arr_time if from_stop_index == to_stop_index else self.MIN_DEP_TIME_VALUE
+        next_leg_source = None
+
+        latest_arrival_per_stop_index[to_stop_index] = desired_arr_time
+        for walk_from_stop_index, walking_time, footpath in self.incoming_footpaths_per_stop_index[to_stop_index]:
+            if walk_from_stop_index != to_stop_index:
+                dep_time_walk = desired_arr_time - walking_time
+                if dep_time_walk > latest_arrival_per_stop_index[walk_from_stop_index]:
+                    latest_arrival_per_stop_index[walk_from_stop_index] = dep_time_walk
+                if walk_from_stop_index == from_stop_index and dep_time_walk > latest_departure_source:
+                    latest_departure_source = dep_time_walk
+                    next_leg_source = (footpath, None)
+        footpath_to_target_per_stop_index = {from_ind: footpath for from_ind, _, footpath in
+                                             self.incoming_footpaths_per_stop_index[to_stop_index]
+                                             if from_ind != to_stop_index}
+
+        con_indices = cs_data.connection_indices_by_arr_time[:self.get_last_connection_position(desired_arr_time)][::-1]
+        for con_index, dep_time, arr_time, con_from_stop_index, con_to_stop_index, trip_index in zip(
+                con_indices,
+                cs_data.dep_times[con_indices],
+                cs_data.arr_times[con_indices],
+                cs_data.from_stop_indices[con_indices],
+                cs_data.to_stop_indices[con_indices],
+                cs_data.trip_indices[con_indices]):
+            if arr_time <= latest_departure_source:
+                break  # stopping criterion
+            if exit_per_trip_index[trip_index] is None:
+                if con_to_stop_index == to_stop_index:
+                    exit_per_trip_index[trip_index] = (con_index, None, True)
+                elif con_to_stop_index in footpath_to_target_per_stop_index and \
+                        arr_time + footpath_to_target_per_stop_index[con_to_stop_index].walking_time <= \
+                        desired_arr_time:
+                    exit_per_trip_index[trip_index] = (con_index, footpath_to_target_per_stop_index[con_to_stop_index],
+                                                       True)
+                elif latest_arrival_per_stop_index[con_to_stop_index] >= arr_time:
+                    exit_per_trip_index[trip_index] = (con_index, None, False)
+                else:
+                    continue
+            if con_from_stop_index == from_stop_index and dep_time > latest_departure_source:
+                latest_departure_source = dep_time
+                next_leg_source = (None, con_index)
+            if dep_time <= vehicle_departure_per_stop_index[con_from_stop_index]:
+                continue  # limited walking: the footpaths were already relaxed with a later departure
+            vehicle_departure_per_stop_index[con_from_stop_index] = dep_time
+            for walk_from_stop_index, walking_time, footpath in \
+                    self.incoming_footpaths_per_stop_index[con_from_stop_index]:
+                dep_time_walk = dep_time - walking_time
+                if dep_time_walk > latest_arrival_per_stop_index[walk_from_stop_index]:
+                    latest_arrival_per_stop_index[walk_from_stop_index] = dep_time_walk
+                    if with_reconstruction:
+                        next_leg_per_stop_index[walk_from_stop_index] = (footpath, con_index)
+                if walk_from_stop_index == from_stop_index and walk_from_stop_index != con_from_stop_index and \
+                        dep_time_walk > latest_departure_source:
+                    latest_departure_source = dep_time_walk
+                    next_leg_source = (footpath, con_index)
+
+        return (latest_departure_source, next_leg_source,
+                (next_leg_per_stop_index, exit_per_trip_index) if with_reconstruction else None)
+
+    def scan_latest_departure_all_sources(self, to_stop_index, desired_arr_time):
+        """Scans the columnar connection store of the ConnectionScanData in descending arrival time order
+        for the latest departure from all stops to the target stop (see scan_latest_departure).
+
+        Args:
+            to_stop_index (int): index of the target stop.
+            desired_arr_time (int): desired arrival time in seconds after midnight.
+
+        Returns:
+            list: latest departure time per stop index (MIN_DEP_TIME_VALUE if the target stop is not reachable).
+        """
+        cs_data = self.connection_scan_data
+        nb_stops = len(cs_data.stop_id_registry)
+        latest_arrival_per_stop_index = [self.MIN_DEP_TIME_VALUE] * nb_stops  # including transfer/walking times
+        latest_departure_per_stop_index = [self.MIN_DEP_TIME_VALUE] * nb_stops  # without transfer time at the start
+        vehicle_departure_per_stop_index = [self.MIN_DEP_TIME_VALUE] * nb_stops
+        trip_is_set_per_trip_index = [False] * len(cs_data.trip_id_registry)
+
+        latest_arrival_per_stop_index[to_stop_index] = desired_arr_time
+        latest_departure_per_stop_index[to_stop_index] = desired_arr_time
+        walking_time_to_target_per_stop_index = {}
+        for walk_from_stop_index, walking_time, _ in self.incoming_footpaths_per_stop_index[to_stop_index]:
+            if walk_from_stop_index != to_stop_index:
+                walking_time_to_target_per_stop_index[walk_from_stop_index] = walking_time
+                dep_time_walk = desired_arr_time - walking_time
+                latest_arrival_per_stop_index[walk_from_stop_index] = max(
+                    latest_arrival_per_stop_index[walk_from_stop_index], dep_time_walk)
+                latest_departure_per_stop_index[walk_from_stop_index] = max(
+                    latest_departure_per_stop_index[walk_from_stop_index], dep_time_walk)
+
+        con_indices = cs_data.connection_indices_by_arr_time[:self.get_last_connection_position(desired_arr_time)][::-1]
+        for dep_time, arr_time, con_from_stop_index, con_to_stop_index, trip_index in zip(
+                cs_data.dep_times[con_indices],
+                cs_data.arr_times[con_indices],
+                cs_data.from_stop_indices[con_indices],
+                cs_data.to_stop_indices[con_indices],
+                cs_data.trip_indices[con_indices]):
+            if not trip_is_set_per_trip_index[trip_index]:
+                if con_to_stop_index != to_stop_index and \
+                        arr_time + walking_time_to_target_per_stop_index.get(con_to_stop_index,
+                                                                             self.MAX_ARR_TIME_VALUE) > \
+                        desired_arr_time and latest_arrival_per_stop_index[con_to_stop_index] < arr_time:
+                    continue
+                trip_is_set_per_trip_index[trip_index] = True
+            if dep_time <= vehicle_departure_per_stop_index[con_from_stop_index]:
+                continue  # limited walking
+            vehicle_departure_per_stop_index[con_from_stop_index] = dep_time
+            if dep_time > latest_departure_per_stop_index[con_from_stop_index]:
+                latest_departure_per_stop_index[con_from_stop_index] = dep_time
+            for walk_from_stop_index, walking_time, _ in self.incoming_footpaths_per_stop_index[con_from_stop_index]:
+                dep_time_walk = dep_time - walking_time
+                if dep_time_walk > latest_arrival_per_stop_index[walk_from_stop_index]:
+                    latest_arrival_per_stop_index[walk_from_stop_index] = dep_time_walk
+                if walk_from_stop_index != con_from_stop_index and \
+                        dep_time_walk > latest_departure_per_stop_index[walk_from_stop_index]:
+                    latest_departure_per_stop_index[walk_from_stop_index] = dep_time_walk
+        return latest_departure_per_stop_index
+
+    def reconstruct_journey_backward(self, next_leg_source, next_legs):
+        """Reconstructs the journey from the next leg pointers collected in scan_latest_departure.
+
+        Args:
+            next_leg_source (tuple): next leg pointer at the source stop.
+            next_legs (tuple): next leg pointer per stop index and exit per trip index.
+
+        Returns:
+            Journey: the reconstructed journey (without journey legs if the target stop is not reachable).
+        """
+        cs_data = self.connection_scan_data
+        next_leg_per_stop_index, exit_per_trip_index = next_legs
+        journey_legs = []
+        if next_leg_source is not None:
+            footpath, in_connection_index = next_leg_source
+            if footpath is not None:
+                journey_legs += [JourneyLeg(None, None, footpath)]
+            while in_connection_index is not None:
+                out_connection_index, footpath, is_last = exit_per_trip_index[cs_data.trip_indices[in_connection_index]]
+                next_in_connection_index = None
+                if not is_last:
+                    footpath, next_in_connection_index = next_leg_per_stop_index[
+                        cs_data.to_stop_indices[out_connection_index]]
+                journey_legs += [JourneyLeg(cs_data.sorted_connections[in_connection_index],
+                                            cs_data.sorted_connections[out_connection_index],
+                                            footpath)]
+                in_connection_index = next_in_connection_index
+        journey = Journey()
+        for journey_leg in reversed(journey_legs):
+            journey.prepend_journey_leg(journey_leg)
+        return journey
+
     def route_by_name(self, from_stop_name, to_stop_name, desired_dep_time_hhmmss, router):
         """Wrapper function to execute routing requests based on the name of the source and target stop.
 
@@ -326,6 +1507,211 @@ class ConnectionScanCore:
         )
 
 
+class KernelJourneyLegs:
+    """Read-only view on the journey legs per stop index returned by the scan kernels
+    as journey leg pointers (see ConnectionScanCore.scan_earliest_arrival).
+
+    Args and attributes:
+        in_connection_indices (ndarray): index of the in connection per stop index (-1 if not defined).
+        out_connection_indices (ndarray): index of the out connection per stop index (-1 if not defined).
+        footpath_indices (ndarray): position of the footpath in footpaths per stop index (-1 if not defined).
+        footpaths (list): footpaths referenced by footpath_indices.
+    """
+    __slots__ = ["in_connection_indices", "out_connection_indices", "footpath_indices", "footpaths"]
+
+    def __init__(self, in_connection_indices, out_connection_indices, footpath_indices, footpaths):
+        self.in_connection_indices = in_connection_indices
+        self.out_connection_indices = out_connection_indices
+        self.footpath_indices = footpath_indices
+        self.footpaths = footpaths
+
+    def get_journey_leg(self, in_connection_index, out_connection_index, footpath_index):
+        """Converts a journey leg given as positions into a journey leg pointer.
+
+        Returns:
+            tuple: the journey leg pointer or None if the journey leg is not defined.
+        """
+        footpath = self.footpaths[footpath_index] if footpath_index >= 0 else None
+        if in_connection_index < 0:
+            return None if footpath is None else (None, None, footpath)
+        return int(in_connection_index), int(out_connection_index), footpath
+
+    def __getitem__(self, stop_index):
+        return self.get_journey_leg(self.in_connection_indices[stop_index],
+                                    self.out_connection_indices[stop_index],
+                                    self.footpath_indices[stop_index])
+
+    def __len__(self):
+        return len(self.in_connection_indices)
+
+
+def get_query_message(description, from_stop, to_stop, desired_time, max_desired_time=None):
+    """Returns the log message of a routing query (built by log_start only if the message is logged).
+
+    Args:
+        description (str): description of the router.
+        from_stop (Stop): the source stop (None for all stops).
+        to_stop (Stop): the target stop (None for all stops).
+        desired_time (int): desired departure or arrival time in seconds after midnight.
+        max_desired_time (:obj:`int`, optional): end of the departure time range in seconds after midnight
+        (for profile queries). Default is None.
+
+    Returns:
+        str: the log message.
+    """
+    return "{} from {} to {} {}".format(
+        description,
+        "all stops" if from_stop is None else from_stop.name,
+        "all stops" if to_stop is None else to_stop.name,
+        "at {}".format(seconds_to_hhmmss(desired_time)) if max_desired_time is None else "between {} and {}".format(
+            seconds_to_hhmmss(desired_time), seconds_to_hhmmss(max_desired_time)))
+
+
+def get_time_message(description, seconds):
+    """Returns the log message of a time of a routing result (built by log_end only if the message is logged).
+
+    Args:
+        description (str): description of the time.
+        seconds (int): the time in seconds after midnight (None if there is no result).
+
+    Returns:
+        str: the log message.
+    """
+    return "{}: {}".format(description, seconds_to_hhmmss(seconds))
+
+
+def create_connection_time_indexes(dep_times, arr_times):
+    """Creates the time indexes of the connections (see connection_indices_by_arr_time and
+    first_connection_index_per_minute of ConnectionScanData).
+
+    Args:
+        dep_times (ndarray): departure time per connection (sorted by departure time).
+        arr_times (ndarray): arrival time per connection.
+
+    Returns:
+        tuple: connection_indices_by_arr_time and first_connection_index_per_minute.
+    """
+    # stable sort: connections with equal times keep their order in sorted_connections (i.e. in their trip)
+    connection_indices_by_arr_time = np.lexsort((dep_times, arr_times)).astype(np.int32)
+
+    # departure time index: first connection departing not before the begin of every minute
+    nb_minutes = int(dep_times[-1]) // 60 + 2 if len(dep_times) > 0 else 1
+    first_connection_index_per_minute = np.searchsorted(
+        dep_times, np.arange(nb_minutes, dtype=np.int64) * 60, side="left").astype(np.int32)
+    return connection_indices_by_arr_time, first_connection_index_per_minute
+
+
+def get_stops_per_name(stops_per_id):
+    """Returns the stop per stop name. If the name is not unique, the name is assigned the best fitting stop
+    according to the following logic: (1. stop which is a station, 2. stop which has the shortest id).
+
+    Args:
+        stops_per_id (dict): stop per stop id.
+
+    Returns:
+        dict: stop per stop name.
+    """
+    stop_list_per_name = defaultdict(list)
+    for a_stop in stops_per_id.values():
+        stop_list_per_name[a_stop.name] += [a_stop]
+
+    def choose_best_stop(stops_with_same_name):
+        """Helper function for chosen the best fitting stop per stop name"""
+        stops_with_same_name_sorted = sorted(stops_with_same_name,
+                                             key=lambda s: (0 if s.is_station else 1, len(s.id)))
+        return stops_with_same_name_sorted[0]
+
+    return {name: choose_best_stop(stop_list) for (name, stop_list) in stop_list_per_name.items()}
+
+
+def check_connection_scan_data(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id):
+    """Checks the consistency of the timetable data (ValidationLevel.FULL)
+    and raises a ValueError if the data is inconsistent.
+
+    The ids in the dicts must equal the ids of the stops, footpaths and trips and all stop ids occurring
+    in footpaths and connections of trips must occur in stops_per_id.
+    If the footpaths are not transitive, a warning is logged (see check_for_transitivity).
+
+    Args:
+        stops_per_id (dict): stop per stop id.
+        footpaths_per_from_to_stop_id (dict): footpath per (from_stop_id, to_stop_id)-tuple.
+        trips_per_id (dict): trip per trip id.
+    """
+    with log_span("checking consistency of timetable data ({})", log, ValidationLevel.FULL):
+        # stops
+        for stop_id, stop in stops_per_id.items():
+            if stop_id != stop.id:
+                raise ValueError("id in dict ({}) does not equal id in Stop {}".format(stop_id, stop))
+
+        # footpaths
+        for ((from_stop_id, to_stop_id), footpath) in footpaths_per_from_to_stop_id.items():
+            if from_stop_id != footpath.from_stop_id:
+                raise ValueError(
+                    "from_stop_id {} in dict does not equal from_stop_id in footpath {}".format(from_stop_id, footpath))
+            if to_stop_id != footpath.to_stop_id:
+                raise ValueError(
+                    "to_stop_id {} in dict does not equal to_stop_id in footpath {}".format(to_stop_id, footpath))
+
+        stop_ids_in_footpaths = {s[0] for s in footpaths_per_from_to_stop_id.keys()}.union(
+            {s[1] for s in footpaths_per_from_to_stop_id.keys()})
+        stop_ids_in_footpaths_not_in_stops = stop_ids_in_footpaths.difference(set(stops_per_id.keys()))
+        if len(stop_ids_in_footpaths_not_in_stops) > 0:
+            raise ValueError(("there are stop_ids in footpaths_per_from_to_stop_id which do not occur as stop_id in "
+                              "stops_per_id: {}").format(
+                stop_ids_in_footpaths_not_in_stops))
+
+        new_footpaths, footpaths_with_time_change = check_for_transitivity(footpaths_per_from_to_stop_id)
+        if len(new_footpaths) > 0 or len(footpaths_with_time_change) > 0:
+            msg_str = "footpaths are not transitive: there are {} missing footpaths and {} footpaths" \
+                      " violating the triangle inequality"
+            log.warning(msg_str.format(len(new_footpaths), len(footpaths_with_time_change)))
+
+        # trips
+        for trip_id, trip in trips_per_id.items():
+            if trip_id != trip.id:
+                raise ValueError("id in dict ({}) does not equal id in Trip {}".format(trip_id, trip))
+
+        stop_ids_in_trips = {s for t in trips_per_id.values() for s in t.get_set_of_all_stop_ids()}
+        stop_ids_in_trips_not_in_stops = stop_ids_in_trips.difference(set(stops_per_id.keys()))
+        if len(stop_ids_in_trips_not_in_stops) > 0:
+            raise ValueError(
+                "there are stop_ids in trips_per_id which do not occur as stop_id in stops_per_id: {}".format(
+                    stop_ids_in_trips_not_in_stops))
+
+
+def check_connection_scan_data_fast(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id):
+    """Checks the consistency of the timetable data like check_connection_scan_data (ValidationLevel.FAST),
+    but without the check for transitivity of the footpaths.
+
+    The ids are compared and collected into sets by C-level iterators (map, set operations on the key views)
+    instead of python loops. Only if an inconsistency is found, check_connection_scan_data is called
+    to raise the detailed ValueError.
+
+    Args:
+        stops_per_id (dict): stop per stop id.
+        footpaths_per_from_to_stop_id (dict): footpath per (from_stop_id, to_stop_id)-tuple.
+        trips_per_id (dict): trip per trip id.
+    """
+    with log_span("checking consistency of timetable data ({})", log, ValidationLevel.FAST) as span:
+        footpaths = footpaths_per_from_to_stop_id.values()
+        connections = list(chain.from_iterable(map(attrgetter("connections"), trips_per_id.values())))
+        is_consistent = (
+            all(map(eq, stops_per_id.keys(), map(attrgetter("id"), stops_per_id.values())))
+            and all(map(eq, map(itemgetter(0), footpaths_per_from_to_stop_id.keys()),
+                        map(attrgetter("from_stop_id"), footpaths)))
+            and all(map(eq, map(itemgetter(1), footpaths_per_from_to_stop_id.keys()),
+                        map(attrgetter("to_stop_id"), footpaths)))
+            and stops_per_id.keys() >= set(map(attrgetter("from_stop_id"), footpaths)).union(
+                map(attrgetter("to_stop_id"), footpaths))
+            and all(map(eq, trips_per_id.keys(), map(attrgetter("id"), trips_per_id.values())))
+            and stops_per_id.keys() >= set(map(attrgetter("from_stop_id"), connections)).union(
+                map(attrgetter("to_stop_id"), connections))
+        )
+        if not is_consistent:
+            check_connection_scan_data(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id)
+        span.set_additional_message("# footpaths: {}, # connections: {}", len(footpaths), len(connections))
+
+
 def check_for_transitivity(footpaths_per_from_to_stop_id):
     """Checks the footpaths for transitivity
     and returns missing footpaths and modified footpaths violating the triangle inequality.
@@ -348,9 +1734,9 @@ def check_for_transitivity(footpaths_per_from_to_stop_id):
         tuple: new and modified footpaths (see above for the details).
     """
     log_start("checking footpaths for transitivity", log)
-    footpaths_per_from_stop_id = {}
+    footpaths_per_from_stop_id = defaultdict(list)
     for (from_stop_id, _), footpath in footpaths_per_from_to_stop_id.items():
-        footpaths_per_from_stop_id[from_stop_id] = footpaths_per_from_stop_id.get(from_stop_id, []) + [footpath]
+        footpaths_per_from_stop_id[from_stop_id].append(footpath)
     new_footpaths = []
     footpaths_with_time_change = []
     footpaths_per_from_stop_id = dict(footpaths_per_from_stop_id)
@@ -367,34 +1753,101 @@ def check_for_transitivity(footpaths_per_from_to_stop_id):
     return new_footpaths, footpaths_with_time_change
 
 
-def make_transitive(footpaths_per_from_to_stop_id):
-    """Iteratively adds new footpaths or modifies the walking times until the footpaths are transitive.
+def make_transitive(footpaths_per_from_to_stop_id, max_walking_time=None):
+    """Adds new footpaths or modifies the walking times so that the footpaths are transitive.
+
+    All new and shortened footpaths are computed in a single pass by a bounded dijkstra from every stop
+    within its (weakly) connected component of the footpath graph (see get_footpath_closure).
+    If max_walking_time is None, the result is the same as the one of the repeated application
+    of check_for_transitivity, except that an existing footpath is kept if the shortest walking time is 0
+    (as in check_for_transitivity the walking time of an existing footpath is never reduced to 0).
 
     Args:
         footpaths_per_from_to_stop_id (dict): footpath per (from_stop_id, to_stop_id)-tuple.
+        max_walking_time (:obj:`float`, optional): maximal walking time in seconds of the new or shortened footpaths
+        (the footpaths are only transitive up to this walking time). Default is None (no limit).
     """
-    log_start("making footpaths transitive", log)
-    n = 0
+    log_start("making footpaths transitive (max. walking time: {})".format(max_walking_time), log)
     nb_footpaths_added = 0
     nb_footpaths_changed_time = 0
-    while True:
-        new_footpaths, footpaths_with_time_change = check_for_transitivity(footpaths_per_from_to_stop_id)
-        if len(new_footpaths) > 0 or len(footpaths_with_time_change) > 0:
-            for new_footpath in new_footpaths:
-                footpaths_per_from_to_stop_id[new_footpath.from_stop_id, new_footpath.to_stop_id] = new_footpath
-            for mod_footpath in footpaths_with_time_change:
-                footpaths_per_from_to_stop_id[mod_footpath.from_stop_id, mod_footpath.to_stop_id] = mod_footpath
-            str_msg = "iteration {}: # footpaths added: {}, # footpaths with changed walking time: {}"
-            log.info(str_msg.format(n, len(new_footpaths), len(footpaths_with_time_change)))
-            n += 1
-            nb_footpaths_added += len(new_footpaths)
-            nb_footpaths_changed_time += len(footpaths_with_time_change)
-        else:
-            break
-    str_msg = "# iterations: {}, # footpaths added: {}, # footpaths with changed time: {}, # footpaths total: {}"
+    for from_stop_id, to_stop_id, walking_time in get_footpath_closure(footpaths_per_from_to_stop_id,
+                                                                       max_walking_time):
+        footpath = footpaths_per_from_to_stop_id.get((from_stop_id, to_stop_id), None)
+        if footpath is None:
+            footpaths_per_from_to_stop_id[from_stop_id, to_stop_id] = Footpath(from_stop_id, to_stop_id, walking_time)
+            nb_footpaths_added += 1
+        elif 0 < walking_time < footpath.walking_time:
+            footpaths_per_from_to_stop_id[from_stop_id, to_stop_id] = Footpath(from_stop_id, to_stop_id, walking_time)
+            nb_footpaths_changed_time += 1
+    str_msg = "# footpaths added: {}, # footpaths with changed time: {}, # footpaths total: {}"
     log_end(additional_message=str_msg.format(
-        n,
         nb_footpaths_added,
         nb_footpaths_changed_time,
         len(footpaths_per_from_to_stop_id))
     )
+
+
+def get_footpath_closure(footpaths_per_from_to_stop_id, max_walking_time=None, max_batch_size=10 ** 7):
+    """Returns the shortest walking time between all pairs of stops connected by a sequence of footpaths.
+
+    The footpath graph is split into its weakly connected components and a dijkstra (bounded by max_walking_time)
+    is run from every stop of a component on the subgraph of the component only.
+    The walking time of a loop (from a stop to itself) is the shortest cycle through this stop
+    (only loops given in footpaths_per_from_to_stop_id can have a walking time of 0).
+
+    Args:
+        footpaths_per_from_to_stop_id (dict): footpath per (from_stop_id, to_stop_id)-tuple.
+        max_walking_time (:obj:`float`, optional): pairs with a longer walking time are omitted.
+        Default is None (no limit).
+        max_batch_size (:obj:`int`, optional): maximal number of entries of the distance matrix computed at once
+        (limits the memory consumption on large components). Default is 10 ** 7.
+
+    Returns:
+        list: (from_stop_id, to_stop_id, walking_time)-tuples.
+    """
+    from scipy import sparse
+    from scipy.sparse import csgraph
+
+    stop_id_registry = IdRegistry(dict.fromkeys(stop_id for from_to_stop_id in footpaths_per_from_to_stop_id
+                                                for stop_id in from_to_stop_id))
+    from_indices = []
+    to_indices = []
+    walking_times = []
+    for (from_stop_id, to_stop_id), footpath in footpaths_per_from_to_stop_id.items():
+        if from_stop_id != to_stop_id:
+            from_indices += [stop_id_registry.index_per_id[from_stop_id]]
+            to_indices += [stop_id_registry.index_per_id[to_stop_id]]
+            walking_times += [footpath.walking_time]
+    nb_stops = len(stop_id_registry)
+    limit = np.inf if max_walking_time is None else max_walking_time
+    # explicit zeros are edges with walking time 0 in csgraph
+    graph = sparse.csr_matrix((np.array(walking_times, dtype=np.float64), (from_indices, to_indices)),
+                              shape=(nb_stops, nb_stops))
+    nb_components, component_per_stop = csgraph.connected_components(graph, directed=True, connection="weak")
+    stop_indices_per_component = np.split(np.argsort(component_per_stop, kind="stable"),
+                                          np.cumsum(np.bincount(component_per_stop, minlength=nb_components))[:-1])
+    closure = []
+    for stop_indices in stop_indices_per_component:
+        if len(stop_indices) < 2:
+            continue
+        subgraph = graph[stop_indices][:, stop_indices]
+        incoming_subgraph = subgraph.T.tocsr()
+        batch_size = max(1, max_batch_size // len(stop_indices))
+        for batch_start in range(0, len(stop_indices), batch_size):
+            sources = np.arange(batch_start, min(batch_start + batch_size, len(stop_indices)))
+            distances = csgraph.dijkstra(subgraph, indices=sources, limit=limit)
+            # shortest cycle through a source: shortest path to a stop w and the footpath from w back to the source
+            distances_to_source = np.full(len(sources), np.inf)
+            for row, source in enumerate(sources.tolist()):
+                incoming = slice(incoming_subgraph.indptr[source], incoming_subgraph.indptr[source + 1])
+                if incoming.start < incoming.stop:
+                    distances_to_source[row] = np.min(distances[row, incoming_subgraph.indices[incoming]] +
+                                                      incoming_subgraph.data[incoming])
+            distances[np.arange(len(sources)), sources] = np.where(distances_to_source <= limit,
+                                                                   distances_to_source, np.inf)
+            rows, columns = np.nonzero(np.isfinite(distances))
+            closure += [(stop_id_registry.ids[stop_indices[sources[row]]], stop_id_registry.ids[stop_indices[column]],
+                         walking_time)
+                        for row, column, walking_time in zip(rows.tolist(), columns.tolist(),
+                                                             distances[rows, columns].tolist())]
+    return closure
@@ -2,40 +2,67 @@
 # -*- coding: utf-8 -*-
 """This module provides a parser for gtfs data."""
 import csv
+import gc
 import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
 from io import TextIOWrapper
 from zipfile import ZipFile
 
+import numpy as np
+import pandas as pd
 from scipy import spatial
 
 from scripts.classes import Connection, Footpath, Stop, Trip, TripType
-from scripts.connectionscan_router import ConnectionScanData, make_transitive
-from scripts.helpers.funs import hhmmss_to_sec, parse_yymmdd, wgs84_to_spherical_mercator, distance
-from scripts.helpers.my_logging import log_end, log_start
+from scripts.connectionscan_router import ConnectionScanData, ValidationLevel, make_transitive
+from scripts.helpers.funs import (EARTH_RADIUS, cached_hhmmss_to_sec, haversine_distance, hhmmss_array_to_sec,
+                                  parse_yymmdd, wgs84_to_spherical_mercator_array)
+from scripts.helpers.my_logging import log_elapsed, log_end, log_span, log_start
 
 ENCODING = "utf-8-sig"  # we use utf-8-sig since gtfs-data from switzerland are encoded in utf-8-with-bom
 
 log = logging.getLogger(__name__)
 
+_worker_stop_lookup = None  # stop lookup of convert_stop_times_chunk in a worker (see _init_stop_times_worker)
+
 
 def get_index_with_default(header, column_name, default_value=None):
     """Helper function to extract the index of a column."""
     return header.index(column_name) if column_name in header else default_value
 
 
+class BeelineMetric(Enum):
+    """Definition of the metrics of the beeline distance between two stops."""
+    MERCATOR = 0  # euclidean distance of the spherical mercator coordinates (inaccurate far from the equator)
+    HAVERSINE = 1  # great-circle distance (haversine formula)
+
+
+DEFAULT_STOP_TIMES_CHUNK_SIZE = 100000  # number of rows of stop_times.txt per chunk if parsed in parallel
+
+
 def parse_gtfs(
         path_to_gtfs_zip,
         desired_date,
         add_beeline_footpaths=True,
         beeline_distance=100.0,
         walking_speed=2.0 / 3.6,
-        make_footpaths_transitive=False
+        make_footpaths_transitive=False,
+        stop_times_chunk_size=None,
+        nb_processes=1,
+        beeline_metric=BeelineMetric.MERCATOR,
+        max_transitive_walking_time=None,
+        validation_level=ValidationLevel.FULL
 ):
     """Parses a gtfs-file and returns the corresponding timetable data of a specific date.
 
     In many GTFS files the information about the footpaths/transfers is not complete.
     In these cases it is recommended to define appropriate footpaths within a beeline distance.
 
+    If nb_processes is not 1, the gtfs-file is parsed by a pipeline of processes (see parse_gtfs_in_parallel).
+
     Args:
         path_to_gtfs_zip (str): path to the gtfs-file (weblink or path to a zip-file).
         desired_date (date): date on which the timetable data is read.
@@ -46,45 +73,162 @@ def parse_gtfs(
         walking_speed (obj:`float`, optional): walking speed in meters per second for calculating the walking time
         of the created beeline footpaths (only relevant if add_beeline_footpaths is True).
         make_footpaths_transitive (obj:`bool`, optional): True if the footpaths are to be made transitive, else False.
-        Making footpaths transitive can lead to long running times and implausible results.
+        Making footpaths transitive can lead to implausible results (see also max_transitive_walking_time).
+        stop_times_chunk_size (obj:`int`, optional): if defined, stop_times.txt is read in chunks of this number of rows
+        and the connections are created vectorized (see read_stop_times_in_chunks). Otherwise stop_times.txt is read
+        row by row (or in chunks of DEFAULT_STOP_TIMES_CHUNK_SIZE rows if parsed in parallel). Default is None.
+        nb_processes (obj:`int`, optional): number of processes. Default is 1 (i.e. the gtfs-file is parsed
+        in the calling process). None means os.cpu_count().
+        beeline_metric (obj:`BeelineMetric`, optional): metric of the beeline distance
+        (only relevant if add_beeline_footpaths is True). Default is BeelineMetric.MERCATOR.
+        max_transitive_walking_time (obj:`float`, optional): maximal walking time in seconds of the footpaths
+        created or shortened by making the footpaths transitive (only relevant if make_footpaths_transitive is True).
+        Default is None (no limit).
+        validation_level (obj:`ValidationLevel`, optional): consistency checks of the created ConnectionScanData.
+        Default is ValidationLevel.FULL.
 
     Returns:
         ConnectionScanData: timetable data of the specific date.
     """
-    log_start("parsing gtfs-file for desired date {} ({})".format(desired_date, path_to_gtfs_zip), log)
-    stops_per_id = {}
-    footpaths_per_from_to_stop_id = {}
-    trips_per_id = {}
+    nb_processes = os.cpu_count() if nb_processes is None else nb_processes
+    if nb_processes > 1:
+        return parse_gtfs_in_parallel(path_to_gtfs_zip, desired_date, add_beeline_footpaths, beeline_distance,
+                                      walking_speed, make_footpaths_transitive, stop_times_chunk_size, nb_processes,
+                                      beeline_metric, max_transitive_walking_time, validation_level)
+    with log_span("parsing gtfs-file for desired date {} ({})".format(desired_date, path_to_gtfs_zip), log) as span:
+        with ZipFile(path_to_gtfs_zip, "r") as zip_file:
+            stops_per_id = parse_stops(zip_file)
+            footpaths_per_from_to_stop_id = create_footpaths(zip_file, stops_per_id, add_beeline_footpaths,
+                                                             beeline_distance, walking_speed, make_footpaths_transitive,
+                                                             beeline_metric, max_transitive_walking_time)
+            trip_available_at_date_per_trip_id, route_type_per_trip_id = parse_trips(zip_file, desired_date)
+            trips_per_id = parse_stop_times(zip_file, stops_per_id, trip_available_at_date_per_trip_id,
+                                            route_type_per_trip_id, stop_times_chunk_size)
+
+        cs_data = ConnectionScanData(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id,
+                                     validation_level=validation_level)
+        span.set_additional_message("{}".format(cs_data))
+    return cs_data
+
+
+def parse_gtfs_in_parallel(path_to_gtfs_zip, desired_date, add_beeline_footpaths, beeline_distance, walking_speed,
+                           make_footpaths_transitive, stop_times_chunk_size, nb_processes,
+                           beeline_metric=BeelineMetric.MERCATOR, max_transitive_walking_time=None,
+                           validation_level=ValidationLevel.FULL):
+    """Parses a gtfs-file by a pipeline of processes and returns the corresponding timetable data of a specific date.
 
+    The pipeline consists of the following stages:
+    - stops.txt and trips.txt (with calendar.txt, calendar_dates.txt and routes.txt) are parsed concurrently.
+    - as soon as the stops are parsed, the footpaths are created (transfers.txt, beeline footpaths) in the background.
+    - as soon as the stops and trips are parsed, stop_times.txt is split at trip boundaries and the chunks are
+    processed by a pool of nb_processes processes (see read_stop_times_in_chunks).
+    The stages are timed in the processes executing them and the timings are logged in the calling process.
+
+    Args:
+        see parse_gtfs.
+
+    Returns:
+        ConnectionScanData: timetable data of the specific date.
+    """
+    with log_span("parsing gtfs-file for desired date {} ({}) with {} processes".format(
+            desired_date, path_to_gtfs_zip, nb_processes), log) as span:
+        if stop_times_chunk_size is None:
+            stop_times_chunk_size = DEFAULT_STOP_TIMES_CHUNK_SIZE
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            stops_future = executor.submit(_run_stage, parse_stops, path_to_gtfs_zip)
+            trips_future = executor.submit(_run_stage, parse_trips, path_to_gtfs_zip, desired_date)
+            stops_per_id, elapsed = stops_future.result()
+            log_elapsed("stage parsing stops.txt", elapsed, log)
+            footpaths_future = executor.submit(_run_stage, create_footpaths, path_to_gtfs_zip, stops_per_id,
+                                               add_beeline_footpaths, beeline_distance, walking_speed,
+                                               make_footpaths_transitive, beeline_metric, max_transitive_walking_time)
+            (trip_available_at_date_per_trip_id, route_type_per_trip_id), elapsed = trips_future.result()
+            log_elapsed("stage parsing trips.txt, calendar.txt, calendar_dates.txt and routes.txt", elapsed, log)
+
+            start_time = time.time()
+            with ZipFile(path_to_gtfs_zip, "r") as zip_file:
+                trips_per_id = parse_stop_times(zip_file, stops_per_id, trip_available_at_date_per_trip_id,
+                                                route_type_per_trip_id, stop_times_chunk_size, nb_processes)
+            log_elapsed("stage parsing stop_times.txt", time.time() - start_time, log)
+
+            footpaths_per_from_to_stop_id, elapsed = footpaths_future.result()
+            log_elapsed("stage creating footpaths", elapsed, log)
+
+        cs_data = ConnectionScanData(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id,
+                                     validation_level=validation_level)
+        span.set_additional_message("{}".format(cs_data))
+    return cs_data
+
+
+def _run_stage(stage_function, path_to_gtfs_zip, *args):
+    """Helper function for executing a stage of parse_gtfs_in_parallel in a process.
+    Returns the result of the stage and the elapsed time in seconds."""
+    start_time = time.time()
     with ZipFile(path_to_gtfs_zip, "r") as zip_file:
-        log_start("parsing stops.txt", log)
-        with zip_file.open("stops.txt", "r") as gtfs_file:  # required
-            reader = csv.reader(TextIOWrapper(gtfs_file, ENCODING))
-            header = next(reader)
-            id_index = header.index("stop_id")  # required
-            code_index = get_index_with_default(header, "stop_code")  # optional
-            name_index = get_index_with_default(header, "stop_name")  # conditionally required
-            lat_index = get_index_with_default(header, "stop_lat")  # conditionally required
-            lon_index = get_index_with_default(header, "stop_lon")  # conditionally required
-            location_type_index = get_index_with_default(header, "location_type")
-            parent_station_index = get_index_with_default(header, "parent_station")
-            for row in reader:
-                stop_id = row[id_index]
-                is_station = row[location_type_index] == "1" if location_type_index else False
-                parent_station_id = ((row[parent_station_index] if row[parent_station_index] != "" else None)
-                                     if parent_station_index else None)
-                stops_per_id[stop_id] = Stop(
-                    stop_id,
-                    row[code_index] if code_index else "",
-                    row[name_index] if name_index else "",
-                    float(row[lon_index]) if lon_index else 0.0,
-                    float(row[lat_index]) if lat_index else 0.0,
-                    is_station=is_station,
-                    parent_station_id=parent_station_id
-                )
-        log_end(additional_message="# stops: {}".format(len(stops_per_id)))
-
-        log_start("parsing transfers.txt", log)
+        res = stage_function(zip_file, *args)
+    return res, time.time() - start_time
+
+
+def parse_stops(zip_file):
+    """Parses stops.txt and returns the stop per stop id.
+
+    Args:
+        zip_file (ZipFile): gtfs-file.
+
+    Returns:
+        dict: stop per stop id.
+    """
+    stops_per_id = {}
+    log_start("parsing stops.txt", log)
+    with zip_file.open("stops.txt", "r") as gtfs_file:  # required
+        reader = csv.reader(TextIOWrapper(gtfs_file, ENCODING))
+        header = next(reader)
+        id_index = header.index("stop_id")  # required
+        code_index = get_index_with_default(header, "stop_code")  # optional
+        name_index = get_index_with_default(header, "stop_name")  # conditionally required
+        lat_index = get_index_with_default(header, "stop_lat")  # conditionally required
+        lon_index = get_index_with_default(header, "stop_lon")  # conditionally required
+        location_type_index = get_index_with_default(header, "location_type")
+        parent_station_index = get_index_with_default(header, "parent_station")
+        for row in reader:
+            stop_id = row[id_index]
+            is_station = row[location_type_index] == "1" if location_type_index else False
+            parent_station_id = ((row[parent_station_index] if row[parent_station_index] != "" else None)
+                                 if parent_station_index else None)
+            stops_per_id[stop_id] = Stop(
+                stop_id,
+                row[code_index] if code_index else "",
+                row[name_index] if name_index else "",
+                float(row[lon_index]) if lon_index else 0.0,
+                float(row[lat_index]) if lat_index else 0.0,
+                is_station=is_station,
+                parent_station_id=parent_station_id
+            )
+    log_end(additional_message="# stops: {}".format(len(stops_per_id)))
+    return stops_per_id
+
+
+def create_footpaths(zip_file, stops_per_id, add_beeline_footpaths, beeline_distance, walking_speed,
+                     make_footpaths_transitive, beeline_metric=BeelineMetric.MERCATOR,
+                     max_transitive_walking_time=None):
+    """Parses transfers.txt and returns the footpaths completed by footpaths from/to parent stations,
+    footpaths within stops and (optionally) beeline footpaths (see parse_gtfs for the arguments).
+
+    Args:
+        zip_file (ZipFile): gtfs-file.
+        stops_per_id (dict): stop per stop id.
+        add_beeline_footpaths (bool): see parse_gtfs.
+        beeline_distance (float): see parse_gtfs.
+        walking_speed (float): see parse_gtfs.
+        make_footpaths_transitive (bool): see parse_gtfs.
+        beeline_metric (:obj:`BeelineMetric`, optional): see parse_gtfs. Default is BeelineMetric.MERCATOR.
+        max_transitive_walking_time (:obj:`float`, optional): see parse_gtfs. Default is None.
+
+    Returns:
+        dict: footpath per (from_stop_id, to_stop_id)-tuple.
+    """
+    footpaths_per_from_to_stop_id = {}
+    with log_span("parsing transfers.txt", log) as span:
         if "transfers.txt" in zip_file.namelist():
             with zip_file.open("transfers.txt", "r") as gtfs_file:  # optional
                 reader = csv.reader(TextIOWrapper(gtfs_file, ENCODING))
@@ -116,117 +260,392 @@ def parse_gtfs(
                 else:
                     raise ValueError(("min_transfer_time column in gtfs transfers.txt file is not defined, "
                                       "cannot calculate footpaths."))
-        log_end(additional_message="# footpaths from transfers.txt: {}".format(len(footpaths_per_from_to_stop_id)))
-        log_start("adding footpaths to parent station", log)
-        nb_parent_footpaths = 0
-        for a_stop in stops_per_id.values():
-            if a_stop.parent_station_id is not None:
-                key = (a_stop.id, a_stop.parent_station_id)
-                if key not in footpaths_per_from_to_stop_id:
-                    footpaths_per_from_to_stop_id[key] = Footpath(key[0], key[1], 0)
-                    nb_parent_footpaths += 1
-                if (key[1], key[0]) not in footpaths_per_from_to_stop_id:
-                    footpaths_per_from_to_stop_id[(key[1], key[0])] = Footpath(key[1], key[0], 0)
-                    nb_parent_footpaths += 1
-        log_end(additional_message="# footpath from/to parent_station added: {}. # footpaths total: {}".format(
-            nb_parent_footpaths, len(footpaths_per_from_to_stop_id)))
-        log_start("adding footpaths within stops (if not defined)", log)
-        nb_loops = 0
-        for stop_id in stops_per_id.keys():
-            from_to_stop_id = (stop_id, stop_id)
-            if from_to_stop_id not in footpaths_per_from_to_stop_id:
-                footpaths_per_from_to_stop_id[from_to_stop_id] = Footpath(stop_id, stop_id, 0)  # best guess!!
-                nb_loops += 1
-        log_end(additional_message="# footpath loops added: {}, # footpaths total: {}".format(nb_loops, len(
-            footpaths_per_from_to_stop_id)))
-
-        if add_beeline_footpaths:
-            create_beeline_footpaths(stops_per_id, footpaths_per_from_to_stop_id, beeline_distance, walking_speed)
-        else:
-            log.info("adding beeline footpaths is deactivated")
-
-        if make_footpaths_transitive:
-            make_transitive(footpaths_per_from_to_stop_id)
-        else:
-            log.info("making footpaths transitive is deactivated")
-
-        log_start("parsing calendar.txt and calendar_dates.txt", log)
+        span.set_additional_message("# footpaths from transfers.txt: {}".format(len(footpaths_per_from_to_stop_id)))
+    log_start("adding footpaths to parent station", log)
+    nb_parent_footpaths = 0
+    for a_stop in stops_per_id.values():
+        if a_stop.parent_station_id is not None:
+            key = (a_stop.id, a_stop.parent_station_id)
+            if key not in footpaths_per_from_to_stop_id:
+                footpaths_per_from_to_stop_id[key] = Footpath(key[0], key[1], 0)
+                nb_parent_footpaths += 1
+            if (key[1], key[0]) not in footpaths_per_from_to_stop_id:
+                footpaths_per_from_to_stop_id[(key[1], key[0])] = Footpath(key[1], key[0], 0)
+                nb_parent_footpaths += 1
+    log_end(additional_message="# footpath from/to parent_station added: {}. # footpaths total: {}".format(
+        nb_parent_footpaths, len(footpaths_per_from_to_stop_id)))
+    log_start("adding footpaths within stops (if not defined)", log)
+    nb_loops = 0
+    for stop_id in stops_per_id.keys():
+        from_to_stop_id = (stop_id, stop_id)
+        if from_to_stop_id not in footpaths_per_from_to_stop_id:
+            footpaths_per_from_to_stop_id[from_to_stop_id] = Footpath(stop_id, stop_id, 0)  # best guess!!
+            nb_loops += 1
+    log_end(additional_message="# footpath loops added: {}, # footpaths total: {}".format(nb_loops, len(
+        footpaths_per_from_to_stop_id)))
+
+    if add_beeline_footpaths:
+        create_beeline_footpaths(stops_per_id, footpaths_per_from_to_stop_id, beeline_distance, walking_speed,
+                                 beeline_metric)
+    else:
+        log.info("adding beeline footpaths is deactivated")
+
+    if make_footpaths_transitive:
+        make_transitive(footpaths_per_from_to_stop_id, max_transitive_walking_time)
+    else:
+        log.info("making footpaths transitive is deactivated")
+    return footpaths_per_from_to_stop_id
+
+
+def parse_trips(zip_file, desired_date):
+    """Parses calendar.txt, calendar_dates.txt, trips.txt and routes.txt and returns whether the trips are available
+    at the desired date and their route types.
+
+    Args:
+        zip_file (ZipFile): gtfs-file.
+        desired_date (date): date on which the timetable data is read.
+
+    Returns:
+        tuple: True if the trip is available at the desired date per trip id and route type per trip id.
+    """
+    with log_span("parsing calendar.txt and calendar_dates.txt", log):
         service_available_at_date_per_service_id = get_service_available_at_date_per_service_id(zip_file, desired_date)
-        log_end()
-
-        log_start("parsing trips.txt", log)
-        trip_available_at_date_per_trip_id, route_id_per_trip_id = \
-            get_trip_available_at_date_per_trip_id(zip_file, service_available_at_date_per_service_id)
-        if len(trip_available_at_date_per_trip_id):
-            msg = "# trips available at {}: {}".format(desired_date, len(trip_available_at_date_per_trip_id))
-        else:
-            msg = "no trips available at {}. assure that the date is within the timetable period.".format(desired_date)
-        log_end(additional_message=msg)
-
-        log_start("parsing routes.txt and assigning route_type to trip_id", log)
-        with zip_file.open("routes.txt", "r") as gtfs_file:  # required
-            reader = csv.reader(TextIOWrapper(gtfs_file, ENCODING))
-            header = next(reader)
-            route_id_index = header.index("route_id")  # required
-            route_type_index = header.index("route_type")  # required
-            route_type_per_route_id = {}
-            for row in reader:
-                route_type_per_route_id[row[route_id_index]] = int(row[route_type_index])
-        route_type_per_trip_id = {trip_id: route_type_per_route_id[route_id_per_trip_id[trip_id]]
-                                  for trip_id in route_id_per_trip_id}
-        log_end()
-
-        log_start("parsing stop_times.txt", log)
-        with zip_file.open("stop_times.txt", "r") as gtfs_file:  # required
-            reader = csv.reader(TextIOWrapper(gtfs_file, ENCODING))
-            header = next(reader)
-            trip_id_index = header.index("trip_id")  # required
-            stop_id_index = header.index("stop_id")  # required
-            arrival_time_index = get_index_with_default(header, "arrival_time")  # conditionally required
-            departure_time_index = get_index_with_default(header, "departure_time")  # conditionally required
-
-            def process_rows_of_trip(rows):
-                if rows:
-                    trip_id = rows[0][trip_id_index]
-                    if trip_available_at_date_per_trip_id[trip_id]:
-                        connections = []
-                        for i in range(len(rows) - 1):
-                            from_row = rows[i]
-                            to_row = rows[i + 1]
-                            con_dep = from_row[departure_time_index] if departure_time_index else None
-                            con_arr = to_row[arrival_time_index] if arrival_time_index else None
-                            if con_dep and con_arr:
-                                connections += [Connection(
-                                    trip_id,
-                                    from_row[stop_id_index],
-                                    to_row[stop_id_index],
-                                    hhmmss_to_sec(con_dep),
-                                    hhmmss_to_sec(con_arr))]
-                            else:
-                                return  # we do not want trips with missing times
-
-                        try:
-                            trip_type = TripType(route_type_per_trip_id[trip_id])
-                        except ValueError:
-                            trip_type = TripType.UNKNOWN
-                        trips_per_id[trip_id] = Trip(trip_id, connections, trip_type)
-
-            last_trip_id = None
-            row_list = []
-            for row in reader:
-                act_trip_id = row[trip_id_index]
-                if last_trip_id == act_trip_id:
-                    row_list += [row]
-                else:
-                    process_rows_of_trip(row_list)
-                    last_trip_id = act_trip_id
-                    row_list = [row]
-            process_rows_of_trip(row_list)
-        log_end(additional_message="# trips: {}".format(len(trips_per_id)))
-
-    cs_data = ConnectionScanData(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id)
-    log_end(additional_message="{}".format(cs_data))
-    return cs_data
+
+    log_start("parsing trips.txt", log)
+    trip_available_at_date_per_trip_id, route_id_per_trip_id = \
+        get_trip_available_at_date_per_trip_id(zip_file, service_available_at_date_per_service_id)
+    if len(trip_available_at_date_per_trip_id):
+        msg = "# trips available at {}: {}".format(desired_date, len(trip_available_at_date_per_trip_id))
+    else:
+        msg = "no trips available at {}. assure that the date is within the timetable period.".format(desired_date)
+    log_end(additional_message=msg)
+
+    log_start("parsing routes.txt and assigning route_type to trip_id", log)
+    route_type_per_route_id = get_route_type_per_route_id(zip_file)
+    route_type_per_trip_id = {trip_id: route_type_per_route_id[route_id_per_trip_id[trip_id]]
+                              for trip_id in route_id_per_trip_id}
+    log_end()
+    return trip_available_at_date_per_trip_id, route_type_per_trip_id
+
+
+def parse_stop_times(zip_file, stops_per_id, trip_available_at_date_per_trip_id, route_type_per_trip_id,
+                     stop_times_chunk_size=None, nb_processes=1):
+    """Parses stop_times.txt and returns the trips available at the desired date.
+
+    Args:
+        zip_file (ZipFile): gtfs-file.
+        stops_per_id (dict): stop per stop id.
+        trip_available_at_date_per_trip_id (dict): True if the trip is available at the date per trip id.
+        route_type_per_trip_id (dict): route type per trip id.
+        stop_times_chunk_size (obj:`int`, optional): see parse_gtfs. Default is None (row by row).
+        nb_processes (obj:`int`, optional): number of processes processing the chunks (only relevant if
+        stop_times_chunk_size is defined). Default is 1.
+
+    Returns:
+        dict: trip per trip id.
+    """
+    if stop_times_chunk_size is not None:
+        with log_span("parsing stop_times.txt in chunks of {} rows".format(stop_times_chunk_size), log) as span:
+            with zip_file.open("stop_times.txt", "r") as gtfs_file:  # required
+                trips_per_id = create_trips_from_stop_times_in_chunks(
+                    gtfs_file, stops_per_id, trip_available_at_date_per_trip_id, route_type_per_trip_id,
+                    stop_times_chunk_size, nb_processes)
+            span.set_additional_message("# trips: {}".format(len(trips_per_id)))
+        return trips_per_id
+
+    trips_per_id = {}
+    log_start("parsing stop_times.txt", log)
+    with zip_file.open("stop_times.txt", "r") as gtfs_file:  # required
+        reader = csv.reader(TextIOWrapper(gtfs_file, ENCODING))
+        header = next(reader)
+        trip_id_index = header.index("trip_id")  # required
+        stop_id_index = header.index("stop_id")  # required
+        arrival_time_index = get_index_with_default(header, "arrival_time")  # conditionally required
+        departure_time_index = get_index_with_default(header, "departure_time")  # conditionally required
+
+        def process_rows_of_trip(rows):
+            if rows:
+                trip_id = rows[0][trip_id_index]
+                if trip_available_at_date_per_trip_id[trip_id]:
+                    connections = []
+                    for i in range(len(rows) - 1):
+                        from_row = rows[i]
+                        to_row = rows[i + 1]
+                        con_dep = from_row[departure_time_index] if departure_time_index else None
+                        con_arr = to_row[arrival_time_index] if arrival_time_index else None
+                        if con_dep and con_arr:
+                            connections += [Connection(
+                                trip_id,
+                                from_row[stop_id_index],
+                                to_row[stop_id_index],
+                                cached_hhmmss_to_sec(con_dep),
+                                cached_hhmmss_to_sec(con_arr))]
+                        else:
+                            return  # we do not want trips with missing times
+
+                    trips_per_id[trip_id] = Trip(trip_id, connections,
+                                                 get_trip_type(route_type_per_trip_id[trip_id]))
+
+        last_trip_id = None
+        row_list = []
+        for row in reader:
+            act_trip_id = row[trip_id_index]
+            if last_trip_id == act_trip_id:
+                row_list += [row]
+            else:
+                process_rows_of_trip(row_list)
+                last_trip_id = act_trip_id
+                row_list = [row]
+        process_rows_of_trip(row_list)
+    log_end(additional_message="# trips: {}".format(len(trips_per_id)))
+    return trips_per_id
+
+
+def get_route_type_per_route_id(zip_file):
+    """Helper function for parsing the route types from routes.txt."""
+    route_type_per_route_id = {}
+    with zip_file.open("routes.txt", "r") as gtfs_file:  # required
+        reader = csv.reader(TextIOWrapper(gtfs_file, ENCODING))
+        header = next(reader)
+        route_id_index = header.index("route_id")  # required
+        route_type_index = header.index("route_type")  # required
+        for row in reader:
+            route_type_per_route_id[row[route_id_index]] = int(row[route_type_index])
+    return route_type_per_route_id
+
+
+def get_trip_type(route_type):
+    """Helper function for determining the trip type of a route type (TripType.UNKNOWN if not defined)."""
+    try:
+        return TripType(route_type)
+    except ValueError:
+        return TripType.UNKNOWN
+
+
+def read_stop_times_in_chunks(gtfs_file, stop_index_per_id, trip_index_per_id, chunk_size, nb_processes=1):
+    """Reads stop_times.txt in chunks of about chunk_size rows and returns the connections as arrays.
+
+    As in the row by row parser, consecutive rows of the same trip define a connection, i.e. stop_times.txt must be
+    grouped by trip (and sorted by stop_sequence within a trip). Only the columns trip_id, stop_id, arrival_time and
+    departure_time are read and the rows of trips not in trip_index_per_id are dropped while reading
+    (see read_stop_times_chunks). The chunks are converted independently (see convert_stop_times_chunk),
+    by a pool of nb_processes processes if nb_processes > 1. Trips with missing times are dropped.
+
+    Args:
+        gtfs_file (file): stop_times.txt opened in binary mode.
+        stop_index_per_id (dict): index per stop id.
+        trip_index_per_id (dict): index per trip id of the trips to read.
+        chunk_size (int): number of rows of stop_times.txt read at once.
+        nb_processes (:obj:`int`, optional): number of processes converting the chunks. Default is 1
+        (i.e. the chunks are converted in the calling process).
+
+    Returns:
+        tuple: trip indices, from stop indices, to stop indices, departure times and arrival times (ndarrays of int32,
+        one entry per connection in the order of stop_times.txt) and the indices of the read trips (ndarray)
+        in the order of their first occurrence in stop_times.txt.
+    """
+    text_file = TextIOWrapper(gtfs_file, ENCODING)
+    header = next(csv.reader([text_file.readline()]))
+    column_indices = [header.index("trip_id"),  # required
+                      header.index("stop_id"),  # required
+                      get_index_with_default(header, "arrival_time"),  # conditionally required
+                      get_index_with_default(header, "departure_time")]  # conditionally required
+    chunks = read_stop_times_chunks(text_file, column_indices, trip_index_per_id, chunk_size)
+    if nb_processes == 1:
+        stop_lookup = IndexLookup(stop_index_per_id)
+        converted_chunks = [convert_stop_times_chunk(chunk, stop_lookup) for chunk in chunks]
+    else:
+        converted_chunks = []
+        with ProcessPoolExecutor(max_workers=nb_processes, initializer=_init_stop_times_worker,
+                                 initargs=(stop_index_per_id,)) as executor:
+            # at most two chunks per process in flight: stop_times.txt is never completely in memory
+            futures = deque()
+            for chunk in chunks:
+                futures.append(executor.submit(_convert_stop_times_chunk, chunk))
+                if len(futures) >= 2 * nb_processes:
+                    converted_chunks += [futures.popleft().result()]
+            converted_chunks += [future.result() for future in futures]
+    return merge_stop_times_chunks(converted_chunks)
+
+
+def read_stop_times_chunks(text_file, column_indices, trip_index_per_id, chunk_size):
+    """Reads the needed columns of stop_times.txt (without header) in chunks of chunk_size rows, drops the rows
+    of trips not in trip_index_per_id and splits the remaining rows at trip boundaries,
+    i.e. all rows of a trip are in the same chunk.
+
+    Args:
+        text_file (TextIOWrapper): stop_times.txt (positioned after the header).
+        column_indices (list): indices of the columns trip_id, stop_id, arrival_time and departure_time
+        (None if the column does not exist).
+        trip_index_per_id (dict): index per trip id of the trips to read.
+        chunk_size (int): number of rows read at once.
+
+    Yields:
+        tuple: trip indices (ndarray of int32), stop id's, arrival times and departure times (ndarrays of str objects,
+        None if the column does not exist) of the rows of the chunk.
+    """
+    trip_lookup = IndexLookup(trip_index_per_id)
+    try:
+        reader = pd.read_csv(text_file, header=None, dtype=object, na_filter=False, chunksize=chunk_size,
+                             usecols=sorted({ind for ind in column_indices if ind is not None}))
+    except pd.errors.EmptyDataError:  # no rows
+        return
+    rest = None
+    for rows in reader:
+        trip_indices = trip_lookup.lookup(rows[column_indices[0]].values)
+        is_read = trip_indices >= 0
+        chunk = [trip_indices[is_read]] + [rows[ind].values[is_read] if ind is not None else None
+                                           for ind in column_indices[1:]]
+        if rest is not None:
+            chunk = [np.concatenate([rest_column, column]) if column is not None else None
+                     for rest_column, column in zip(rest, chunk)]
+        # the rows of the last trip may continue in the next chunk
+        other_trip_positions = np.flatnonzero(chunk[0] != chunk[0][-1]) if len(chunk[0]) else []
+        boundary = other_trip_positions[-1] + 1 if len(other_trip_positions) else 0
+        if boundary > 0:
+            yield tuple(column[:boundary] if column is not None else None for column in chunk)
+        rest = [column[boundary:] if column is not None else None for column in chunk]
+    if rest is not None and len(rest[0]):
+        yield tuple(rest)
+
+
+def convert_stop_times_chunk(chunk, stop_lookup):
+    """Converts a chunk of stop_times.txt (see read_stop_times_chunks) to connection arrays.
+
+    Args:
+        chunk (tuple): trip indices, stop id's, arrival times and departure times of the rows of the chunk.
+        stop_lookup (IndexLookup): index per stop id.
+
+    Returns:
+        tuple: trip indices, from stop indices, to stop indices, departure times and arrival times (ndarrays of int32,
+        one entry per connection, -1 for missing times) and the indices of the trips in the chunk (ndarray)
+        in the order of their first occurrence.
+    """
+    trip_indices, stop_ids, arrival_times, departure_times = chunk
+    stop_indices = stop_lookup.lookup(stop_ids)
+    if np.any(stop_indices < 0):
+        raise ValueError("there are stop_ids in stop_times.txt which do not occur as stop_id in stops.txt: {}"
+                         .format(set(stop_ids[stop_indices < 0].tolist())))
+    arr_times, dep_times = (convert_times(times) if times is not None
+                            else np.full(len(trip_indices), -1, dtype=np.int32)
+                            for times in [arrival_times, departure_times])
+
+    distinct_trip_indices, first_positions = np.unique(trip_indices, return_index=True)
+    # a connection per pair of consecutive rows of the same trip
+    is_connection = trip_indices[:-1] == trip_indices[1:]
+    return (trip_indices[:-1][is_connection], stop_indices[:-1][is_connection], stop_indices[1:][is_connection],
+            dep_times[:-1][is_connection], arr_times[1:][is_connection],
+            distinct_trip_indices[np.argsort(first_positions)].astype(np.int32))
+
+
+def convert_times(times):
+    """Helper function for converting HH:MM:SS-strings to seconds (every distinct string only once)."""
+    codes, distinct_times = pd.factorize(times)
+    return hhmmss_array_to_sec(np.asarray(distinct_times, dtype=str))[codes]
+
+
+def merge_stop_times_chunks(converted_chunks):
+    """Merges the converted chunks of stop_times.txt (see convert_stop_times_chunk) and drops the trips
+    with missing times.
+
+    Args:
+        converted_chunks (list): converted chunks in the order of stop_times.txt.
+
+    Returns:
+        tuple: see read_stop_times_in_chunks.
+    """
+    if converted_chunks:
+        trip_indices, from_stop_indices, to_stop_indices, dep_times, arr_times, read_trip_indices = (
+            np.concatenate(part).astype(np.int32) for part in zip(*converted_chunks))
+    else:
+        trip_indices, from_stop_indices, to_stop_indices, dep_times, arr_times, read_trip_indices = (
+            np.zeros(0, dtype=np.int32) for _ in range(6))
+    # we do not want trips with missing times
+    trips_with_missing_times = np.unique(trip_indices[(dep_times < 0) | (arr_times < 0)])
+    is_valid = ~np.isin(trip_indices, trips_with_missing_times)
+    read_trip_indices = read_trip_indices[~np.isin(read_trip_indices, trips_with_missing_times)]
+    return (trip_indices[is_valid], from_stop_indices[is_valid], to_stop_indices[is_valid], dep_times[is_valid],
+            arr_times[is_valid], read_trip_indices)
+
+
+class IndexLookup:
+    """Vectorized lookup of the index of every value in an array (hash-based, see pandas.Index.get_indexer).
+
+    Args:
+        index_per_value (dict): index per value.
+    """
+
+    def __init__(self, index_per_value):
+        self.values = pd.Index(list(index_per_value.keys()))
+        # the index -1 of a value not found picks the appended -1
+        self.indices = np.array(list(index_per_value.values()) + [-1], dtype=np.int32)
+
+    def lookup(self, values):
+        """Returns the index (ndarray of int32) of every value (-1 if the value is not found)."""
+        return self.indices[self.values.get_indexer(values)]
+
+
+def create_trips_from_stop_times_in_chunks(gtfs_file, stops_per_id, trip_available_at_date_per_trip_id,
+                                           route_type_per_trip_id, chunk_size, nb_processes=1):
+    """Reads stop_times.txt in chunks (see read_stop_times_in_chunks) and returns the trips available at the date.
+
+    Args:
+        gtfs_file (file): stop_times.txt opened in binary mode.
+        stops_per_id (dict): stop per stop id.
+        trip_available_at_date_per_trip_id (dict): True if the trip is available at the date per trip id.
+        route_type_per_trip_id (dict): route type per trip id.
+        chunk_size (int): minimal number of rows per chunk.
+        nb_processes (:obj:`int`, optional): number of processes converting the chunks. Default is 1.
+
+    Returns:
+        dict: trip per trip id.
+    """
+    stop_ids = np.array(list(stops_per_id.keys()), dtype=object)
+    trip_ids = np.array([trip_id for trip_id, is_available in trip_available_at_date_per_trip_id.items()
+                         if is_available], dtype=object)
+    trip_indices, from_stop_indices, to_stop_indices, dep_times, arr_times, read_trip_indices = \
+        read_stop_times_in_chunks(gtfs_file, {stop_id: ind for ind, stop_id in enumerate(stop_ids)},
+                                  {trip_id: ind for ind, trip_id in enumerate(trip_ids)}, chunk_size, nb_processes)
+
+    # group the connections by trip (stable, i.e. in the order of stop_times.txt within a trip)
+    order = np.argsort(trip_indices, kind="stable")
+    first_positions = np.searchsorted(trip_indices[order], np.arange(len(trip_ids) + 1)).tolist()
+    # the connections share the id and time objects (as in the row by row parser, see cached_hhmmss_to_sec).
+    # connections and trips do not form reference cycles, the cyclic garbage collector is paused while creating them
+    # (otherwise it traverses the objects created so far again and again)
+    is_gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        connections = list(map(Connection, trip_ids[trip_indices[order]].tolist(),
+                               stop_ids[from_stop_indices[order]].tolist(), stop_ids[to_stop_indices[order]].tolist(),
+                               get_shared_ints(dep_times[order]), get_shared_ints(arr_times[order])))
+        trips_per_id = {}
+        for trip_index in read_trip_indices.tolist():
+            trip_id = trip_ids[trip_index]
+            trips_per_id[trip_id] = Trip(trip_id, connections[first_positions[trip_index]:
+                                                              first_positions[trip_index + 1]],
+                                         get_trip_type(route_type_per_trip_id[trip_id]))
+    finally:
+        if is_gc_enabled:
+            gc.enable()
+    return trips_per_id
+
+
+def get_shared_ints(values):
+    """Helper function for converting an array of integers to a list of int objects (equal values share an object)."""
+    distinct_values, inverse = np.unique(values, return_inverse=True)
+    return np.array(distinct_values.tolist(), dtype=object)[inverse.reshape(-1)].tolist()
+
+
+def _init_stop_times_worker(stop_index_per_id):
+    """Initializes a worker process converting chunks of stop_times.txt (see read_stop_times_in_chunks)."""
+    global _worker_stop_lookup
+    _worker_stop_lookup = IndexLookup(stop_index_per_id)
+
+
+def _convert_stop_times_chunk(chunk):
+    """Converts a chunk of stop_times.txt in a worker process (see _init_stop_times_worker)."""
+    return convert_stop_times_chunk(chunk, _worker_stop_lookup)
 
 
 def get_service_available_at_date_per_service_id(zip_file, desired_date):
@@ -286,7 +705,8 @@ def get_trip_available_at_date_per_trip_id(zip_file, service_available_at_date_p
     return trip_available_at_date_per_trip_id, route_id_per_trip_id
 
 
-def create_beeline_footpaths(stops_per_id, footpaths_per_from_to_stop_id, beeline_distance, walking_speed):
+def create_beeline_footpaths(stops_per_id, footpaths_per_from_to_stop_id, beeline_distance, walking_speed,
+                             beeline_metric=BeelineMetric.MERCATOR):
     """Creates for every stop new footpaths to the other stops within the beeline distance
     if they are not already defined.
 
@@ -298,36 +718,74 @@ def create_beeline_footpaths(stops_per_id, footpaths_per_from_to_stop_id, beelin
         footpaths_per_from_to_stop_id (): footpaths per (from_stop_id, to_stop_id) tuple.
         beeline_distance (float): the beeline distance in meters.
         walking_speed (float): walking speed in meters per second.
+        beeline_metric (:obj:`BeelineMetric`, optional): metric of the beeline distance.
+        Default is BeelineMetric.MERCATOR.
     """
     nb_footpaths_perimeter = 0
-    log_start("adding footpaths in beeline perimeter with radius {}m".format(beeline_distance), log)
-    log_start("transforming coordinates", log)
-    stop_list = list(stops_per_id.values())
-    easting_northing_list = [(s.easting, s.northing) for s in stop_list]
-    x_y_coordinates = [wgs84_to_spherical_mercator(p[0], p[1]) for p in easting_northing_list]
-    log_end()
-    log_start("creating quadtree for fast perimeter search", log)
-    tree = spatial.KDTree(x_y_coordinates)
-    log_end()
-    log_start("perimeter search around every stop", log)
-    for ind, a_stop in enumerate(stop_list):
-        x_y_a_stop = x_y_coordinates[ind]
-        for another_ind in tree.query_ball_point(x_y_a_stop, beeline_distance):
-            x_y_another_stop = x_y_coordinates[another_ind]
-            d = distance(x_y_a_stop, x_y_another_stop)
-            # distance in meters.
-            # note that distances can be very inaccurate (up to factor 2 on a lat of 60°), but this should be ok here.
-            walking_time = d / walking_speed
-            another_stop = stop_list[another_ind]
-            key = (a_stop.id, another_stop.id)
-            if key not in footpaths_per_from_to_stop_id:
-                footpaths_per_from_to_stop_id[key] = Footpath(key[0], key[1], walking_time)
-                nb_footpaths_perimeter += 1
-            if (key[1], key[0]) not in footpaths_per_from_to_stop_id:
-                footpaths_per_from_to_stop_id[(key[1], key[0])] = Footpath(key[1], key[0], walking_time)
-                nb_footpaths_perimeter += 1
-    log_end()
+    log_start("adding footpaths in beeline perimeter with radius {}m ({})".format(beeline_distance, beeline_metric),
+              log)
+    stop_ids = list(stops_per_id.keys())
+    from_stop_indices, to_stop_indices, distances = get_stop_pairs_within_beeline_distance(
+        np.array([s.easting for s in stops_per_id.values()], dtype=np.float64),
+        np.array([s.northing for s in stops_per_id.values()], dtype=np.float64),
+        beeline_distance,
+        beeline_metric)
+    walking_times = distances / walking_speed
+    for from_stop_index, to_stop_index, walking_time in zip(from_stop_indices.tolist(), to_stop_indices.tolist(),
+                                                            walking_times.tolist()):
+        key = (stop_ids[from_stop_index], stop_ids[to_stop_index])
+        if key not in footpaths_per_from_to_stop_id:
+            footpaths_per_from_to_stop_id[key] = Footpath(key[0], key[1], walking_time)
+            nb_footpaths_perimeter += 1
+        if (key[1], key[0]) not in footpaths_per_from_to_stop_id:
+            footpaths_per_from_to_stop_id[(key[1], key[0])] = Footpath(key[1], key[0], walking_time)
+            nb_footpaths_perimeter += 1
+    for stop_id in stop_ids:  # every stop is within the beeline distance of itself
+        if (stop_id, stop_id) not in footpaths_per_from_to_stop_id:
+            footpaths_per_from_to_stop_id[(stop_id, stop_id)] = Footpath(stop_id, stop_id, 0.0)
+            nb_footpaths_perimeter += 1
     log_end(additional_message="# footpath within perimeter added: {}. # footpaths total: {}".format(
         nb_footpaths_perimeter,
         len(footpaths_per_from_to_stop_id)
     ))
+
+
+def get_stop_pairs_within_beeline_distance(eastings, northings, beeline_distance,
+                                           beeline_metric=BeelineMetric.MERCATOR):
+    """Returns all pairs of stops within the beeline distance (found by a single bulk query on a cKDTree).
+
+    Args:
+        eastings (ndarray): longitude (WGS84) per stop.
+        northings (ndarray): latitude (WGS84) per stop.
+        beeline_distance (float): the beeline distance in meters.
+        beeline_metric (:obj:`BeelineMetric`, optional): metric of the beeline distance.
+        Default is BeelineMetric.MERCATOR.
+
+    Returns:
+        tuple: index i of the first stop, index j > i of the second stop and distance in meters (ndarrays)
+        per pair, sorted by (i, j).
+    """
+    if len(eastings) < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    if beeline_metric == BeelineMetric.MERCATOR:
+        # note that distances can be very inaccurate (up to factor 2 on a lat of 60°), but this should be ok here.
+        x_y_coordinates = wgs84_to_spherical_mercator_array(eastings, northings)
+        pairs = spatial.cKDTree(x_y_coordinates).query_pairs(beeline_distance, output_type="ndarray")
+        distances = np.hypot(*(x_y_coordinates[pairs[:, 0]] - x_y_coordinates[pairs[:, 1]]).T)
+    elif beeline_metric == BeelineMetric.HAVERSINE:
+        # the great-circle distance is monotone in the chord distance of the points on the sphere
+        lons = np.radians(eastings)
+        lats = np.radians(northings)
+        x_y_z_coordinates = EARTH_RADIUS * np.column_stack(
+            (np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)))
+        chord_distance = 2 * EARTH_RADIUS * np.sin(min(beeline_distance / (2 * EARTH_RADIUS), np.pi / 2))
+        pairs = spatial.cKDTree(x_y_z_coordinates).query_pairs(chord_distance * (1 + 1e-9), output_type="ndarray")
+        distances = haversine_distance(eastings[pairs[:, 0]], northings[pairs[:, 0]],
+                                       eastings[pairs[:, 1]], northings[pairs[:, 1]])
+        is_within = distances <= beeline_distance
+        pairs = pairs[is_within]
+        distances = distances[is_within]
+    else:
+        raise ValueError("unknown beeline metric: {}".format(beeline_metric))
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    return pairs[order, 0], pairs[order, 1], distances[order]
@@ -4,9 +4,15 @@
 import logging
 import math
 from datetime import date
+from functools import lru_cache
+
+import numpy as np
 
 log = logging.getLogger(__name__)
 
+EARTH_RADIUS = 6371000.0  # mean earth radius in meters
+HHMMSS_CACHE_SIZE = 1 << 18  # a gtfs-file has typically less than 200'000 distinct time strings
+
 
 def parse_yymmdd(yymmdd_str):
     """Parses a YYYYMMDD-string and returns the corresponding date.
@@ -36,6 +42,70 @@ def hhmmss_to_sec(hhmmss):
     return int(h) * 3600 + int(m) * 60 + int(s)
 
 
+@lru_cache(maxsize=HHMMSS_CACHE_SIZE)
+def cached_hhmmss_to_sec(hhmmss):
+    """Memoized version of hhmmss_to_sec (with a bounded memo table of HHMMSS_CACHE_SIZE entries).
+
+    Args:
+        hhmmss (str): HH:MM:SS-string
+
+    Returns:
+        int: number of seconds after midnight.
+    """
+    return hhmmss_to_sec(hhmmss)
+
+
+def hhmmss_array_to_sec(hhmmss_array, missing_value=-1):
+    """Vectorized version of hhmmss_to_sec.
+
+    Strings of the form H:MM:SS, HH:MM:SS or HHH:MM:SS (hours may exceed 24) are converted on their character codes
+    without parsing, all other strings are parsed with hhmmss_to_sec (every distinct string only once).
+
+    Args:
+        hhmmss_array (ndarray): array of HH:MM:SS-strings (str or bytes, empty strings for missing times).
+        missing_value (:obj:`int`, optional): value for empty strings. Default is -1.
+
+    Returns:
+        ndarray: number of seconds after midnight (int32) per string.
+    """
+    hhmmss_array = np.asarray(hhmmss_array)
+    if hhmmss_array.dtype.kind not in "SU":
+        hhmmss_array = hhmmss_array.astype(str)
+    hhmmss_array = np.ascontiguousarray(hhmmss_array.reshape(-1))
+    nb_strings = len(hhmmss_array)
+    res = np.full(nb_strings, missing_value, dtype=np.int32)
+    is_converted = np.zeros(nb_strings, dtype=bool)
+    width = hhmmss_array.dtype.itemsize // (4 if hhmmss_array.dtype.kind == "U" else 1)
+    if nb_strings == 0 or width == 0:
+        return res
+    # character codes per string (strings are padded with zeros)
+    codes = hhmmss_array.view(np.uint32 if hhmmss_array.dtype.kind == "U" else np.uint8).reshape(nb_strings, width)
+    lengths = np.count_nonzero(codes, axis=1)
+    is_converted[lengths == 0] = True  # missing
+    for length in range(7, min(width, 9) + 1):
+        indices = np.flatnonzero(lengths == length)
+        if len(indices) == 0:
+            continue
+        digits = codes[indices, :length].astype(np.int32) - ord("0")
+        digit_columns = [i for i in range(length) if i not in (length - 6, length - 3)]
+        is_valid = ((digits[:, length - 6] == ord(":") - ord("0")) & (digits[:, length - 3] == ord(":") - ord("0"))
+                    & np.all((digits[:, digit_columns] >= 0) & (digits[:, digit_columns] <= 9), axis=1))
+        hours = np.zeros(len(indices), dtype=np.int32)
+        for i in range(length - 6):
+            hours = 10 * hours + digits[:, i]
+        seconds = (3600 * hours + 60 * (10 * digits[:, length - 5] + digits[:, length - 4])
+                   + 10 * digits[:, length - 2] + digits[:, length - 1])
+        res[indices[is_valid]] = seconds[is_valid]
+        is_converted[indices[is_valid]] = True
+
+    if not np.all(is_converted):
+        distinct_hhmmss, inverse = np.unique(hhmmss_array[~is_converted], return_inverse=True)
+        distinct_seconds = np.array([hhmmss_to_sec(hhmmss.decode() if isinstance(hhmmss, bytes) else hhmmss)
+                                     for hhmmss in distinct_hhmmss.tolist()], dtype=np.int32)
+        res[~is_converted] = distinct_seconds[inverse.reshape(-1)]
+    return res
+
+
 def seconds_to_hhmmssms(seconds):
     """Parses the number of seconds after midnight and returns the corresponding HH:MM:SS.f-string.
 
@@ -132,3 +202,38 @@ def wgs84_to_spherical_mercator(lon, lat):
     y = math.log(math.tan((90 + lat) * math.pi / 360)) / (math.pi / 180);
     y = y * 20037508.34 / 180;
     return [x, y]
+
+
+def wgs84_to_spherical_mercator_array(lons, lats):
+    """Vectorized version of wgs84_to_spherical_mercator.
+
+    Args:
+        lons (ndarray): longitudes of the points.
+        lats (ndarray): latitudes of the points.
+
+    Returns:
+        ndarray: x- and y-coordinate per point (shape (# points, 2)).
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    x = lons * 20037508.34 / 180
+    y = np.log(np.tan((90 + lats) * math.pi / 360)) / (math.pi / 180) * 20037508.34 / 180
+    return np.column_stack((x, y))
+
+
+def haversine_distance(lon_1, lat_1, lon_2, lat_2):
+    """Calculates the great-circle distance in meters between lon-lat-coordinates (WGS84) with the haversine formula.
+    Works on floats and (element-wise) on ndarrays.
+
+    Args:
+        lon_1 (float, ndarray): longitude of the first point.
+        lat_1 (float, ndarray): latitude of the first point.
+        lon_2 (float, ndarray): longitude of the second point.
+        lat_2 (float, ndarray): latitude of the second point.
+
+    Returns:
+        float, ndarray: the great-circle distance in meters.
+    """
+    lon_1, lat_1, lon_2, lat_2 = (np.radians(v) for v in (lon_1, lat_1, lon_2, lat_2))
+    a = np.sin((lat_2 - lat_1) / 2) ** 2 + np.cos(lat_1) * np.cos(lat_2) * np.sin((lon_2 - lon_1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
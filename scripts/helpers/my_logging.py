@@ -5,40 +5,135 @@ import logging
 import os
 import sys
 import time
-from collections import deque, namedtuple
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from scripts.helpers.funs import seconds_to_hhmmssms
 
-LogEntry = namedtuple("LogEntry", ["message", "start_time", "logger"])  # Container for log entries.
-log_stack = deque()  # Stack where the log-entries are collected.
+# Container for log entries (start_time is None if the logger did not log the start).
+LogEntry = namedtuple("LogEntry", ["message", "args", "start_time", "logger"])
+# Stack where the log entries of the current context are collected. The stack is an immutable tuple, i.e. every thread
+# and every asyncio task (which runs in a copy of the context of its creator) has its own stack.
+log_stack = ContextVar("log_stack", default=())
 
 
-def log_start(message, logger):
+def log_start(message, logger, *args):
     """Logs the start of a process step.
 
+    The message is only built if the logger is enabled for INFO,
+    i.e. a filtered process step costs one level check and one stack update.
+
     Args:
-        message (str): message to log.
+        message (str or callable): message to log (a format string if args are given)
+        or function returning the message if it is called with args.
         logger (Logger): instance of the logger where the message should be logged.
+        *args: arguments of the message (e.g. the values of the replacement fields of the format string).
     """
-    log_stack.append(LogEntry(message, time.time(), logger))
-    logger.info("({}) start {}.".format(len(log_stack), message))
+    stack = log_stack.get()
+    if not logger.isEnabledFor(logging.INFO):
+        log_stack.set(stack + (LogEntry(message, args, None, logger),))
+        return
+    log_stack.set(stack + (LogEntry(message, args, time.time(), logger),))
+    logger.info("({}) start {}.".format(len(stack) + 1, get_message(message, args)))
 
 
-def log_end(additional_message=None):
+def log_end(additional_message=None, *args):
     """Logs the end of a process step together with the start message and the elapsed.
 
     Args:
-        additional_message (str): Additional message, which is added to the message from the start log.
+        additional_message (:obj:`str` or :obj:`callable`, optional): Additional message, which is added to the message
+        from the start log (built like the message of log_start). Default is None.
+        *args: arguments of the additional message.
     """
-    n = len(log_stack)
-    log_entry = log_stack.pop()
-    log_message = "({}) end {}. time elapsed: {}{}".format(n, log_entry.message,
+    stack = log_stack.get()
+    if not stack:
+        raise ValueError("log_end without log_start in the current context")
+    log_stack.set(stack[:-1])
+    log_entry = stack[-1]
+    if log_entry.start_time is None or not log_entry.logger.isEnabledFor(logging.INFO):
+        return
+    additional_message = get_message(additional_message, args) if additional_message else None
+    log_message = "({}) end {}. time elapsed: {}{}".format(len(stack), get_message(log_entry.message, log_entry.args),
                                                            seconds_to_hhmmssms(time.time() - log_entry.start_time),
                                                            ". {}. ".format(
                                                                additional_message) if additional_message else ".")
     log_entry.logger.info(log_message)
 
 
+class LogSpan:
+    """Handle of a process step logged by log_span, the additional message of its end log can be set in the block."""
+
+    def __init__(self):
+        self.additional_message = None
+        self.args = ()
+
+    def set_additional_message(self, additional_message, *args):
+        """Sets the additional message of the end log (built like the additional message of log_end).
+
+        Args:
+            additional_message (str or callable): additional message (see log_end).
+            *args: arguments of the additional message.
+        """
+        self.additional_message = additional_message
+        self.args = args
+
+
+@contextmanager
+def log_span(message, logger, *args):
+    """Logs the start and the end of a process step (see log_start and log_end) around a with block.
+
+    In contrast to log_start and log_end, the stack is also cleaned up if the with block raises an exception.
+    The with block gets a LogSpan, where the additional message of the end log can be set.
+
+    Args:
+        message (str or callable): message to log (see log_start).
+        logger (Logger): instance of the logger where the message should be logged.
+        *args: arguments of the message.
+    """
+    log_start(message, logger, *args)
+    span = LogSpan()
+    try:
+        yield span
+    finally:
+        log_end(span.additional_message, *span.args)
+
+
+def log_elapsed(message, elapsed_seconds, logger, *args):
+    """Logs a process step whose time was measured elsewhere (e.g. in another process).
+
+    Args:
+        message (str or callable): message to log (see log_start).
+        elapsed_seconds (float): elapsed time of the process step in seconds.
+        logger (Logger): instance of the logger where the message should be logged.
+        *args: arguments of the message.
+    """
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("({}) {}. time elapsed: {}.".format(len(log_stack.get()) + 1, get_message(message, args),
+                                                        seconds_to_hhmmssms(elapsed_seconds)))
+
+
+def get_log_depth():
+    """Returns the number of started and not yet ended process steps of the current context."""
+    return len(log_stack.get())
+
+
+def get_message(message, args):
+    """Builds a message of log_start, log_end or log_elapsed.
+
+    Args:
+        message (str or callable): format string (or plain message without args)
+        or function returning the message if it is called with args.
+        args (tuple): arguments of the message.
+
+    Returns:
+        str: the message.
+    """
+    if callable(message):
+        return message(*args)
+    return message.format(*args) if args else message
+
+
 def init_logging(directory, file_name, log_level=logging.INFO):
     """Initializes the logger for the project.
 
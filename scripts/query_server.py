@@ -0,0 +1,490 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This module provides a HTTP/JSON server answering routing queries (built on asyncio of the standard library).
+
+The timetable data is loaded once. The scans are CPU-bound and are therefore dispatched to a pool of worker
+processes, each holding its own ConnectionScanCore (created once per process, see _init_worker).
+The event loop only parses and validates the requests and serializes the results.
+
+Endpoints:
+- GET /health: status and size of the timetable data.
+- POST /route/earliest_arrival: earliest arrival time (ConnectionScanCore.route_earliest_arrival).
+- POST /route/earliest_arrival_with_reconstruction: journey
+(ConnectionScanCore.route_earliest_arrival_with_reconstruction).
+- POST /route/optimized_earliest_arrival_with_reconstruction: journey
+(ConnectionScanCore.route_optimized_earliest_arrival_with_reconstruction).
+
+The body of a routing request is a json-object with the source (from_stop_id or from_stop_name), the target
+(to_stop_id or to_stop_name) and the desired departure time (desired_dep_time, seconds after midnight or HH:MM:SS).
+Optionally, the results are cached in the server process per departure time bucket (see routing_cache.py).
+
+Example (serving a snapshot created by snapshot.load_or_parse_gtfs):
+    python -m scripts.query_server --gtfs path/to/gtfs.zip --date 20190118 --snapshot path/to/snapshot --port 8080
+"""
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+from scripts.connectionscan_router import ConnectionScanCore, RoutingBackend
+from scripts.gtfs_parser import parse_gtfs
+from scripts.helpers.funs import hhmmss_to_sec, parse_yymmdd, seconds_to_hhmmss
+from scripts.helpers.my_logging import log_elapsed
+from scripts.routing_cache import ResultCache, get_cache_key, get_latest_dep_time
+from scripts.snapshot import load_or_parse_gtfs, load_snapshot
+
+log = logging.getLogger(__name__)
+
+ROUTERS = ("earliest_arrival", "earliest_arrival_with_reconstruction",
+           "optimized_earliest_arrival_with_reconstruction")
+ROUTE_PATH_PREFIX = "/route/"
+HEALTH_PATH = "/health"
+MAX_BODY_SIZE = 1 << 16  # maximal size of a request body in bytes
+MAX_NB_HEADERS = 100  # maximal number of header lines of a request
+KEEP_ALIVE_TIMEOUT = 15.0  # seconds an idle connection is kept open
+MAX_DEP_TIME = 2 * 24 * 60 * 60  # desired departure times must be within two days (see ConnectionScanCore)
+REASON_PER_STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                     413: "Payload Too Large", 500: "Internal Server Error", 501: "Not Implemented",
+                     503: "Service Unavailable"}
+
+_worker_cs_core = None  # ConnectionScanCore of a worker process (see _init_worker)
+
+
+class HttpError(ValueError):
+    """Error answered with the given http status code and a json-object with the error message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class QueryServer:
+    """HTTP/JSON server answering routing queries on one timetable.
+
+    Args and attributes:
+        connection_scan_data (ConnectionScanData): timetable data (used to validate the requests and, if
+        path_to_snapshot is None, passed to the worker processes).
+        host (:obj:`str`, optional): host to bind. Default is "127.0.0.1" (i.e. local only).
+        port (:obj:`int`, optional): port to bind. Default is 8080 (0 means an arbitrary free port).
+        nb_processes (:obj:`int`, optional): number of worker processes executing the scans. Default is 1.
+        backend (:obj:`RoutingBackend`, optional): backend of the ConnectionScanCore's of the worker processes.
+        Default is RoutingBackend.PYTHON.
+        path_to_snapshot (:obj:`str`, optional): if defined, the worker processes load the timetable data from this
+        snapshot (memory-mapped, i.e. the arrays are shared by all processes, see snapshot.py). Default is None.
+        shutdown_timeout (:obj:`float`, optional): seconds the requests in progress are awaited on shutdown.
+        Default is 30.
+        cache_size (:obj:`int`, optional): maximal number of cached routing results. Default is 0 (i.e. no cache).
+        cache_ttl (:obj:`float`, optional): seconds a cached routing result is valid. Default is None
+        (i.e. as long as the server runs).
+        dep_time_bucket (:obj:`int`, optional): size of the departure time buckets of the cache in seconds
+        (only used with a cache, see routing_cache.py). Default is 1 (i.e. the cached results are exact).
+
+    Additional attributes:
+        sockets (list): bound sockets (available after start).
+        nb_requests (int): number of answered requests.
+        cache (ResultCache): cached (result, latest desired departure time)-tuples (None if cache_size is 0).
+    """
+
+    def __init__(self, connection_scan_data, host="127.0.0.1", port=8080, nb_processes=1,
+                 backend=RoutingBackend.PYTHON, path_to_snapshot=None, shutdown_timeout=30.0, cache_size=0,
+                 cache_ttl=None, dep_time_bucket=1):
+        self.connection_scan_data = connection_scan_data
+        self.host = host
+        self.port = port
+        self.nb_processes = nb_processes
+        self.backend = backend
+        self.path_to_snapshot = path_to_snapshot
+        self.shutdown_timeout = shutdown_timeout
+        self.cache = ResultCache(cache_size, cache_ttl) if cache_size > 0 else None
+        self.dep_time_bucket = dep_time_bucket
+        self.sockets = []
+        self.nb_requests = 0
+        self._server = None
+        self._executor = None
+        self._start_time = None
+        self._shutdown_event = None
+        self._is_shutting_down = False
+        self._idle_tasks = set()
+        self._busy_tasks = set()
+
+    async def start(self):
+        """Starts the worker processes and the server (returns as soon as the server accepts connections)."""
+        if self.path_to_snapshot is not None:
+            init_args = (None, self.path_to_snapshot, self.backend)
+        else:
+            init_args = (self.connection_scan_data, None, self.backend)
+        self._executor = ProcessPoolExecutor(max_workers=self.nb_processes, initializer=_init_worker,
+                                             initargs=init_args)
+        # the worker processes are started (and the timetable data is loaded) before the first connection is
+        # accepted: forked workers would otherwise inherit the sockets of the open connections
+        await asyncio.get_running_loop().run_in_executor(self._executor, _get_nb_stops)
+        self._shutdown_event = asyncio.Event()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.sockets = list(self._server.sockets)
+        self._start_time = time.time()
+        log.info("query server listening on {} with {} worker processes ({})".format(
+            ", ".join("{}:{}".format(*s.getsockname()[:2]) for s in self.sockets), self.nb_processes,
+            self.connection_scan_data))
+
+    async def serve(self):
+        """Starts the server and serves until shutdown is requested (by request_shutdown, SIGINT or SIGTERM)."""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_shutdown)
+            except (NotImplementedError, RuntimeError):  # e.g. on windows or not in the main thread
+                pass
+        await self._shutdown_event.wait()
+        await self.shutdown()
+
+    def request_shutdown(self):
+        """Requests a graceful shutdown of a serving server (see serve)."""
+        if self._shutdown_event is not None:
+            self._shutdown_event.set()
+
+    async def shutdown(self):
+        """Shuts the server down gracefully.
+
+        No new connections are accepted, idle connections are closed, the requests in progress are answered
+        (at most shutdown_timeout seconds) and the worker processes are terminated.
+        """
+        if self._is_shutting_down:
+            return
+        self._is_shutting_down = True
+        log.info("shutting down query server ({} requests in progress)".format(len(self._busy_tasks)))
+        self._server.close()
+        for task in list(self._idle_tasks):
+            task.cancel()
+        if self._busy_tasks:
+            _, pending = await asyncio.wait(list(self._busy_tasks), timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+        await self._server.wait_closed()
+        # waiting for the worker processes must not block the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        log.info("query server shut down after {} requests".format(self.nb_requests))
+
+    async def _handle_connection(self, reader, writer):
+        """Answers the requests of a connection (keep-alive) until the client or the server closes it."""
+        task = asyncio.current_task()
+        try:
+            keep_alive = True
+            while keep_alive and not self._is_shutting_down:
+                self._idle_tasks.add(task)
+                try:
+                    request = await asyncio.wait_for(read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HttpError as e:
+                    await write_response(writer, e.status, {"error": str(e)}, False)
+                    break
+                finally:
+                    self._idle_tasks.discard(task)
+                if request is None:
+                    break
+                self._busy_tasks.add(task)
+                try:
+                    method, path, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close" and not self._is_shutting_down
+                    status, result = await self._dispatch(method, path, body)
+                    await write_response(writer, status, result, keep_alive)
+                    self.nb_requests += 1
+                finally:
+                    self._busy_tasks.discard(task)
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        except Exception:
+            log.exception("connection failed")
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        """Answers a request and returns the http status code and the json-serializable result."""
+        start_time = time.time()
+        try:
+            if path == HEALTH_PATH:
+                if method != "GET":
+                    raise HttpError(405, "method {} not allowed on {}".format(method, path))
+                return 200, self.get_health()
+            if not path.startswith(ROUTE_PATH_PREFIX) or path[len(ROUTE_PATH_PREFIX):] not in ROUTERS:
+                raise HttpError(404, "unknown path {}".format(path))
+            if method != "POST":
+                raise HttpError(405, "method {} not allowed on {}".format(method, path))
+            router = path[len(ROUTE_PATH_PREFIX):]
+            from_stop_id, to_stop_id, desired_dep_time = parse_route_query(body, self.connection_scan_data)
+            if self._is_shutting_down:
+                raise HttpError(503, "server is shutting down")
+            if self.cache is None:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, _route, router, from_stop_id, to_stop_id, desired_dep_time)
+            else:
+                key = get_cache_key(router, from_stop_id, to_stop_id, desired_dep_time, self.dep_time_bucket)
+                is_hit, entry = self.cache.lookup(key, lambda cached_entry: desired_dep_time <= cached_entry[1])
+                if not is_hit and key not in self.cache:
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, _route, router, from_stop_id, to_stop_id, key[3])
+                    entry = (result, get_latest_dep_time_of_result(key[3], result))
+                    self.cache.put(key, entry)
+                if entry is not None and desired_dep_time <= entry[1]:
+                    result = entry[0]
+                else:
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, _route, router, from_stop_id, to_stop_id, desired_dep_time)
+            log_elapsed(lambda: "{} from {} to {} at {}".format(router, from_stop_id, to_stop_id,
+                                                                seconds_to_hhmmss(desired_dep_time)),
+                        time.time() - start_time, log)
+            return 200, result
+        except HttpError as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:
+            log.exception("request {} {} failed".format(method, path))
+            return 500, {"error": "internal error: {}".format(type(e).__name__)}
+
+    def get_health(self):
+        """Returns the status of the server.
+
+        Returns:
+            dict: status, uptime in seconds, number of answered requests, size of the timetable data
+            and the counters of the cache (None without cache).
+        """
+        return {
+            "status": "shutting down" if self._is_shutting_down else "ok",
+            "uptime": time.time() - self._start_time,
+            "nb_requests": self.nb_requests,
+            "nb_processes": self.nb_processes,
+            "nb_stops": len(self.connection_scan_data.stops_per_id),
+            "nb_trips": len(self.connection_scan_data.trips_per_id),
+            "nb_connections": len(self.connection_scan_data.sorted_connections),
+            "cache": self.cache.get_stats() if self.cache is not None else None,
+        }
+
+
+async def read_request(reader):
+    """Reads a http request.
+
+    Args:
+        reader (StreamReader): stream of the connection.
+
+    Returns:
+        tuple: method, path, headers (dict with lower case names) and body (bytes)
+        or None if the connection was closed before a request was sent.
+
+    Raises:
+        HttpError: if the request is malformed, too large or uses unsupported features.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode("latin-1").rstrip("\r\n").split(" ")
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+        raise HttpError(400, "malformed request line")
+    method, target, _ = parts
+    headers = {}
+    for _ in range(MAX_NB_HEADERS + 1):
+        line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+        if not line:
+            break
+        name, separator, value = line.partition(":")
+        if not separator:
+            raise HttpError(400, "malformed header line")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(400, "too many header lines")
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HttpError(501, "chunked transfer encoding is not supported")
+    try:
+        content_length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(400, "invalid content-length")
+    if content_length < 0:
+        raise HttpError(400, "invalid content-length")
+    if content_length > MAX_BODY_SIZE:
+        raise HttpError(413, "request body larger than {} bytes".format(MAX_BODY_SIZE))
+    body = await reader.readexactly(content_length) if content_length > 0 else b""
+    return method.upper(), urlsplit(target).path, headers, body
+
+
+async def write_response(writer, status, result, keep_alive):
+    """Writes a http response with a json body.
+
+    Args:
+        writer (StreamWriter): stream of the connection.
+        status (int): http status code.
+        result (dict): json-serializable result.
+        keep_alive (bool): True if the connection is kept open, else False.
+    """
+    body = json.dumps(result).encode("utf-8")
+    head = "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n".format(
+        status, REASON_PER_STATUS.get(status, ""), len(body), "keep-alive" if keep_alive else "close")
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+
+def parse_route_query(body, connection_scan_data):
+    """Parses and validates the json body of a routing request.
+
+    Args:
+        body (bytes): json-object with from_stop_id or from_stop_name, to_stop_id or to_stop_name and
+        desired_dep_time (seconds after midnight or HH:MM:SS-string).
+        connection_scan_data (ConnectionScanData): timetable data.
+
+    Returns:
+        tuple: id of the source stop, id of the target stop and desired departure time in seconds after midnight.
+
+    Raises:
+        HttpError: if the body is not a valid routing query.
+    """
+    try:
+        query = json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        raise HttpError(400, "request body is not valid json")
+    if not isinstance(query, dict):
+        raise HttpError(400, "request body must be a json-object")
+    from_stop_id = get_stop_id(query, "from", connection_scan_data)
+    to_stop_id = get_stop_id(query, "to", connection_scan_data)
+    desired_dep_time = query.get("desired_dep_time")
+    if isinstance(desired_dep_time, str):
+        try:
+            desired_dep_time = hhmmss_to_sec(desired_dep_time)
+        except ValueError:
+            raise HttpError(400, "desired_dep_time {} is not a HH:MM:SS-string".format(desired_dep_time))
+    if isinstance(desired_dep_time, bool) or not isinstance(desired_dep_time, int):
+        raise HttpError(400, "desired_dep_time must be an integer (seconds after midnight) or a HH:MM:SS-string")
+    if not 0 <= desired_dep_time < MAX_DEP_TIME:
+        raise HttpError(400, "desired_dep_time must be within [0, {})".format(MAX_DEP_TIME))
+    return from_stop_id, to_stop_id, desired_dep_time
+
+
+def get_stop_id(query, prefix, connection_scan_data):
+    """Returns the id of the stop defined by prefix_stop_id or prefix_stop_name in the query.
+
+    Args:
+        query (dict): routing query.
+        prefix (str): "from" or "to".
+        connection_scan_data (ConnectionScanData): timetable data.
+
+    Returns:
+        str: id of the stop.
+
+    Raises:
+        HttpError: if not exactly one of the two keys is defined or the stop is unknown.
+    """
+    stop_id = query.get("{}_stop_id".format(prefix))
+    stop_name = query.get("{}_stop_name".format(prefix))
+    if (stop_id is None) == (stop_name is None):
+        raise HttpError(400, "exactly one of {0}_stop_id and {0}_stop_name must be defined".format(prefix))
+    if stop_id is not None:
+        if not isinstance(stop_id, str) or stop_id not in connection_scan_data.stops_per_id:
+            raise HttpError(400, "unknown {}_stop_id {}".format(prefix, stop_id))
+        return stop_id
+    if not isinstance(stop_name, str) or stop_name not in connection_scan_data.stops_per_name:
+        raise HttpError(400, "unknown {}_stop_name {}".format(prefix, stop_name))
+    return connection_scan_data.stops_per_name[stop_name].id
+
+
+def journey_to_dict(journey):
+    """Returns the json-serializable representation of a journey.
+
+    Args:
+        journey (Journey): journey (or None).
+
+    Returns:
+        dict: departure time, arrival time and journey legs (None if journey is None).
+    """
+    if journey is None:
+        return None
+    legs = []
+    for leg in journey.journey_legs:
+        legs += [{
+            "trip_id": leg.get_trip_id(),
+            "in_stop_id": leg.get_in_stop_id(),
+            "out_stop_id": leg.get_out_stop_id(),
+            "dep_time": leg.get_dep_time_in_stop_id(),
+            "arr_time": leg.get_arr_time_out_stop_id(),
+            "footpath": None if leg.footpath is None else {
+                "from_stop_id": leg.footpath.from_stop_id,
+                "to_stop_id": leg.footpath.to_stop_id,
+                "walking_time": leg.footpath.walking_time,
+            },
+        }]
+    return {"dep_time": journey.get_dep_time(), "arr_time": journey.get_arr_time(), "journey_legs": legs}
+
+
+def get_latest_dep_time_of_result(routed_dep_time, result):
+    """Returns the latest desired departure time for which a result of _route is exact (see get_latest_dep_time).
+
+    Args:
+        routed_dep_time (int): departure time the result was routed with.
+        result (dict): json-serializable result of _route.
+
+    Returns:
+        float: the latest desired departure time.
+    """
+    if "journey" not in result:
+        return get_latest_dep_time(routed_dep_time, result["arr_time"] is not None, None)
+    journey = result["journey"]
+    is_reachable = journey is not None and len(journey["journey_legs"]) > 0
+    return get_latest_dep_time(routed_dep_time, is_reachable, journey["dep_time"] if is_reachable else None)
+
+
+def _init_worker(connection_scan_data, path_to_snapshot, backend):
+    """Helper function creating the ConnectionScanCore of a worker process (once per process)."""
+    global _worker_cs_core
+    if path_to_snapshot is not None:
+        _worker_cs_core = load_snapshot(path_to_snapshot, backend=backend)
+    else:
+        _worker_cs_core = ConnectionScanCore(connection_scan_data, backend)
+
+
+def _get_nb_stops():
+    """Helper function returning the number of stops of the ConnectionScanCore of a worker process."""
+    return len(_worker_cs_core.connection_scan_data.stops_per_id)
+
+
+def _route(router, from_stop_id, to_stop_id, desired_dep_time):
+    """Helper function executing a routing query in a worker process."""
+    if router == "earliest_arrival":
+        arr_time = _worker_cs_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time)
+        arr_time = int(arr_time) if arr_time is not None else None  # the scans return numpy integers
+        return {"arr_time": arr_time, "arr_time_hhmmss": seconds_to_hhmmss(arr_time) if arr_time is not None else None}
+    journey = getattr(_worker_cs_core, "route_{}".format(router))(from_stop_id, to_stop_id, desired_dep_time)
+    return {"journey": journey_to_dict(journey)}
+
+
+def main(args=None):
+    """Loads the timetable data (from the snapshot if up to date, see snapshot.load_or_parse_gtfs) and serves
+    routing queries until SIGINT or SIGTERM."""
+    parser = argparse.ArgumentParser(description="HTTP/JSON server answering routing queries.")
+    parser.add_argument("--gtfs", required=True, help="path to the gtfs-file")
+    parser.add_argument("--date", required=True, help="date of the timetable data (YYYYMMDD)")
+    parser.add_argument("--snapshot", default=None, help="path to the snapshot directory (recommended)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--processes", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--backend", default=RoutingBackend.PYTHON.name, choices=[b.name for b in RoutingBackend])
+    parser.add_argument("--beeline-distance", type=float, default=100.0)
+    parser.add_argument("--cache-size", type=int, default=0, help="maximal number of cached results (0: no cache)")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="seconds a cached result is valid")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    backend = RoutingBackend[args.backend]
+    desired_date = parse_yymmdd(args.date)
+    if args.snapshot is not None:
+        cs_core = load_or_parse_gtfs(args.gtfs, desired_date, args.snapshot, backend,
+                                     beeline_distance=args.beeline_distance)
+    else:
+        cs_core = ConnectionScanCore(parse_gtfs(args.gtfs, desired_date, beeline_distance=args.beeline_distance),
+                                     backend)
+    server = QueryServer(cs_core.connection_scan_data, args.host, args.port, args.processes, backend, args.snapshot,
+                         cache_size=args.cache_size, cache_ttl=args.cache_ttl)
+    asyncio.run(server.serve())
+
+
+if __name__ == "__main__":
+    main()
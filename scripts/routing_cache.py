@@ -0,0 +1,279 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This module provides a result cache for repeated routing queries (e.g. popular stop pairs at the same minute).
+
+The results are cached per (router, from_stop_id, to_stop_id, departure time bucket) with size-based (least recently
+used) and time-based (time to live) eviction.
+A cache miss is routed with the start of the bucket of the desired departure time (see get_dep_time_bucket)
+and the result is cached together with the latest desired departure time it is exact for (see get_latest_dep_time):
+- the departure time of its journey (all desired departure times in between have the same earliest arrival time).
+- no limit if the target is not reachable.
+- the start of the bucket if the departure time is not known (e.g. the earliest arrival router returns no journey).
+Later queries of the bucket are routed with their own desired departure time (and not cached).
+Hence a result always has the earliest arrival time of the uncached router. But if several journeys have the
+earliest arrival time, a cached journey may be another one than the journey of the uncached router.
+With the default bucket size of 1 second, the results are exactly the ones of the uncached router.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# routers of ConnectionScanCore whose results can be cached (see CachedConnectionScanCore)
+CACHED_ROUTERS = ("earliest_arrival", "earliest_arrival_with_reconstruction",
+                  "optimized_earliest_arrival_with_reconstruction")
+
+
+class ResultCache:
+    """Least recently used cache with an optional time to live for the entries.
+
+    Args and attributes:
+        max_size (:obj:`int`, optional): maximal number of entries (the least recently used entry is evicted
+        if the cache is full). Default is 10000.
+        ttl (:obj:`float`, optional): seconds an entry is valid after it has been put into the cache.
+        Default is None (i.e. the entries do not expire).
+        clock (:obj:`callable`, optional): function returning the current time in seconds. Default is time.monotonic.
+
+    Additional attributes:
+        entries (OrderedDict): (expiration time, result)-tuple per key (the least recently used entry first).
+        nb_hits (int): number of lookups with a valid entry.
+        nb_misses (int): number of lookups without a valid entry.
+        nb_evictions (int): number of entries evicted because the cache was full.
+        nb_expirations (int): number of entries removed because their time to live was over.
+        nb_invalidations (int): number of calls of clear.
+    """
+
+    def __init__(self, max_size=10000, ttl=None, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("max_size must be positive, but is {}".format(max_size))
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive (or None), but is {}".format(ttl))
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.nb_hits = 0
+        self.nb_misses = 0
+        self.nb_evictions = 0
+        self.nb_expirations = 0
+        self.nb_invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def lookup(self, key, is_valid=None):
+        """Looks up the result of a key (and marks the entry as most recently used).
+
+        Args:
+            key (tuple): the key.
+            is_valid (:obj:`callable`, optional): function returning whether the cached result can be used for this
+            lookup. If not, the lookup counts as miss, but the entry is kept. Default is None (always usable).
+
+        Returns:
+            tuple: True and the result if the cache holds a valid entry for the key, else False and None.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            expiration_time, result = entry
+            if expiration_time is None or self.clock() < expiration_time:
+                self.entries.move_to_end(key)
+                if is_valid is not None and not is_valid(result):
+                    self.nb_misses += 1
+                    return False, None
+                self.nb_hits += 1
+                return True, result
+            del self.entries[key]
+            self.nb_expirations += 1
+        self.nb_misses += 1
+        return False, None
+
+    def put(self, key, result):
+        """Puts the result of a key into the cache (evicting the least recently used entry if the cache is full).
+
+        Args:
+            key (tuple): the key.
+            result (object): the result (shared by all hits, i.e. it must not be modified).
+        """
+        self.entries[key] = (None if self.ttl is None else self.clock() + self.ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.nb_evictions += 1
+
+    def clear(self):
+        """Removes all entries (e.g. because the timetable data has been replaced)."""
+        self.entries.clear()
+        self.nb_invalidations += 1
+
+    def get_stats(self):
+        """Returns the counters of the cache.
+
+        Returns:
+            dict: size, max_size, ttl, nb_hits, nb_misses, hit_rate, nb_evictions, nb_expirations
+            and nb_invalidations.
+        """
+        nb_lookups = self.nb_hits + self.nb_misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "nb_hits": self.nb_hits,
+            "nb_misses": self.nb_misses,
+            "hit_rate": self.nb_hits / nb_lookups if nb_lookups > 0 else 0.0,
+            "nb_evictions": self.nb_evictions,
+            "nb_expirations": self.nb_expirations,
+            "nb_invalidations": self.nb_invalidations,
+        }
+
+
+class CachedConnectionScanCore:
+    """Result cache around the routers in CACHED_ROUTERS of a ConnectionScanCore.
+
+    The cache is invalidated if the ConnectionScanCore is replaced (see set_connection_scan_core)
+    or if the ConnectionScanData of the ConnectionScanCore is replaced.
+
+    Args and attributes:
+        connection_scan_core (ConnectionScanCore): routing instance answering the cache misses.
+        max_size (:obj:`int`, optional): maximal number of cached results. Default is 10000.
+        ttl (:obj:`float`, optional): seconds a result is valid. Default is None (i.e. until invalidation).
+        dep_time_bucket (:obj:`int`, optional): size of the departure time buckets in seconds. Default is 1
+        (i.e. the results are exact).
+        clock (:obj:`callable`, optional): function returning the current time in seconds. Default is time.monotonic.
+
+    Additional attributes:
+        cache (ResultCache): (result, latest desired departure time)-tuple per key (see get_latest_dep_time).
+        cached_connection_scan_data (ConnectionScanData): timetable data of the cached results.
+    """
+
+    def __init__(self, connection_scan_core, max_size=10000, ttl=None, dep_time_bucket=1, clock=time.monotonic):
+        if dep_time_bucket < 1:
+            raise ValueError("dep_time_bucket must be positive, but is {}".format(dep_time_bucket))
+        self.connection_scan_core = connection_scan_core
+        self.dep_time_bucket = dep_time_bucket
+        self.cache = ResultCache(max_size, ttl, clock)
+        self.cached_connection_scan_data = connection_scan_core.connection_scan_data
+
+    def set_connection_scan_core(self, connection_scan_core):
+        """Replaces the routing instance and invalidates the cache.
+
+        Args:
+            connection_scan_core (ConnectionScanCore): the new routing instance.
+        """
+        self.connection_scan_core = connection_scan_core
+        self.invalidate()
+
+    def invalidate(self):
+        """Removes all cached results."""
+        log.info("invalidating {} cached routing results".format(len(self.cache)))
+        self.cache.clear()
+        self.cached_connection_scan_data = self.connection_scan_core.connection_scan_data
+
+    def route(self, router, from_stop_id, to_stop_id, desired_dep_time):
+        """Returns the (cached) result of a router for the departure time bucket of the desired departure time.
+
+        Args:
+            router (str): name of the router in CACHED_ROUTERS (e.g. "earliest_arrival" for
+            ConnectionScanCore.route_earliest_arrival).
+            from_stop_id (str): id of the source stop.
+            to_stop_id (str): id of the target stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+
+        Returns:
+            object: result of the router for the start of the departure time bucket if it is exact for the desired
+            departure time (see module docstring), else for the desired departure time
+            (shared by all hits, i.e. it must not be modified).
+        """
+        if router not in CACHED_ROUTERS:
+            raise ValueError("router {} is not one of {}".format(router, CACHED_ROUTERS))
+        if self.connection_scan_core.connection_scan_data is not self.cached_connection_scan_data:
+            self.invalidate()
+        route = getattr(self.connection_scan_core, "route_{}".format(router))
+        key = get_cache_key(router, from_stop_id, to_stop_id, desired_dep_time, self.dep_time_bucket)
+        is_hit, entry = self.cache.lookup(key, lambda cached_entry: desired_dep_time <= cached_entry[1])
+        if not is_hit and key not in self.cache:
+            result = route(from_stop_id, to_stop_id, key[3])
+            if router == "earliest_arrival":
+                is_reachable, dep_time = result is not None, None
+            else:  # the journey routers return a journey without journey legs if the target is not reachable
+                is_reachable = result.get_nb_journey_legs() > 0
+                dep_time = result.get_dep_time() if is_reachable else None
+            entry = (result, get_latest_dep_time(key[3], is_reachable, dep_time))
+            self.cache.put(key, entry)
+        if entry is not None and desired_dep_time <= entry[1]:
+            return entry[0]
+        return route(from_stop_id, to_stop_id, desired_dep_time)
+
+    def route_earliest_arrival(self, from_stop_id, to_stop_id, desired_dep_time):
+        """Cached version of ConnectionScanCore.route_earliest_arrival (see route)."""
+        return self.route("earliest_arrival", from_stop_id, to_stop_id, desired_dep_time)
+
+    def route_earliest_arrival_with_reconstruction(self, from_stop_id, to_stop_id, desired_dep_time):
+        """Cached version of ConnectionScanCore.route_earliest_arrival_with_reconstruction (see route)."""
+        return self.route("earliest_arrival_with_reconstruction", from_stop_id, to_stop_id, desired_dep_time)
+
+    def route_optimized_earliest_arrival_with_reconstruction(self, from_stop_id, to_stop_id, desired_dep_time):
+        """Cached version of ConnectionScanCore.route_optimized_earliest_arrival_with_reconstruction (see route)."""
+        return self.route("optimized_earliest_arrival_with_reconstruction", from_stop_id, to_stop_id,
+                          desired_dep_time)
+
+    def log_stats(self):
+        """Logs the counters of the cache."""
+        log.info("routing cache: {}".format(", ".join("{}: {}".format(name, value)
+                                                      for name, value in self.cache.get_stats().items())))
+
+
+def get_dep_time_bucket(desired_dep_time, dep_time_bucket):
+    """Rounds a desired departure time down to the start of its departure time bucket.
+
+    Args:
+        desired_dep_time (int): desired departure time in seconds after midnight.
+        dep_time_bucket (int): size of the departure time buckets in seconds.
+
+    Returns:
+        int: the largest multiple of dep_time_bucket not after desired_dep_time.
+    """
+    return int(desired_dep_time) // dep_time_bucket * dep_time_bucket
+
+
+def get_latest_dep_time(routed_dep_time, is_reachable, dep_time):
+    """Returns the latest desired departure time for which a result routed with routed_dep_time is exact.
+
+    If the journey of the result departs at dep_time, every journey departing in [routed_dep_time, dep_time]
+    is also possible from routed_dep_time, i.e. no desired departure time in between leads to an earlier arrival.
+
+    Args:
+        routed_dep_time (int): departure time the result was routed with.
+        is_reachable (bool): False if the target is not reachable (then it is not reachable later either).
+        dep_time (int): departure time of the journey of the result (None if not known, e.g. for a journey
+        consisting of a footpath only).
+
+    Returns:
+        float: the latest desired departure time (math.inf if the target is not reachable).
+    """
+    if not is_reachable:
+        return math.inf
+    if dep_time is None:
+        return routed_dep_time
+    return max(routed_dep_time, dep_time)
+
+
+def get_cache_key(router, from_stop_id, to_stop_id, desired_dep_time, dep_time_bucket):
+    """Returns the key of a routing query in the result cache.
+
+    Args:
+        router (str): name of the router.
+        from_stop_id (str): id of the source stop.
+        to_stop_id (str): id of the target stop.
+        desired_dep_time (int): desired departure time in seconds after midnight.
+        dep_time_bucket (int): size of the departure time buckets in seconds.
+
+    Returns:
+        tuple: (router, from_stop_id, to_stop_id, start of the departure time bucket)-tuple
+        (see get_dep_time_bucket).
+    """
+    return router, from_stop_id, to_stop_id, get_dep_time_bucket(desired_dep_time, dep_time_bucket)
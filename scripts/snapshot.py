@@ -0,0 +1,366 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This module saves and loads snapshots of the timetable data (ConnectionScanData) and the derived indexes of
+the routing instance (ConnectionScanCore) in a versioned on-disk format.
+
+A snapshot is a directory containing:
+- header.json: format version, feed hash, date and parser parameters (to detect stale snapshots)
+and the validation stamp (validation level of the saved timetable data, see ValidationLevel).
+- ids.json: id's, codes and names of the stops and id's and types of the trips.
+- one .npy-file per array (connections, trips, footpaths and stop coordinates).
+
+The arrays are loaded memory-mapped (read-only), i.e. loading a snapshot does not parse the gtfs-file and several
+processes loading the same snapshot share the same pages.
+Only the stops and footpaths are created as objects when a snapshot is loaded. The connections and trips are created
+when they are accessed (see SnapshotConnections and SnapshotTrips), e.g. during the reconstruction of a journey.
+These objects are private to the process, and all of them are created if the timetable data is validated
+or a TripBasedData is created.
+"""
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Mapping, Sequence
+from enum import Enum
+
+import numpy as np
+
+from scripts.classes import Connection, Footpath, Stop, Trip, TripType
+from scripts.connectionscan_router import (COLUMNAR_ARRAY_NAMES, FOOTPATH_ARRAY_NAMES, ConnectionScanCore,
+                                           ConnectionScanData, RoutingBackend, ValidationLevel)
+from scripts.gtfs_parser import parse_gtfs
+from scripts.helpers.my_logging import log_end, log_span, log_start
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+HEADER_FILE_NAME = "header.json"
+IDS_FILE_NAME = "ids.json"
+STOP_ARRAY_NAMES = ("stop_eastings", "stop_northings", "stop_is_station")
+TRIP_ARRAY_NAMES = ("trip_first_indices", "trip_connection_indices")
+SNAPSHOT_ARRAY_NAMES = COLUMNAR_ARRAY_NAMES + FOOTPATH_ARRAY_NAMES + STOP_ARRAY_NAMES + TRIP_ARRAY_NAMES
+# parameters of parse_gtfs which do not change the parsed timetable data (not recorded in the header)
+PERFORMANCE_PARSER_PARAMS = ("stop_times_chunk_size", "nb_processes", "validation_level")
+# validation stamps of snapshots whose timetable data is loaded without consistency checks
+TRUSTED_VALIDATION_LEVELS = (ValidationLevel.FULL.name, ValidationLevel.FAST.name)
+
+
+class SnapshotConnections(Sequence):
+    """Connections of a snapshot sorted exactly like the columnar store (see ConnectionScanData.sorted_connections).
+
+    A connection is created from the memory-mapped arrays when it is accessed for the first time (e.g. during the
+    reconstruction of a journey) and kept afterwards, i.e. the same index always returns the same object.
+
+    Args:
+        trip_ids (list): trip id per trip index.
+        stop_ids (list): stop id per stop index.
+        arrays_per_name (dict): arrays of the snapshot per name (at least the arrays in COLUMNAR_ARRAY_NAMES).
+    """
+
+    def __init__(self, trip_ids, stop_ids, arrays_per_name):
+        self.trip_ids = trip_ids
+        self.stop_ids = stop_ids
+        self.trip_indices = arrays_per_name["trip_indices"]
+        self.from_stop_indices = arrays_per_name["from_stop_indices"]
+        self.to_stop_indices = arrays_per_name["to_stop_indices"]
+        self.dep_times = arrays_per_name["dep_times"]
+        self.arr_times = arrays_per_name["arr_times"]
+        self.connections = [None] * len(self.dep_times)
+
+    def __len__(self):
+        return len(self.connections)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[ind] for ind in range(*index.indices(len(self)))]
+        connection = self.connections[index]
+        if connection is None:
+            connection = Connection(self.trip_ids[self.trip_indices[index]],
+                                    self.stop_ids[self.from_stop_indices[index]],
+                                    self.stop_ids[self.to_stop_indices[index]],
+                                    int(self.dep_times[index]), int(self.arr_times[index]))
+            self.connections[index] = connection
+        return connection
+
+
+class SnapshotTrips(Mapping):
+    """Trips of a snapshot per trip id (see ConnectionScanData.trips_per_id).
+
+    Like the connections (see SnapshotConnections), a trip is created when it is accessed for the first time.
+
+    Args:
+        trip_ids (list): trip id per trip index.
+        trip_types (list): value of the trip type per trip index.
+        connections (SnapshotConnections): connections of the snapshot.
+        trip_first_indices (ndarray): position in trip_connection_indices of the first connection per trip index
+        (the last entry is the number of connections).
+        trip_connection_indices (ndarray): indices of the connections in connections grouped by trip.
+    """
+
+    def __init__(self, trip_ids, trip_types, connections, trip_first_indices, trip_connection_indices):
+        self.trip_index_per_id = {trip_id: ind for ind, trip_id in enumerate(trip_ids)}
+        self.trip_types = trip_types
+        self.connections = connections
+        self.trip_first_indices = trip_first_indices
+        self.trip_connection_indices = trip_connection_indices
+        self.trips_per_id = {}
+
+    def __len__(self):
+        return len(self.trip_index_per_id)
+
+    def __iter__(self):
+        return iter(self.trip_index_per_id)
+
+    def __getitem__(self, trip_id):
+        trip = self.trips_per_id.get(trip_id)
+        if trip is None:
+            trip_index = self.trip_index_per_id[trip_id]
+            connection_indices = self.trip_connection_indices[
+                self.trip_first_indices[trip_index]:self.trip_first_indices[trip_index + 1]].tolist()
+            trip = Trip(trip_id, [self.connections[ind] for ind in connection_indices],
+                        TripType(self.trip_types[trip_index]))
+            self.trips_per_id[trip_id] = trip
+        return trip
+
+
+def compute_feed_hash(path_to_gtfs_zip, chunk_size=1 << 20):
+    """Computes the sha256-hash of a gtfs-file.
+
+    Args:
+        path_to_gtfs_zip (str): path to the gtfs-file.
+        chunk_size (:obj:`int`, optional): number of bytes read at once. Default is 1 MiB.
+
+    Returns:
+        str: hex digest of the sha256-hash.
+    """
+    sha = hashlib.sha256()
+    with open(path_to_gtfs_zip, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def create_header(feed_hash, desired_date, parser_params, validation_level=None):
+    """Creates the header of a snapshot.
+
+    Args:
+        feed_hash (str): hash of the gtfs-file (see compute_feed_hash).
+        desired_date (date): date of the timetable data.
+        parser_params (dict): keyword arguments of parse_gtfs (values must be json-serializable or enums,
+        enums are recorded by their name).
+        validation_level (:obj:`ValidationLevel`, optional): validation stamp, i.e. the consistency checks performed
+        on the timetable data. Default is None (not validated).
+
+    Returns:
+        dict: header of the snapshot.
+    """
+    return {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "feed_hash": feed_hash,
+        "desired_date": desired_date.isoformat() if desired_date is not None else None,
+        "parser_params": {key: value.name if isinstance(value, Enum) else value
+                          for key, value in parser_params.items()} if parser_params is not None else {},
+        "validation_level": validation_level.name if validation_level is not None else None,
+    }
+
+
+def save_snapshot(path_to_snapshot, connection_scan_core, feed_hash=None, desired_date=None, parser_params=None):
+    """Saves the timetable data and the derived indexes of a routing instance to a snapshot directory.
+
+    Args:
+        path_to_snapshot (str): path to the snapshot directory (created if it does not exist).
+        connection_scan_core (ConnectionScanCore): routing instance (including the timetable data).
+        feed_hash (:obj:`str`, optional): hash of the gtfs-file (see compute_feed_hash). Default is None.
+        desired_date (:obj:`date`, optional): date of the timetable data. Default is None.
+        parser_params (:obj:`dict`, optional): keyword arguments of parse_gtfs. Default is None.
+    """
+    log_start("saving snapshot to {}".format(path_to_snapshot), log)
+    cs_data = connection_scan_core.connection_scan_data
+    os.makedirs(path_to_snapshot, exist_ok=True)
+    # the header is removed first and written last: a snapshot without header is incomplete
+    path_to_header = os.path.join(path_to_snapshot, HEADER_FILE_NAME)
+    if os.path.isfile(path_to_header):
+        os.remove(path_to_header)
+
+    stops = list(cs_data.stops_per_id.values())
+    trips = list(cs_data.trips_per_id.values())
+    connection_index_per_object_id = {id(c): ind for ind, c in enumerate(cs_data.sorted_connections)}
+    arrays_per_name = {name: getattr(cs_data, name) for name in COLUMNAR_ARRAY_NAMES}
+    arrays_per_name.update({name: getattr(connection_scan_core, name) for name in FOOTPATH_ARRAY_NAMES})
+    arrays_per_name["stop_eastings"] = np.array([s.easting for s in stops], dtype=np.float64)
+    arrays_per_name["stop_northings"] = np.array([s.northing for s in stops], dtype=np.float64)
+    arrays_per_name["stop_is_station"] = np.array([s.is_station for s in stops], dtype=np.bool_)
+    arrays_per_name["trip_first_indices"] = np.zeros(len(trips) + 1, dtype=np.int64)
+    arrays_per_name["trip_first_indices"][1:] = np.cumsum([len(t.connections) for t in trips])
+    arrays_per_name["trip_connection_indices"] = np.array(
+        [connection_index_per_object_id[id(c)] for t in trips for c in t.connections], dtype=np.int32)
+    for name in SNAPSHOT_ARRAY_NAMES:
+        # replace instead of overwrite: processes may still have the old file memory-mapped
+        path_to_array = os.path.join(path_to_snapshot, name + ".npy")
+        with open(path_to_array + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(arrays_per_name[name]))
+        os.replace(path_to_array + ".tmp", path_to_array)
+
+    ids = {
+        "stop_ids": [s.id for s in stops],
+        "stop_codes": [s.code for s in stops],
+        "stop_names": [s.name for s in stops],
+        "stop_parent_station_ids": [s.parent_station_id for s in stops],
+        "trip_ids": [t.id for t in trips],
+        "trip_types": [t.trip_type.value for t in trips],
+    }
+    with open(os.path.join(path_to_snapshot, IDS_FILE_NAME), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+    with open(path_to_header, "w", encoding="utf-8") as f:
+        json.dump(create_header(feed_hash, desired_date, parser_params, cs_data.validation_level), f, indent=2)
+    log_end(additional_message="{}".format(cs_data))
+
+
+def read_snapshot_header(path_to_snapshot):
+    """Reads the header of a snapshot.
+
+    Args:
+        path_to_snapshot (str): path to the snapshot directory.
+
+    Returns:
+        dict: header of the snapshot (see create_header).
+    """
+    path_to_header = os.path.join(path_to_snapshot, HEADER_FILE_NAME)
+    if not os.path.isfile(path_to_header):
+        raise ValueError("{} is not a (complete) snapshot: {} is missing".format(path_to_snapshot, HEADER_FILE_NAME))
+    with open(path_to_header, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_snapshot_header(path_to_snapshot, feed_hash=None, desired_date=None, parser_params=None):
+    """Checks whether the snapshot has the current format version and (if defined) was created from the gtfs-file
+    with the given hash, for the given date and with the given parser parameters.
+
+    Args:
+        path_to_snapshot (str): path to the snapshot directory.
+        feed_hash (:obj:`str`, optional): expected hash of the gtfs-file. Default is None (not checked).
+        desired_date (:obj:`date`, optional): expected date. Default is None (not checked).
+        parser_params (:obj:`dict`, optional): expected parser parameters. Default is None (not checked).
+
+    Returns:
+        dict: header of the snapshot.
+
+    Raises:
+        ValueError: if the snapshot is incomplete, has another format version or is stale.
+    """
+    header = read_snapshot_header(path_to_snapshot)
+    if header.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError("snapshot {} has format version {}, expected {}".format(
+            path_to_snapshot, header.get("format_version"), SNAPSHOT_FORMAT_VERSION))
+    expected = create_header(feed_hash, desired_date, parser_params)
+    for key, is_defined in [("feed_hash", feed_hash is not None),
+                            ("desired_date", desired_date is not None),
+                            ("parser_params", parser_params is not None)]:
+        if is_defined and header.get(key) != expected[key]:
+            raise ValueError("snapshot {} is stale: {} is {}, expected {}".format(
+                path_to_snapshot, key, header.get(key), expected[key]))
+    return header
+
+
+def load_snapshot(path_to_snapshot, feed_hash=None, desired_date=None, parser_params=None,
+                  backend=RoutingBackend.PYTHON, validation_level=None):
+    """Loads a snapshot created by save_snapshot and returns the routing instance.
+
+    The arrays are memory-mapped (read-only) and the connections and trips are created lazily
+    (see SnapshotConnections and SnapshotTrips). By default the consistency checks of ConnectionScanData are skipped
+    if the snapshot carries a validation stamp in TRUSTED_VALIDATION_LEVELS (they were performed when the snapshot
+    was created), otherwise all checks are performed.
+
+    Args:
+        path_to_snapshot (str): path to the snapshot directory.
+        feed_hash (:obj:`str`, optional): expected hash of the gtfs-file. Default is None (not checked).
+        desired_date (:obj:`date`, optional): expected date. Default is None (not checked).
+        parser_params (:obj:`dict`, optional): expected parser parameters. Default is None (not checked).
+        backend (:obj:`RoutingBackend`, optional): default backend of the routing instance.
+        Default is RoutingBackend.PYTHON.
+        validation_level (:obj:`ValidationLevel`, optional): consistency checks of the loaded timetable data.
+        Default is None (depending on the validation stamp, see above).
+
+    Returns:
+        ConnectionScanCore: routing instance (including the timetable data).
+
+    Raises:
+        ValueError: if the snapshot is incomplete, has another format version or is stale.
+    """
+    header = check_snapshot_header(path_to_snapshot, feed_hash, desired_date, parser_params)
+    for name in SNAPSHOT_ARRAY_NAMES:
+        if not os.path.isfile(os.path.join(path_to_snapshot, name + ".npy")):
+            raise ValueError("{} is not a (complete) snapshot: {}.npy is missing".format(path_to_snapshot, name))
+    if validation_level is None:
+        if header.get("validation_level") in TRUSTED_VALIDATION_LEVELS:
+            validation_level = ValidationLevel.NONE
+        else:
+            validation_level = ValidationLevel.FULL
+    with log_span("loading snapshot from {}".format(path_to_snapshot), log) as span:
+        arrays_per_name = {name: np.load(os.path.join(path_to_snapshot, name + ".npy"), mmap_mode="r")
+                           for name in SNAPSHOT_ARRAY_NAMES}
+        with open(os.path.join(path_to_snapshot, IDS_FILE_NAME), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+
+        stop_ids = ids["stop_ids"]
+        stops_per_id = {stop_id: Stop(stop_id, code, name, easting, northing, is_station=is_station,
+                                      parent_station_id=parent_station_id)
+                        for stop_id, code, name, easting, northing, is_station, parent_station_id in zip(
+                            stop_ids, ids["stop_codes"], ids["stop_names"],
+                            arrays_per_name["stop_eastings"].tolist(), arrays_per_name["stop_northings"].tolist(),
+                            arrays_per_name["stop_is_station"].tolist(), ids["stop_parent_station_ids"])}
+        sorted_connections = SnapshotConnections(ids["trip_ids"], stop_ids, arrays_per_name)
+        trips_per_id = SnapshotTrips(ids["trip_ids"], ids["trip_types"], sorted_connections,
+                                     arrays_per_name["trip_first_indices"],
+                                     arrays_per_name["trip_connection_indices"])
+
+        # footpaths in the order of the compressed sparse row format (see ConnectionScanCore)
+        footpath_first_indices = arrays_per_name["footpath_first_indices"]
+        footpath_from_stop_indices = np.repeat(np.arange(len(stop_ids)), np.diff(footpath_first_indices)).tolist()
+        footpaths_per_from_to_stop_id = {}
+        for from_stop_index, to_stop_index, walking_time in zip(
+                footpath_from_stop_indices,
+                arrays_per_name["footpath_to_stop_indices"].tolist(),
+                arrays_per_name["footpath_walking_times"].tolist()):
+            key = (stop_ids[from_stop_index], stop_ids[to_stop_index])
+            footpaths_per_from_to_stop_id[key] = Footpath(
+                key[0], key[1], int(walking_time) if walking_time.is_integer() else walking_time)
+
+        columnar_store = {name: arrays_per_name[name] for name in COLUMNAR_ARRAY_NAMES}
+        columnar_store["sorted_connections"] = sorted_connections
+        cs_data = ConnectionScanData(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id, columnar_store,
+                                     validation_level)
+        cs_core = ConnectionScanCore(cs_data, backend,
+                                     {name: arrays_per_name[name] for name in FOOTPATH_ARRAY_NAMES})
+        span.set_additional_message("{}".format(cs_data))
+    return cs_core
+
+
+def load_or_parse_gtfs(path_to_gtfs_zip, desired_date, path_to_snapshot, backend=RoutingBackend.PYTHON,
+                       **parser_params):
+    """Loads the routing instance from the snapshot if it is up to date.
+    Otherwise the gtfs-file is parsed (see parse_gtfs) and the snapshot is (re)created.
+
+    Args:
+        path_to_gtfs_zip (str): path to the gtfs-file.
+        desired_date (date): date on which the timetable data is read.
+        path_to_snapshot (str): path to the snapshot directory.
+        backend (:obj:`RoutingBackend`, optional): default backend of the routing instance.
+        Default is RoutingBackend.PYTHON.
+        **parser_params: further keyword arguments of parse_gtfs. The parameters in PERFORMANCE_PARSER_PARAMS
+        are not recorded in the header.
+
+    Returns:
+        ConnectionScanCore: routing instance (including the timetable data).
+    """
+    feed_hash = compute_feed_hash(path_to_gtfs_zip)
+    header_parser_params = {key: value for key, value in parser_params.items()
+                            if key not in PERFORMANCE_PARSER_PARAMS}
+    if os.path.isfile(os.path.join(path_to_snapshot, HEADER_FILE_NAME)):
+        try:
+            return load_snapshot(path_to_snapshot, feed_hash, desired_date, header_parser_params, backend)
+        except ValueError as e:
+            log.info("snapshot cannot be used ({}), parsing gtfs-file".format(e))
+    cs_core = ConnectionScanCore(parse_gtfs(path_to_gtfs_zip, desired_date, **parser_params), backend)
+    save_snapshot(path_to_snapshot, cs_core, feed_hash, desired_date, header_parser_params)
+    return cs_core
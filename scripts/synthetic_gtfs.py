@@ -0,0 +1,385 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This module provides a deterministic generator of synthetic gtfs-files (e.g. for measuring the scaling behaviour
+of the parser and the routers offline).
+
+The stops are placed on a jittered grid around the center of Switzerland. Each route is a random walk on the grid
+and is served in both directions by trips with a fixed headway, with a weekday service (monday to friday)
+and a weekend service (saturday and sunday, with half the frequency).
+The feed is completed by transfers between neighbouring stops (transfers.txt) and calendar exceptions
+(calendar_dates.txt).
+
+The same parameters (including the seed) always produce the same gtfs-file (byte by byte).
+The sizes in SIZE_PRESETS range from a toy network to a network of the size of Switzerland
+(millions of connections per day).
+
+Example:
+    python -m scripts.synthetic_gtfs --preset medium --seed 1 --output path/to/synthetic_gtfs.zip
+"""
+import argparse
+import logging
+import math
+import random
+from datetime import date, timedelta
+from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+from scripts.classes import TripType
+from scripts.helpers.my_logging import log_end, log_start
+
+log = logging.getLogger(__name__)
+
+CENTER_LON = 8.23  # center of the grid (WGS84)
+CENTER_LAT = 46.8
+METERS_PER_DEGREE = 111320.0  # meters per degree latitude (and per degree longitude at the equator)
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)  # fixed modification time of the files in the zip (deterministic output)
+WEEKDAY_PATTERN = ("1", "1", "1", "1", "1", "0", "0")  # monday to sunday
+WEEKEND_PATTERN = ("0", "0", "0", "0", "0", "1", "1")
+SPEED_PER_ROUTE_TYPE = {TripType.TRAM.value: 5.0, TripType.RAIL.value: 20.0,
+                        TripType.BUS.value: 6.0}  # travel speed in meters per second
+DWELL_TIME_PER_ROUTE_TYPE = {TripType.TRAM.value: 0, TripType.RAIL.value: 60, TripType.BUS.value: 0}  # seconds
+WRITE_BUFFER_SIZE = 100000  # number of rows of stop_times.txt written at once
+# parameters of generate_synthetic_gtfs for networks of different sizes
+SIZE_PRESETS = {
+    "toy": dict(nb_stops=50, nb_routes=6, trips_per_hour=2, nb_calendar_exceptions=2),
+    "small": dict(nb_stops=500, nb_routes=50, trips_per_hour=4, nb_calendar_exceptions=10),
+    "medium": dict(nb_stops=5000, nb_routes=400, trips_per_hour=4, nb_calendar_exceptions=50),
+    "switzerland": dict(nb_stops=30000, nb_routes=2000, trips_per_hour=2, nb_calendar_exceptions=200),
+}
+
+
+def generate_synthetic_gtfs(
+        path_to_gtfs_zip,
+        nb_stops=100,
+        nb_routes=10,
+        trips_per_hour=4,
+        start_date=date(2020, 1, 6),
+        nb_service_days=28,
+        transfer_density=0.1,
+        nb_calendar_exceptions=0,
+        min_stops_per_route=5,
+        max_stops_per_route=30,
+        stop_spacing=400.0,
+        first_departure=5 * 60 * 60,
+        last_departure=24 * 60 * 60,
+        seed=0
+):
+    """Writes a synthetic gtfs-file (see module documentation).
+
+    Args:
+        path_to_gtfs_zip (str): path of the gtfs-file to write.
+        nb_stops (:obj:`int`, optional): number of stops. Default is 100.
+        nb_routes (:obj:`int`, optional): number of routes (each served in both directions). Default is 10.
+        trips_per_hour (:obj:`int`, optional): number of trips per hour and direction of a route on weekdays
+        (on weekends half of it, but at least one). Default is 4.
+        start_date (:obj:`date`, optional): first day of the service period. Default is date(2020, 1, 6) (a monday).
+        nb_service_days (:obj:`int`, optional): number of days of the service period. Default is 28.
+        transfer_density (:obj:`float`, optional): probability of a stop to have a transfer (in both directions)
+        to a neighbouring stop in transfers.txt. Default is 0.1.
+        nb_calendar_exceptions (:obj:`int`, optional): number of calendar exceptions, i.e. services removed from
+        or added to a date of the service period. Default is 0.
+        min_stops_per_route (:obj:`int`, optional): minimal number of stops of a route. Default is 5.
+        max_stops_per_route (:obj:`int`, optional): maximal number of stops of a route (a route can be shorter
+        if the random walk gets stuck). Default is 30.
+        stop_spacing (:obj:`float`, optional): distance in meters between neighbouring grid points. Default is 400.
+        first_departure (:obj:`int`, optional): earliest departure of a trip in seconds after midnight.
+        Default is 5 * 60 * 60.
+        last_departure (:obj:`int`, optional): latest departure of a trip at its first stop in seconds after midnight.
+        Default is 24 * 60 * 60.
+        seed (:obj:`int`, optional): seed of the random generator. Default is 0.
+
+    Returns:
+        dict: number of stops, routes, services, trips, stop times, transfers and calendar exceptions per day type
+        and the first and last date of the service period.
+    """
+    if nb_stops < 2:
+        raise ValueError("at least two stops are required, but nb_stops is {}".format(nb_stops))
+    if not 2 <= min_stops_per_route <= max_stops_per_route:
+        raise ValueError("2 <= min_stops_per_route ({}) <= max_stops_per_route ({}) does not hold".format(
+            min_stops_per_route, max_stops_per_route))
+    if trips_per_hour < 1 or nb_service_days < 1 or not 0.0 <= transfer_density <= 1.0:
+        raise ValueError("trips_per_hour ({}) and nb_service_days ({}) must be positive and transfer_density ({}) "
+                         "must be in [0, 1]".format(trips_per_hour, nb_service_days, transfer_density))
+    log_start("generating synthetic gtfs-file {} (seed {})".format(path_to_gtfs_zip, seed), log)
+    rnd = random.Random(seed)
+    nb_columns = int(math.ceil(math.sqrt(nb_stops)))
+    coordinates = create_stop_coordinates(nb_stops, nb_columns, stop_spacing, rnd)
+    routes = [create_route(nb_stops, nb_columns, rnd.randint(min_stops_per_route, max_stops_per_route), rnd)
+              for _ in range(nb_routes)]
+    route_types = [rnd.choice((TripType.BUS.value, TripType.BUS.value, TripType.TRAM.value, TripType.RAIL.value))
+                   for _ in range(nb_routes)]
+    transfers = create_transfers(nb_stops, nb_columns, transfer_density, rnd)
+    end_date = start_date + timedelta(days=nb_service_days - 1)
+    service_ids = [service_id for route_index in range(nb_routes)
+                   for service_id in ("WD{}".format(route_index), "WE{}".format(route_index))]
+    calendar_exceptions = create_calendar_exceptions(service_ids, start_date, nb_service_days, nb_calendar_exceptions,
+                                                     rnd)
+
+    res = {"nb_stops": nb_stops, "nb_routes": nb_routes, "nb_services": len(service_ids), "nb_trips": 0,
+           "nb_stop_times": 0, "nb_transfers": len(transfers), "nb_calendar_exceptions": len(calendar_exceptions),
+           "start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
+    with ZipFile(path_to_gtfs_zip, "w") as zip_file:
+        write_gtfs_file(zip_file, "agency.txt", ["agency_id,agency_name,agency_url,agency_timezone",
+                                                 "SYN,Synthetic Transit,http://example.com,Europe/Zurich"])
+        write_gtfs_file(zip_file, "stops.txt", ["stop_id,stop_code,stop_name,stop_lat,stop_lon,location_type,"
+                                                "parent_station"] + [
+            "S{0},{0},Stop {0},{1:.6f},{2:.6f},0,".format(stop_index, lat, lon)
+            for stop_index, (lon, lat) in enumerate(coordinates)])
+        write_gtfs_file(zip_file, "routes.txt", ["route_id,agency_id,route_short_name,route_long_name,route_type"] + [
+            "R{0},SYN,{0},Route {0},{1}".format(route_index, route_type)
+            for route_index, route_type in enumerate(route_types)])
+        write_gtfs_file(zip_file, "calendar.txt", [
+            "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date"] + [
+            "{},{},{},{}".format(service_id, ",".join(WEEKDAY_PATTERN if service_id.startswith("WD")
+                                                      else WEEKEND_PATTERN),
+                                 start_date.strftime("%Y%m%d"), end_date.strftime("%Y%m%d"))
+            for service_id in service_ids])
+        write_gtfs_file(zip_file, "calendar_dates.txt", ["service_id,date,exception_type"] + [
+            "{},{},{}".format(service_id, a_date.strftime("%Y%m%d"), exception_type)
+            for service_id, a_date, exception_type in calendar_exceptions])
+        write_gtfs_file(zip_file, "transfers.txt", ["from_stop_id,to_stop_id,transfer_type,min_transfer_time"] + [
+            "S{},S{},2,{}".format(from_stop_index, to_stop_index, min_transfer_time)
+            for from_stop_index, to_stop_index, min_transfer_time in transfers])
+
+        trip_rows = ["route_id,service_id,trip_id,direction_id"]
+        with zip_file.open(create_zip_info("stop_times.txt"), "w", force_zip64=True) as stop_times_file:
+            stop_time_rows = ["trip_id,arrival_time,departure_time,stop_id,stop_sequence"]
+            for route_index, (stop_indices, route_type) in enumerate(zip(routes, route_types)):
+                running_times = get_running_times(stop_indices, coordinates, route_type)
+                dwell_time = DWELL_TIME_PER_ROUTE_TYPE[route_type]
+                for service_id, nb_trips_per_hour in (("WD{}".format(route_index), trips_per_hour),
+                                                      ("WE{}".format(route_index), max(1, trips_per_hour // 2))):
+                    headway = 3600 // nb_trips_per_hour
+                    offset = rnd.randrange(headway)
+                    for direction in (0, 1):
+                        directed_stop_indices = stop_indices if direction == 0 else stop_indices[::-1]
+                        directed_running_times = running_times if direction == 0 else running_times[::-1]
+                        for dep_time in range(first_departure + offset, last_departure, headway):
+                            trip_id = "{}_{}_{}".format(service_id, direction, dep_time)
+                            trip_rows += ["R{},{},{},{}".format(route_index, service_id, trip_id, direction)]
+                            stop_time_rows += create_stop_time_rows(trip_id, directed_stop_indices,
+                                                                    directed_running_times, dwell_time, dep_time)
+                            res["nb_trips"] += 1
+                            res["nb_stop_times"] += len(directed_stop_indices)
+                            if len(stop_time_rows) >= WRITE_BUFFER_SIZE:
+                                stop_times_file.write(("\n".join(stop_time_rows) + "\n").encode("utf-8"))
+                                stop_time_rows = []
+            stop_times_file.write(("\n".join(stop_time_rows) + "\n").encode("utf-8") if stop_time_rows else b"")
+        write_gtfs_file(zip_file, "trips.txt", trip_rows)
+    log_end(additional_message=", ".join("{}: {}".format(key, value) for key, value in res.items()))
+    return res
+
+
+def create_stop_coordinates(nb_stops, nb_columns, stop_spacing, rnd):
+    """Returns the (lon, lat)-tuple (WGS84) per stop index of the stops on a jittered grid with nb_columns columns.
+
+    Args:
+        nb_stops (int): number of stops.
+        nb_columns (int): number of columns of the grid.
+        stop_spacing (float): distance in meters between neighbouring grid points.
+        rnd (Random): random generator.
+
+    Returns:
+        list: (lon, lat)-tuple per stop index.
+    """
+    meters_per_degree_lon = METERS_PER_DEGREE * math.cos(math.radians(CENTER_LAT))
+    offset = (nb_columns - 1) * stop_spacing / 2.0
+    coordinates = []
+    for stop_index in range(nb_stops):
+        x = (stop_index % nb_columns) * stop_spacing - offset + rnd.uniform(-0.3, 0.3) * stop_spacing
+        y = (stop_index // nb_columns) * stop_spacing - offset + rnd.uniform(-0.3, 0.3) * stop_spacing
+        coordinates += [(CENTER_LON + x / meters_per_degree_lon, CENTER_LAT + y / METERS_PER_DEGREE)]
+    return coordinates
+
+
+def get_grid_neighbours(stop_index, nb_stops, nb_columns):
+    """Returns the indices of the stops on the neighbouring grid points (right, left, up and down) of a stop.
+
+    Args:
+        stop_index (int): index of the stop.
+        nb_stops (int): number of stops.
+        nb_columns (int): number of columns of the grid.
+
+    Returns:
+        list: indices of the neighbouring stops.
+    """
+    column = stop_index % nb_columns
+    neighbours = []
+    if column + 1 < nb_columns and stop_index + 1 < nb_stops:
+        neighbours += [stop_index + 1]
+    if column > 0:
+        neighbours += [stop_index - 1]
+    if stop_index + nb_columns < nb_stops:
+        neighbours += [stop_index + nb_columns]
+    if stop_index >= nb_columns:
+        neighbours += [stop_index - nb_columns]
+    return neighbours
+
+
+def create_route(nb_stops, nb_columns, nb_route_stops, rnd):
+    """Returns the stop indices of a route created by a self-avoiding random walk on the grid
+    (which prefers to continue in the same direction).
+
+    Args:
+        nb_stops (int): number of stops.
+        nb_columns (int): number of columns of the grid.
+        nb_route_stops (int): desired number of stops of the route (the walk stops earlier if it gets stuck).
+        rnd (Random): random generator.
+
+    Returns:
+        list: stop indices of the route (at least two).
+    """
+    while True:
+        stop_indices = [rnd.randrange(nb_stops)]
+        visited = {stop_indices[0]}
+        step = None
+        while len(stop_indices) < nb_route_stops:
+            candidates = [n for n in get_grid_neighbours(stop_indices[-1], nb_stops, nb_columns) if n not in visited]
+            if not candidates:
+                break
+            next_stop_index = stop_indices[-1] + step if step is not None else None
+            if next_stop_index not in candidates or rnd.random() < 0.3:
+                next_stop_index = rnd.choice(candidates)
+            step = next_stop_index - stop_indices[-1]
+            stop_indices += [next_stop_index]
+            visited.add(next_stop_index)
+        if len(stop_indices) >= 2:
+            return stop_indices
+
+
+def create_transfers(nb_stops, nb_columns, transfer_density, rnd):
+    """Returns the transfers between neighbouring stops (in both directions).
+
+    Args:
+        nb_stops (int): number of stops.
+        nb_columns (int): number of columns of the grid.
+        transfer_density (float): probability of a stop to have a transfer to a neighbouring stop.
+        rnd (Random): random generator.
+
+    Returns:
+        list: (from_stop_index, to_stop_index, min_transfer_time)-tuples (without duplicates).
+    """
+    min_transfer_time_per_pair = {}
+    for stop_index in range(nb_stops):
+        if rnd.random() < transfer_density:
+            neighbour = rnd.choice(get_grid_neighbours(stop_index, nb_stops, nb_columns))
+            min_transfer_time = 60 * rnd.randint(2, 8)
+            min_transfer_time_per_pair.setdefault((stop_index, neighbour), min_transfer_time)
+            min_transfer_time_per_pair.setdefault((neighbour, stop_index), min_transfer_time)
+    return [(from_stop_index, to_stop_index, min_transfer_time)
+            for (from_stop_index, to_stop_index), min_transfer_time in min_transfer_time_per_pair.items()]
+
+
+def create_calendar_exceptions(service_ids, start_date, nb_service_days, nb_calendar_exceptions, rnd):
+    """Returns calendar exceptions of random services at random dates of the service period.
+
+    A service regularly operating at the date is removed (exception type 2), otherwise it is added (exception type 1).
+
+    Args:
+        service_ids (list): ids of the services (weekday services start with "WD", weekend services with "WE").
+        start_date (date): first day of the service period.
+        nb_service_days (int): number of days of the service period.
+        nb_calendar_exceptions (int): number of exceptions (at most one per service and date).
+        rnd (Random): random generator.
+
+    Returns:
+        list: (service_id, date, exception_type)-tuples.
+    """
+    nb_calendar_exceptions = min(nb_calendar_exceptions, len(service_ids) * nb_service_days)
+    exception_type_per_service_id_and_date = {}
+    while len(exception_type_per_service_id_and_date) < nb_calendar_exceptions:
+        service_id = rnd.choice(service_ids)
+        a_date = start_date + timedelta(days=rnd.randrange(nb_service_days))
+        pattern = WEEKDAY_PATTERN if service_id.startswith("WD") else WEEKEND_PATTERN
+        exception_type_per_service_id_and_date[(service_id, a_date)] = 2 if pattern[a_date.weekday()] == "1" else 1
+    return [(service_id, a_date, exception_type)
+            for (service_id, a_date), exception_type in exception_type_per_service_id_and_date.items()]
+
+
+def get_running_times(stop_indices, coordinates, route_type):
+    """Returns the running times in seconds (full minutes, at least one) between consecutive stops of a route.
+
+    Args:
+        stop_indices (list): stop indices of the route.
+        coordinates (list): (lon, lat)-tuple per stop index.
+        route_type (int): route type (determines the speed, see SPEED_PER_ROUTE_TYPE).
+
+    Returns:
+        list: running time per pair of consecutive stops.
+    """
+    meters_per_degree_lon = METERS_PER_DEGREE * math.cos(math.radians(CENTER_LAT))
+    running_times = []
+    for from_stop_index, to_stop_index in zip(stop_indices[:-1], stop_indices[1:]):
+        (from_lon, from_lat), (to_lon, to_lat) = coordinates[from_stop_index], coordinates[to_stop_index]
+        meters = math.hypot((to_lon - from_lon) * meters_per_degree_lon, (to_lat - from_lat) * METERS_PER_DEGREE)
+        running_times += [60 * max(1, int(math.ceil(meters / SPEED_PER_ROUTE_TYPE[route_type] / 60)))]
+    return running_times
+
+
+def create_stop_time_rows(trip_id, stop_indices, running_times, dwell_time, dep_time):
+    """Returns the rows of stop_times.txt of a trip.
+
+    Args:
+        trip_id (str): id of the trip.
+        stop_indices (list): stop indices of the trip.
+        running_times (list): running time per pair of consecutive stops.
+        dwell_time (int): dwell time in seconds at the intermediate stops.
+        dep_time (int): departure time at the first stop in seconds after midnight.
+
+    Returns:
+        list: row per stop of the trip.
+    """
+    rows = []
+    arr_time = dep_time
+    for stop_sequence, stop_index in enumerate(stop_indices):
+        if stop_sequence > 0:
+            arr_time = dep_time + running_times[stop_sequence - 1]
+            dep_time = arr_time + (dwell_time if stop_sequence < len(running_times) else 0)
+        rows += ["{},{},{},S{},{}".format(trip_id, format_time(arr_time), format_time(dep_time), stop_index,
+                                          stop_sequence + 1)]
+    return rows
+
+
+def format_time(seconds):
+    """Returns the HH:MM:SS-string of a time in seconds after midnight (hours can exceed 24)."""
+    return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def create_zip_info(file_name):
+    """Returns the ZipInfo of a file of the gtfs-file (compressed, with a fixed modification time)."""
+    zip_info = ZipInfo(file_name, date_time=ZIP_DATE_TIME)
+    zip_info.compress_type = ZIP_DEFLATED
+    zip_info.external_attr = 0o644 << 16
+    return zip_info
+
+
+def write_gtfs_file(zip_file, file_name, rows):
+    """Writes a file with the given rows (including the header) into the gtfs-file."""
+    zip_file.writestr(create_zip_info(file_name), "\n".join(rows) + "\n")
+
+
+def main(args=None):
+    """Writes a synthetic gtfs-file of a preset size (see SIZE_PRESETS), optionally with modified parameters."""
+    parser = argparse.ArgumentParser(description="Deterministic generator of synthetic gtfs-files.")
+    parser.add_argument("--output", required=True, help="path of the gtfs-file to write")
+    parser.add_argument("--preset", default="small", choices=list(SIZE_PRESETS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stops", type=int, default=None, help="number of stops (overrides the preset)")
+    parser.add_argument("--routes", type=int, default=None, help="number of routes (overrides the preset)")
+    parser.add_argument("--trips-per-hour", type=int, default=None, help="overrides the preset")
+    parser.add_argument("--service-days", type=int, default=28, help="number of days of the service period")
+    parser.add_argument("--transfer-density", type=float, default=0.1)
+    parser.add_argument("--calendar-exceptions", type=int, default=None, help="overrides the preset")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    params = dict(SIZE_PRESETS[args.preset])
+    for name, value in (("nb_stops", args.stops), ("nb_routes", args.routes), ("trips_per_hour", args.trips_per_hour),
+                        ("nb_calendar_exceptions", args.calendar_exceptions)):
+        if value is not None:
+            params[name] = value
+    generate_synthetic_gtfs(args.output, nb_service_days=args.service_days, transfer_density=args.transfer_density,
+                            seed=args.seed, **params)
+
+
+if __name__ == "__main__":
+    main()
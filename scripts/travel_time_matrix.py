@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This module provides the computation of travel time matrices with one-to-all connection scans."""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from scripts.connectionscan_router import ConnectionScanCore, RoutingBackend
+from scripts.helpers.my_logging import log_end, log_start
+
+log = logging.getLogger(__name__)
+
+_worker_cs_core = None  # ConnectionScanCore of a worker process (see _init_worker)
+
+
+def compute_travel_time_matrix(
+        connection_scan_data,
+        from_stop_ids,
+        to_stop_ids,
+        desired_dep_times,
+        nb_processes=None,
+        chunk_size=16,
+        path_to_memmap=None,
+        backend=RoutingBackend.PYTHON
+):
+    """Computes the travel time matrix between the source and target stops for every desired departure time.
+
+    For every desired departure time and source stop one one-to-all scan is executed
+    (see ConnectionScanCore.scan_earliest_arrival_all_targets).
+    The source stops are split into chunks of chunk_size source stops, the chunks are processed by a pool of
+    nb_processes processes and the results are written into the matrix as soon as a chunk is finished.
+
+    Args:
+        connection_scan_data (ConnectionScanData): timetable data.
+        from_stop_ids (list): id's of the source stops.
+        to_stop_ids (list): id's of the target stops.
+        desired_dep_times (list): desired departure times in seconds after midnight.
+        nb_processes (:obj:`int`, optional): number of worker processes. Default is None (i.e. os.cpu_count()).
+        If nb_processes is 1 the scans are executed in the calling process.
+        chunk_size (:obj:`int`, optional): number of source stops per task of the process pool. Default is 16.
+        path_to_memmap (:obj:`str`, optional): path to a .npy-file. If defined, the matrix is memory-mapped to this
+        file (and the file is overwritten) so that the matrix does not need to fit into memory. Default is None.
+        backend (:obj:`RoutingBackend`, optional): backend executing the scans. Default is RoutingBackend.PYTHON.
+
+    Returns:
+        ndarray: travel time in seconds (float32) per (desired departure time, source stop, target stop)
+        with shape (len(desired_dep_times), len(from_stop_ids), len(to_stop_ids)).
+        The travel time is inf if the target stop is not reachable.
+    """
+    nb_processes = os.cpu_count() if nb_processes is None else nb_processes
+    shape = (len(desired_dep_times), len(from_stop_ids), len(to_stop_ids))
+    log_start("computing travel time matrix of shape {} with {} processes".format(shape, nb_processes), log)
+    if path_to_memmap is None:
+        matrix = np.empty(shape, dtype=np.float32)
+    else:
+        matrix = np.lib.format.open_memmap(path_to_memmap, mode="w+", dtype=np.float32, shape=shape)
+
+    stop_id_registry = connection_scan_data.stop_id_registry
+    from_stop_indices = [stop_id_registry.get_index(stop_id) for stop_id in from_stop_ids]
+    to_stop_indices = np.array([stop_id_registry.get_index(stop_id) for stop_id in to_stop_ids], dtype=np.int64)
+    first_connection_indices = connection_scan_data.get_first_connection_indices(desired_dep_times)
+    tasks = [(dep_time_ind, from_ind, from_stop_indices[from_ind:from_ind + chunk_size])
+             for dep_time_ind in range(len(desired_dep_times))
+             for from_ind in range(0, len(from_stop_indices), chunk_size)]
+
+    if nb_processes == 1:
+        _init_worker(connection_scan_data, backend)
+        try:
+            for dep_time_ind, from_ind, chunk in tasks:
+                matrix[dep_time_ind, from_ind:from_ind + len(chunk)] = _compute_chunk(
+                    chunk, to_stop_indices, desired_dep_times[dep_time_ind], first_connection_indices[dep_time_ind])
+        finally:
+            _init_worker(None, None)
+    else:
+        with ProcessPoolExecutor(max_workers=nb_processes, initializer=_init_worker,
+                                 initargs=(connection_scan_data, backend)) as executor:
+            future_per_task = {executor.submit(_compute_chunk, chunk, to_stop_indices, desired_dep_times[dep_time_ind],
+                                               first_connection_indices[dep_time_ind]): (dep_time_ind, from_ind, chunk)
+                               for dep_time_ind, from_ind, chunk in tasks}
+            for future in as_completed(future_per_task):
+                dep_time_ind, from_ind, chunk = future_per_task.pop(future)
+                matrix[dep_time_ind, from_ind:from_ind + len(chunk)] = future.result()
+
+    if path_to_memmap is not None:
+        matrix.flush()
+    log_end(additional_message="# scans: {}".format(len(desired_dep_times) * len(from_stop_ids)))
+    return matrix
+
+
+def _init_worker(connection_scan_data, backend):
+    """Helper function creating the ConnectionScanCore of a worker process (once per process)."""
+    global _worker_cs_core
+    _worker_cs_core = ConnectionScanCore(connection_scan_data, backend) if connection_scan_data is not None else None
+
+
+def _compute_chunk(from_stop_indices, to_stop_indices, desired_dep_time, first_connection_index):
+    """Helper function computing the travel times from a chunk of source stops to the target stops."""
+    res = np.empty((len(from_stop_indices), len(to_stop_indices)), dtype=np.float32)
+    for ind, from_stop_index in enumerate(from_stop_indices):
+        arr_time_per_stop_index = _worker_cs_core.scan_earliest_arrival_all_targets(
+            from_stop_index, desired_dep_time, first_connection_index=first_connection_index)
+        arr_times = arr_time_per_stop_index[to_stop_indices]
+        res[ind] = np.where(arr_times < _worker_cs_core.MAX_ARR_TIME_VALUE, arr_times - desired_dep_time, np.inf)
+    return res
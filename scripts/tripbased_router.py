@@ -0,0 +1,576 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This module provides an implementation of Trip-Based public transit routing (https://arxiv.org/pdf/1504.07149.pdf)
+as alternative to the connection scan algorithm.
+
+The trip-to-trip transfers are computed once in a (parallel) preprocessing step and can be saved to disk.
+The earliest arrival queries are answered by a breadth-first search over trip segments.
+"""
+import logging
+import os
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from scripts.classes import Journey, JourneyLeg
+from scripts.connectionscan_router import ConnectionScanCore, get_query_message, get_time_message
+from scripts.helpers.my_logging import log_end, log_span, log_start
+
+log = logging.getLogger(__name__)
+
+_worker_tb_data = None  # TripBasedData of a worker process (see _init_worker)
+
+
+class TripBasedData:
+    """Container for the preprocessed data of the Trip-Based routing.
+
+    The trips of connection_scan_data are grouped into lines: trips with the same sequence of stops that do not
+    overtake each other. The stops of a trip are referred to by their position in the trip:
+    position 0 is the from stop of the first connection, position i > 0 is the to stop of the i-th connection.
+
+    A transfer (u, j) of position i of trip t means that a passenger arriving with trip t at position i can reach
+    position j of trip u (by a footpath from the stop at position i to the stop at position j). The transfers are
+    reduced as follows: U-turn transfers and transfers which do not improve any arrival or transfer time are removed.
+
+    If path_to_transfers is defined and the file exists, the transfers are loaded from this file.
+    Otherwise they are computed and (if path_to_transfers is defined) saved to this file.
+
+    Args and attributes:
+        connection_scan_data (ConnectionScanData): timetable data.
+        nb_processes (:obj:`int`, optional): number of processes computing the transfers. Default is 1
+        (i.e. the transfers are computed in the calling process). None means os.cpu_count().
+        path_to_transfers (:obj:`str`, optional): path to a .npz-file with the transfers. Default is None.
+
+    Additional attributes:
+        outgoing_footpaths_per_stop_index (list): list of (to_stop_index, walking_time, footpath)-tuples
+        of the outgoing footpaths per stop index (see ConnectionScanCore).
+        incoming_footpaths_per_stop_index (list): list of (from_stop_index, walking_time, footpath)-tuples
+        of the incoming footpaths per stop index (see ConnectionScanCore).
+        stop_indices_per_trip_index (list): list of the stop index per position per trip index.
+        dep_times_per_trip_index (list): list of the departure time per position per trip index
+        (the arrival time at the last position).
+        arr_times_per_trip_index (list): list of the arrival time per position per trip index
+        (the departure time at position 0).
+        connection_indices_per_trip_index (list): list of the indices of the connections (in sorted_connections)
+        per trip index. The connection with index i departs at position i.
+        line_index_per_trip_index (list): line index per trip index (None for trips without connections).
+        trip_indices_per_line_index (list): list of the trip indices of the line sorted by departure time
+        per line index.
+        position_in_line_per_trip_index (list): position of the trip in trip_indices_per_line_index.
+        dep_times_per_line_index (list): list of the sorted departure times of the trips of the line per position
+        per line index.
+        line_positions_per_stop_index (list): list of (line_index, position)-tuples where a trip of the line
+        can be boarded per stop index.
+        transfer_first_indices (ndarray): position in transfer_to_trip_indices of the first transfer
+        per trip position (offset of the trip in trip_position_offsets + position). The last entry is the number
+        of transfers.
+        transfer_to_trip_indices (ndarray): trip index u per transfer.
+        transfer_to_positions (ndarray): position j per transfer.
+        trip_position_offsets (ndarray): offset of the positions of the trip per trip index.
+    """
+
+    def __init__(self, connection_scan_data, nb_processes=1, path_to_transfers=None):
+        with log_span("creating TripBasedData", log) as span:
+            self.connection_scan_data = connection_scan_data
+            cs_core = ConnectionScanCore(connection_scan_data)
+            self.outgoing_footpaths_per_stop_index = cs_core.outgoing_footpaths_per_stop_index
+            self.incoming_footpaths_per_stop_index = cs_core.incoming_footpaths_per_stop_index
+            stop_id_registry = connection_scan_data.stop_id_registry
+            trip_id_registry = connection_scan_data.trip_id_registry
+
+            # trips as sequences of positions
+            connection_index_per_connection = {id(c): ind for ind, c in
+                                               enumerate(connection_scan_data.sorted_connections)}
+            self.stop_indices_per_trip_index = []
+            self.dep_times_per_trip_index = []
+            self.arr_times_per_trip_index = []
+            self.connection_indices_per_trip_index = []
+            for trip_id in trip_id_registry.ids:
+                connections = connection_scan_data.trips_per_id[trip_id].connections
+                self.stop_indices_per_trip_index += [
+                    [stop_id_registry.get_index(c.from_stop_id) for c in connections[:1]] +
+                    [stop_id_registry.get_index(c.to_stop_id) for c in connections]]
+                self.dep_times_per_trip_index += [
+                    [c.dep_time for c in connections] + [c.arr_time for c in connections[-1:]]]
+                self.arr_times_per_trip_index += [
+                    [c.dep_time for c in connections[:1]] + [c.arr_time for c in connections]]
+                self.connection_indices_per_trip_index += [
+                    [connection_index_per_connection[id(c)] for c in connections]]
+            self.trip_position_offsets = np.zeros(len(trip_id_registry) + 1, dtype=np.int64)
+            self.trip_position_offsets[1:] = np.cumsum([len(stops) for stops in self.stop_indices_per_trip_index])
+
+            # lines
+            self.line_index_per_trip_index = [None] * len(trip_id_registry)
+            self.trip_indices_per_line_index = []
+            trip_indices_per_stop_sequence = {}
+            for trip_index, stop_indices in enumerate(self.stop_indices_per_trip_index):
+                if stop_indices:
+                    trip_indices_per_stop_sequence.setdefault(tuple(stop_indices), []).append(trip_index)
+            for trip_indices in trip_indices_per_stop_sequence.values():
+                first_line_index = len(self.trip_indices_per_line_index)
+                for trip_index in sorted(trip_indices, key=lambda t: (self.dep_times_per_trip_index[t],
+                                                                      self.arr_times_per_trip_index[t])):
+                    line_index = next((line_ind for line_ind in range(first_line_index,
+                                                                      len(self.trip_indices_per_line_index))
+                                       if self.is_not_overtaking(self.trip_indices_per_line_index[line_ind][-1],
+                                                                 trip_index)), None)
+                    if line_index is None:
+                        line_index = len(self.trip_indices_per_line_index)
+                        self.trip_indices_per_line_index += [[]]
+                    self.trip_indices_per_line_index[line_index] += [trip_index]
+                    self.line_index_per_trip_index[trip_index] = line_index
+            self.position_in_line_per_trip_index = [None] * len(trip_id_registry)
+            self.dep_times_per_line_index = []
+            self.line_positions_per_stop_index = [[] for _ in range(len(stop_id_registry))]
+            for line_index, trip_indices in enumerate(self.trip_indices_per_line_index):
+                for position_in_line, trip_index in enumerate(trip_indices):
+                    self.position_in_line_per_trip_index[trip_index] = position_in_line
+                stop_indices = self.stop_indices_per_trip_index[trip_indices[0]]
+                self.dep_times_per_line_index += [[[self.dep_times_per_trip_index[t][position] for t in trip_indices]
+                                                   for position in range(len(stop_indices))]]
+                for position, stop_index in enumerate(stop_indices[:-1]):
+                    self.line_positions_per_stop_index[stop_index] += [(line_index, position)]
+
+            # transfers
+            if path_to_transfers is not None and os.path.exists(path_to_transfers):
+                self.load_transfers(path_to_transfers)
+            else:
+                self.compute_transfers(nb_processes)
+                if path_to_transfers is not None:
+                    self.save_transfers(path_to_transfers)
+            span.set_additional_message("# lines: {}, # transfers: {}", len(self.trip_indices_per_line_index),
+                                        len(self.transfer_to_trip_indices))
+
+    def is_not_overtaking(self, trip_index, next_trip_index):
+        """Checks if next_trip_index does not overtake trip_index (i.e. both trips can belong to the same line).
+
+        Args:
+            trip_index (int): index of the first trip.
+            next_trip_index (int): index of the second trip (with the same sequence of stops).
+
+        Returns:
+            bool: True if the second trip departs and arrives not earlier than the first trip at every position.
+        """
+        return all(dep_time <= next_dep_time and arr_time <= next_arr_time for
+                   dep_time, next_dep_time, arr_time, next_arr_time in zip(
+                       self.dep_times_per_trip_index[trip_index], self.dep_times_per_trip_index[next_trip_index],
+                       self.arr_times_per_trip_index[trip_index], self.arr_times_per_trip_index[next_trip_index]))
+
+    def get_earliest_trip(self, line_index, position, time):
+        """Returns the earliest trip of the line departing at the position not before the given time.
+
+        Args:
+            line_index (int): index of the line.
+            position (int): position in the trips of the line.
+            time (int): time in seconds after midnight.
+
+        Returns:
+            int: index of the trip (None if there is no such trip).
+        """
+        ind = bisect_left(self.dep_times_per_line_index[line_index][position], time)
+        trip_indices = self.trip_indices_per_line_index[line_index]
+        return trip_indices[ind] if ind < len(trip_indices) else None
+
+    def get_transfers(self, trip_index, position):
+        """Returns the transfers of a position of a trip.
+
+        Args:
+            trip_index (int): index of the trip.
+            position (int): position in the trip.
+
+        Returns:
+            zip: (to_trip_index, to_position)-tuples.
+        """
+        ind = self.trip_position_offsets[trip_index] + position
+        from_ind = self.transfer_first_indices[ind]
+        to_ind = self.transfer_first_indices[ind + 1]
+        return zip(self.transfer_to_trip_indices[from_ind:to_ind].tolist(),
+                   self.transfer_to_positions[from_ind:to_ind].tolist())
+
+    def compute_transfers(self, nb_processes=1):
+        """Computes the reduced transfers of all trips.
+
+        The trips are split into chunks which are processed by a pool of nb_processes processes.
+
+        Args:
+            nb_processes (:obj:`int`, optional): number of processes. Default is 1
+            (i.e. the transfers are computed in the calling process). None means os.cpu_count().
+        """
+        nb_processes = os.cpu_count() if nb_processes is None else nb_processes
+        log_start("computing transfers with {} processes".format(nb_processes), log)
+        nb_trips = len(self.stop_indices_per_trip_index)
+        chunk_size = max(1, -(-nb_trips // (4 * nb_processes)))
+        chunks = [range(from_ind, min(from_ind + chunk_size, nb_trips)) for from_ind in range(0, nb_trips, chunk_size)]
+        if nb_processes == 1:
+            transfers_per_chunk = [self.compute_transfers_of_trips(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=nb_processes, initializer=_init_worker, initargs=(self,)) as executor:
+                transfers_per_chunk = list(executor.map(_compute_transfers_of_trips, chunks))
+        transfers_per_trip_position = [transfers for transfers_per_trip in transfers_per_chunk
+                                       for transfers_per_position in transfers_per_trip
+                                       for transfers in transfers_per_position]
+        self.set_transfers(transfers_per_trip_position)
+        log_end(additional_message="# transfers: {}".format(len(self.transfer_to_trip_indices)))
+
+    def set_transfers(self, transfers_per_trip_position):
+        """Stores the transfers in compressed sparse row format.
+
+        Args:
+            transfers_per_trip_position (list): list of (to_trip_index, to_position)-tuples per trip position
+            (in the order of trip_position_offsets).
+        """
+        self.transfer_first_indices = np.zeros(len(transfers_per_trip_position) + 1, dtype=np.int64)
+        self.transfer_first_indices[1:] = np.cumsum([len(transfers) for transfers in transfers_per_trip_position])
+        self.transfer_to_trip_indices = np.array([u for transfers in transfers_per_trip_position for u, _ in transfers],
+                                                 dtype=np.int32)
+        self.transfer_to_positions = np.array([j for transfers in transfers_per_trip_position for _, j in transfers],
+                                              dtype=np.int32)
+
+    def compute_transfers_of_trips(self, trip_indices):
+        """Computes the reduced transfers of some trips.
+
+        Args:
+            trip_indices (iterable): indices of the trips.
+
+        Returns:
+            list: list of the transfers (list of (to_trip_index, to_position)-tuples) per position per trip.
+        """
+        return [self.reduce_transfers(trip_index, self.compute_candidate_transfers(trip_index))
+                for trip_index in trip_indices]
+
+    def compute_candidate_transfers(self, trip_index):
+        """Computes the transfers of a trip without U-turn transfers (step 1 and 2 of the preprocessing).
+
+        For every position, footpath and line serving the to stop of the footpath, only the earliest reachable trip
+        of the line is a candidate. Transfers to the same line are only candidates if they go to an earlier trip
+        or an earlier position.
+
+        Args:
+            trip_index (int): index of the trip.
+
+        Returns:
+            list: list of (to_trip_index, to_position)-tuples per position of the trip.
+        """
+        stop_indices = self.stop_indices_per_trip_index[trip_index]
+        arr_times = self.arr_times_per_trip_index[trip_index]
+        line_index = self.line_index_per_trip_index[trip_index]
+        res = [[] for _ in stop_indices]
+        for position in range(1, len(stop_indices)):
+            for walk_to_stop_index, walking_time, _ in self.outgoing_footpaths_per_stop_index[stop_indices[position]]:
+                for to_line_index, to_position in self.line_positions_per_stop_index[walk_to_stop_index]:
+                    to_trip_index = self.get_earliest_trip(to_line_index, to_position,
+                                                           arr_times[position] + walking_time)
+                    if to_trip_index is None:
+                        continue
+                    if to_line_index == line_index and not (
+                            self.position_in_line_per_trip_index[to_trip_index] <
+                            self.position_in_line_per_trip_index[trip_index] or to_position < position):
+                        continue
+                    if self.is_u_turn(trip_index, position, to_trip_index, to_position):
+                        continue
+                    res[position] += [(to_trip_index, to_position)]
+        return res
+
+    def is_u_turn(self, trip_index, position, to_trip_index, to_position):
+        """Checks if the transfer is a U-turn transfer, i.e. the passenger could have transferred at the previous stop.
+
+        Args:
+            trip_index (int): index of the trip.
+            position (int): position in the trip.
+            to_trip_index (int): index of the trip after the transfer.
+            to_position (int): position in the trip after the transfer.
+
+        Returns:
+            bool: True if the transfer is a U-turn transfer, else False.
+        """
+        stop_indices = self.stop_indices_per_trip_index[trip_index]
+        to_stop_indices = self.stop_indices_per_trip_index[to_trip_index]
+        if to_position + 1 >= len(to_stop_indices) or stop_indices[position - 1] != to_stop_indices[to_position + 1]:
+            return False
+        stop_index = stop_indices[position - 1]
+        change_time = next((walking_time for walk_to_stop_index, walking_time, _ in
+                            self.outgoing_footpaths_per_stop_index[stop_index] if walk_to_stop_index == stop_index),
+                           None)
+        return change_time is not None and self.arr_times_per_trip_index[trip_index][position - 1] + change_time <= \
+            self.dep_times_per_trip_index[to_trip_index][to_position + 1]
+
+    def reduce_transfers(self, trip_index, candidate_transfers):
+        """Removes the transfers which do not improve the arrival or transfer time at any stop
+        (step 3 of the preprocessing).
+
+        The positions of the trip are processed from the last to the first position, so that staying in the trip
+        is preferred to transferring.
+
+        Args:
+            trip_index (int): index of the trip.
+            candidate_transfers (list): list of (to_trip_index, to_position)-tuples per position of the trip.
+
+        Returns:
+            list: list of the kept (to_trip_index, to_position)-tuples per position of the trip.
+        """
+        earliest_arrival_per_stop_index = {}  # without transfer time
+        earliest_change_per_stop_index = {}  # including transfer/walking time
+
+        def update(stop_index, arr_time):
+            """Helper function updating the earliest arrival and change times after an arrival at a stop."""
+            improved = False
+            if arr_time < earliest_arrival_per_stop_index.get(stop_index, arr_time + 1):
+                earliest_arrival_per_stop_index[stop_index] = arr_time
+                improved = True
+            for walk_to_stop_index, walking_time, _ in self.outgoing_footpaths_per_stop_index[stop_index]:
+                arr_time_walk = arr_time + walking_time
+                if arr_time_walk < earliest_change_per_stop_index.get(walk_to_stop_index, arr_time_walk + 1):
+                    earliest_change_per_stop_index[walk_to_stop_index] = arr_time_walk
+                    improved = True
+                if walk_to_stop_index != stop_index and arr_time_walk < earliest_arrival_per_stop_index.get(
+                        walk_to_stop_index, arr_time_walk + 1):
+                    earliest_arrival_per_stop_index[walk_to_stop_index] = arr_time_walk
+                    improved = True
+            return improved
+
+        stop_indices = self.stop_indices_per_trip_index[trip_index]
+        arr_times = self.arr_times_per_trip_index[trip_index]
+        res = [[] for _ in stop_indices]
+        for position in range(len(stop_indices) - 1, 0, -1):
+            update(stop_indices[position], arr_times[position])
+            for to_trip_index, to_position in sorted(candidate_transfers[position],
+                                                     key=lambda transfer: self.arr_times_per_trip_index[
+                                                         transfer[0]][transfer[1]]):
+                to_stop_indices = self.stop_indices_per_trip_index[to_trip_index]
+                to_arr_times = self.arr_times_per_trip_index[to_trip_index]
+                is_kept = False
+                for to_stop_position in range(to_position + 1, len(to_stop_indices)):
+                    if update(to_stop_indices[to_stop_position], to_arr_times[to_stop_position]):
+                        is_kept = True
+                if is_kept:
+                    res[position] += [(to_trip_index, to_position)]
+        return res
+
+    def get_fingerprint(self):
+        """Returns numbers identifying the timetable (used to check if saved transfers belong to the timetable).
+
+        Returns:
+            ndarray: # stops, # trips, # trip positions, # connections, # footpaths and the sum of the departure times.
+        """
+        cs_data = self.connection_scan_data
+        return np.array([len(cs_data.stop_id_registry), len(cs_data.trip_id_registry), self.trip_position_offsets[-1],
+                         len(cs_data.sorted_connections), len(cs_data.footpaths_per_from_to_stop_id),
+                         int(cs_data.dep_times.sum(dtype=np.int64))], dtype=np.int64)
+
+    def save_transfers(self, path_to_transfers):
+        """Saves the transfers to a .npz-file.
+
+        Args:
+            path_to_transfers (str): path to the file.
+        """
+        log_start("saving transfers to {}".format(path_to_transfers), log)
+        with open(path_to_transfers, "wb") as f:
+            np.savez(f, fingerprint=self.get_fingerprint(), transfer_first_indices=self.transfer_first_indices,
+                     transfer_to_trip_indices=self.transfer_to_trip_indices,
+                     transfer_to_positions=self.transfer_to_positions)
+        log_end()
+
+    def load_transfers(self, path_to_transfers):
+        """Loads the transfers from a .npz-file created by save_transfers.
+
+        Args:
+            path_to_transfers (str): path to the file.
+        """
+        with log_span("loading transfers from {}".format(path_to_transfers), log):
+            with np.load(path_to_transfers) as transfers:
+                if not np.array_equal(transfers["fingerprint"], self.get_fingerprint()):
+                    raise ValueError("the transfers in {} do not belong to this timetable".format(path_to_transfers))
+                self.transfer_first_indices = transfers["transfer_first_indices"]
+                self.transfer_to_trip_indices = transfers["transfer_to_trip_indices"]
+                self.transfer_to_positions = transfers["transfer_to_positions"]
+
+
+class TripBasedCore:
+    """Container for the Trip-Based routing instance.
+
+    Args and attributes:
+        trip_based_data (TripBasedData): preprocessed data belong to this routing instance.
+    """
+
+    def __init__(self, trip_based_data):
+        self.trip_based_data = trip_based_data
+
+    def route_earliest_arrival(self, from_stop_id, to_stop_id, desired_dep_time):
+        """Executes the earliest arrival query of the Trip-Based routing
+        from the source to the target stop respecting the desired departure time.
+
+        Args:
+            from_stop_id (str): id of the source stop.
+            to_stop_id (str): id of the target stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+
+        Returns:
+            int: earliest possible arrival time at the target stop (None if the target stop is not reachable).
+        """
+        cs_data = self.trip_based_data.connection_scan_data
+        log_start(get_query_message, log, "trip-based earliest arrival routing", cs_data.stops_per_id[from_stop_id],
+                  cs_data.stops_per_id[to_stop_id], desired_dep_time)
+        arr_time_target, _, _ = self.search_earliest_arrival(cs_data.stop_id_registry.get_index(from_stop_id),
+                                                             cs_data.stop_id_registry.get_index(to_stop_id),
+                                                             desired_dep_time)
+        log_end(get_time_message, "earliest arrival time", arr_time_target)
+        return arr_time_target
+
+    def route_earliest_arrival_with_reconstruction(self, from_stop_id, to_stop_id, desired_dep_time):
+        """Executes the earliest arrival query with journey reconstruction of the Trip-Based routing
+        from the source to the target stop respecting the desired departure time.
+
+        Args:
+            from_stop_id (str): id of the source stop.
+            to_stop_id (str): id of the target stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+
+        Returns:
+            Journey: a Journey with earliest possible arrival time from the source to the target stop
+            (without journey legs if the target stop is not reachable).
+        """
+        cs_data = self.trip_based_data.connection_scan_data
+        log_start(get_query_message, log, "trip-based earliest arrival routing with journey reconstruction",
+                  cs_data.stops_per_id[from_stop_id], cs_data.stops_per_id[to_stop_id], desired_dep_time)
+        from_stop_index = cs_data.stop_id_registry.get_index(from_stop_id)
+        to_stop_index = cs_data.stop_id_registry.get_index(to_stop_id)
+        _, target, segments = self.search_earliest_arrival(from_stop_index, to_stop_index, desired_dep_time)
+        res = self.reconstruct_journey(target, segments)
+        log_end("# journey legs: {}", res.get_nb_journey_legs())
+        return res
+
+    def search_earliest_arrival(self, from_stop_index, to_stop_index, desired_dep_time):
+        """Breadth-first search over trip segments for the earliest arrival from the source to the target stop.
+
+        A trip segment is a (trip_index, from_position, to_position, parent, first_footpath)-tuple:
+        the passenger boards the trip at from_position and can alight at the positions from_position + 1, ...,
+        to_position. The passenger reached the trip by a transfer from the position of the previous segment given as
+        (segment_index, position)-tuple in parent (None for the first trip) or by first_footpath from the source stop
+        (None if the first trip is boarded at the source stop).
+        The segments of round n are reached with n transfers.
+
+        Args:
+            from_stop_index (int): index of the source stop.
+            to_stop_index (int): index of the target stop.
+            desired_dep_time (int): desired departure time in seconds after midnight.
+
+        Returns:
+            tuple: earliest arrival time at the target stop (None if the target stop is not reachable),
+            the target as (segment_index, position, footpath)-tuple (segment_index and position are None for a journey
+            consisting of a footpath only, None if the source stop equals the target stop or the target stop is not
+            reachable) and the list of the trip segments.
+        """
+        tb_data = self.trip_based_data
+        if from_stop_index == to_stop_index:
+            return desired_dep_time, None, []
+        walking_time_to_target_per_stop_index = {to_stop_index: (0, None)}
+        for from_ind, walking_time, footpath in tb_data.incoming_footpaths_per_stop_index[to_stop_index]:
+            if from_ind != to_stop_index:
+                walking_time_to_target_per_stop_index[from_ind] = (walking_time, footpath)
+        earliest_arrival_target = None
+        target = None
+        if from_stop_index in walking_time_to_target_per_stop_index:
+            walking_time, footpath = walking_time_to_target_per_stop_index[from_stop_index]
+            earliest_arrival_target = desired_dep_time + walking_time
+            target = (None, None, footpath)
+
+        reached_position_per_trip_index = [len(stop_indices) - 1
+                                           for stop_indices in tb_data.stop_indices_per_trip_index]
+        segments = []
+        queue = []
+
+        def enqueue(trip_index, position, parent_segment_index, first_footpath, next_queue):
+            """Helper function adding the trip segment if the position was not reached before."""
+            if position < reached_position_per_trip_index[trip_index]:
+                next_queue += [len(segments)]
+                segments.append((trip_index, position, reached_position_per_trip_index[trip_index],
+                                 parent_segment_index, first_footpath))
+                trip_indices = tb_data.trip_indices_per_line_index[tb_data.line_index_per_trip_index[trip_index]]
+                for later_trip_index in trip_indices[tb_data.position_in_line_per_trip_index[trip_index]:]:
+                    if position < reached_position_per_trip_index[later_trip_index]:
+                        reached_position_per_trip_index[later_trip_index] = position
+
+        for walk_to_stop_index, walking_time, footpath in tb_data.outgoing_footpaths_per_stop_index[from_stop_index]:
+            if walk_to_stop_index == from_stop_index:
+                continue
+            for line_index, position in tb_data.line_positions_per_stop_index[walk_to_stop_index]:
+                trip_index = tb_data.get_earliest_trip(line_index, position, desired_dep_time + walking_time)
+                if trip_index is not None:
+                    enqueue(trip_index, position, None, footpath, queue)
+        for line_index, position in tb_data.line_positions_per_stop_index[from_stop_index]:
+            trip_index = tb_data.get_earliest_trip(line_index, position, desired_dep_time)
+            if trip_index is not None:
+                enqueue(trip_index, position, None, None, queue)
+
+        while queue:
+            # arrivals at the target stop
+            for segment_index in queue:
+                trip_index, from_position, to_position, _, _ = segments[segment_index]
+                stop_indices = tb_data.stop_indices_per_trip_index[trip_index]
+                arr_times = tb_data.arr_times_per_trip_index[trip_index]
+                for position in range(from_position + 1, to_position + 1):
+                    if stop_indices[position] in walking_time_to_target_per_stop_index:
+                        walking_time, footpath = walking_time_to_target_per_stop_index[stop_indices[position]]
+                        arr_time = arr_times[position] + walking_time
+                        if earliest_arrival_target is None or arr_time < earliest_arrival_target:
+                            earliest_arrival_target = arr_time
+                            target = (segment_index, position, footpath)
+            # transfers
+            next_queue = []
+            for segment_index in queue:
+                trip_index, from_position, to_position, _, _ = segments[segment_index]
+                arr_times = tb_data.arr_times_per_trip_index[trip_index]
+                for position in range(from_position + 1, to_position + 1):
+                    if earliest_arrival_target is not None and arr_times[position] >= earliest_arrival_target:
+                        break  # pruning: every journey from here on arrives later
+                    for to_trip_index, to_position in tb_data.get_transfers(trip_index, position):
+                        enqueue(to_trip_index, to_position, (segment_index, position), None, next_queue)
+            queue = next_queue
+        return earliest_arrival_target, target, segments
+
+    def reconstruct_journey(self, target, segments):
+        """Reconstructs the journey from the trip segments collected in search_earliest_arrival.
+
+        Args:
+            target (tuple): the target as (segment_index, position, footpath)-tuple.
+            segments (list): the trip segments.
+
+        Returns:
+            Journey: the reconstructed journey (without journey legs if the target stop is not reachable).
+        """
+        tb_data = self.trip_based_data
+        cs_data = tb_data.connection_scan_data
+        journey = Journey()
+        if target is None:
+            return journey
+        segment_index, position, footpath = target
+        if segment_index is None:
+            journey.prepend_journey_leg(JourneyLeg(None, None, footpath))
+            return journey
+        while True:
+            trip_index, from_position, _, parent, first_footpath = segments[segment_index]
+            connection_indices = tb_data.connection_indices_per_trip_index[trip_index]
+            journey.prepend_journey_leg(JourneyLeg(cs_data.sorted_connections[connection_indices[from_position]],
+                                                   cs_data.sorted_connections[connection_indices[position - 1]],
+                                                   footpath))
+            if parent is None:
+                if first_footpath is not None:
+                    journey.prepend_journey_leg(JourneyLeg(None, None, first_footpath))
+                return journey
+            board_stop_index = tb_data.stop_indices_per_trip_index[trip_index][from_position]
+            segment_index, position = parent
+            alight_stop_index = tb_data.stop_indices_per_trip_index[segments[segment_index][0]][position]
+            footpath = cs_data.footpaths_per_from_to_stop_id[(cs_data.stop_id_registry.get_id(alight_stop_index),
+                                                              cs_data.stop_id_registry.get_id(board_stop_index))]
+
+
+def _init_worker(trip_based_data):
+    """Helper function setting the TripBasedData of a worker process (once per process)."""
+    global _worker_tb_data
+    _worker_tb_data = trip_based_data
+
+
+def _compute_transfers_of_trips(trip_indices):
+    """Helper function computing the transfers of a chunk of trips in a worker process."""
+    return _worker_tb_data.compute_transfers_of_trips(trip_indices)
@@ -3,8 +3,11 @@
 import math
 from datetime import date
 
+import numpy as np
+
 from scripts.helpers.funs import parse_yymmdd, hhmmss_to_sec, seconds_to_hhmmssms, seconds_to_hhmmss, binary_search, \
-    distance, wgs84_to_spherical_mercator
+    distance, wgs84_to_spherical_mercator, hhmmss_array_to_sec, cached_hhmmss_to_sec, haversine_distance, \
+    wgs84_to_spherical_mercator_array
 
 
 def test_parse_yymmdd():
@@ -17,6 +20,30 @@ def test_hhmmss_to_sec():
     assert 6 * 60 * 60 + 23 * 60 + 5 == hhmmss_to_sec("06:23:05")
 
 
+def test_hhmmss_array_to_sec():
+    assert [hhmmss_to_sec("06:23:05"), -1, hhmmss_to_sec("25:00:01"), hhmmss_to_sec("06:23:05")] == \
+           hhmmss_array_to_sec(np.array(["06:23:05", "", "25:00:01", "06:23:05"])).tolist()
+    assert [] == hhmmss_array_to_sec(np.array([], dtype=str)).tolist()
+    assert [-1, -1] == hhmmss_array_to_sec(np.array(["", ""])).tolist()
+
+    # irregular strings are parsed by hhmmss_to_sec
+    hhmmss_list = ["6:23:05", "123:00:01", " 8:00:00", "07:5:00", "", "24:00:00", "08:00:00"]
+    exp_seconds = [hhmmss_to_sec(hhmmss) if hhmmss else -1 for hhmmss in hhmmss_list]
+    assert exp_seconds == hhmmss_array_to_sec(np.array(hhmmss_list)).tolist()
+    assert exp_seconds == hhmmss_array_to_sec(np.array(hhmmss_list, dtype=np.bytes_)).tolist()
+    assert exp_seconds == hhmmss_array_to_sec(hhmmss_list).tolist()
+
+    all_hhmmss = ["{:02d}:{:02d}:{:02d}".format(h, m, s) for h in range(30) for m in range(60) for s in range(0, 60, 7)]
+    assert [hhmmss_to_sec(hhmmss) for hhmmss in all_hhmmss] == hhmmss_array_to_sec(np.array(all_hhmmss)).tolist()
+
+
+def test_cached_hhmmss_to_sec():
+    cached_hhmmss_to_sec.cache_clear()
+    assert hhmmss_to_sec("25:10:59") == cached_hhmmss_to_sec("25:10:59")
+    assert hhmmss_to_sec("25:10:59") == cached_hhmmss_to_sec("25:10:59")
+    assert 1 == cached_hhmmss_to_sec.cache_info().hits
+
+
 def test_seconds_to_hhmmssms():
     assert "00:00:00.013" == seconds_to_hhmmssms(0.012879)
     assert "00:00:02.012" == seconds_to_hhmmssms(2.012379)
@@ -77,6 +104,28 @@ def test_wgs84_to_spherical_mercator_bern_bern_bahnhof():
     wgs84_to_spherical_mercator_test(bern, bern_bahnhof, 120.0)
 
 
+def test_wgs84_to_spherical_mercator_array():
+    lons = np.array([7.58955142623287, 7.43911954873327])
+    lats = np.array([47.5483160574667, 46.9490702586521])
+    x_y_coordinates = wgs84_to_spherical_mercator_array(lons, lats)
+    assert (2, 2) == x_y_coordinates.shape
+    for (lon, lat), x_y in zip(zip(lons, lats), x_y_coordinates):
+        assert np.allclose(wgs84_to_spherical_mercator(lon, lat), x_y)
+
+
+def test_haversine_distance():
+    # one degree of latitude on the equator and a quarter of the equator
+    assert math.isclose(6371000.0 * math.pi / 180, haversine_distance(0.0, 0.0, 0.0, 1.0))
+    assert math.isclose(6371000.0 * math.pi / 2, haversine_distance(0.0, 0.0, 90.0, 0.0))
+    assert 0.0 == haversine_distance(7.4, 46.9, 7.4, 46.9)
+    distances = haversine_distance(np.array([7.43911954873327, 7.58955142623287]),
+                                   np.array([46.9490702586521, 47.5483160574667]),
+                                   np.array([7.44034125751985, 8.54017680461]),
+                                   np.array([46.9484631542439, 47.3781762754361]))
+    assert 100.0 < distances[0] < 120.0  # bern - bern bahnhof
+    assert 70000.0 < distances[1] < 75000.0  # basel sbb - zuerich hb
+
+
 def wgs84_to_spherical_mercator_test(lon_lat_1, lon_lat_2, exp_distance, tolerance_factor=2):
     coord_1 = wgs84_to_spherical_mercator(lon_lat_1[0], lon_lat_1[1])
     coord_2 = wgs84_to_spherical_mercator(lon_lat_2[0], lon_lat_2[1])
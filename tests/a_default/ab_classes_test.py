@@ -3,7 +3,7 @@
 
 import pytest
 
-from scripts.classes import Connection, Footpath, Stop, Trip, JourneyLeg, Journey, TripType
+from scripts.classes import Connection, Footpath, IdRegistry, Stop, Trip, JourneyLeg, Journey, TripType
 
 
 def test_stop_constructor():
@@ -15,6 +15,21 @@ def test_stop_constructor():
     assert 56.6 == a_stop.northing
 
 
+def test_id_registry():
+    registry = IdRegistry(["s1", "s2", "s3"])
+    assert 3 == len(registry)
+    assert 0 == registry.get_index("s1")
+    assert 2 == registry.get_index("s3")
+    assert "s2" == registry.get_id(1)
+    assert "s3" in registry
+    assert "s4" not in registry
+
+
+def test_id_registry_not_unique():
+    with pytest.raises(ValueError):
+        IdRegistry(["s1", "s2", "s1"])
+
+
 def test_footpath_constructor():
     a_footpath = Footpath("1", "2", 60)
     assert "1" == a_footpath.from_stop_id
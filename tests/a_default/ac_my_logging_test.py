@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import threading
+from contextvars import Context
+
+import pytest
+
+from scripts.helpers.my_logging import get_log_depth, log_elapsed, log_end, log_span, log_start
+
+log = logging.getLogger("tests.my_logging")
+
+
+class CountingArgument:
+    def __init__(self):
+        self.nb_formats = 0
+
+    def __format__(self, format_spec):
+        self.nb_formats += 1
+        return "argument"
+
+
+def test_log_start_and_log_end(caplog):
+    def scenario():
+        with caplog.at_level(logging.INFO, logger=log.name):
+            log_start("outer {} {}", log, 1, "a")
+            log_start(lambda x: "inner {}".format(x), log, 2)
+            assert 2 == get_log_depth()
+            log_elapsed("step", 1.5, log)
+            log_end("result {}", 42)
+            log_end()
+        assert 0 == get_log_depth()
+        with pytest.raises(ValueError):
+            log_end()
+
+    Context().run(scenario)
+    messages = [record.getMessage() for record in caplog.records]
+    assert "(1) start outer 1 a." == messages[0]
+    assert "(2) start inner 2." == messages[1]
+    assert "(3) step. time elapsed: 00:00:01.500." == messages[2]
+    assert messages[3].startswith("(2) end inner 2. time elapsed: ")
+    assert messages[3].endswith(". result 42. ")
+    assert messages[4].startswith("(1) end outer 1 a. time elapsed: ")
+
+
+def test_filtered_messages_are_not_built(caplog):
+    def message(argument):
+        raise AssertionError("the message of a filtered process step must not be built")
+
+    def scenario():
+        argument = CountingArgument()
+        with caplog.at_level(logging.WARNING, logger=log.name):
+            log_start(message, log, argument)
+            log_start("{}", log, argument)
+            log_elapsed(message, 1.0, log, argument)
+            log_end(message, argument)
+            log_end("{}", argument)
+        assert 0 == argument.nb_formats
+        assert 0 == get_log_depth()
+
+    Context().run(scenario)
+    assert [] == caplog.records
+
+
+def test_log_span_ends_on_exception(caplog):
+    def scenario():
+        with caplog.at_level(logging.INFO, logger=log.name):
+            with pytest.raises(KeyError):
+                with log_span("failing step", log):
+                    assert 1 == get_log_depth()
+                    raise KeyError("x")
+        assert 0 == get_log_depth()
+
+    Context().run(scenario)
+    assert caplog.records[-1].getMessage().startswith("(1) end failing step. time elapsed: ")
+
+
+def test_log_span_additional_message(caplog):
+    def scenario():
+        with caplog.at_level(logging.INFO, logger=log.name):
+            with log_span("outer {}", log, 1):
+                with pytest.raises(ValueError):
+                    with log_span("inner", log) as span:
+                        span.set_additional_message("never logged")
+                        raise ValueError("x")
+                assert 1 == get_log_depth()
+                with log_span("step", log) as span:
+                    span.set_additional_message("result {}", 42)
+        assert 0 == get_log_depth()
+
+    Context().run(scenario)
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages[2].startswith("(2) end inner. time elapsed: ")
+    assert messages[2].endswith(". never logged. ")
+    assert messages[4].endswith(". result 42. ")
+    assert messages[5].startswith("(1) end outer 1. time elapsed: ")
+
+
+def test_log_stacks_are_context_local():
+    depths = []
+
+    async def query(name):
+        log_start(name, log)
+        for _ in range(3):
+            await asyncio.sleep(0)
+            depths.append((name, get_log_depth()))
+        log_end()
+
+    async def scenario():
+        log_start("server", log)
+        await asyncio.gather(*[query("query {}".format(i)) for i in range(4)])
+        log_end()
+
+    Context().run(asyncio.run, scenario())
+    assert 12 == len(depths)
+    assert all(2 == depth for _, depth in depths)
+
+    def thread_target():
+        log_start("thread", log)
+        depths.append(("thread", get_log_depth()))
+        log_end()
+
+    log_start("main thread", log)
+    depth = get_log_depth()
+    threads = [threading.Thread(target=thread_target) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log_end()
+    assert all(1 == depth for _, depth in depths[12:])
+    assert depth - 1 == get_log_depth()
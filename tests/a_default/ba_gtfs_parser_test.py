@@ -2,17 +2,23 @@
 # -*- coding: utf-8 -*-
 
 from datetime import date
+from io import BytesIO, StringIO
 from zipfile import ZipFile
 
+import numpy as np
 import pytest
 
 from scripts.classes import Stop, Footpath, TripType
-from scripts.gtfs_parser import (get_service_available_at_date_per_service_id,
+from scripts.gtfs_parser import (BeelineMetric,
+                                 get_service_available_at_date_per_service_id,
                                  get_trip_available_at_date_per_trip_id,
                                  parse_gtfs,
-                                 create_beeline_footpaths)
-from scripts.connectionscan_router import make_transitive
-from scripts.helpers.funs import hhmmss_to_sec
+                                 create_beeline_footpaths,
+                                 get_stop_pairs_within_beeline_distance,
+                                 read_stop_times_chunks,
+                                 read_stop_times_in_chunks)
+from scripts.connectionscan_router import check_for_transitivity, get_footpath_closure, make_transitive
+from scripts.helpers.funs import distance, haversine_distance, hhmmss_to_sec, wgs84_to_spherical_mercator
 
 PATH_GTFS_TEST_SAMPLE = "tests/resources/gtfsfp20192018-12-05_small.zip"
 
@@ -95,6 +101,81 @@ def test_gtfs_parser():
         cs_data.trips_per_id["471.TA.26-759-j19-1.5.R"]
 
 
+def test_gtfs_parser_stop_times_in_chunks():
+    cs_data = parse_gtfs(PATH_GTFS_TEST_SAMPLE, date(2019, 1, 18), beeline_distance=200)
+    for chunk_size in [7, 1000, 100000]:
+        cs_data_chunks = parse_gtfs(PATH_GTFS_TEST_SAMPLE, date(2019, 1, 18), beeline_distance=200,
+                                    stop_times_chunk_size=chunk_size)
+        assert list(cs_data.trips_per_id.keys()) == list(cs_data_chunks.trips_per_id.keys())
+        for trip_id, trip in cs_data.trips_per_id.items():
+            trip_chunks = cs_data_chunks.trips_per_id[trip_id]
+            assert trip.trip_type == trip_chunks.trip_type
+            assert [str(c) for c in trip.connections] == [str(c) for c in trip_chunks.connections]
+        assert np.array_equal(cs_data.dep_times, cs_data_chunks.dep_times)
+        assert np.array_equal(cs_data.arr_times, cs_data_chunks.arr_times)
+
+
+def test_read_stop_times_in_chunks():
+    stop_times = "\n".join([
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence",
+        "t1,,08:00:00,s1,1",
+        "t1,08:10:00,08:11:00,s2,2",
+        "t1,08:20:00,,s3,3",
+        "t2,09:00:00,09:00:00,s1,1",  # not available
+        "t2,09:10:00,09:10:00,s2,2",
+        "t3,25:00:00,25:01:00,s3,1",
+        "t3,25:10:00,,s1,2",
+        "t4,10:00:00,10:00:00,s1,1",
+        "t4,,,s2,2",  # missing times
+        "t4,10:20:00,10:20:00,s3,3",
+        "t5,11:00:00,11:00:00,s2,1",  # only one row
+    ]) + "\n"
+    stop_index_per_id = {"s1": 0, "s2": 1, "s3": 2}
+    trip_index_per_id = {"t1": 0, "t3": 1, "t4": 2, "t5": 3}
+    for chunk_size, nb_processes in [(1, 1), (2, 1), (3, 1), (100, 1), (1, 2)]:
+        trip_indices, from_stop_indices, to_stop_indices, dep_times, arr_times, read_trip_indices = \
+            read_stop_times_in_chunks(BytesIO(stop_times.encode("utf-8")), stop_index_per_id, trip_index_per_id,
+                                      chunk_size, nb_processes)
+        assert [0, 0, 1] == trip_indices.tolist()
+        assert [0, 1, 2] == from_stop_indices.tolist()
+        assert [1, 2, 0] == to_stop_indices.tolist()
+        assert [hhmmss_to_sec(t) for t in ["08:00:00", "08:11:00", "25:01:00"]] == dep_times.tolist()
+        assert [hhmmss_to_sec(t) for t in ["08:10:00", "08:20:00", "25:10:00"]] == arr_times.tolist()
+        assert [0, 1, 3] == read_trip_indices.tolist()
+
+    with pytest.raises(ValueError):
+        read_stop_times_in_chunks(BytesIO(stop_times.encode("utf-8")), {"s1": 0, "s2": 1}, trip_index_per_id, 3)
+
+
+def test_read_stop_times_chunks():
+    text = "t1,a\nt1,b\nt1,c\nt2,a\nt3,a\nt3,b\nt9,a\n"
+    trip_index_per_id = {"t1": 0, "t2": 1, "t3": 2}
+
+    def read(chunk_size):
+        chunks = read_stop_times_chunks(StringIO(text), [0, 1, None, None], trip_index_per_id, chunk_size)
+        return [(trip_indices.tolist(), stop_ids.tolist(), arrival_times, departure_times)
+                for trip_indices, stop_ids, arrival_times, departure_times in chunks]
+    assert [([0, 0, 0], ["a", "b", "c"], None, None), ([1], ["a"], None, None), ([2, 2], ["a", "b"], None, None)] == \
+        read(1)
+    assert [([0, 0, 0, 1], ["a", "b", "c", "a"], None, None), ([2, 2], ["a", "b"], None, None)] == read(3)
+    assert read(3) == read(10)  # the rows of the last trip are held back until the next chunk is read
+    assert [] == list(read_stop_times_chunks(StringIO(""), [0, 1, None, None], trip_index_per_id, 10))
+
+
+def test_gtfs_parser_in_parallel():
+    cs_data = parse_gtfs(PATH_GTFS_TEST_SAMPLE, date(2019, 1, 18), beeline_distance=200)
+    cs_data_parallel = parse_gtfs(PATH_GTFS_TEST_SAMPLE, date(2019, 1, 18), beeline_distance=200,
+                                  stop_times_chunk_size=50, nb_processes=2)
+    assert str(cs_data) == str(cs_data_parallel)
+    assert list(cs_data.stops_per_id.keys()) == list(cs_data_parallel.stops_per_id.keys())
+    assert {key: f.walking_time for key, f in cs_data.footpaths_per_from_to_stop_id.items()} == \
+           {key: f.walking_time for key, f in cs_data_parallel.footpaths_per_from_to_stop_id.items()}
+    assert list(cs_data.trips_per_id.keys()) == list(cs_data_parallel.trips_per_id.keys())
+    for trip_id, trip in cs_data.trips_per_id.items():
+        assert [str(c) for c in trip.connections] == \
+               [str(c) for c in cs_data_parallel.trips_per_id[trip_id].connections]
+
+
 def test_get_service_available_at_date_per_service_id_get_trip_available_at_date_per_trip_id():
     with ZipFile(PATH_GTFS_TEST_SAMPLE, "r") as zip_file:
         # calendar.txt and # calendar_dates.txt
@@ -160,6 +241,43 @@ def test_create_beeline_footpaths():
     assert (bern_bahnhof.id, bern.id) not in footpaths_per_from_to_stop_id
 
 
+def test_create_beeline_footpaths_haversine():
+    bern = Stop("Bern", "", "", 7.43911954873327, 46.9488249647708)
+    bern_bahnhof = Stop("Bern, Bahnhof", "", "", 7.44020651022721, 46.948107473715)
+    stops_per_id = {s.id: s for s in [bern, bern_bahnhof]}
+    footpaths_per_from_to_stop_id = {}
+    # the mercator distance is about 1.5 times the great-circle distance (about 115m) in switzerland
+    create_beeline_footpaths(stops_per_id, footpaths_per_from_to_stop_id, beeline_distance=150, walking_speed=1.0)
+    assert (bern.id, bern_bahnhof.id) not in footpaths_per_from_to_stop_id
+    create_beeline_footpaths(stops_per_id, footpaths_per_from_to_stop_id, beeline_distance=150, walking_speed=1.0,
+                             beeline_metric=BeelineMetric.HAVERSINE)
+    walking_time = footpaths_per_from_to_stop_id[bern.id, bern_bahnhof.id].walking_time
+    assert walking_time == footpaths_per_from_to_stop_id[bern_bahnhof.id, bern.id].walking_time
+    assert walking_time == pytest.approx(haversine_distance(bern.easting, bern.northing,
+                                                            bern_bahnhof.easting, bern_bahnhof.northing))
+    assert 0.0 == footpaths_per_from_to_stop_id[bern.id, bern.id].walking_time
+
+
+def test_get_stop_pairs_within_beeline_distance():
+    rng = np.random.default_rng(42)
+    eastings = rng.uniform(7.4, 7.5, 300)
+    northings = rng.uniform(46.9, 47.0, 300)
+    beeline_distance = 500.0
+    x_y_coordinates = [wgs84_to_spherical_mercator(lon, lat) for lon, lat in zip(eastings, northings)]
+    for beeline_metric, metric in [
+        (BeelineMetric.MERCATOR, lambda i, j: distance(x_y_coordinates[i], x_y_coordinates[j])),
+        (BeelineMetric.HAVERSINE, lambda i, j: haversine_distance(eastings[i], northings[i],
+                                                                  eastings[j], northings[j]))
+    ]:
+        exp_pairs = [(i, j, metric(i, j)) for i in range(len(eastings)) for j in range(i + 1, len(eastings))
+                     if metric(i, j) <= beeline_distance]
+        from_indices, to_indices, distances = get_stop_pairs_within_beeline_distance(eastings, northings,
+                                                                                     beeline_distance, beeline_metric)
+        assert [(i, j) for i, j, _ in exp_pairs] == list(zip(from_indices.tolist(), to_indices.tolist()))
+        assert np.allclose([d for _, _, d in exp_pairs], distances)
+    assert 0 == len(get_stop_pairs_within_beeline_distance(eastings[:1], northings[:1], beeline_distance)[0])
+
+
 def test_make_transitive_simple():
     footpaths = [
         Footpath("s1", "s2", 60),
@@ -223,3 +341,66 @@ def test_make_transitive_nothing_to_do():
     make_transitive(footpaths_per_from_to_stop_id)
 
     assert 3 == len(footpaths_per_from_to_stop_id)
+
+
+def test_make_transitive_max_walking_time():
+    footpaths = [
+        Footpath("s1", "s2", 60),
+        Footpath("s2", "s3", 70),
+        Footpath("s3", "s4", 70),
+        Footpath("s1", "s4", 500),
+    ]
+
+    footpaths_per_from_to_stop_id = {(f.from_stop_id, f.to_stop_id): f for f in footpaths}
+
+    make_transitive(footpaths_per_from_to_stop_id, max_walking_time=150)
+
+    assert 6 == len(footpaths_per_from_to_stop_id)
+    assert 130 == footpaths_per_from_to_stop_id[("s1", "s3")].walking_time
+    assert 140 == footpaths_per_from_to_stop_id[("s2", "s4")].walking_time
+    assert 500 == footpaths_per_from_to_stop_id[("s1", "s4")].walking_time
+
+
+def test_make_transitive_loops_and_zero_walking_times():
+    footpaths = [
+        Footpath("s1", "s1", 300),
+        Footpath("s1", "s2", 60),
+        Footpath("s2", "s1", 70),
+        Footpath("s2", "p", 0),
+        Footpath("p", "s3", 0),
+        Footpath("s2", "s3", 120),
+    ]
+
+    footpaths_per_from_to_stop_id = {(f.from_stop_id, f.to_stop_id): f for f in footpaths}
+
+    make_transitive(footpaths_per_from_to_stop_id)
+
+    assert 130 == footpaths_per_from_to_stop_id[("s1", "s1")].walking_time
+    assert 130 == footpaths_per_from_to_stop_id[("s2", "s2")].walking_time
+    assert 120 == footpaths_per_from_to_stop_id[("s2", "s3")].walking_time  # not reduced to 0
+    assert 60 == footpaths_per_from_to_stop_id[("s1", "s3")].walking_time
+    assert 60 == footpaths_per_from_to_stop_id[("s1", "p")].walking_time
+    assert ("s3", "s1") not in footpaths_per_from_to_stop_id
+
+
+def test_get_footpath_closure():
+    footpaths_per_from_to_stop_id = parse_gtfs(PATH_GTFS_TEST_SAMPLE, date(2019, 1, 18),
+                                               beeline_distance=800).footpaths_per_from_to_stop_id
+    footpaths_iteratively = dict(footpaths_per_from_to_stop_id)
+    while True:
+        new_footpaths, footpaths_with_time_change = check_for_transitivity(footpaths_iteratively)
+        if len(new_footpaths) == 0 and len(footpaths_with_time_change) == 0:
+            break
+        for footpath in new_footpaths + footpaths_with_time_change:
+            footpaths_iteratively[footpath.from_stop_id, footpath.to_stop_id] = footpath
+    make_transitive(footpaths_per_from_to_stop_id)
+    assert footpaths_iteratively.keys() == footpaths_per_from_to_stop_id.keys()
+    for key, footpath in footpaths_iteratively.items():
+        assert footpath.walking_time == pytest.approx(footpaths_per_from_to_stop_id[key].walking_time)
+
+    closure = get_footpath_closure(footpaths_per_from_to_stop_id, max_walking_time=1500, max_batch_size=100)
+    # loops without a cycle through the stop are not part of the closure
+    assert {(from_stop_id, to_stop_id) for from_stop_id, to_stop_id, _ in closure if from_stop_id != to_stop_id} == \
+           {key for key, footpath in footpaths_per_from_to_stop_id.items()
+            if footpath.walking_time <= 1500 and key[0] != key[1]}
+    assert [] == get_footpath_closure({})
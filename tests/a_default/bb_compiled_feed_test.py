@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from datetime import date
+from zipfile import ZipFile
+
+import numpy as np
+import pytest
+
+from scripts.compiled_feed import compile_gtfs, get_service_validity
+from scripts.connectionscan_router import COLUMNAR_ARRAY_NAMES
+from scripts.gtfs_parser import parse_gtfs
+from tests.a_default.ba_gtfs_parser_test import PATH_GTFS_TEST_SAMPLE
+
+
+@pytest.fixture(scope="module")
+def compiled_feed():
+    return compile_gtfs(PATH_GTFS_TEST_SAMPLE, beeline_distance=200, stop_times_chunk_size=1000)
+
+
+def test_compiled_feed_equals_parse_gtfs(compiled_feed):
+    for desired_date in [date(2019, 1, 18), date(2019, 1, 19), date(2019, 1, 20), date(2019, 6, 3)]:
+        cs_data = parse_gtfs(PATH_GTFS_TEST_SAMPLE, desired_date, beeline_distance=200)
+        cs_data_compiled = compiled_feed.get_connection_scan_data(desired_date)
+        assert str(cs_data) == str(cs_data_compiled)
+        assert list(cs_data.trips_per_id.keys()) == list(cs_data_compiled.trips_per_id.keys())
+        for trip_id, trip in cs_data.trips_per_id.items():
+            trip_compiled = cs_data_compiled.trips_per_id[trip_id]
+            assert trip.trip_type == trip_compiled.trip_type
+            assert [str(c) for c in trip.connections] == [str(c) for c in trip_compiled.connections]
+        assert [str(c) for c in cs_data.sorted_connections] == [str(c) for c in cs_data_compiled.sorted_connections]
+        for name in COLUMNAR_ARRAY_NAMES:
+            assert np.array_equal(getattr(cs_data, name), getattr(cs_data_compiled, name))
+
+
+def test_compiled_feed_service_validity(compiled_feed):
+    with ZipFile(PATH_GTFS_TEST_SAMPLE, "r") as zip_file:
+        first_date, nb_days, service_ids, service_validity = get_service_validity(zip_file)
+    assert first_date == compiled_feed.first_date
+    assert nb_days == compiled_feed.nb_days == len(compiled_feed.get_dates())
+    assert (len(service_ids), nb_days) == service_validity.shape
+    for desired_date in compiled_feed.get_dates()[::5]:
+        day_index = compiled_feed.get_day_index(desired_date)
+        assert service_validity[:, day_index].tolist() == \
+               compiled_feed.get_service_available_at_date(desired_date).tolist()
+
+    # 2019-01-18 was a friday
+    service_available = dict(zip(compiled_feed.service_ids,
+                                 compiled_feed.get_service_available_at_date(date(2019, 1, 18)).tolist()))
+    assert service_available["TA+b0001"]
+    assert not service_available["TA+b02i1"]
+    assert not service_available["TA+b00va"]  # removed by calendar_dates.txt
+    assert service_available["TA+b02ro"]
+    assert not service_available["TA+b03ur"]  # removed by calendar_dates.txt
+
+
+def test_compiled_feed_date_outside_feed_period(compiled_feed):
+    assert compiled_feed.get_day_index(date(2000, 1, 1)) is None
+    assert not np.any(compiled_feed.get_trip_available_at_date(date(2000, 1, 1)))
+    cs_data = compiled_feed.get_connection_scan_data(date(2000, 1, 1))
+    assert 0 == len(cs_data.trips_per_id)
+    assert 0 == len(cs_data.sorted_connections)
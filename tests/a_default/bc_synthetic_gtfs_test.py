@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from datetime import date, timedelta
+from zipfile import ZipFile
+
+import pytest
+
+from scripts.connectionscan_router import ConnectionScanCore
+from scripts.gtfs_parser import parse_gtfs
+from scripts.synthetic_gtfs import SIZE_PRESETS, create_stop_time_rows, format_time, generate_synthetic_gtfs
+
+
+def test_generate_synthetic_gtfs_is_deterministic(tmp_path):
+    paths = [str(tmp_path / name) for name in ["a.zip", "b.zip", "c.zip"]]
+    generate_synthetic_gtfs(paths[0], seed=7, **SIZE_PRESETS["toy"])
+    generate_synthetic_gtfs(paths[1], seed=7, **SIZE_PRESETS["toy"])
+    generate_synthetic_gtfs(paths[2], seed=8, **SIZE_PRESETS["toy"])
+    contents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            contents += [f.read()]
+    assert contents[0] == contents[1]
+    assert contents[0] != contents[2]
+
+
+def test_generate_synthetic_gtfs_is_parsable(tmp_path):
+    path = str(tmp_path / "synthetic.zip")
+    res = generate_synthetic_gtfs(path, nb_stops=80, nb_routes=8, trips_per_hour=3, nb_service_days=14,
+                                  transfer_density=0.5, nb_calendar_exceptions=5, seed=3)
+    with ZipFile(path) as zip_file:
+        assert {"agency.txt", "stops.txt", "routes.txt", "trips.txt", "stop_times.txt", "calendar.txt",
+                "calendar_dates.txt", "transfers.txt"} == set(zip_file.namelist())
+        nb_exceptions = len(zip_file.read("calendar_dates.txt").decode("utf-8").splitlines()) - 1
+    assert 5 == nb_exceptions == res["nb_calendar_exceptions"]
+
+    nb_trips_per_date = {}
+    for day in range(14):
+        desired_date = date(2020, 1, 6) + timedelta(days=day)
+        cs_data = parse_gtfs(path, desired_date)
+        assert 80 == len(cs_data.stops_per_id)
+        assert 0 < len(cs_data.trips_per_id) < res["nb_trips"]
+        nb_trips_per_date[desired_date] = len(cs_data.trips_per_id)
+    assert 0 == len(parse_gtfs(path, date(2020, 1, 20)).trips_per_id)  # after the service period
+    # weekend services run with half the frequency (up to calendar exceptions)
+    assert max(nb_trips_per_date[date(2020, 1, 11)], nb_trips_per_date[date(2020, 1, 12)]) < \
+           max(nb_trips_per_date[date(2020, 1, 8)], nb_trips_per_date[date(2020, 1, 9)])
+
+    cs_core = ConnectionScanCore(parse_gtfs(path, date(2020, 1, 8)))
+    trip = next(iter(cs_core.connection_scan_data.trips_per_id.values()))
+    first_connection, last_connection = trip.connections[0], trip.connections[-1]
+    assert last_connection.arr_time <= cs_core.route_earliest_arrival(
+        first_connection.from_stop_id, last_connection.to_stop_id, first_connection.dep_time)
+
+
+def test_create_stop_time_rows():
+    assert ["t,08:00:00,08:00:00,S3,1", "t,08:02:00,08:03:00,S4,2", "t,08:05:00,08:05:00,S9,3"] == \
+           create_stop_time_rows("t", [3, 4, 9], [120, 120], 60, 8 * 3600)
+    assert "25:01:02" == format_time(25 * 3600 + 62)
+
+
+def test_generate_synthetic_gtfs_invalid_parameters(tmp_path):
+    with pytest.raises(ValueError):
+        generate_synthetic_gtfs(str(tmp_path / "a.zip"), nb_stops=1)
+    with pytest.raises(ValueError):
+        generate_synthetic_gtfs(str(tmp_path / "a.zip"), min_stops_per_route=10, max_stops_per_route=5)
+    with pytest.raises(ValueError):
+        generate_synthetic_gtfs(str(tmp_path / "a.zip"), transfer_density=1.5)
@@ -3,12 +3,13 @@
 
 from datetime import date
 
+import numpy as np
 import pytest
 
 from scripts.classes import Connection, Footpath, Stop, Trip
-from scripts.connectionscan_router import ConnectionScanData
+from scripts.connectionscan_router import ConnectionScanData, ValidationLevel
 from scripts.gtfs_parser import parse_gtfs
-from scripts.helpers.my_logging import log_end
+from scripts.helpers.my_logging import get_log_depth
 from tests.a_default.ba_gtfs_parser_test import PATH_GTFS_TEST_SAMPLE
 
 
@@ -46,46 +47,135 @@ def test_connectionscan_data_constructor_basic():
     assert [con_2_1, con_1_1, con_2_2, con_1_2] == cs_data.sorted_connections
 
 
+def test_connectionscan_data_constructor_columnar_connections():
+    stops_per_id = {
+        "1": Stop("1", "c1", "n1", 0.0, 0.0),
+        "2": Stop("2", "c2", "n2", 1.0, 1.0),
+        "3": Stop("3", "c3", "n3", 3.0, 3.0),
+    }
+    con_1_1 = Connection("t1", "1", "2", 60, 70)
+    con_1_2 = Connection("t1", "2", "3", 72, 80)
+    con_2_1 = Connection("t2", "2", "3", 50, 59)
+    con_2_2 = Connection("t2", "3", "1", 60, 72)
+    trips_per_id = {
+        "t1": Trip("t1", [con_1_1, con_1_2]),
+        "t2": Trip("t2", [con_2_1, con_2_2])
+    }
+    cs_data = ConnectionScanData(stops_per_id, {}, trips_per_id)
+    assert ["1", "2", "3"] == cs_data.stop_id_registry.ids
+    assert 2 == cs_data.stop_id_registry.get_index("3")
+    assert ["t1", "t2"] == cs_data.trip_id_registry.ids
+    assert "t2" == cs_data.trip_id_registry.get_id(1)
+    for array in [cs_data.dep_times, cs_data.arr_times, cs_data.from_stop_indices, cs_data.to_stop_indices,
+                  cs_data.trip_indices]:
+        assert np.int32 == array.dtype
+        assert array.flags["C_CONTIGUOUS"]
+    assert [50, 60, 60, 72] == cs_data.dep_times.tolist()
+    assert [59, 70, 72, 80] == cs_data.arr_times.tolist()
+    assert [1, 0, 2, 1] == cs_data.from_stop_indices.tolist()
+    assert [2, 1, 0, 2] == cs_data.to_stop_indices.tolist()
+    assert [1, 0, 1, 0] == cs_data.trip_indices.tolist()
+
+
 def test_connectionscan_data_constructor_stop_id_not_consistent():
+    depth = get_log_depth()
     with pytest.raises(ValueError):
         ConnectionScanData({"s1": Stop("s2", "", "", 0.0, 0.0)}, {}, {})
-    log_end(additional_message="test failed successful")
+    assert depth == get_log_depth()
 
 
 def test_connectionscan_data_constructor_from_stop_id_in_footpath_not_consistent():
+    depth = get_log_depth()
     with pytest.raises(ValueError):
         ConnectionScanData({"s1": Stop("s1", "", "", 0.0, 0.0), "s2": Stop("s2", "", "", 0.0, 0.0)},
                            {("s2", "s2"): Footpath("s1", "s1", 60)}, {})
-    log_end(additional_message="test failed successful")
+    assert depth == get_log_depth()
 
 
 def test_connectionscan_data_constructor_to_stop_id_in_footpath_not_consistent():
+    depth = get_log_depth()
     with pytest.raises(ValueError):
         ConnectionScanData({"s1": Stop("s1", "", "", 0.0, 0.0), "s2": Stop("s2", "", "", 0.0, 0.0)},
                            {("s2", "s1"): Footpath("s2", "s2", 60)}, {})
-    log_end(additional_message="test failed successful")
+    assert depth == get_log_depth()
 
 
 def test_connectionscan_data_constructor_stops_in_footpath_and_stops_not_consistent():
+    depth = get_log_depth()
     with pytest.raises(ValueError):
         ConnectionScanData({"s1": Stop("s1", "", "", 0.0, 0.0)}, {("s1", "s2"): Footpath("s1", "s2", 60)}, {})
-    log_end(additional_message="test failed successful")
+    assert depth == get_log_depth()
 
 
 def test_connectionscan_data_constructor_trip_id_not_consistent():
+    depth = get_log_depth()
     with pytest.raises(ValueError):
         ConnectionScanData({}, {}, {"t1": Trip("t", [])})
-    log_end(additional_message="test failed successful")
+    assert depth == get_log_depth()
 
 
 def test_connectionscan_data_constructor_stop_ids_in_trips_not_consistent_with_stops():
+    depth = get_log_depth()
     with pytest.raises(ValueError):
         ConnectionScanData({"s1": Stop("s1", "", "", 0.0, 0.0)}, {},
                            {"t": Trip("t", [Connection("t", "s1", "s2", 30, 40)])})
-    log_end(additional_message="test failed successful")
+    assert depth == get_log_depth()
+
+
+def test_connectionscan_data_constructor_validation_levels():
+    s1 = Stop("s1", "", "", 0.0, 0.0)
+    s2 = Stop("s2", "", "", 0.0, 0.0)
+    inconsistent_data = [
+        ({"s1": Stop("s2", "", "", 0.0, 0.0)}, {}, {}),
+        ({"s1": s1, "s2": s2}, {("s2", "s2"): Footpath("s1", "s1", 60)}, {}),
+        ({"s1": s1, "s2": s2}, {("s2", "s1"): Footpath("s2", "s2", 60)}, {}),
+        ({"s1": s1}, {("s1", "s2"): Footpath("s1", "s2", 60)}, {}),
+        ({}, {}, {"t1": Trip("t", [])}),
+        ({"s1": s1}, {}, {"t": Trip("t", [Connection("t", "s1", "s2", 30, 40)])}),
+    ]
+    for stops_per_id, footpaths_per_from_to_stop_id, trips_per_id in inconsistent_data:
+        depth = get_log_depth()
+        with pytest.raises(ValueError):
+            ConnectionScanData(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id,
+                               validation_level=ValidationLevel.FAST)
+        assert depth == get_log_depth()
+        cs_data = ConnectionScanData(stops_per_id, footpaths_per_from_to_stop_id, {},
+                                     validation_level=ValidationLevel.NONE)
+        assert ValidationLevel.NONE == cs_data.validation_level
+    depth = get_log_depth()
+    with pytest.raises(ValueError):
+        ConnectionScanData({"s1": s1}, {}, {}, validation_level="fast")
+    assert depth == get_log_depth()
+
+    cs_data = parse_gtfs(PATH_GTFS_TEST_SAMPLE, date(2019, 1, 18))
+    assert ValidationLevel.FULL == cs_data.validation_level
+    for validation_level in [ValidationLevel.FAST, ValidationLevel.NONE]:
+        other_cs_data = ConnectionScanData(cs_data.stops_per_id, cs_data.footpaths_per_from_to_stop_id,
+                                           cs_data.trips_per_id, validation_level=validation_level)
+        assert validation_level == other_cs_data.validation_level
+        assert str(cs_data) == str(other_cs_data)
+        assert np.array_equal(cs_data.dep_times, other_cs_data.dep_times)
 
 
 def test_connectionscan_data_constructor_stops_per_name():
     cs_data = parse_gtfs(PATH_GTFS_TEST_SAMPLE, date(2019, 1, 18))
     assert "8507000P" == cs_data.stops_per_name["Bern"].id
     assert "8502886" == cs_data.stops_per_name["Kirchleerau-Moosleerau, Post"].id
+
+
+def test_connectionscan_data_get_first_connection_index():
+    cs_data = parse_gtfs(PATH_GTFS_TEST_SAMPLE, date(2019, 1, 18))
+    dep_times = list(cs_data.dep_times)
+    desired_dep_times = [-60, 0, 1, 59, 60, 61] + list(range(5 * 3600, 25 * 3600, 457)) + [
+        dep_times[0], dep_times[-1], dep_times[-1] + 1, 3 * 24 * 3600]
+    for desired_dep_time in desired_dep_times:
+        exp_index = next((i for i, dep_time in enumerate(dep_times) if dep_time >= desired_dep_time), len(dep_times))
+        assert exp_index == cs_data.get_first_connection_index(desired_dep_time)
+    assert [cs_data.get_first_connection_index(t) for t in desired_dep_times] == list(
+        cs_data.get_first_connection_indices(desired_dep_times))
+
+
+def test_connectionscan_data_get_first_connection_index_no_connections():
+    cs_data = ConnectionScanData({}, {}, {})
+    assert 0 == cs_data.get_first_connection_index(3600)
+    assert [0, 0] == list(cs_data.get_first_connection_indices([0, 3600]))
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from scripts.classes import Connection, Footpath, Stop, Trip
-from scripts.connectionscan_router import ConnectionScanData
+from scripts.connectionscan_router import ConnectionScanCore, ConnectionScanData, ScanWorkspace
 from scripts.helpers.funs import seconds_to_hhmmss, hhmmss_to_sec
 
 fribourg = Stop("1", "FR", "Fribourg/Freiburg", 0.0, 0.0)
@@ -189,3 +189,39 @@ def test_get_forth_and_back_trips():
 
     assert "5" == trips_sg_fri[0].connections[0].from_stop_id
     assert "1" == trips_sg_fri[-1].connections[-1].to_stop_id
+
+
+def test_scan_workspaces_are_reused_and_reset():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    stop_ids = list(cs_data.stops_per_id)
+    queries = [(from_stop_id, to_stop_id, hhmmss_to_sec(dep_time)) for dep_time in ["05:00:00", "08:30:00", "21:00:00"]
+               for from_stop_id in stop_ids for to_stop_id in stop_ids]
+    for from_stop_id, to_stop_id, desired_dep_time in queries:
+        fresh_cs_core = ConnectionScanCore(cs_data)
+        assert fresh_cs_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time) == \
+               cs_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time)
+        journey = cs_core.route_optimized_earliest_arrival_with_reconstruction(from_stop_id, to_stop_id,
+                                                                               desired_dep_time)
+        assert str(fresh_cs_core.route_optimized_earliest_arrival_with_reconstruction(
+            from_stop_id, to_stop_id, desired_dep_time)) == str(journey)
+        assert fresh_cs_core.route_earliest_arrival_all_targets(from_stop_id, desired_dep_time) == \
+               cs_core.route_earliest_arrival_all_targets(from_stop_id, desired_dep_time)
+
+    # the queries are scanned sequentially, i.e. with a single workspace
+    assert 1 == cs_core.workspace_pool.nb_workspaces
+    workspace = cs_core.workspace_pool.free_workspaces[0]
+    assert 3 * len(queries) == workspace.nb_queries
+    assert 0 < len(workspace.touched_stop_indices)
+    workspace.reset()
+    initial_workspace = ScanWorkspace(len(stop_ids), len(cs_data.trips_per_id), cs_core.MAX_ARR_TIME_VALUE)
+    for name in ["earliest_arrival_per_stop_index", "journey_leg_per_stop_index", "vehicle_arrival_per_stop_index",
+                 "in_connection_index_per_trip_index", "touched_stop_indices", "touched_trip_indices"]:
+        assert getattr(initial_workspace, name) == getattr(workspace, name)
+
+    # nested acquisitions use different workspaces
+    with cs_core.workspace_pool.acquired() as workspace_1:
+        with cs_core.workspace_pool.acquired() as workspace_2:
+            assert workspace_1 is not workspace_2
+    assert 2 == cs_core.workspace_pool.nb_workspaces
+    assert 2 == len(cs_core.workspace_pool.free_workspaces)
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from scripts.connectionscan_kernels import scan_earliest_arrival_all_targets
+from scripts.connectionscan_router import ConnectionScanCore, RoutingBackend
+from scripts.helpers.funs import hhmmss_to_sec
+from tests.a_default.cb_connectionscan_core_test import (bern, bern_bahnhof, chur, create_test_connectionscan_data,
+                                                         samedan, samedan_bahnhof, zuerich_hb)
+
+
+def get_journey_signature(journey):
+    return [(leg.in_connection, leg.out_connection, leg.footpath) for leg in journey.journey_legs]
+
+
+def test_numba_backend_equals_python_backend():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    stop_ids = list(cs_data.stops_per_id.keys())
+    for desired_dep_time_hhmmss in ["04:00:00", "07:30:00", "08:26:00", "12:09:46", "23:33:00"]:
+        desired_dep_time = hhmmss_to_sec(desired_dep_time_hhmmss)
+        for from_stop_id in stop_ids:
+            for to_stop_id in stop_ids:
+                journey_python = cs_core.route_optimized_earliest_arrival_with_reconstruction(
+                    from_stop_id, to_stop_id, desired_dep_time, backend=RoutingBackend.PYTHON)
+                journey_numba = cs_core.route_optimized_earliest_arrival_with_reconstruction(
+                    from_stop_id, to_stop_id, desired_dep_time, backend=RoutingBackend.NUMBA)
+                assert get_journey_signature(journey_python) == get_journey_signature(journey_numba)
+
+
+def test_scan_optimized_earliest_arrival_kernel_equals_python_scan():
+    # without numba the kernels are executed uncompiled
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    nb_stops = len(cs_data.stops_per_id)
+    for desired_dep_time_hhmmss in ["04:00:00", "07:30:00", "08:26:00", "12:09:46", "23:33:00"]:
+        desired_dep_time = hhmmss_to_sec(desired_dep_time_hhmmss)
+        for from_stop_index in range(nb_stops):
+            for to_stop_index in range(nb_stops):
+                arr_time_kernel, journey_leg_target_kernel, journey_legs_kernel = \
+                    cs_core.scan_optimized_earliest_arrival_with_kernel(from_stop_index, to_stop_index,
+                                                                        desired_dep_time)
+                arr_time, journey_leg_target, journey_legs = cs_core.scan_earliest_arrival(
+                    from_stop_index, to_stop_index, desired_dep_time, True, True)
+                assert arr_time == arr_time_kernel
+                assert journey_leg_target == journey_leg_target_kernel
+                assert get_journey_signature(cs_core.reconstruct_journey(from_stop_index, journey_leg_target,
+                                                                         journey_legs)) == \
+                    get_journey_signature(cs_core.reconstruct_journey(from_stop_index, journey_leg_target_kernel,
+                                                                      journey_legs_kernel))
+
+
+def test_scan_earliest_arrival_all_targets_kernel_equals_python_scan():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    for desired_dep_time_hhmmss in ["04:00:00", "07:30:00", "08:26:00", "12:09:46", "23:33:00"]:
+        desired_dep_time = hhmmss_to_sec(desired_dep_time_hhmmss)
+        for from_stop_index in range(len(cs_data.stops_per_id)):
+            arr_times_kernel = scan_earliest_arrival_all_targets(
+                cs_data.dep_times,
+                cs_data.arr_times,
+                cs_data.from_stop_indices,
+                cs_data.to_stop_indices,
+                cs_data.trip_indices,
+                cs_core.footpath_first_indices,
+                cs_core.footpath_to_stop_indices,
+                cs_core.footpath_walking_times,
+                len(cs_data.trip_id_registry),
+                from_stop_index,
+                float(desired_dep_time),
+                cs_core.get_first_connection_index(desired_dep_time),
+                float(cs_core.MAX_ARR_TIME_VALUE)
+            )
+            arr_times = cs_core.scan_earliest_arrival_all_targets(from_stop_index, desired_dep_time,
+                                                                  backend=RoutingBackend.PYTHON)
+            assert arr_times.tolist() == arr_times_kernel.tolist()
+
+
+def test_numba_backend_bern_bahnhof_samedan_bahnhof():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data, backend=RoutingBackend.NUMBA)
+    journey = cs_core.route_optimized_earliest_arrival_with_reconstruction(bern_bahnhof.id, samedan_bahnhof.id,
+                                                                           hhmmss_to_sec("08:26:00"))
+    assert 4 == journey.get_nb_journey_legs()
+    assert 3 == journey.get_nb_pt_journey_legs()
+    assert hhmmss_to_sec("08:27:00") == journey.get_dep_time()
+    assert hhmmss_to_sec("12:48:00") == journey.get_arr_time()
+    assert [bern.id, zuerich_hb.id, chur.id] == journey.get_pt_in_stop_ids()
+    assert [zuerich_hb.id, chur.id, samedan.id] == journey.get_pt_out_stop_ids()
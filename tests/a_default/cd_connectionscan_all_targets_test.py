@@ -0,0 +1,39 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from scripts.connectionscan_router import ConnectionScanCore, RoutingBackend
+from scripts.helpers.funs import hhmmss_to_sec
+from tests.a_default.cb_connectionscan_core_test import (bern, bern_bahnhof, create_test_connectionscan_data, samedan,
+                                                         samedan_spital, zuerich_hb)
+
+
+def test_route_earliest_arrival_all_targets_bern():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    arr_time_per_stop_id = cs_core.route_earliest_arrival_all_targets(bern.id, hhmmss_to_sec("08:30:00"))
+    assert hhmmss_to_sec("08:30:00") == arr_time_per_stop_id[bern.id]
+    assert hhmmss_to_sec("08:35:00") == arr_time_per_stop_id[bern_bahnhof.id]
+    assert hhmmss_to_sec("09:28:00") == arr_time_per_stop_id[zuerich_hb.id]
+    assert hhmmss_to_sec("12:45:00") == arr_time_per_stop_id[samedan.id]
+
+
+def test_route_earliest_arrival_all_targets_not_reachable():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    arr_time_per_stop_id = cs_core.route_earliest_arrival_all_targets(bern.id, hhmmss_to_sec("21:00:00"))
+    assert samedan.id not in arr_time_per_stop_id
+    assert samedan_spital.id not in arr_time_per_stop_id
+
+
+def test_route_earliest_arrival_all_targets_equals_route_earliest_arrival():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    for desired_dep_time_hhmmss in ["04:00:00", "07:30:00", "12:09:46", "23:33:00"]:
+        desired_dep_time = hhmmss_to_sec(desired_dep_time_hhmmss)
+        for from_stop_id in cs_data.stops_per_id:
+            for backend in [RoutingBackend.PYTHON, RoutingBackend.NUMBA]:
+                arr_time_per_stop_id = cs_core.route_earliest_arrival_all_targets(from_stop_id, desired_dep_time,
+                                                                                  backend=backend)
+                for to_stop_id in cs_data.stops_per_id:
+                    assert cs_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time) == \
+                           arr_time_per_stop_id.get(to_stop_id)
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from scripts.connectionscan_router import ConnectionScanCore
+from scripts.helpers.funs import hhmmss_to_sec, seconds_to_hhmmss
+from tests.a_default.cb_connectionscan_core_test import (bern, bern_bahnhof, chur, create_test_connectionscan_data,
+                                                         samedan, samedan_bahnhof, samedan_spital, zuerich_hb)
+
+
+def test_route_earliest_arrival_profile_bern_samedan():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    journeys = cs_core.route_earliest_arrival_profile(bern.id, samedan.id, hhmmss_to_sec("07:00:00"),
+                                                      hhmmss_to_sec("10:00:00"))
+    assert [("07:32:00", "11:45:00"), ("08:32:00", "12:45:00"), ("09:32:00", "13:45:00")] == [
+        (seconds_to_hhmmss(j.get_dep_time()), seconds_to_hhmmss(j.get_arr_time())) for j in journeys]
+    for journey in journeys:
+        assert [bern.id, zuerich_hb.id, chur.id] == journey.get_pt_in_stop_ids()
+        assert [zuerich_hb.id, chur.id, samedan.id] == journey.get_pt_out_stop_ids()
+
+
+def test_route_earliest_arrival_profile_bern_bahnhof_samedan_spital():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    journeys = cs_core.route_earliest_arrival_profile(bern_bahnhof.id, samedan_spital.id, hhmmss_to_sec("05:00:00"),
+                                                      hhmmss_to_sec("12:00:00"))
+    assert 1 == len(journeys)
+    journey = journeys[0]
+    assert journey.is_first_leg_footpath()
+    assert "10:27:00" == seconds_to_hhmmss(journey.get_dep_time())
+    assert "15:07:00" == seconds_to_hhmmss(journey.get_arr_time())
+    assert [bern.id, zuerich_hb.id, chur.id, samedan_bahnhof.id] == journey.get_pt_in_stop_ids()
+
+
+def test_route_earliest_arrival_profile_same_stop():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    assert [] == cs_core.route_earliest_arrival_profile(bern.id, bern.id, hhmmss_to_sec("07:00:00"),
+                                                        hhmmss_to_sec("10:00:00"))
+
+
+def test_route_earliest_arrival_profile_consistent_with_earliest_arrival():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    min_dep_time = hhmmss_to_sec("06:50:00")
+    max_dep_time = hhmmss_to_sec("09:10:00")
+    for from_stop_id in cs_data.stops_per_id:
+        for to_stop_id in cs_data.stops_per_id:
+            if from_stop_id == to_stop_id:
+                continue
+            journeys = cs_core.route_earliest_arrival_profile(from_stop_id, to_stop_id, min_dep_time, max_dep_time)
+            dep_arr_times = [(j.get_dep_time(), j.get_arr_time()) for j in journeys]
+            assert sorted(dep_arr_times) == dep_arr_times
+            for (dep_time, arr_time), (next_dep_time, next_arr_time) in zip(dep_arr_times, dep_arr_times[1:]):
+                assert dep_time < next_dep_time and arr_time < next_arr_time  # pareto optimal
+            for dep_time, arr_time in dep_arr_times:
+                assert min_dep_time <= dep_time <= max_dep_time
+                assert arr_time == cs_core.route_earliest_arrival(from_stop_id, to_stop_id, dep_time)
+            for desired_dep_time in range(min_dep_time, max_dep_time + 1, 60):
+                journey = cs_core.route_optimized_earliest_arrival_with_reconstruction(from_stop_id, to_stop_id,
+                                                                                       desired_dep_time)
+                arr_times = [arr for dep, arr in dep_arr_times if dep >= desired_dep_time]
+                if arr_times and journey.get_nb_pt_journey_legs() > 0:
+                    assert journey.get_arr_time() == arr_times[0]
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from scripts.connectionscan_mc_router import McConnectionScanCore, McLabel, benchmark_mc_router, insert_into_bag
+from scripts.connectionscan_router import ConnectionScanCore
+from scripts.helpers.funs import hhmmss_to_sec, seconds_to_hhmmss
+from tests.a_default.cb_connectionscan_core_test import (bern, bern_bahnhof, chur, create_test_connectionscan_data,
+                                                         interlaken_ost, samedan, samedan_spital, zuerich_hb)
+
+
+def test_insert_into_bag():
+    bag = []
+    arr_times = []
+    assert insert_into_bag(bag, arr_times, McLabel(100, 3, None, None))
+    assert insert_into_bag(bag, arr_times, McLabel(200, 1, None, None))
+    assert not insert_into_bag(bag, arr_times, McLabel(150, 3, None, None))
+    assert not insert_into_bag(bag, arr_times, McLabel(200, 2, None, None))
+    assert insert_into_bag(bag, arr_times, McLabel(150, 2, None, None))
+    assert [(100, 3), (150, 2), (200, 1)] == [(label.arr_time, label.nb_pt_legs) for label in bag]
+    assert insert_into_bag(bag, arr_times, McLabel(90, 2, None, None))
+    assert [(90, 2), (200, 1)] == [(label.arr_time, label.nb_pt_legs) for label in bag]
+    assert [90, 200] == arr_times
+    bag = []
+    arr_times = []
+    assert insert_into_bag(bag, arr_times, McLabel(200, 2, None, None))
+    assert insert_into_bag(bag, arr_times, McLabel(200, 1, None, None))
+    assert [(200, 1)] == [(label.arr_time, label.nb_pt_legs) for label in bag]
+    assert [200] == arr_times
+
+
+def test_route_pareto_earliest_arrival_bern_samedan():
+    cs_data = create_test_connectionscan_data()
+    mc_core = McConnectionScanCore(cs_data)
+    journeys = mc_core.route_pareto_earliest_arrival(bern.id, samedan.id, hhmmss_to_sec("08:30:00"))
+    assert 1 == len(journeys)
+    assert "12:45:00" == seconds_to_hhmmss(journeys[0].get_arr_time())
+    assert [bern.id, zuerich_hb.id, chur.id] == journeys[0].get_pt_in_stop_ids()
+
+
+def test_route_pareto_earliest_arrival_fewer_transfers():
+    cs_data = create_test_connectionscan_data()
+    mc_core = McConnectionScanCore(cs_data)
+    journeys = mc_core.route_pareto_earliest_arrival(interlaken_ost.id, chur.id, hhmmss_to_sec("06:10:00"))
+    assert [("10:52:00", 3), ("11:52:00", 2)] == [
+        (seconds_to_hhmmss(j.get_arr_time()), j.get_nb_pt_journey_legs()) for j in journeys]
+    cs_core = ConnectionScanCore(cs_data)
+    assert journeys[0].get_arr_time() == cs_core.route_earliest_arrival(interlaken_ost.id, chur.id,
+                                                                        hhmmss_to_sec("06:10:00"))
+    journeys = mc_core.route_pareto_earliest_arrival(interlaken_ost.id, chur.id, hhmmss_to_sec("06:10:00"),
+                                                     max_nb_transfers=1)
+    assert [("11:52:00", 2)] == [(seconds_to_hhmmss(j.get_arr_time()), j.get_nb_pt_journey_legs()) for j in journeys]
+
+
+def test_route_pareto_earliest_arrival_walking_only():
+    cs_data = create_test_connectionscan_data()
+    mc_core = McConnectionScanCore(cs_data)
+    journeys = mc_core.route_pareto_earliest_arrival(bern.id, bern_bahnhof.id, hhmmss_to_sec("08:30:00"))
+    assert 1 == len(journeys)
+    assert 0 == journeys[0].get_nb_pt_journey_legs()
+    assert journeys[0].is_first_leg_footpath()
+    labels = mc_core.scan_pareto_earliest_arrival(cs_data.stop_id_registry.get_index(bern.id),
+                                                  cs_data.stop_id_registry.get_index(bern_bahnhof.id),
+                                                  hhmmss_to_sec("08:30:00"))
+    assert [(hhmmss_to_sec("08:35:00"), 0)] == [(label.arr_time, label.nb_pt_legs) for label in labels]
+
+
+def test_route_pareto_earliest_arrival_equals_repeated_scans():
+    cs_data = create_test_connectionscan_data()
+    mc_core = McConnectionScanCore(cs_data)
+    cs_core = ConnectionScanCore(cs_data)
+    for desired_dep_time_hhmmss in ["06:10:00", "08:30:00", "12:09:46"]:
+        desired_dep_time = hhmmss_to_sec(desired_dep_time_hhmmss)
+        for from_stop_id in cs_data.stops_per_id:
+            for to_stop_id in cs_data.stops_per_id:
+                for max_nb_transfers in [None, 0, 1]:
+                    journeys = mc_core.route_pareto_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time,
+                                                                     max_nb_transfers)
+                    pt_journeys = [j for j in journeys if j.get_nb_pt_journey_legs() > 0]
+                    for journey in pt_journeys:
+                        assert desired_dep_time <= journey.get_dep_time()
+                    pareto_set, _ = mc_core.route_pareto_earliest_arrival_by_repeated_scans(
+                        from_stop_id, to_stop_id, desired_dep_time, max_nb_transfers)
+                    assert len(pareto_set) == len(journeys)
+                    assert [(arr_time, nb_pt_legs) for arr_time, nb_pt_legs in pareto_set if nb_pt_legs > 0] == [
+                        (j.get_arr_time(), j.get_nb_pt_journey_legs()) for j in pt_journeys]
+                    if pareto_set and max_nb_transfers is None:
+                        assert cs_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time) == \
+                               pareto_set[0][0]
+
+
+def test_benchmark_mc_router():
+    cs_data = create_test_connectionscan_data()
+    queries = [(bern.id, samedan.id, hhmmss_to_sec("08:30:00")),
+               (bern_bahnhof.id, samedan_spital.id, hhmmss_to_sec("08:30:00"))]
+    res = benchmark_mc_router(cs_data, queries)
+    assert 2 == res["nb_queries"]
+    assert res["nb_journeys"] >= 2
+    assert res["nb_single_criterion_scans"] >= 2
+    assert res["time_mc"] > 0 and res["time_repeated_scans"] > 0
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from scripts.connectionscan_router import ConnectionScanCore
+from scripts.helpers.funs import hhmmss_to_sec, seconds_to_hhmmss
+from tests.a_default.cb_connectionscan_core_test import (bern, bern_bahnhof, chur, create_test_connectionscan_data,
+                                                         samedan, samedan_spital, zuerich_hb)
+
+
+def test_route_latest_departure_bern_samedan():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    assert "08:32:00" == seconds_to_hhmmss(cs_core.route_latest_departure(bern.id, samedan.id,
+                                                                          hhmmss_to_sec("13:00:00")))
+    journey = cs_core.route_latest_departure_with_reconstruction(bern.id, samedan.id, hhmmss_to_sec("13:00:00"))
+    assert "08:32:00" == seconds_to_hhmmss(journey.get_dep_time())
+    assert "12:45:00" == seconds_to_hhmmss(journey.get_arr_time())
+    assert [bern.id, zuerich_hb.id, chur.id] == journey.get_pt_in_stop_ids()
+    assert [zuerich_hb.id, chur.id, samedan.id] == journey.get_pt_out_stop_ids()
+
+
+def test_route_latest_departure_bern_bahnhof_samedan_spital():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    journey = cs_core.route_latest_departure_with_reconstruction(bern_bahnhof.id, samedan_spital.id,
+                                                                 hhmmss_to_sec("15:30:00"))
+    assert journey.is_first_leg_footpath()
+    assert bern_bahnhof.id == journey.get_first_stop_id()
+    assert samedan_spital.id == journey.get_last_stop_id()
+    assert "15:07:00" == seconds_to_hhmmss(journey.get_arr_time())
+
+
+def test_route_latest_departure_not_reachable():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    assert cs_core.route_latest_departure(bern.id, samedan.id, hhmmss_to_sec("05:00:00")) is None
+    assert not cs_core.route_latest_departure_with_reconstruction(bern.id, samedan.id,
+                                                                  hhmmss_to_sec("05:00:00")).has_legs()
+
+
+def test_route_latest_departure_consistent_with_earliest_arrival():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    for desired_arr_time_hhmmss in ["08:00:00", "11:30:00", "15:07:00", "23:59:00"]:
+        desired_arr_time = hhmmss_to_sec(desired_arr_time_hhmmss)
+        for to_stop_id in cs_data.stops_per_id:
+            dep_time_per_stop_id = cs_core.route_latest_departure_all_sources(to_stop_id, desired_arr_time)
+            for from_stop_id in cs_data.stops_per_id:
+                dep_time = cs_core.route_latest_departure(from_stop_id, to_stop_id, desired_arr_time)
+                assert dep_time == dep_time_per_stop_id.get(from_stop_id)
+                if dep_time is None or from_stop_id == to_stop_id:
+                    continue
+                assert cs_core.route_earliest_arrival(from_stop_id, to_stop_id, dep_time) <= desired_arr_time
+                arr_time_later = cs_core.route_earliest_arrival(from_stop_id, to_stop_id, dep_time + 1)
+                assert arr_time_later is None or arr_time_later > desired_arr_time
+                journey = cs_core.route_latest_departure_with_reconstruction(from_stop_id, to_stop_id,
+                                                                             desired_arr_time)
+                assert from_stop_id == journey.get_first_stop_id()
+                assert to_stop_id == journey.get_last_stop_id()
+                if journey.get_nb_pt_journey_legs() > 0:
+                    assert dep_time == journey.get_dep_time()
+                    assert journey.get_arr_time() <= desired_arr_time
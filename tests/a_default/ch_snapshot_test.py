@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from datetime import date
+
+import numpy as np
+import pytest
+
+from scripts.connectionscan_router import ConnectionScanCore, ValidationLevel
+from scripts.helpers.funs import hhmmss_to_sec
+from scripts.helpers.my_logging import get_log_depth
+from scripts.snapshot import (HEADER_FILE_NAME, SnapshotConnections, SnapshotTrips, compute_feed_hash,
+                              load_or_parse_gtfs, load_snapshot, read_snapshot_header, save_snapshot)
+from scripts.tripbased_router import TripBasedCore, TripBasedData
+from tests.a_default.ba_gtfs_parser_test import PATH_GTFS_TEST_SAMPLE
+from tests.a_default.cb_connectionscan_core_test import bern, create_test_connectionscan_data, samedan
+
+
+def test_save_and_load_snapshot(tmp_path):
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    path_to_snapshot = str(tmp_path / "snapshot")
+    save_snapshot(path_to_snapshot, cs_core, "abc", date(2019, 1, 18), {"beeline_distance": 100.0})
+    loaded_core = load_snapshot(path_to_snapshot, "abc", date(2019, 1, 18), {"beeline_distance": 100.0})
+    loaded_data = loaded_core.connection_scan_data
+
+    assert isinstance(loaded_data.dep_times, np.memmap)
+    assert isinstance(loaded_data.sorted_connections, SnapshotConnections)
+    assert isinstance(loaded_data.trips_per_id, SnapshotTrips)
+    assert [None] * len(cs_data.sorted_connections) == loaded_data.sorted_connections.connections
+    assert isinstance(loaded_core.footpath_to_stop_indices, np.memmap)
+    assert not loaded_data.dep_times.flags.writeable
+    assert cs_data.stop_id_registry.ids == loaded_data.stop_id_registry.ids
+    assert cs_data.trip_id_registry.ids == loaded_data.trip_id_registry.ids
+    assert str(cs_data) == str(loaded_data)
+    for stop_id, stop in cs_data.stops_per_id.items():
+        assert str(stop) == str(loaded_data.stops_per_id[stop_id])
+    for trip_id, trip in cs_data.trips_per_id.items():
+        assert [str(c) for c in trip.connections] == [str(c) for c in loaded_data.trips_per_id[trip_id].connections]
+    assert [str(c) for c in cs_data.sorted_connections] == [str(c) for c in loaded_data.sorted_connections]
+    assert {key: f.walking_time for key, f in cs_data.footpaths_per_from_to_stop_id.items()} == \
+           {key: f.walking_time for key, f in loaded_data.footpaths_per_from_to_stop_id.items()}
+    assert np.array_equal(cs_data.first_connection_index_per_minute, loaded_data.first_connection_index_per_minute)
+
+    for desired_dep_time_hhmmss in ["06:10:00", "08:30:00", "12:09:46"]:
+        desired_dep_time = hhmmss_to_sec(desired_dep_time_hhmmss)
+        for from_stop_id in cs_data.stops_per_id:
+            for to_stop_id in cs_data.stops_per_id:
+                assert cs_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time) == \
+                       loaded_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time)
+                assert str(cs_core.route_earliest_arrival_with_reconstruction(
+                    from_stop_id, to_stop_id, desired_dep_time)) == str(
+                    loaded_core.route_earliest_arrival_with_reconstruction(
+                        from_stop_id, to_stop_id, desired_dep_time))
+    assert cs_core.route_latest_departure(bern.id, samedan.id, hhmmss_to_sec("13:00:00")) == \
+           loaded_core.route_latest_departure(bern.id, samedan.id, hhmmss_to_sec("13:00:00"))
+
+
+def test_load_snapshot_lazy_connections_and_trips(tmp_path):
+    cs_data = create_test_connectionscan_data()
+    path_to_snapshot = str(tmp_path / "snapshot")
+    save_snapshot(path_to_snapshot, ConnectionScanCore(cs_data))
+    loaded_data = load_snapshot(path_to_snapshot).connection_scan_data
+    connections = loaded_data.sorted_connections
+    assert len(cs_data.sorted_connections) == len(connections)
+    assert connections[3] is connections[3]
+    assert connections[-1] is connections[len(connections) - 1]
+    assert [str(c) for c in cs_data.sorted_connections[2:5]] == [str(c) for c in connections[2:5]]
+    assert 4 == sum(c is not None for c in connections.connections)
+
+    trips_per_id = loaded_data.trips_per_id
+    assert list(cs_data.trips_per_id) == list(trips_per_id)
+    trip_id = list(cs_data.trips_per_id)[0]
+    assert trip_id in trips_per_id and "unknown" not in trips_per_id
+    assert trips_per_id[trip_id] is trips_per_id[trip_id]
+    assert all(c is connections[cs_data.sorted_connections.index(c_orig)]
+               for c, c_orig in zip(trips_per_id[trip_id].connections, cs_data.trips_per_id[trip_id].connections))
+
+    # the trip-based router creates all trips
+    desired_dep_time = hhmmss_to_sec("08:30:00")
+    assert str(TripBasedCore(TripBasedData(cs_data)).route_earliest_arrival_with_reconstruction(
+        bern.id, samedan.id, desired_dep_time)) == str(TripBasedCore(TripBasedData(
+            loaded_data)).route_earliest_arrival_with_reconstruction(bern.id, samedan.id, desired_dep_time))
+
+
+def test_load_snapshot_stale(tmp_path):
+    cs_core = ConnectionScanCore(create_test_connectionscan_data())
+    path_to_snapshot = str(tmp_path / "snapshot")
+    depth = get_log_depth()
+    with pytest.raises(ValueError):
+        load_snapshot(path_to_snapshot)
+    save_snapshot(path_to_snapshot, cs_core, "abc", date(2019, 1, 18), {"beeline_distance": 100.0})
+    assert "abc" == read_snapshot_header(path_to_snapshot)["feed_hash"]
+    load_snapshot(path_to_snapshot)  # nothing to check
+    with pytest.raises(ValueError):
+        load_snapshot(path_to_snapshot, feed_hash="abd")
+    with pytest.raises(ValueError):
+        load_snapshot(path_to_snapshot, desired_date=date(2019, 1, 19))
+    with pytest.raises(ValueError):
+        load_snapshot(path_to_snapshot, parser_params={"beeline_distance": 200.0})
+
+    header = read_snapshot_header(path_to_snapshot)
+    header["format_version"] = -1
+    with open(os.path.join(path_to_snapshot, HEADER_FILE_NAME), "w") as f:
+        json.dump(header, f)
+    with pytest.raises(ValueError):
+        load_snapshot(path_to_snapshot)
+
+    os.remove(os.path.join(path_to_snapshot, "dep_times.npy"))
+    with pytest.raises(ValueError):
+        load_snapshot(path_to_snapshot)
+    assert depth == get_log_depth()
+
+
+def test_load_or_parse_gtfs(tmp_path):
+    path_to_snapshot = str(tmp_path / "snapshot")
+    desired_date = date(2019, 1, 18)
+    cs_core = load_or_parse_gtfs(PATH_GTFS_TEST_SAMPLE, desired_date, path_to_snapshot, beeline_distance=200.0)
+    header = read_snapshot_header(path_to_snapshot)
+    assert compute_feed_hash(PATH_GTFS_TEST_SAMPLE) == header["feed_hash"]
+    assert "2019-01-18" == header["desired_date"]
+    assert {"beeline_distance": 200.0} == header["parser_params"]
+
+    loaded_core = load_or_parse_gtfs(PATH_GTFS_TEST_SAMPLE, desired_date, path_to_snapshot, beeline_distance=200.0,
+                                     stop_times_chunk_size=1000)
+    assert isinstance(loaded_core.connection_scan_data.dep_times, np.memmap)
+    assert str(cs_core.connection_scan_data) == str(loaded_core.connection_scan_data)
+    cs_data = cs_core.connection_scan_data
+    for from_stop_id in list(cs_data.stops_per_id)[:20]:
+        assert cs_core.route_earliest_arrival_all_targets(from_stop_id, hhmmss_to_sec("08:00:00")) == \
+               loaded_core.route_earliest_arrival_all_targets(from_stop_id, hhmmss_to_sec("08:00:00"))
+
+    # other parser parameters: the snapshot is stale and recreated
+    depth = get_log_depth()
+    reparsed_core = load_or_parse_gtfs(PATH_GTFS_TEST_SAMPLE, desired_date, path_to_snapshot, beeline_distance=100.0)
+    assert depth == get_log_depth()
+    assert not isinstance(reparsed_core.connection_scan_data.dep_times, np.memmap)
+    assert {"beeline_distance": 100.0} == read_snapshot_header(path_to_snapshot)["parser_params"]
+
+
+def test_load_snapshot_validation_stamp(tmp_path):
+    cs_core = ConnectionScanCore(create_test_connectionscan_data())
+    path_to_snapshot = str(tmp_path / "snapshot")
+    save_snapshot(path_to_snapshot, cs_core)
+    assert ValidationLevel.FULL.name == read_snapshot_header(path_to_snapshot)["validation_level"]
+    assert ValidationLevel.NONE == load_snapshot(path_to_snapshot).connection_scan_data.validation_level
+    assert ValidationLevel.FAST == load_snapshot(
+        path_to_snapshot, validation_level=ValidationLevel.FAST).connection_scan_data.validation_level
+
+    # a snapshot of data which was not validated is validated when loaded
+    not_validated_core = load_snapshot(path_to_snapshot)
+    save_snapshot(path_to_snapshot, not_validated_core)
+    assert ValidationLevel.NONE.name == read_snapshot_header(path_to_snapshot)["validation_level"]
+    assert ValidationLevel.FULL == load_snapshot(path_to_snapshot).connection_scan_data.validation_level
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+
+from scripts.connectionscan_router import ConnectionScanCore
+from scripts.helpers.funs import hhmmss_to_sec
+from scripts.query_server import QueryServer, journey_to_dict
+from tests.a_default.cb_connectionscan_core_test import bern, create_test_connectionscan_data, samedan, st_gallen
+
+
+async def send_request(port, method, path, body=None, raw_body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = raw_body if raw_body is not None else (b"" if body is None else json.dumps(body).encode("utf-8"))
+    writer.write("{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(
+        method, path, len(data)).encode("latin-1") + data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, response_body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), json.loads(response_body.decode("utf-8"))
+
+
+def test_query_server():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+
+    async def scenario():
+        server = QueryServer(cs_data, port=0, nb_processes=1)
+        await server.start()
+        port = server.sockets[0].getsockname()[1]
+        try:
+            status, health = await send_request(port, "GET", "/health")
+            assert 200 == status
+            assert "ok" == health["status"]
+            assert len(cs_data.stops_per_id) == health["nb_stops"]
+
+            query = {"from_stop_id": bern.id, "to_stop_id": samedan.id, "desired_dep_time": "07:30:00"}
+            status, result = await send_request(port, "POST", "/route/earliest_arrival", query)
+            assert 200 == status
+            assert cs_core.route_earliest_arrival(bern.id, samedan.id, hhmmss_to_sec("07:30:00")) == result["arr_time"]
+
+            for router in ["earliest_arrival_with_reconstruction", "optimized_earliest_arrival_with_reconstruction"]:
+                query = {"from_stop_name": bern.name, "to_stop_id": st_gallen.id,
+                         "desired_dep_time": hhmmss_to_sec("09:00:00")}
+                status, result = await send_request(port, "POST", "/route/" + router, query)
+                assert 200 == status
+                exp_journey = getattr(cs_core, "route_" + router)(bern.id, st_gallen.id, hhmmss_to_sec("09:00:00"))
+                assert json.loads(json.dumps(journey_to_dict(exp_journey))) == result["journey"]
+
+            # concurrent queries
+            queries = [{"from_stop_id": bern.id, "to_stop_id": samedan.id, "desired_dep_time": dep_time}
+                       for dep_time in range(6 * 3600, 12 * 3600, 1800)]
+            results = await asyncio.gather(*[send_request(port, "POST", "/route/earliest_arrival", q)
+                                             for q in queries])
+            assert [cs_core.route_earliest_arrival(bern.id, samedan.id, q["desired_dep_time"]) for q in queries] == \
+                   [r["arr_time"] for _, r in results]
+
+            # invalid requests
+            assert 404 == (await send_request(port, "POST", "/route/unknown", query))[0]
+            assert 405 == (await send_request(port, "GET", "/route/earliest_arrival"))[0]
+            assert 400 == (await send_request(port, "POST", "/route/earliest_arrival", raw_body=b"{no json"))[0]
+            for invalid_query in [
+                {"to_stop_id": samedan.id, "desired_dep_time": 0},
+                {"from_stop_id": bern.id, "from_stop_name": bern.name, "to_stop_id": samedan.id,
+                 "desired_dep_time": 0},
+                {"from_stop_id": "unknown", "to_stop_id": samedan.id, "desired_dep_time": 0},
+                {"from_stop_id": bern.id, "to_stop_id": samedan.id, "desired_dep_time": "7h30"},
+                {"from_stop_id": bern.id, "to_stop_id": samedan.id, "desired_dep_time": -1},
+                {"from_stop_id": bern.id, "to_stop_id": samedan.id},
+            ]:
+                status, result = await send_request(port, "POST", "/route/earliest_arrival", invalid_query)
+                assert 400 == status
+                assert "error" in result
+        finally:
+            await server.shutdown()
+        return server
+
+    server = asyncio.run(scenario())
+    assert server.nb_requests >= 15
+
+
+def test_query_server_graceful_shutdown():
+    cs_data = create_test_connectionscan_data()
+
+    async def scenario():
+        server = QueryServer(cs_data, port=0, nb_processes=2)
+        serve_task = asyncio.ensure_future(server.serve())
+        while not server.sockets:
+            await asyncio.sleep(0.01)
+        port = server.sockets[0].getsockname()[1]
+        idle_reader, idle_writer = await asyncio.open_connection("127.0.0.1", port)  # idle keep-alive connection
+        query = {"from_stop_id": bern.id, "to_stop_id": samedan.id, "desired_dep_time": 6 * 3600}
+        request_task = asyncio.ensure_future(send_request(port, "POST", "/route/earliest_arrival", query))
+        while server.nb_requests == 0 and not server._busy_tasks:
+            await asyncio.sleep(0.001)
+        server.request_shutdown()
+        await asyncio.wait_for(serve_task, 30)
+        assert b"" == await idle_reader.read()  # idle connection is closed
+        idle_writer.close()
+        return await request_task
+
+    status, result = asyncio.run(scenario())
+    assert 200 == status
+    assert result["arr_time"] is not None
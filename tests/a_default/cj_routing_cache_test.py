@@ -0,0 +1,197 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import math
+
+import pytest
+
+from scripts.classes import Journey
+from scripts.connectionscan_router import ConnectionScanCore
+from scripts.helpers.funs import hhmmss_to_sec
+from scripts.query_server import QueryServer, get_latest_dep_time_of_result, journey_to_dict
+from scripts.routing_cache import (CachedConnectionScanCore, ResultCache, get_cache_key, get_dep_time_bucket,
+                                   get_latest_dep_time)
+from tests.a_default.cb_connectionscan_core_test import bern, create_test_connectionscan_data, samedan, st_gallen
+from tests.a_default.ci_query_server_test import send_request
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_result_cache_lru_and_ttl():
+    clock = FakeClock()
+    cache = ResultCache(max_size=2, ttl=10.0, clock=clock)
+    assert (False, None) == cache.lookup("a")
+    cache.put("a", 1)
+    cache.put("b", None)  # None is a valid result
+    assert (True, 1) == cache.lookup("a")
+    assert (True, None) == cache.lookup("b")
+    cache.lookup("a")  # "b" is the least recently used entry
+    cache.put("c", 3)
+    assert (False, None) == cache.lookup("b")
+    assert (True, 1) == cache.lookup("a")
+    assert 2 == len(cache)
+
+    clock.now = 9.9
+    assert (True, 3) == cache.lookup("c")
+    clock.now = 10.0
+    assert (False, None) == cache.lookup("c")
+    cache.put("c", 4)
+    assert (True, 4) == cache.lookup("c")
+    assert (False, None) == cache.lookup("c", lambda result: result < 4)
+    assert "c" in cache
+
+    stats = cache.get_stats()
+    assert 6 == stats["nb_hits"]
+    assert 4 == stats["nb_misses"]
+    assert 1 == stats["nb_evictions"]
+    assert 1 == stats["nb_expirations"]
+    cache.clear()
+    assert 0 == len(cache)
+    assert 1 == cache.get_stats()["nb_invalidations"]
+
+    with pytest.raises(ValueError):
+        ResultCache(max_size=0)
+    with pytest.raises(ValueError):
+        ResultCache(ttl=0)
+
+
+def test_get_dep_time_bucket():
+    assert hhmmss_to_sec("08:00:00") == get_dep_time_bucket(hhmmss_to_sec("08:00:00"), 60)
+    assert hhmmss_to_sec("08:00:00") == get_dep_time_bucket(hhmmss_to_sec("08:00:01"), 60)
+    assert hhmmss_to_sec("08:00:00") == get_dep_time_bucket(hhmmss_to_sec("08:00:59"), 60)
+    assert 17 == get_dep_time_bucket(17, 1)
+    assert ("earliest_arrival", "1", "2", 0) == get_cache_key("earliest_arrival", "1", "2", 241, 300)
+
+
+def test_get_latest_dep_time():
+    assert math.inf == get_latest_dep_time(100, False, None)
+    assert 100 == get_latest_dep_time(100, True, None)
+    assert 130 == get_latest_dep_time(100, True, 130)
+
+
+def test_cached_connection_scan_core():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    cached_cs_core = CachedConnectionScanCore(cs_core, max_size=100)
+    for _ in range(2):
+        for dep_time in ["06:00:00", "07:30:00", "09:00:00"]:
+            desired_dep_time = hhmmss_to_sec(dep_time)
+            assert cs_core.route_earliest_arrival(bern.id, samedan.id, desired_dep_time) == \
+                   cached_cs_core.route_earliest_arrival(bern.id, samedan.id, desired_dep_time)
+            journey = cached_cs_core.route_optimized_earliest_arrival_with_reconstruction(bern.id, st_gallen.id,
+                                                                                          desired_dep_time)
+            assert str(cs_core.route_optimized_earliest_arrival_with_reconstruction(
+                bern.id, st_gallen.id, desired_dep_time)) == str(journey)
+    assert 6 == cached_cs_core.cache.nb_misses
+    assert 6 == cached_cs_core.cache.nb_hits
+
+    # the default buckets are exact
+    cached_cs_core.route_earliest_arrival(bern.id, samedan.id, hhmmss_to_sec("07:30:01"))
+    assert 7 == cached_cs_core.cache.nb_misses
+
+    # replacing the timetable data invalidates the cache
+    cs_core.connection_scan_data = create_test_connectionscan_data()
+    cs_core.route_earliest_arrival(bern.id, samedan.id, hhmmss_to_sec("06:00:00"))
+    cached_cs_core.route_earliest_arrival(bern.id, samedan.id, hhmmss_to_sec("06:00:00"))
+    assert 1 == len(cached_cs_core.cache)
+    assert 1 == cached_cs_core.cache.nb_invalidations
+    cached_cs_core.set_connection_scan_core(ConnectionScanCore(cs_data))
+    assert 0 == len(cached_cs_core.cache)
+    assert 2 == cached_cs_core.cache.nb_invalidations
+
+    with pytest.raises(ValueError):
+        cached_cs_core.route("latest_departure", bern.id, samedan.id, 0)
+
+
+def test_cached_connection_scan_core_dep_time_buckets():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    cached_cs_core = CachedConnectionScanCore(cs_core, dep_time_bucket=300)
+    stop_ids = list(cs_data.stops_per_id)
+    # desired departure times shortly before and after departures in the middle of the buckets
+    desired_dep_times = sorted({int(dep_time) + offset
+                                for dep_time in cs_data.dep_times[::97] for offset in (-31, -1, 0, 1)})
+    for router in ["earliest_arrival", "optimized_earliest_arrival_with_reconstruction"]:
+        for from_stop_id in stop_ids[::3]:
+            for to_stop_id in stop_ids[::4]:
+                for desired_dep_time in desired_dep_times:
+                    res = getattr(cs_core, "route_{}".format(router))(from_stop_id, to_stop_id, desired_dep_time)
+                    cached_res = cached_cs_core.route(router, from_stop_id, to_stop_id, desired_dep_time)
+                    if router == "earliest_arrival":
+                        assert res == cached_res
+                    elif res is None or cached_res is None:
+                        assert res is None and cached_res is None
+                    else:
+                        assert res.get_arr_time() == cached_res.get_arr_time()
+                        assert cached_res.get_dep_time() is None or desired_dep_time <= cached_res.get_dep_time()
+    assert 0 < cached_cs_core.cache.nb_hits
+
+    # a query after the departure of the cached journey is routed with its own departure time
+    cached_cs_core = CachedConnectionScanCore(cs_core, dep_time_bucket=3600)
+    bucket_journey = cached_cs_core.route_optimized_earliest_arrival_with_reconstruction(
+        bern.id, samedan.id, hhmmss_to_sec("07:00:00"))
+    later_dep_time = bucket_journey.get_dep_time() + 1
+    journey = cs_core.route_optimized_earliest_arrival_with_reconstruction(bern.id, samedan.id, later_dep_time)
+    cached_journey = cached_cs_core.route_optimized_earliest_arrival_with_reconstruction(
+        bern.id, samedan.id, later_dep_time)
+    assert str(journey) == str(cached_journey)
+    assert str(bucket_journey) != str(cached_journey)
+    assert 0 == cached_cs_core.cache.nb_hits
+
+
+def test_cached_connection_scan_core_unreachable_target():
+    cs_core = ConnectionScanCore(create_test_connectionscan_data())
+    cached_cs_core = CachedConnectionScanCore(cs_core, dep_time_bucket=3600)
+    for router in ["earliest_arrival", "earliest_arrival_with_reconstruction",
+                   "optimized_earliest_arrival_with_reconstruction"]:
+        for desired_dep_time in ["22:00:00", "22:30:00", "22:59:59"]:
+            result = cached_cs_core.route(router, bern.id, samedan.id, hhmmss_to_sec(desired_dep_time))
+            assert result is None or 0 == result.get_nb_journey_legs()
+    # the result of the start of the bucket is exact for the whole bucket
+    assert 3 == cached_cs_core.cache.nb_misses
+    assert 6 == cached_cs_core.cache.nb_hits
+    assert (True, (None, math.inf)) == cached_cs_core.cache.lookup(
+        get_cache_key("earliest_arrival", bern.id, samedan.id, hhmmss_to_sec("22:00:00"), 3600))
+
+
+def test_get_latest_dep_time_of_result():
+    assert math.inf == get_latest_dep_time_of_result(100, {"arr_time": None})
+    assert 100 == get_latest_dep_time_of_result(100, {"arr_time": 200})
+    assert math.inf == get_latest_dep_time_of_result(100, {"journey": journey_to_dict(Journey())})
+    cs_core = ConnectionScanCore(create_test_connectionscan_data())
+    desired_dep_time = hhmmss_to_sec("07:30:00")
+    journey = cs_core.route_optimized_earliest_arrival_with_reconstruction(bern.id, samedan.id, desired_dep_time)
+    assert journey.get_dep_time() == get_latest_dep_time_of_result(desired_dep_time,
+                                                                   {"journey": journey_to_dict(journey)})
+
+
+def test_query_server_with_cache():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+
+    async def scenario():
+        server = QueryServer(cs_data, port=0, nb_processes=1, cache_size=10, dep_time_bucket=60)
+        await server.start()
+        port = server.sockets[0].getsockname()[1]
+        try:
+            results = []
+            for dep_time in ["07:30:00", "07:29:30", "07:30:00"]:
+                query = {"from_stop_id": bern.id, "to_stop_id": samedan.id, "desired_dep_time": dep_time}
+                results += [await send_request(port, "POST", "/route/earliest_arrival", query)]
+            _, health = await send_request(port, "GET", "/health")
+        finally:
+            await server.shutdown()
+        return results, health
+
+    results, health = asyncio.run(scenario())
+    exp_arr_time = cs_core.route_earliest_arrival(bern.id, samedan.id, hhmmss_to_sec("07:30:00"))
+    assert [(200, exp_arr_time)] * 3 == [(status, result["arr_time"]) for status, result in results]
+    assert 1 == health["cache"]["nb_hits"]  # 07:29:30 is after the start of its bucket
+    assert 2 == health["cache"]["nb_misses"]
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+
+from scripts.benchmark import (DEFAULT_FEEDS, STAGES, compare_benchmarks, create_query_set, create_synthetic_feeds,
+                               format_results, main, run_benchmark)
+from tests.a_default.cb_connectionscan_core_test import create_test_connectionscan_data
+
+
+def test_create_query_set():
+    cs_data = create_test_connectionscan_data()
+    queries = create_query_set(cs_data, 10, seed=42)
+    assert queries == create_query_set(cs_data, 10, seed=42)
+    assert queries != create_query_set(cs_data, 10, seed=43)
+    for from_stop_id, to_stop_id, desired_dep_time in queries:
+        assert from_stop_id != to_stop_id
+        assert from_stop_id in cs_data.stops_per_id and to_stop_id in cs_data.stops_per_id
+        assert 0 == desired_dep_time % 60
+
+
+def test_run_benchmark():
+    results = run_benchmark(DEFAULT_FEEDS[:1], nb_repetitions=1, nb_queries=2)
+    name = DEFAULT_FEEDS[0][0]
+    assert [name] == list(results["feeds"])
+    feed = results["feeds"][name]
+    assert list(STAGES) == list(feed["stages"])
+    assert 2 == feed["nb_queries"]
+    for stats in feed["stages"].values():
+        assert 0 <= stats["min"] <= stats["median"]
+    assert results == json.loads(json.dumps(results))
+    assert name in format_results(results)
+
+
+def create_results(time_per_stage_per_feed):
+    return {"feeds": {name: {"stages": {stage: {"median": elapsed} for stage, elapsed in time_per_stage.items()}}
+                      for name, time_per_stage in time_per_stage_per_feed.items()}}
+
+
+def test_compare_benchmarks():
+    baseline = create_results({"a": {"parse_gtfs": 1.0, "make_transitive": 0.0001}, "b": {"parse_gtfs": 1.0}})
+    current = create_results({"a": {"parse_gtfs": 1.2, "make_transitive": 0.0005}, "c": {"parse_gtfs": 5.0}})
+    assert [("a", "parse_gtfs", 1.0, 1.2)] == [r[:4] for r in compare_benchmarks(baseline, current)]
+    assert [] == compare_benchmarks(baseline, current, threshold=0.25)
+    assert 2 == len(compare_benchmarks(baseline, current, min_difference=0.0))
+
+
+def test_main_compare(tmp_path):
+    baseline_path = str(tmp_path / "baseline.json")
+    current_path = str(tmp_path / "current.json")
+    with open(baseline_path, "w") as f:
+        json.dump(create_results({"a": {"parse_gtfs": 1.0}}), f)
+    with open(current_path, "w") as f:
+        json.dump(create_results({"a": {"parse_gtfs": 1.05}}), f)
+    assert 0 == main(["compare", baseline_path, current_path])
+    assert 1 == main(["compare", baseline_path, current_path, "--threshold", "0.01"])
+
+
+def test_run_benchmark_on_synthetic_feed(tmp_path):
+    feeds = create_synthetic_feeds(["toy"], str(tmp_path))
+    assert [("synthetic_toy", str(tmp_path / "synthetic_toy_0.zip"), "20200108")] == feeds
+    results = run_benchmark(feeds, nb_repetitions=1, nb_queries=2)
+    assert 0 < results["feeds"]["synthetic_toy"]["nb_connections"]
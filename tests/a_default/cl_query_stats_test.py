@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from scripts.connectionscan_kernels import NUMBA_AVAILABLE
+from scripts.connectionscan_router import ConnectionScanCore, QueryStats, RoutingBackend
+from scripts.helpers.funs import hhmmss_to_sec
+from tests.a_default.cb_connectionscan_core_test import bern, create_test_connectionscan_data, samedan, st_gallen
+
+
+class CountingFootpaths:
+    """Outgoing footpaths per stop index counting the footpaths iterated by the scans."""
+
+    def __init__(self, outgoing_footpaths_per_stop_index):
+        self.outgoing_footpaths_per_stop_index = outgoing_footpaths_per_stop_index
+        self.nb_footpaths = 0
+
+    def __getitem__(self, stop_index):
+        footpaths = self.outgoing_footpaths_per_stop_index[stop_index]
+        self.nb_footpaths += len(footpaths)
+        return footpaths
+
+
+def get_nb_footpath_relaxations(cs_core, route, from_stop_id):
+    counting_footpaths = CountingFootpaths(cs_core.outgoing_footpaths_per_stop_index)
+    cs_core.outgoing_footpaths_per_stop_index = counting_footpaths
+    try:
+        route()
+    finally:
+        cs_core.outgoing_footpaths_per_stop_index = counting_footpaths.outgoing_footpaths_per_stop_index
+    from_stop_index = cs_core.connection_scan_data.stop_id_registry.get_index(from_stop_id)
+    nb_loops = sum(1 for to_stop_index, _, _ in cs_core.outgoing_footpaths_per_stop_index[from_stop_index]
+                   if to_stop_index == from_stop_index)
+    return counting_footpaths.nb_footpaths - nb_loops
+
+
+def test_query_stats():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    nb_connections = len(cs_data.sorted_connections)
+    for from_stop_id, to_stop_id in [(bern.id, samedan.id), (st_gallen.id, bern.id), (samedan.id, st_gallen.id)]:
+        for dep_time in ["05:00:00", "07:30:00", "21:00:00"]:
+            desired_dep_time = hhmmss_to_sec(dep_time)
+            res, stats = cs_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time, with_stats=True)
+            assert cs_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time) == res
+            assert (0, nb_connections, nb_connections, 0) == (stats.first_connection_index,
+                                                              stats.end_connection_index,
+                                                              stats.nb_connections_scanned,
+                                                              stats.nb_connections_skipped)
+            assert not stats.stopping_criterion_fired
+            assert get_nb_footpath_relaxations(cs_core, lambda: cs_core.route_earliest_arrival(
+                from_stop_id, to_stop_id, desired_dep_time), from_stop_id) == stats.nb_footpath_relaxations
+            assert 0.0 == stats.reconstruction_time
+
+            journey, stats = cs_core.route_optimized_earliest_arrival_with_reconstruction(
+                from_stop_id, to_stop_id, desired_dep_time, with_stats=True)
+            assert str(cs_core.route_optimized_earliest_arrival_with_reconstruction(
+                from_stop_id, to_stop_id, desired_dep_time)) == str(journey)
+            assert cs_core.get_first_connection_index(desired_dep_time) == stats.first_connection_index
+            assert nb_connections == stats.nb_connections_scanned + stats.nb_connections_skipped
+            assert (stats.end_connection_index < nb_connections) == stats.stopping_criterion_fired
+            route = cs_core.route_optimized_earliest_arrival_with_reconstruction
+            assert get_nb_footpath_relaxations(cs_core, lambda: route(from_stop_id, to_stop_id, desired_dep_time),
+                                               from_stop_id) == stats.nb_footpath_relaxations
+            assert 0.0 < stats.scan_time and 0.0 <= stats.reconstruction_time
+
+        res, stats = cs_core.route_earliest_arrival_all_targets(from_stop_id, desired_dep_time, with_stats=True)
+        assert cs_core.route_earliest_arrival_all_targets(from_stop_id, desired_dep_time) == res
+        assert nb_connections == stats.end_connection_index and not stats.stopping_criterion_fired
+        assert get_nb_footpath_relaxations(cs_core, lambda: cs_core.route_earliest_arrival_all_targets(
+            from_stop_id, desired_dep_time), from_stop_id) == stats.nb_footpath_relaxations
+
+
+@pytest.mark.skipif(not NUMBA_AVAILABLE, reason="numba is not installed")
+def test_query_stats_numba_backend():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    for from_stop_id, to_stop_id in [(bern.id, samedan.id), (st_gallen.id, bern.id), (samedan.id, st_gallen.id)]:
+        for dep_time in ["05:00:00", "07:30:00", "21:00:00"]:
+            desired_dep_time = hhmmss_to_sec(dep_time)
+            _, stats = cs_core.route_optimized_earliest_arrival_with_reconstruction(
+                from_stop_id, to_stop_id, desired_dep_time, with_stats=True)
+            _, numba_stats = cs_core.route_optimized_earliest_arrival_with_reconstruction(
+                from_stop_id, to_stop_id, desired_dep_time, backend=RoutingBackend.NUMBA, with_stats=True)
+            assert (stats.first_connection_index, stats.end_connection_index, stats.stopping_criterion_fired) == \
+                   (numba_stats.first_connection_index, numba_stats.end_connection_index,
+                    numba_stats.stopping_criterion_fired)
+            assert numba_stats.nb_trips_boarded is None and numba_stats.nb_footpath_relaxations is None
+
+
+def test_query_stats_trips_boarded():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    desired_dep_time = hhmmss_to_sec("07:30:00")
+    journey, stats = cs_core.route_earliest_arrival_with_reconstruction(bern.id, samedan.id, desired_dep_time,
+                                                                        with_stats=True)
+    _, optimized_stats = cs_core.route_optimized_earliest_arrival_with_reconstruction(
+        bern.id, samedan.id, desired_dep_time, with_stats=True)
+    assert journey.get_nb_pt_journey_legs() <= optimized_stats.nb_trips_boarded <= stats.nb_trips_boarded
+    assert optimized_stats.nb_footpath_relaxations <= stats.nb_footpath_relaxations
+    assert optimized_stats.stopping_criterion_fired
+    assert 0 < optimized_stats.nb_connections_skipped
+
+    # the statistics do not depend on the previous queries of the workspace
+    _, stats_again = cs_core.route_earliest_arrival_with_reconstruction(bern.id, samedan.id, desired_dep_time,
+                                                                        with_stats=True)
+    assert (stats.nb_trips_boarded, stats.nb_footpath_relaxations) == \
+           (stats_again.nb_trips_boarded, stats_again.nb_footpath_relaxations)
+
+
+def test_query_stats_to_dict():
+    stats = QueryStats("earliest_arrival", 10, 25, 100, True, 3, 7, 0.5, 0.25)
+    stats_dict = json.loads(json.dumps(stats.to_dict()))
+    assert 15 == stats_dict["nb_connections_scanned"]
+    assert 85 == stats_dict["nb_connections_skipped"]
+    assert stats_dict["stopping_criterion_fired"]
+    assert "scanned 15 of 100 connections from index 10" in str(stats)
@@ -0,0 +1,44 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+
+from scripts.connectionscan_router import ConnectionScanCore
+from scripts.helpers.funs import hhmmss_to_sec
+from scripts.travel_time_matrix import compute_travel_time_matrix
+from tests.a_default.cb_connectionscan_core_test import create_test_connectionscan_data
+
+
+def check_travel_time_matrix(cs_data, from_stop_ids, to_stop_ids, desired_dep_times, matrix):
+    cs_core = ConnectionScanCore(cs_data)
+    assert (len(desired_dep_times), len(from_stop_ids), len(to_stop_ids)) == matrix.shape
+    for dep_time_ind, desired_dep_time in enumerate(desired_dep_times):
+        for from_ind, from_stop_id in enumerate(from_stop_ids):
+            for to_ind, to_stop_id in enumerate(to_stop_ids):
+                arr_time = cs_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time)
+                travel_time = matrix[dep_time_ind, from_ind, to_ind]
+                if arr_time is None:
+                    assert math.isinf(travel_time)
+                else:
+                    assert arr_time - desired_dep_time == travel_time
+
+
+def test_compute_travel_time_matrix_in_process():
+    cs_data = create_test_connectionscan_data()
+    stop_ids = list(cs_data.stops_per_id.keys())
+    desired_dep_times = [hhmmss_to_sec("07:30:00"), hhmmss_to_sec("21:00:00")]
+    matrix = compute_travel_time_matrix(cs_data, stop_ids, stop_ids[::-1], desired_dep_times, nb_processes=1,
+                                        chunk_size=5)
+    check_travel_time_matrix(cs_data, stop_ids, stop_ids[::-1], desired_dep_times, matrix)
+
+
+def test_compute_travel_time_matrix_process_pool_memmap(tmp_path):
+    cs_data = create_test_connectionscan_data()
+    stop_ids = list(cs_data.stops_per_id.keys())
+    desired_dep_times = [hhmmss_to_sec("08:26:00")]
+    path_to_memmap = str(tmp_path / "matrix.npy")
+    matrix = compute_travel_time_matrix(cs_data, stop_ids[:7], stop_ids, desired_dep_times, nb_processes=2,
+                                        chunk_size=3, path_to_memmap=path_to_memmap)
+    check_travel_time_matrix(cs_data, stop_ids[:7], stop_ids, desired_dep_times, matrix)
+    assert np.array_equal(matrix, np.load(path_to_memmap, mmap_mode="r"))
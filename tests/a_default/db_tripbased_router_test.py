@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from scripts.classes import Connection, Footpath, Stop, Trip
+from scripts.connectionscan_router import ConnectionScanCore, ConnectionScanData
+from scripts.helpers.funs import hhmmss_to_sec, seconds_to_hhmmss
+from scripts.helpers.my_logging import get_log_depth
+from scripts.tripbased_router import TripBasedCore, TripBasedData
+from tests.a_default.cb_connectionscan_core_test import (bern, bern_bahnhof, chur, create_test_connectionscan_data,
+                                                         samedan, samedan_spital, zuerich_hb)
+
+
+def test_trip_based_data_lines():
+    cs_data = create_test_connectionscan_data()
+    tb_data = TripBasedData(cs_data)
+    for trip_indices in tb_data.trip_indices_per_line_index:
+        stop_indices = tb_data.stop_indices_per_trip_index[trip_indices[0]]
+        for trip_index, next_trip_index in zip(trip_indices, trip_indices[1:]):
+            assert stop_indices == tb_data.stop_indices_per_trip_index[next_trip_index]
+            assert tb_data.is_not_overtaking(trip_index, next_trip_index)
+    assert len(cs_data.trips_per_id) == sum(len(trip_indices) for trip_indices in tb_data.trip_indices_per_line_index)
+
+
+def test_trip_based_data_parallel_and_saved_transfers(tmp_path):
+    cs_data = create_test_connectionscan_data()
+    tb_data = TripBasedData(cs_data)
+    path_to_transfers = str(tmp_path / "transfers.npz")
+    tb_data_parallel = TripBasedData(cs_data, nb_processes=2, path_to_transfers=path_to_transfers)
+    tb_data_loaded = TripBasedData(cs_data, path_to_transfers=path_to_transfers)
+    for other_tb_data in [tb_data_parallel, tb_data_loaded]:
+        assert np.array_equal(tb_data.transfer_first_indices, other_tb_data.transfer_first_indices)
+        assert np.array_equal(tb_data.transfer_to_trip_indices, other_tb_data.transfer_to_trip_indices)
+        assert np.array_equal(tb_data.transfer_to_positions, other_tb_data.transfer_to_positions)
+
+
+def test_trip_based_data_saved_transfers_of_other_timetable(tmp_path):
+    cs_data = create_test_connectionscan_data()
+    path_to_transfers = str(tmp_path / "transfers.npz")
+    TripBasedData(cs_data, path_to_transfers=path_to_transfers)
+    other_cs_data = ConnectionScanData(cs_data.stops_per_id, cs_data.footpaths_per_from_to_stop_id,
+                                       dict(list(cs_data.trips_per_id.items())[1:]))
+    depth = get_log_depth()
+    with pytest.raises(ValueError):
+        TripBasedData(other_cs_data, path_to_transfers=path_to_transfers)
+    assert depth == get_log_depth()
+
+
+def test_trip_based_route_earliest_arrival_with_reconstruction_bern_samedan():
+    tb_core = TripBasedCore(TripBasedData(create_test_connectionscan_data()))
+    journey = tb_core.route_earliest_arrival_with_reconstruction(bern.id, samedan.id, hhmmss_to_sec("08:30:00"))
+    assert "08:32:00" == seconds_to_hhmmss(journey.get_dep_time())
+    assert "12:45:00" == seconds_to_hhmmss(journey.get_arr_time())
+    assert [bern.id, zuerich_hb.id, chur.id] == journey.get_pt_in_stop_ids()
+    assert [zuerich_hb.id, chur.id, samedan.id] == journey.get_pt_out_stop_ids()
+
+
+def test_trip_based_route_earliest_arrival_with_reconstruction_footpaths():
+    tb_core = TripBasedCore(TripBasedData(create_test_connectionscan_data()))
+    journey = tb_core.route_earliest_arrival_with_reconstruction(bern_bahnhof.id, samedan_spital.id,
+                                                                 hhmmss_to_sec("08:30:00"))
+    assert journey.is_first_leg_footpath()
+    assert bern_bahnhof.id == journey.get_first_stop_id()
+    assert samedan_spital.id == journey.get_last_stop_id()
+    journey = tb_core.route_earliest_arrival_with_reconstruction(bern.id, bern_bahnhof.id, hhmmss_to_sec("08:30:00"))
+    assert 1 == journey.get_nb_journey_legs()
+    assert 0 == journey.get_nb_pt_journey_legs()
+
+
+def test_trip_based_route_earliest_arrival_equals_connection_scan():
+    cs_data = create_test_connectionscan_data()
+    cs_core = ConnectionScanCore(cs_data)
+    tb_core = TripBasedCore(TripBasedData(cs_data))
+    for desired_dep_time_hhmmss in ["04:00:00", "07:30:00", "08:26:00", "12:09:46", "23:33:00"]:
+        desired_dep_time = hhmmss_to_sec(desired_dep_time_hhmmss)
+        for from_stop_id in cs_data.stops_per_id:
+            for to_stop_id in cs_data.stops_per_id:
+                arr_time = cs_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time)
+                assert arr_time == tb_core.route_earliest_arrival(from_stop_id, to_stop_id, desired_dep_time)
+                journey = tb_core.route_earliest_arrival_with_reconstruction(from_stop_id, to_stop_id,
+                                                                             desired_dep_time)
+                cs_journey = cs_core.route_optimized_earliest_arrival_with_reconstruction(from_stop_id, to_stop_id,
+                                                                                          desired_dep_time)
+                assert cs_journey.get_nb_journey_legs() > 0 or journey.get_nb_journey_legs() == 0
+                if journey.get_nb_pt_journey_legs() > 0:
+                    assert arr_time == journey.get_arr_time()
+                    assert from_stop_id == journey.get_first_stop_id()
+                    assert to_stop_id == journey.get_last_stop_id()
+
+
+def test_trip_based_route_earliest_arrival_transfer_to_earlier_trip_of_same_line():
+    # the earlier trip u dwells at b until after the later trip t arrived there
+    stops_per_id = {s.id: s for s in [Stop("a", "A", "A", 0.0, 0.0), Stop("b", "B", "B", 0.0, 0.0),
+                                      Stop("c", "C", "C", 0.0, 0.0)]}
+    footpaths_per_from_to_stop_id = {(s_id, s_id): Footpath(s_id, s_id, 2 * 60) for s_id in stops_per_id}
+    trips_per_id = {
+        "u": Trip("u", [Connection("u", "a", "b", hhmmss_to_sec("09:55:00"), hhmmss_to_sec("10:00:00")),
+                        Connection("u", "b", "c", hhmmss_to_sec("10:05:00"), hhmmss_to_sec("10:10:00"))]),
+        "t": Trip("t", [Connection("t", "a", "b", hhmmss_to_sec("09:56:00"), hhmmss_to_sec("10:02:00")),
+                        Connection("t", "b", "c", hhmmss_to_sec("10:30:00"), hhmmss_to_sec("10:35:00"))]),
+    }
+    cs_data = ConnectionScanData(stops_per_id, footpaths_per_from_to_stop_id, trips_per_id)
+    tb_core = TripBasedCore(TripBasedData(cs_data))
+    desired_dep_time = hhmmss_to_sec("09:56:00")
+    assert hhmmss_to_sec("10:10:00") == ConnectionScanCore(cs_data).route_earliest_arrival("a", "c", desired_dep_time)
+    assert hhmmss_to_sec("10:10:00") == tb_core.route_earliest_arrival("a", "c", desired_dep_time)
+    journey = tb_core.route_earliest_arrival_with_reconstruction("a", "c", desired_dep_time)
+    assert ["a", "b"] == journey.get_pt_in_stop_ids()
+    assert hhmmss_to_sec("10:10:00") == journey.get_arr_time()